@@ -3,7 +3,7 @@
 Script para agregar estudiantes de prueba a la base de datos
 """
 
-from services.database_service import get_connection
+from services.database_service import get_connection, invalidar_cache_estudiantes
 
 def agregar_estudiantes_prueba():
     """Agrega estudiantes de prueba a la base de datos"""
@@ -57,41 +57,46 @@ def agregar_estudiantes_prueba():
             print("❌ Error: No se pudo conectar a la base de datos")
             return False
             
-        cursor = connection.cursor()
+        try:
+            cursor = connection.cursor()
         
-        # Verificar si la tabla existe
-        cursor.execute("SHOW TABLES LIKE 'estudiantes'")
-        if not cursor.fetchone():
-            print("❌ La tabla 'estudiantes' no existe")
-            return False
+            # Verificar si la tabla existe
+            cursor.execute("SHOW TABLES LIKE 'estudiantes'")
+            if not cursor.fetchone():
+                print("❌ La tabla 'estudiantes' no existe")
+                return False
         
-        # Agregar estudiantes
-        for estudiante in estudiantes_prueba:
-            # Verificar si el estudiante ya existe
-            cursor.execute("SELECT id FROM estudiantes WHERE codigo = %s", (estudiante['codigo'],))
-            if cursor.fetchone():
-                print(f"⚠️  Estudiante {estudiante['codigo']} ya existe, saltando...")
-                continue
+            # Agregar estudiantes
+            for estudiante in estudiantes_prueba:
+                # Verificar si el estudiante ya existe
+                cursor.execute("SELECT id FROM estudiantes WHERE codigo = %s", (estudiante['codigo'],))
+                if cursor.fetchone():
+                    print(f"⚠️  Estudiante {estudiante['codigo']} ya existe, saltando...")
+                    continue
             
-                    # Insertar nuevo estudiante
-        query = """
-            INSERT INTO estudiantes (codigo, dni, nombre, correo, direccion)
-            VALUES (%s, %s, %s, %s, %s)
-        """
-        values = (
-            estudiante['codigo'],
-            estudiante['dni'],
-            estudiante['nombres'],
-            f"{estudiante['nombres'].lower().replace(' ', '.')}@uni.edu.pe",
-            "Lima, Perú"
-        )
+                # Insertar nuevo estudiante
+                query = """
+                    INSERT INTO estudiantes (codigo, dni, nombre, correo, direccion)
+                    VALUES (%s, %s, %s, %s, %s)
+                """
+                values = (
+                    estudiante['codigo'],
+                    estudiante['dni'],
+                    estudiante['nombres'],
+                    f"{estudiante['nombres'].lower().replace(' ', '.')}@uni.edu.pe",
+                    "Lima, Perú"
+                )
             
-            cursor.execute(query, values)
-            print(f"✅ Estudiante {estudiante['codigo']} agregado: {estudiante['nombres']} {estudiante['apellidos']}")
+                cursor.execute(query, values)
+                print(f"✅ Estudiante {estudiante['codigo']} agregado: {estudiante['nombres']} {estudiante['apellidos']}")
+        
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
         
-        connection.commit()
-        cursor.close()
-        connection.close()
+        # Los códigos recién insertados pueden estar en caché como inexistentes
+        invalidar_cache_estudiantes()
         
         print("\n✅ Estudiantes de prueba agregados exitosamente")
         return True
@@ -130,39 +135,41 @@ def agregar_empresas_prueba():
             print("❌ Error: No se pudo conectar a la base de datos")
             return False
             
-        cursor = connection.cursor()
+        try:
+            cursor = connection.cursor()
         
-        # Verificar si la tabla existe
-        cursor.execute("SHOW TABLES LIKE 'empresas'")
-        if not cursor.fetchone():
-            print("❌ La tabla 'empresas' no existe")
-            return False
+            # Verificar si la tabla existe
+            cursor.execute("SHOW TABLES LIKE 'empresas'")
+            if not cursor.fetchone():
+                print("❌ La tabla 'empresas' no existe")
+                return False
         
-        # Agregar empresas
-        for empresa in empresas_prueba:
-            # Verificar si la empresa ya existe
-            cursor.execute("SELECT id FROM empresas WHERE ruc = %s", (empresa['ruc'],))
-            if cursor.fetchone():
-                print(f"⚠️  Empresa {empresa['ruc']} ya existe, saltando...")
-                continue
+            # Agregar empresas
+            for empresa in empresas_prueba:
+                # Verificar si la empresa ya existe
+                cursor.execute("SELECT id FROM empresas WHERE ruc = %s", (empresa['ruc'],))
+                if cursor.fetchone():
+                    print(f"⚠️  Empresa {empresa['ruc']} ya existe, saltando...")
+                    continue
             
-                    # Insertar nueva empresa
-        query = """
-            INSERT INTO empresas (nombre, direccion, contacto_email)
-            VALUES (%s, %s, %s)
-        """
-        values = (
-            empresa['nombre'],
-            empresa['direccion'],
-            empresa['contacto_email']
-        )
+                # Insertar nueva empresa
+                query = """
+                    INSERT INTO empresas (nombre, direccion, contacto_email)
+                    VALUES (%s, %s, %s)
+                """
+                values = (
+                    empresa['nombre'],
+                    empresa['direccion'],
+                    empresa['contacto_email']
+                )
             
-            cursor.execute(query, values)
-            print(f"✅ Empresa {empresa['ruc']} agregada: {empresa['nombre']}")
+                cursor.execute(query, values)
+                print(f"✅ Empresa {empresa['ruc']} agregada: {empresa['nombre']}")
         
-        connection.commit()
-        cursor.close()
-        connection.close()
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
         
         print("\n✅ Empresas de prueba agregadas exitosamente")
         return True
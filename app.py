@@ -1,6 +1,12 @@
-from flask import Flask, request, jsonify
-from services.database_service import consultar_horas, consultar_empresas, registrar_solicitud_carta, consultar_fechas_criticas, consultar_oportunidades_practicas, obtener_estudiante_id, obtener_empresa_id
-from carta_generator import generar_carta_presentacion
+import hmac
+from datetime import datetime
+
+from flask import Flask, Response, request, jsonify, stream_with_context
+from config import Config
+from services.database_service import crear_fecha_critica, actualizar_estado_fecha_critica, crear_oportunidad_practica, actualizar_estado_oportunidad, consultar_horas, consultar_empresas, registrar_solicitud_carta, consultar_fechas_criticas, consultar_oportunidades_practicas, obtener_estudiante_id, obtener_empresa_id, obtener_estadisticas_pool, obtener_estadisticas_cache, obtener_estadisticas_cache_estudiantes, consultar_resumen_estudiante, obtener_metricas_consultas, consultar_oportunidades_pagina, obtener_estadisticas_sentencias, obtener_estadisticas_replicas, exportar_solicitudes_carta, COLUMNAS_EXPORTACION, buscar_empresas, obtener_estadisticas_indice_empresas
+from services.render_service import solicitar_carta, consultar_trabajo, obtener_estadisticas_render, ColaLlenaError
+from services.exportacion_service import exportar, FORMATOS
+from services.plantillas_cartas import tipos_carta, obtener_definicion, campos_faltantes
 
 app = Flask(__name__)
 
@@ -14,15 +20,114 @@ def obtener_empresas(codigo_estudiante):
     empresas = consultar_empresas(codigo_estudiante)  # Llama a la función de base de datos
     return jsonify({'codigo_estudiante': codigo_estudiante, 'empresas': empresas})
 
+@app.route('/estudiante/<codigo_estudiante>/resumen', methods=['GET'])
+def obtener_resumen_estudiante(codigo_estudiante):
+    resumen = consultar_resumen_estudiante(codigo_estudiante)  # Una sola consulta a la base de datos
+    if resumen is None:
+        return jsonify({'error': 'Estudiante no encontrado'}), 404
+    resumen['cartas'] = [{'empresa': empresa, 'ruta_pdf': ruta_pdf} for empresa, ruta_pdf in resumen['cartas']]
+    return jsonify(resumen)
+
+# Búsqueda aproximada de empresas por nombre (autocompletado): ?q=texto&limit=5
+@app.route('/empresas/buscar', methods=['GET'])
+def buscar_empresas_por_nombre():
+    limite = max(1, min(request.args.get('limit', 5, type=int), 20))
+    return jsonify({'empresas': buscar_empresas(request.args.get('q', ''), limite)})
+
 @app.route('/fechas_criticas', methods=['GET'])
 def obtener_fechas_criticas():
     fechas = consultar_fechas_criticas()  # Llama a la función de base de datos
     return jsonify({'fechas_criticas': fechas})
 
+# Paginado: ?limit=N&after=<token>; 'siguiente' es el token de la página siguiente (null al final)
 @app.route('/oportunidades', methods=['GET'])
 def obtener_oportunidades():
-    oportunidades = consultar_oportunidades_practicas()  # Llama a la función de base de datos
-    return jsonify({'oportunidades': oportunidades})
+    try:
+        limite = request.args.get('limit', type=int)
+        oportunidades, siguiente = consultar_oportunidades_pagina(limite, request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'oportunidades': oportunidades, 'siguiente': siguiente})
+
+# Administración de fechas críticas y oportunidades: requieren la cabecera
+# X-Admin-Token con Config.ADMIN_TOKEN. Las funciones de escritura invalidan las
+# cachés de consultas de todos los procesos (bot y API)
+def _no_autorizado():
+    """Respuesta de error si la petición no trae el token de administración; None si lo trae"""
+    if not Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Administración deshabilitada (falta ADMIN_TOKEN)'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), Config.ADMIN_TOKEN):
+        return jsonify({'error': 'No autorizado'}), 401
+    return None
+
+def _leer_campos(data, campos):
+    """Devuelve los campos del JSON (las fechas ya validadas) o el mensaje de error"""
+    faltantes = [campo for campo in campos if not data.get(campo)]
+    if faltantes:
+        return None, f"Faltan campos: {', '.join(faltantes)}"
+    valores = []
+    for campo in campos:
+        valor = data[campo]
+        if campo.startswith('fecha'):
+            try:
+                valor = datetime.strptime(str(valor), '%Y-%m-%d').date()
+            except ValueError:
+                return None, f"{campo} debe tener el formato AAAA-MM-DD"
+        valores.append(valor)
+    return valores, None
+
+@app.route('/fechas_criticas', methods=['POST'])
+def crear_fecha_critica_admin():
+    error = _no_autorizado()
+    if error:
+        return error
+    valores, mensaje = _leer_campos(request.get_json(silent=True) or {}, ['descripcion', 'fecha'])
+    if mensaje:
+        return jsonify({'error': mensaje}), 400
+    fecha_id = crear_fecha_critica(*valores)
+    if fecha_id is None:
+        return jsonify({'error': 'No se pudo crear la fecha crítica'}), 503
+    return jsonify({'id': fecha_id}), 201
+
+@app.route('/fechas_criticas/<int:fecha_id>', methods=['PATCH'])
+def actualizar_fecha_critica_admin(fecha_id):
+    error = _no_autorizado()
+    if error:
+        return error
+    valores, mensaje = _leer_campos(request.get_json(silent=True) or {}, ['estado'])
+    if mensaje:
+        return jsonify({'error': mensaje}), 400
+    if not actualizar_estado_fecha_critica(fecha_id, *valores):
+        return jsonify({'error': 'Fecha crítica no encontrada'}), 404
+    return jsonify({'id': fecha_id, 'estado': valores[0]})
+
+@app.route('/oportunidades', methods=['POST'])
+def crear_oportunidad_admin():
+    error = _no_autorizado()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    valores, mensaje = _leer_campos(data, ['empresa_id', 'descripcion', 'fecha_inicio', 'fecha_fin'])
+    if mensaje:
+        return jsonify({'error': mensaje}), 400
+    if valores[2] > valores[3]:
+        return jsonify({'error': 'fecha_inicio no puede ser posterior a fecha_fin'}), 400
+    oportunidad_id = crear_oportunidad_practica(*valores)
+    if oportunidad_id is None:
+        return jsonify({'error': 'No se pudo crear la oportunidad'}), 503
+    return jsonify({'id': oportunidad_id}), 201
+
+@app.route('/oportunidades/<int:oportunidad_id>', methods=['PATCH'])
+def actualizar_oportunidad_admin(oportunidad_id):
+    error = _no_autorizado()
+    if error:
+        return error
+    valores, mensaje = _leer_campos(request.get_json(silent=True) or {}, ['estado'])
+    if mensaje:
+        return jsonify({'error': mensaje}), 400
+    if not actualizar_estado_oportunidad(oportunidad_id, *valores):
+        return jsonify({'error': 'Oportunidad no encontrada'}), 404
+    return jsonify({'id': oportunidad_id, 'estado': valores[0]})
 
 
 @app.route('/solicitar_carta', methods=['POST'])
@@ -36,6 +141,105 @@ def solicitar_carta():
     registrar_solicitud_carta(estudiante_id, empresa_id, fecha_solicitud)
     return jsonify({"mensaje": "Solicitud de carta registrada con éxito."})
 
+# Generación de cartas en segundo plano: responde 202 con el id del trabajo,
+# que se consulta en /cartas/trabajos/<id> hasta que su estado sea 'lista' o 'error'
+@app.route('/cartas', methods=['POST'])
+def encolar_carta():
+    data = request.get_json(silent=True) or {}
+    estudiante_data = data.get('estudiante') or {}
+    empresa_data = data.get('empresa') or {}
+    tipo = data.get('tipo') or 'presentacion'
+    if tipo not in tipos_carta():
+        return jsonify({'error': f"Tipo de carta desconocido: {tipo}", 'tipos': tipos_carta()}), 400
+    # Los campos requeridos los define la plantilla de la carta (plantillas_cartas/<tipo>.json)
+    faltantes = [campo if grupo == 'estudiante' else f"{grupo}.{campo}"
+                 for grupo, campo in campos_faltantes(obtener_definicion(tipo), estudiante_data, empresa_data)]
+    if not estudiante_data.get('codigo') and 'codigo' not in faltantes:
+        faltantes.insert(0, 'codigo')
+    if not empresa_data.get('nombre') and 'empresa.nombre' not in faltantes:
+        faltantes.append('empresa.nombre')
+    if faltantes:
+        return jsonify({'error': f"Faltan campos: {', '.join(faltantes)}"}), 400
+
+    estudiante_id = obtener_estudiante_id(estudiante_data['codigo'])
+    if estudiante_id is None:
+        return jsonify({'error': 'Estudiante no encontrado'}), 404
+    empresa_id = obtener_empresa_id(empresa_data['nombre'])
+    if empresa_id is None:
+        # Sin sufijo ('Inversiones Lima') puede coincidir con varias: se pide el nombre completo
+        candidatas = [empresa for empresa in buscar_empresas(empresa_data['nombre']) if empresa['similitud'] == 1]
+        if len(candidatas) > 1:
+            return jsonify({'error': 'Hay varias empresas con ese nombre',
+                            'empresas': [empresa['nombre'] for empresa in candidatas]}), 409
+        return jsonify({'error': 'Empresa no encontrada'}), 404
+
+    fecha_solicitud = data.get('fecha_solicitud') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        resultado = solicitar_carta(estudiante_id, empresa_id, fecha_solicitud, estudiante_data, empresa_data, tipo=tipo)
+    except ColaLlenaError as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '30'}
+
+    if resultado['estado'] == 'duplicada':
+        return jsonify({'estado': 'duplicada', 'solicitud_id': resultado['solicitud_id'], 'ruta_pdf': resultado['ruta_pdf']})
+    if resultado['estado'] == 'en_curso':
+        # La está generando otro proceso: se puede volver a pedir o descargar más tarde
+        return jsonify({'estado': 'en_curso', 'solicitud_id': resultado['solicitud_id']}), 409, {'Retry-After': '30'}
+    if resultado['estado'] == 'error':
+        return jsonify({'error': 'No se pudo registrar la solicitud'}), 503
+    trabajo = resultado['trabajo']
+    return jsonify({
+        'estado': 'encolada',
+        'solicitud_id': resultado['solicitud_id'],
+        'trabajo': trabajo.id,
+        'url': f"/cartas/trabajos/{trabajo.id}"
+    }), 202
+
+@app.route('/cartas/trabajos/<trabajo_id>', methods=['GET'])
+def obtener_trabajo_carta(trabajo_id):
+    trabajo = consultar_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(trabajo)
+
+# Exportación de solicitudes de carta: ?formato=csv|ndjson&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+# La respuesta se envía por bloques mientras se leen las filas de la base de datos
+@app.route('/exportar/solicitudes', methods=['GET'])
+def exportar_solicitudes():
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return jsonify({'error': f"Formato no soportado: {formato}"}), 400
+    try:
+        desde = request.args.get('desde')
+        hasta = request.args.get('hasta')
+        desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else None
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else None
+    except ValueError:
+        return jsonify({'error': 'Las fechas deben tener el formato AAAA-MM-DD'}), 400
+
+    filas = exportar_solicitudes_carta(desde, hasta)
+    if filas is None:
+        return jsonify({'error': 'No se pudo consultar la base de datos'}), 503
+    bloques = exportar(formato, COLUMNAS_EXPORTACION, filas)
+    return Response(
+        stream_with_context(bloques),
+        mimetype=FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename=solicitudes_carta.{formato}'}
+    )
+
+# Estado del pool, cachés, tiempos por función, sentencias preparadas, réplicas, índice de empresas y cola de cartas
+@app.route('/estadisticas', methods=['GET'])
+def obtener_estadisticas():
+    return jsonify({
+        'pool': obtener_estadisticas_pool(),
+        'cache': obtener_estadisticas_cache(),
+        'cache_estudiantes': obtener_estadisticas_cache_estudiantes(),
+        'consultas': obtener_metricas_consultas(),
+        'sentencias': obtener_estadisticas_sentencias(),
+        'replicas': obtener_estadisticas_replicas(),
+        'indice_empresas': obtener_estadisticas_indice_empresas(),
+        'render': obtener_estadisticas_render()
+    })
+
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la generación de cartas
+
+Mide, sobre un conjunto fijo de cartas (nombres de empresa largos, texto con
+tildes y eñes, con y sin gerente_general, direcciones que ocupan varias líneas):
+
+- latencia de generar_carta_presentacion / generar_carta_estudiante (p50, p99)
+- memoria asignada por carta (pico de tracemalloc) y tamaño de los PDF
+- cartas por segundo con N procesos (cartas_masivas.generar_lote)
+- RSS máximo del proceso y de los procesos del pool
+
+Las cartas se escriben en un directorio temporal y cada una tiene un código
+distinto, así nunca se reutiliza una carta de la caché. Los resultados se
+pueden guardar en JSON (--json) y comparar con un resultado anterior (--base):
+si alguna métrica empeora más que --tolerancia el programa termina con código 2.
+
+"--comparar" mide en cambio el tiempo de CPU por carta con una PlantillaCarta
+nueva por carta (lo que hacían antes generar_carta_presentacion y
+generar_carta_estudiante), con la plantilla compartida y sobre el membrete.
+
+Uso:
+    python benchmark_cartas.py
+    python benchmark_cartas.py --cartas 500 --procesos 1 4 --json base.json
+    python benchmark_cartas.py --base base.json --tolerancia 0.15
+    python benchmark_cartas.py --comparar --tipo estudiante
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import reportlab
+from reportlab import rl_config
+
+from carta_generator import PlantillaCarta, obtener_plantilla, generar_carta_presentacion, generar_carta_estudiante
+
+# Versión del formato del JSON de resultados
+VERSION_RESULTADOS = 1
+
+FECHA_CARTAS = "1 de marzo de 2025"
+
+ESTUDIANTE_EJEMPLO = {
+    'codigo': '20210001',
+    'dni': '12345678',
+    'nombres': 'Juan Carlos',
+    'apellidos': 'Pérez García',
+    'carrera': 'Ingeniería de Sistemas',
+    'ciclo': '8vo'
+}
+
+EMPRESA_EJEMPLO = {
+    'nombre': 'Tech Solutions S.A.C.',
+    'ruc': '20123456789',
+    'direccion': 'Av. Arequipa 123, Lima',
+    'gerente_general': 'Dr. Juan Pérez',
+}
+
+# (nombre, estudiante, empresa); se recorren en orden, siempre los mismos
+CORPUS = [
+    ('ejemplo', ESTUDIANTE_EJEMPLO, EMPRESA_EJEMPLO),
+    ('sin_gerente', ESTUDIANTE_EJEMPLO, dict(EMPRESA_EJEMPLO, gerente_general=None)),
+    ('empresa_larga', ESTUDIANTE_EJEMPLO, dict(
+        EMPRESA_EJEMPLO,
+        nombre='Corporación Internacional de Servicios Tecnológicos, Consultoría Empresarial '
+               'y Soluciones Integrales para la Industria del Perú S.A.C.'
+    )),
+    ('tildes', dict(
+        ESTUDIANTE_EJEMPLO, nombres='María José', apellidos='Ñañez Gutiérrez', ciclo='10mo',
+        carrera='Ingeniería Electrónica y de Telecomunicaciones'
+    ), {
+        'nombre': 'Compañía Peruana de Ingeniería y Diseño Ñandú S.R.L.',
+        'ruc': '20601234567',
+        'direccion': 'Jr. Ayacucho 1045, Pueblo Libre, Lima',
+        'gerente_general': 'Ing. Sofía Ramírez Núñez',
+    }),
+    ('direccion_larga', ESTUDIANTE_EJEMPLO, dict(
+        EMPRESA_EJEMPLO, gerente_general=None,
+        direccion='Av. Javier Prado Este 4200, Centro Empresarial Chacarilla, Torre B, Oficina 1204, '
+                  'Urbanización Monterrico Chico, Santiago de Surco, Lima'
+    )),
+]
+
+GENERADORES = {
+    'presentacion': generar_carta_presentacion,
+    'estudiante': generar_carta_estudiante,
+}
+
+# Métricas en las que un valor mayor es mejor; en el resto, menor es mejor
+METRICAS_MAYOR_ES_MEJOR = ('cartas_por_segundo',)
+
+def _carta(numero, prefijo='B'):
+    """(nombre del caso, estudiante, empresa) de la carta `numero`, con un código único"""
+    caso, estudiante, empresa = CORPUS[numero % len(CORPUS)]
+    return caso, dict(estudiante, codigo=f"{prefijo}{numero:06d}"), empresa
+
+def percentil(valores, fraccion):
+    """Percentil por rango más cercano de una lista no vacía"""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(fraccion * len(ordenados)) - 1)]
+
+def medir_latencia(tipo, cartas):
+    """
+    Returns:
+        dict: Latencias (ms) y tamaños de los PDF (bytes) de `cartas` cartas de `tipo`
+    """
+    generar = GENERADORES[tipo]
+    tiempos, tamanos = [], []
+    for numero in range(cartas):
+        _, estudiante, empresa = _carta(numero, prefijo=f"L{tipo[0]}")
+        inicio = time.perf_counter()
+        ruta = generar(estudiante, empresa, FECHA_CARTAS)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        tamanos.append(os.path.getsize(ruta))
+    return {
+        'latencia_p50_ms': percentil(tiempos, 0.50),
+        'latencia_p99_ms': percentil(tiempos, 0.99),
+        'latencia_media_ms': sum(tiempos) / len(tiempos),
+        'tamano_medio_bytes': sum(tamanos) / len(tamanos),
+        'tamano_max_bytes': max(tamanos),
+    }
+
+def medir_memoria(tipo, cartas):
+    """
+    Returns:
+        dict: Pico de memoria asignada por carta (KB, media y máximo) según tracemalloc
+    """
+    generar = GENERADORES[tipo]
+    picos = []
+    tracemalloc.start()
+    try:
+        for numero in range(cartas):
+            _, estudiante, empresa = _carta(numero, prefijo=f"M{tipo[0]}")
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            generar(estudiante, empresa, FECHA_CARTAS)
+            picos.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+    finally:
+        tracemalloc.stop()
+    return {'memoria_pico_media_kb': sum(picos) / len(picos), 'memoria_pico_max_kb': max(picos)}
+
+def medir_lote(cartas, procesos):
+    """
+    Returns:
+        dict: Cartas por segundo generando `cartas` cartas de presentación con `procesos` procesos
+    """
+    from cartas_masivas import generar_lote
+    tareas = []
+    for numero in range(cartas):
+        _, estudiante, empresa = _carta(numero, prefijo=f"T{procesos}x")
+        tareas.append({'estudiante': estudiante, 'empresa': empresa})
+    inicio = time.monotonic()
+    resultados = generar_lote(tareas, procesos, FECHA_CARTAS)
+    transcurrido = time.monotonic() - inicio
+    fallidas = sum(1 for _, _, error in resultados if error)
+    return {'cartas_por_segundo': cartas / transcurrido, 'fallidas': fallidas}
+
+def _rss_max_mb(quien):
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    maximo = resource.getrusage(quien).ru_maxrss
+    return maximo / (1024 * 1024) if sys.platform == 'darwin' else maximo / 1024
+
+def ejecutar_suite(tipos, cartas, procesos, cartas_lote):
+    """
+    Ejecuta todas las mediciones en un directorio temporal
+
+    Returns:
+        dict: Resultado listo para guardar en JSON; las métricas van en 'metricas'
+        con nombres como 'presentacion.latencia_p99_ms' o 'lote_4_procesos.cartas_por_segundo'
+    """
+    metricas = {}
+    directorio_original = os.getcwd()
+    invariante_original = rl_config.invariant
+    with tempfile.TemporaryDirectory(prefix='benchmark_cartas_') as directorio:
+        os.chdir(directorio)
+        # PDF sin fecha ni identificador aleatorio: el tamaño es el mismo en cada ejecución
+        rl_config.invariant = 1
+        try:
+            for tipo in tipos:
+                # Calentamiento: fuentes, imports perezosos de ReportLab, plantilla y membretes
+                for numero in range(len(CORPUS)):
+                    _, estudiante, empresa = _carta(numero, prefijo=f"W{tipo[0]}")
+                    GENERADORES[tipo](estudiante, empresa, FECHA_CARTAS)
+                print(f"⏱️  Latencia '{tipo}' ({cartas} cartas)...")
+                for nombre, valor in medir_latencia(tipo, cartas).items():
+                    metricas[f"{tipo}.{nombre}"] = valor
+                for nombre, valor in medir_memoria(tipo, max(5, cartas // 10)).items():
+                    metricas[f"{tipo}.{nombre}"] = valor
+            metricas['proceso.rss_max_mb'] = _rss_max_mb(resource.RUSAGE_SELF)
+
+            for cantidad in procesos:
+                print(f"🚀 Lote de {cartas_lote} cartas con {cantidad} proceso(s)...")
+                for nombre, valor in medir_lote(cartas_lote, cantidad).items():
+                    metricas[f"lote_{cantidad}_procesos.{nombre}"] = valor
+            if procesos:
+                metricas['procesos_pool.rss_max_mb'] = _rss_max_mb(resource.RUSAGE_CHILDREN)
+        finally:
+            rl_config.invariant = invariante_original
+            os.chdir(directorio_original)
+
+    return {
+        'version': VERSION_RESULTADOS,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(),
+            'reportlab': reportlab.Version,
+            'plataforma': platform.platform(),
+            'nucleos': os.cpu_count(),
+        },
+        'parametros': {'tipos': list(tipos), 'cartas': cartas, 'procesos': list(procesos),
+                       'cartas_lote': cartas_lote, 'corpus': [caso for caso, _, _ in CORPUS]},
+        'metricas': metricas,
+    }
+
+def comparar_con_base(metricas, base, tolerancia):
+    """
+    Compara las métricas con las de una ejecución anterior
+
+    Args:
+        metricas: Diccionario nombre -> valor de esta ejecución
+        base: Diccionario nombre -> valor de la ejecución de referencia
+        tolerancia: Fracción que se permite empeorar (0.2 = 20 %)
+
+    Returns:
+        list: (nombre, valor_base, valor, cambio) de las métricas que empeoraron
+        más que la tolerancia; `cambio` es la fracción en que empeoraron
+    """
+    regresiones = []
+    for nombre, valor_base in base.items():
+        valor = metricas.get(nombre)
+        if valor is None or not valor_base or nombre.endswith('.fallidas'):
+            continue
+        if nombre.endswith(METRICAS_MAYOR_ES_MEJOR):
+            cambio = (valor_base - valor) / valor_base
+        else:
+            cambio = (valor - valor_base) / valor_base
+        if cambio > tolerancia:
+            regresiones.append((nombre, valor_base, valor, cambio))
+    return regresiones
+
+def medir(cartas, tipo, compartida, renderizar, membrete=False):
+    """
+    Returns:
+        float: Milisegundos de CPU por carta
+    """
+    inicio = time.process_time()
+    for numero in range(cartas):
+        plantilla = obtener_plantilla() if compartida else PlantillaCarta()
+        _, estudiante, empresa = _carta(numero)
+        if tipo == 'estudiante':
+            story = plantilla.historia_estudiante(estudiante, empresa, FECHA_CARTAS)
+        else:
+            story = plantilla.historia_presentacion(estudiante, empresa, FECHA_CARTAS)
+        destino = io.BytesIO()
+        if membrete and plantilla.construir_con_membrete(tipo, story, destino):
+            continue
+        if renderizar:
+            plantilla.construir(story, destino)
+    return (time.process_time() - inicio) * 1000 / cartas
+
+def comparar_plantillas(cartas, tipo):
+    """Tabla de ms de CPU por carta sin plantilla compartida, con ella y sobre el membrete"""
+    # Calentamiento: fuentes, imports perezosos de ReportLab, la plantilla compartida y los membretes
+    medir(len(CORPUS), tipo, True, True, membrete=True)
+
+    print(f"{cartas} cartas de tipo '{tipo}' (ms de CPU por carta)")
+    print(f"{'fase':<12}{'sin plantilla':>16}{'con plantilla':>16}{'ahorro':>10}")
+    for fase, renderizar in (('historia', False), ('pdf', True)):
+        sin_plantilla = medir(cartas, tipo, False, renderizar)
+        con_plantilla = medir(cartas, tipo, True, renderizar)
+        ahorro = (1 - con_plantilla / sin_plantilla) * 100 if sin_plantilla else 0.0
+        print(f"{fase:<12}{sin_plantilla:>16.3f}{con_plantilla:>16.3f}{ahorro:>9.1f}%")
+    con_membrete = medir(cartas, tipo, True, True, membrete=True)
+    print(f"\nmembrete: {con_membrete:.3f} ms por carta ({con_plantilla / con_membrete:.1f}x respecto a pdf con plantilla, "
+          f"{1000 / con_membrete:.0f} cartas/s por núcleo)")
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Mide latencia, memoria, tamaño y rendimiento de la generación de cartas")
+    parser.add_argument('--cartas', type=int, default=200, help="cartas por medición de latencia (default: 200)")
+    parser.add_argument('--tipo', choices=['presentacion', 'estudiante'], default=None,
+                        help="solo este tipo de carta (default: ambos; con --comparar, presentacion)")
+    parser.add_argument('--procesos', type=int, nargs='*', default=None,
+                        help="cantidades de procesos a medir con un lote (default: 1 y los núcleos; sin valores: ninguna)")
+    parser.add_argument('--lote', type=int, default=200, help="cartas por lote paralelo (default: 200)")
+    parser.add_argument('--json', default=None, help="guarda los resultados en este archivo")
+    parser.add_argument('--base', default=None, help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument('--tolerancia', type=float, default=0.20,
+                        help="fracción que puede empeorar una métrica respecto a --base (default: 0.20)")
+    parser.add_argument('--comparar', action='store_true',
+                        help="compara el costo por carta con y sin plantilla compartida y con membrete")
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar_plantillas(args.cartas, args.tipo or 'presentacion')
+        return 0
+
+    base = None
+    if args.base:
+        try:
+            with open(args.base, encoding='utf-8') as archivo:
+                base = json.load(archivo)['metricas']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Error: No se pudo leer {args.base}: {e}", file=sys.stderr)
+            return 1
+
+    tipos = [args.tipo] if args.tipo else list(GENERADORES)
+    procesos = args.procesos if args.procesos is not None else sorted({1, os.cpu_count() or 1})
+    resultado = ejecutar_suite(tipos, args.cartas, procesos, args.lote)
+
+    print(f"\n{'métrica':<45}{'valor':>14}{'base':>14}")
+    for nombre, valor in resultado['metricas'].items():
+        referencia = f"{base[nombre]:>14.2f}" if base and nombre in base else ''
+        print(f"{nombre:<45}{valor:>14.2f}{referencia}")
+
+    if args.json:
+        directorio = os.path.dirname(args.json)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+    if any(valor for nombre, valor in resultado['metricas'].items() if nombre.endswith('.fallidas')):
+        print("❌ Algunas cartas del lote fallaron", file=sys.stderr)
+        return 1
+
+    if base is not None:
+        regresiones = comparar_con_base(resultado['metricas'], base, args.tolerancia)
+        for nombre, valor_base, valor, cambio in regresiones:
+            print(f"❌ {nombre}: {valor_base:.2f} -> {valor:.2f} ({cambio * 100:+.1f}%)", file=sys.stderr)
+        if regresiones:
+            return 2
+        print(f"✅ Sin regresiones respecto a {args.base} (tolerancia {args.tolerancia * 100:.0f}%)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
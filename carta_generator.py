@@ -1,165 +1,485 @@
 #!/usr/bin/env python3
 """
 Generador de Cartas de Presentación para Prácticas Pre Profesionales
+
+Cada tipo de carta es una plantilla en JSON de plantillas_cartas/ (ver
+services/plantillas_cartas.py). PlantillaCarta las compila una sola vez por
+proceso: los estilos y los párrafos fijos (encabezado de la universidad,
+cuerpo, firma y datos de contacto) se crean al inicio y por cada carta solo se
+crean los párrafos con los datos del estudiante y de la empresa.
+
+Además, la primera carta de cada forma (tipo y alto de cada campo) se maqueta
+con los campos reemplazados por ranuras y lo fijo queda dibujado como membrete
+(Membrete); las siguientes solo maquetan sus campos y los dibujan encima. Si un
+campo no encaja (tendría que partirse entre páginas) se usa Platypus completo.
+
+Los PDF se guardan en static/cartas/ con un nombre que incluye el hash de sus
+datos (services/cache_cartas.py): pedir de nuevo la misma carta el mismo día
+devuelve el archivo ya generado. Se reparten en subcarpetas por hash y se
+anotan en un manifiesto (services/almacen_cartas.py) que mantener_cartas.py usa
+para archivar o eliminar las cartas vencidas. Con Config.SAVE_LOCAL = False la carta se
+genera en memoria y los bytes se suben directo a S3 (y se entregan a quien la
+pidió), sin pasar por el disco; si el objeto con ese nombre ya está en S3 se
+reutiliza sin volver a generarlo.
 """
 
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab import rl_config
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Flowable
+from reportlab.platypus.doctemplate import LayoutError
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
 from datetime import datetime
+import copy
+import io
 import os
-from services.database_service import consultar_cartas_generadas, existe_carta_para_estudiante_y_empresa
-from telegram import Update
-from telegram.ext import CallbackContext
+import threading
 
-def generar_carta_presentacion(estudiante_data, empresa_data, fecha_actual=None):
+from config import Config
+from services.cache_cartas import CacheArchivos, clave_contenido, normalizar_valor
+from services.almacen_cartas import ManifiestoCartas
+from services.plantillas_cartas import (
+    PlantillaInvalidaError, obtener_registro, recorrer_bloques, campos_del_texto, valores_carta
+)
+from services.s3_service import es_ruta_s3, ruta_s3, existe_s3, subir_bytes_s3, descargar_bytes_s3, eliminar_s3
+
+# Subir cuando cambie la forma de dibujar las cartas; los cambios en plantillas_cartas/ ya cambian
+# la clave de cada carta (huella de la plantilla), así no se sirven cartas con la plantilla anterior
+VERSION_PLANTILLA = 1
+
+# Ancho del texto en SimpleDocTemplate(pagesize=A4): márgenes de 1 pulgada y 6 puntos de padding del marco
+ANCHO_TEXTO = A4[0] - 2 * inch - 12
+
+# Membretes distintos (tipo de carta y alto de cada campo) que se preparan por proceso
+MEMBRETES_MAX = 64
+
+class _Ranura(Flowable):
+    """Ocupa el lugar de un campo al maquetar el membrete y anota dónde quedó"""
+
+    def __init__(self, parrafo, posiciones):
+        Flowable.__init__(self)
+        self.campo = parrafo.campo
+        self.estilo = parrafo.style
+        self.alto = parrafo.height
+        self.posiciones = posiciones
+        self.partida = False
+
+    def wrap(self, ancho, alto):
+        self.width, self.height = ancho, self.alto
+        return self.width, self.height
+
+    def getSpaceBefore(self):
+        return self.estilo.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.estilo.spaceAfter
+
+    def split(self, ancho, alto):
+        # Un párrafo de varias líneas se partiría entre dos páginas: eso no se puede repetir sobre el membrete
+        self.partida = self.alto > self.estilo.leading
+        return []
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self.posiciones.append((self.campo, canvas.getPageNumber(), x, y, _sW, self.width))
+
+class _LienzoMembrete(Canvas):
+    """Canvas que guarda las operaciones PDF de cada página al maquetar el membrete"""
+
+    def __init__(self, *args, **kwargs):
+        Canvas.__init__(self, *args, **kwargs)
+        self.paginas = []
+
+    def showPage(self):
+        self.paginas.append('\n'.join([self._preamble] + self._code))
+        Canvas.showPage(self)
+
+    def fuentes(self):
+        """Fuentes en el orden en que se registraron (define sus nombres internos /F1, /F2...)"""
+        return list(self._doc.fontMapping)
+
+def _codificar_flujo(operaciones):
+    """Aplica una sola vez los filtros que ReportLab aplicaría al guardar el flujo en cada PDF"""
+    filtros = [pdfdoc.PDFBase85Encode, pdfdoc.PDFZCompress] if rl_config.useA85 else [pdfdoc.PDFZCompress]
+    contenido = pdfdoc.pdfdocEnc(operaciones)
+    for filtro in reversed(filtros):
+        contenido = filtro.encode(contenido)
+    return contenido, pdfdoc.PDFArray([pdfdoc.PDFName(filtro.pdfname) for filtro in filtros])
+
+class Membrete:
     """
-    Genera una carta de presentación en PDF y la guarda en static/cartas/
-    
+    Partes fijas de una carta ya dibujadas, listas para poner los campos encima
+
+    Las operaciones de cada página fija se capturan al maquetar y se comprimen
+    una sola vez; en cada carta se incluyen tal cual como un Form XObject y los
+    campos se dibujan en las posiciones que Platypus les asignó, así el
+    resultado es igual al de PlantillaCarta.construir().
+    """
+
+    def __init__(self, paginas, fuentes, posiciones):
+        self.flujos = [_codificar_flujo(operaciones) for operaciones in paginas]
+        self.fuentes = fuentes
+        self.posiciones = posiciones
+
+    def dibujar(self, parrafos, destino):
+        """
+        Args:
+            parrafos: Diccionario campo -> Paragraph ya maquetado con ANCHO_TEXTO
+            destino: Ruta o archivo abierto en modo binario
+        """
+        lienzo = Canvas(destino, pagesize=A4)
+        documento = lienzo._doc
+        # Mismo orden de registro que al maquetar, para que /F1, /F2... apunten a las mismas fuentes
+        for fuente in self.fuentes:
+            documento.getInternalFontName(fuente)
+        for numero, (contenido, filtros) in enumerate(self.flujos, 1):
+            formulario = pdfdoc.PDFFormXObject(0, 0, *A4)
+            # Con Filter ya presente ReportLab escribe el contenido sin volver a comprimirlo
+            formulario.Contents = pdfdoc.PDFStream(pdfdoc.PDFDictionary({'Filter': filtros}), contenido)
+            documento.addForm(f"membrete{numero}", formulario)
+
+            lienzo.doForm(f"membrete{numero}")
+            for campo, pagina, x, y, sobrante, _ in self.posiciones:
+                if pagina == numero:
+                    parrafos[campo].drawOn(lienzo, x, y, _sW=sobrante)
+            lienzo.showPage()
+        lienzo.save()
+
+    @classmethod
+    def preparar(cls, story):
+        """
+        Maqueta una vez la carta con ranuras en lugar de los campos
+
+        Returns:
+            Membrete: O None si algún campo no se puede poner sobre el membrete
+        """
+        posiciones = []
+        ranuras = [_Ranura(f, posiciones) if getattr(f, 'campo', None) else f for f in story]
+        # build() vacía la lista que recibe
+        campos = [f for f in ranuras if isinstance(f, _Ranura)]
+        lienzos = []
+
+        def crear_lienzo(*args, **kwargs):
+            lienzos.append(_LienzoMembrete(*args, **kwargs))
+            return lienzos[-1]
+
+        try:
+            SimpleDocTemplate(io.BytesIO(), pagesize=A4).build(ranuras, canvasmaker=crear_lienzo)
+        except LayoutError:
+            return None
+        if (any(f.partida for f in campos) or len(posiciones) != len(campos)
+                or any(abs(ancho - ANCHO_TEXTO) > 0.01 for *_, ancho in posiciones)):
+            return None
+        return cls(lienzos[-1].paginas, lienzos[-1].fuentes(), posiciones)
+
+ALINEACIONES = {'izquierda': TA_LEFT, 'centro': TA_CENTER, 'derecha': TA_RIGHT, 'justificado': TA_JUSTIFY}
+
+def _crear_estilo(nombre, propiedades, base):
+    """ParagraphStyle a partir de un estilo de plantillas_cartas/ (ver services/plantillas_cartas.py)"""
+    propiedades = dict(propiedades)
+    padre = propiedades.pop('padre', 'Normal')
+    if padre not in base:
+        raise PlantillaInvalidaError(f"Estilo {nombre}: padre desconocido {padre!r}")
+    if 'alignment' in propiedades:
+        if propiedades['alignment'] not in ALINEACIONES:
+            raise PlantillaInvalidaError(f"Estilo {nombre}: alineación {propiedades['alignment']!r} "
+                                         f"(se admiten {', '.join(ALINEACIONES)})")
+        propiedades['alignment'] = ALINEACIONES[propiedades['alignment']]
+    if 'textColor' in propiedades:
+        color = propiedades['textColor']
+        try:
+            propiedades['textColor'] = colors.HexColor(color) if color.startswith('#') else getattr(colors, color)
+        except (AttributeError, ValueError):
+            raise PlantillaInvalidaError(f"Estilo {nombre}: color desconocido {color!r}")
+    return ParagraphStyle(nombre, parent=base[padre], **propiedades)
+
+class PlantillaCarta:
+    """
+    Motor de las cartas: las plantillas de plantillas_cartas/ ya compiladas
+
+    Los estilos y los párrafos sin datos se crean una sola vez; cada plantilla
+    queda como una lista de instrucciones ('fijo', flowable) o ('campo', nombre,
+    texto, estilo, si) que historia() recorre para cada carta. Los párrafos fijos
+    se copian (copia superficial) al armar cada carta porque ReportLab guarda en
+    el párrafo el ancho y las líneas calculadas al maquetar; la copia comparte
+    los fragmentos de texto ya interpretados.
+
+    Args:
+        registro: Resultado de services.plantillas_cartas.cargar_registro
+            (por defecto, el de Config.CARTAS_PLANTILLAS)
+    """
+
+    def __init__(self, registro=None):
+        self.registro = registro or obtener_registro()
+        base = getSampleStyleSheet()
+        self.estilos = {nombre: _crear_estilo(nombre, propiedades, base)
+                        for nombre, propiedades in self.registro['estilos'].items()}
+
+        # Un bloque fijo compartido por varias plantillas se interpreta una sola vez
+        self._fijos = {}
+        self.fragmentos = {}
+        for nombre, bloques in self.registro['fragmentos'].items():
+            instrucciones = self._compilar(bloques)
+            if all(instruccion[0] == 'fijo' for instruccion in instrucciones):
+                self.fragmentos[nombre] = [flowable for _, flowable in instrucciones]
+        self.programas = {tipo: self._compilar(definicion['bloques'])
+                          for tipo, definicion in self.registro['plantillas'].items()}
+
+        self._membretes = {}
+        self._membretes_lock = threading.Lock()
+
+    def _compilar(self, bloques):
+        instrucciones = []
+        for bloque in recorrer_bloques(bloques, self.registro['fragmentos']):
+            if 'espacio' in bloque:
+                if id(bloque) not in self._fijos:
+                    self._fijos[id(bloque)] = Spacer(1, bloque['espacio'])
+                instrucciones.append(('fijo', self._fijos[id(bloque)]))
+                continue
+            estilo = self.estilos[bloque.get('estilo', 'normal')]
+            if 'si' in bloque or campos_del_texto(bloque['texto']):
+                si = tuple(bloque['si'].split('.', 1)) if 'si' in bloque else None
+                # El nombre identifica al campo dentro de la carta (ver construir_con_membrete)
+                instrucciones.append(('campo', f"campo{len(instrucciones)}", bloque['texto'], estilo, si))
+                continue
+            if id(bloque) not in self._fijos:
+                self._fijos[id(bloque)] = Paragraph(bloque['texto'], estilo)
+            instrucciones.append(('fijo', self._fijos[id(bloque)]))
+        return instrucciones
+
+    def definicion(self, tipo):
+        """
+        Raises:
+            ValueError: Si no hay una plantilla para `tipo`
+        """
+        plantillas = self.registro['plantillas']
+        if tipo not in plantillas:
+            raise ValueError(f"Tipo de carta desconocido: {tipo} (hay: {', '.join(sorted(plantillas))})")
+        return plantillas[tipo]
+
+    def fragmento(self, nombre):
+        """Copias de los flowables de un fragmento fijo, listas para agregar a una historia"""
+        return [copy.copy(flowable) for flowable in self.fragmentos[nombre]]
+
+    @staticmethod
+    def _campo(nombre, texto, estilo):
+        """Párrafo con datos de la carta; `campo` lo identifica para dibujarlo sobre el membrete"""
+        parrafo = Paragraph(texto, estilo)
+        parrafo.campo = nombre
+        return parrafo
+
+    def historia(self, tipo, estudiante_data, empresa_data, fecha_actual):
+        """
+        Flowables de una carta
+
+        Raises:
+            DatosCartaError: Si faltan datos requeridos por la plantilla
+            ValueError: Si no hay una plantilla para `tipo`
+        """
+        valores = valores_carta(self.definicion(tipo), estudiante_data, empresa_data, fecha_actual)
+        story = []
+        for instruccion in self.programas[tipo]:
+            if instruccion[0] == 'fijo':
+                story.append(copy.copy(instruccion[1]))
+                continue
+            _, nombre, texto, estilo, si = instruccion
+            if si is None or valores[si[0]][si[1]]:
+                story.append(self._campo(nombre, texto.format_map(valores), estilo))
+        return story
+
+    def historia_presentacion(self, estudiante_data, empresa_data, fecha_actual):
+        """Flowables de la carta que presenta la universidad"""
+        return self.historia('presentacion', estudiante_data, empresa_data, fecha_actual)
+
+    def historia_estudiante(self, estudiante_data, empresa_data, fecha_actual):
+        """Flowables de la carta escrita por el propio estudiante"""
+        return self.historia('estudiante', estudiante_data, empresa_data, fecha_actual)
+
+    @staticmethod
+    def construir(story, destino):
+        """Genera el PDF en `destino` (ruta o archivo abierto en modo binario)"""
+        doc = SimpleDocTemplate(destino, pagesize=A4)
+        doc.build(story)
+
+    def construir_con_membrete(self, tipo, story, destino):
+        """
+        Genera el PDF dibujando solo los campos sobre el membrete de la carta
+
+        El membrete (todo lo fijo, ya maquetado y dibujado) se prepara la primera
+        vez que aparece una carta de ese tipo con campos del mismo alto en líneas;
+        las siguientes solo maquetan sus campos.
+
+        Returns:
+            bool: False si la carta no encaja en un membrete (un campo se
+            partiría entre páginas o ya hay MEMBRETES_MAX preparados); en ese
+            caso no se escribió nada y hay que usar construir()
+        """
+        parrafos = {}
+        for flowable in story:
+            if getattr(flowable, 'campo', None):
+                flowable.wrap(ANCHO_TEXTO, A4[1])
+                parrafos[flowable.campo] = flowable
+        clave = (tipo,) + tuple((campo, parrafo.height) for campo, parrafo in parrafos.items())
+
+        with self._membretes_lock:
+            if clave in self._membretes:
+                membrete = self._membretes[clave]
+            elif len(self._membretes) < MEMBRETES_MAX:
+                membrete = self._membretes[clave] = Membrete.preparar(story)
+            else:
+                membrete = None
+        if membrete is None:
+            return False
+        membrete.dibujar(parrafos, destino)
+        return True
+
+_plantilla = None
+_plantilla_lock = threading.Lock()
+
+def obtener_plantilla():
+    """Plantilla compartida del proceso; se prepara en el primer uso"""
+    global _plantilla
+    if _plantilla is None:
+        with _plantilla_lock:
+            if _plantilla is None:
+                _plantilla = PlantillaCarta()
+    return _plantilla
+
+_cache = None
+
+def obtener_cache_cartas():
+    global _cache
+    if _cache is None:
+        with _plantilla_lock:
+            if _cache is None:
+                _cache = CacheArchivos(
+                    os.path.join('static', 'cartas'),
+                    max_bytes=Config.CARTAS_CACHE_MAX_MB * 1024 * 1024,
+                    max_edad=Config.CARTAS_CACHE_MAX_DIAS * 86400,
+                    intervalo_limpieza=Config.CARTAS_CACHE_LIMPIEZA,
+                    niveles=Config.CARTAS_NIVELES,
+                    manifiesto=ManifiestoCartas(Config.CARTAS_MANIFIESTO) if Config.CARTAS_MANIFIESTO else None
+                )
+    return _cache
+
+def asociar_carta(solicitud_id, ruta_pdf):
+    """Anota en el manifiesto el PDF local de una solicitud (las cartas en S3 no se anotan)"""
+    asociar_cartas([(solicitud_id, ruta_pdf)])
+
+def asociar_cartas(solicitudes):
+    """Como asociar_carta, para una lista de (solicitud_id, ruta_pdf) en una sola escritura"""
+    manifiesto = obtener_cache_cartas().manifiesto
+    locales = [(solicitud_id, ruta_pdf) for solicitud_id, ruta_pdf in solicitudes
+               if ruta_pdf and not es_ruta_s3(ruta_pdf)]
+    if manifiesto is not None and locales:
+        manifiesto.asociar_varias(locales)
+
+def clave_carta(tipo, estudiante_data, empresa_data, fecha_actual):
+    """sha256 de los datos normalizados que determinan el contenido de la carta"""
+    definicion = obtener_plantilla().definicion(tipo)
+    datos = {}
+    for grupo, valores in (('estudiante', estudiante_data), ('empresa', empresa_data)):
+        requeridos, opcionales = definicion['campos'][grupo]
+        datos[grupo] = {campo: normalizar_valor(valores.get(campo)) for campo in requeridos + opcionales}
+    return clave_contenido({
+        'tipo': tipo,
+        'version': VERSION_PLANTILLA,
+        'plantilla': definicion['huella'],
+        'fecha': normalizar_valor(fecha_actual),
+        **datos,
+    })
+
+def _nombre_archivo(tipo, estudiante_data, clave):
+    codigo = ''.join(c for c in normalizar_valor(estudiante_data['codigo']) if c.isalnum())
+    return f"carta_{tipo}_{codigo}_{clave[:24]}.pdf"
+
+def renderizar_carta(tipo, estudiante_data, empresa_data, fecha_actual):
+    """Genera el PDF en memoria; `tipo` es el nombre de una plantilla de plantillas_cartas/"""
+    plantilla = obtener_plantilla()
+    story = plantilla.historia(tipo, estudiante_data, empresa_data, fecha_actual)
+    buffer = io.BytesIO()
+    if not (Config.CARTAS_MEMBRETE and plantilla.construir_con_membrete(tipo, story, buffer)):
+        plantilla.construir(story, buffer)
+    return buffer.getvalue()
+
+def generar_carta(tipo, estudiante_data, empresa_data, fecha_actual=None):
+    """
+    Genera la carta y la guarda en static/cartas/ (Config.SAVE_LOCAL) o en S3
+
     Args:
+        tipo: Nombre de una plantilla de plantillas_cartas/ ('presentacion', 'estudiante'...)
         estudiante_data: Diccionario con datos del estudiante
         empresa_data: Diccionario con datos de la empresa
         fecha_actual: Fecha actual (opcional)
-    
+
     Returns:
-        str: Ruta del archivo PDF generado
+        tuple: (ruta_pdf, datos). `ruta_pdf` es una ruta local o s3://bucket/clave;
+        `datos` son los bytes del PDF recién generado, o None si se reutilizó
+        el archivo ya guardado (se leen con leer_carta)
     """
-    
     if fecha_actual is None:
         fecha_actual = datetime.now().strftime("%d de %B de %Y")
-    
-    # Crear carpeta si no existe
-    output_dir = os.path.join('static', 'cartas')
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Crear nombre del archivo
-    filename = f"carta_presentacion_{estudiante_data['codigo']}_{empresa_data['nombre'].replace(' ', '_')}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-    filepath = os.path.join(output_dir, filename)
-    
-    # Crear el documento
-    doc = SimpleDocTemplate(filepath, pagesize=A4)
-    story = []
-    
-    # Obtener estilos
-    styles = getSampleStyleSheet()
-    
-    # Estilos personalizados
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        alignment=TA_JUSTIFY,
-        leading=18
-    )
-    
-    signature_style = ParagraphStyle(
-        'Signature',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        leading=16
-    )
-    
-    # Encabezado de la universidad
-    story.append(Paragraph("UNIVERSIDAD PERUANA UNION", title_style))
-    story.append(Paragraph("FACULTAD DE INGENIERÍA DE SISTEMAS", title_style))
-    story.append(Paragraph("DEPARTAMENTO ACADÉMICO DE INGENIERÍA DE SISTEMAS", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Título del documento
-    story.append(Paragraph("CARTA DE PRESENTACIÓN", title_style))
-    story.append(Spacer(1, 30))
-    
-    # Fecha
-    story.append(Paragraph(f"Lima, {fecha_actual}", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # Datos de la empresa
-    story.append(Paragraph(f"<b>Señores:</b>", normal_style))
-    story.append(Paragraph(f"<b>{empresa_data['nombre']}</b>", normal_style))
-    story.append(Paragraph(f"<b>RUC: {empresa_data['ruc']}</b>", normal_style))
-    story.append(Paragraph(f"<b>Dirección: {empresa_data['direccion']}</b>", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # Gerente general
-    if empresa_data.get('gerente_general'):
-        story.append(Paragraph(f"<b>Atención: {empresa_data['gerente_general']} (Gerente General)</b>", normal_style))
-    
-    # Saludo
-    story.append(Paragraph("Estimados señores:", normal_style))
-    story.append(Spacer(1, 15))
-    
-    # Cuerpo de la carta
-    cuerpo_carta = f"""
-    Por medio de la presente, tengo a bien presentar al estudiante <b>{estudiante_data['nombres']} {estudiante_data.get('apellidos','')}</b>, 
-    quien cursa el {estudiante_data.get('ciclo','')} ciclo de la carrera de <b>{estudiante_data.get('carrera','')}</b> en nuestra Facultad, 
-    con código universitario <b>{estudiante_data['codigo']}</b> y DNI <b>{estudiante_data['dni']}</b>.
+
+    nombre = _nombre_archivo(tipo, estudiante_data, clave_carta(tipo, estudiante_data, empresa_data, fecha_actual))
+    if not Config.SAVE_LOCAL:
+        clave_s3 = f"cartas/{nombre}"
+        if existe_s3(ruta_s3(clave_s3)):
+            return ruta_s3(clave_s3), None
+        datos = renderizar_carta(tipo, estudiante_data, empresa_data, fecha_actual)
+        return subir_bytes_s3(datos, clave_s3), datos
+
+    generada = {}
+
+    def generar(destino):
+        generada['datos'] = renderizar_carta(tipo, estudiante_data, empresa_data, fecha_actual)
+        with open(destino, 'wb') as archivo:
+            archivo.write(generada['datos'])
+
+    ruta = obtener_cache_cartas().obtener_o_generar(nombre, generar)
+    return ruta, generada.get('datos')
+
+def leer_carta(ruta_pdf):
     """
-    story.append(Paragraph(cuerpo_carta, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    El estudiante mencionado desea realizar sus <b>Prácticas Pre Profesionales</b> en su distinguida empresa, 
-    con el objetivo de aplicar los conocimientos adquiridos durante su formación académica y desarrollar 
-    competencias profesionales en un entorno laboral real.
-    """, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    Durante su formación, el estudiante ha demostrado un excelente rendimiento académico y ha desarrollado 
-    habilidades técnicas y competencias profesionales que le permitirán contribuir de manera efectiva 
-    a los objetivos de su organización.
-    """, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    Por lo tanto, solicitamos a ustedes considerar favorablemente la solicitud del estudiante para realizar 
-    sus prácticas pre profesionales en su empresa, brindándole la oportunidad de aplicar sus conocimientos 
-    y desarrollar nuevas competencias en un entorno profesional.
-    """, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    Agradecemos de antemano su atención y quedamos a la espera de su respuesta favorable.
-    """, normal_style))
-    story.append(Spacer(1, 30))
-    
-    # Despedida
-    story.append(Paragraph("Atentamente,", normal_style))
-    story.append(Spacer(1, 40))
-    
-    # Firma
-    story.append(Paragraph("_________________________", signature_style))
-    story.append(Paragraph("<b>Dr. Dani Levano</b>", signature_style))
-    story.append(Paragraph("<b>Director del Departamento Académico</b>", signature_style))
-    story.append(Paragraph("<b>Ingeniería de Sistemas</b>", signature_style))
-    story.append(Paragraph("<b>Universidad Nacional de Ingeniería</b>", signature_style))
-    story.append(Spacer(1, 20))
-    
-    # Información de contacto
-    story.append(Paragraph("Información de contacto:", normal_style))
-    story.append(Paragraph("Teléfono: (01) 481-1070", signature_style))
-    story.append(Paragraph("Email: sistemas@uni.edu.pe", signature_style))
-    story.append(Paragraph("Dirección: Av. Túpac Amaru 210, Rímac, Lima", signature_style))
+    Returns:
+        bytes: Contenido del PDF guardado en `ruta_pdf` (local o S3), o None si no existe
+    """
+    if not ruta_pdf:
+        return None
+    try:
+        if es_ruta_s3(ruta_pdf):
+            return descargar_bytes_s3(ruta_pdf)
+        with open(ruta_pdf, 'rb') as archivo:
+            return archivo.read()
+    except Exception as e:
+        print(f"Error al leer la carta {ruta_pdf}: {e}")
+        return None
+
+def eliminar_carta(ruta_pdf):
+    """Elimina el PDF guardado (local o S3); no falla si ya no existe"""
+    try:
+        if es_ruta_s3(ruta_pdf):
+            eliminar_s3(ruta_pdf)
+        elif ruta_pdf and os.path.exists(ruta_pdf):
+            os.remove(ruta_pdf)
+    except Exception as e:
+        print(f"Error al eliminar la carta {ruta_pdf}: {e}")
+
+def generar_carta_presentacion(estudiante_data, empresa_data, fecha_actual=None):
+    """
+    Genera una carta de presentación en PDF y la guarda en static/cartas/ (o en S3)
     
-    # Construir el PDF
-    doc.build(story)
+    Args:
+        estudiante_data: Diccionario con datos del estudiante
+        empresa_data: Diccionario con datos de la empresa
+        fecha_actual: Fecha actual (opcional)
     
-    return filepath
+    Returns:
+        str: Ruta del archivo PDF generado (o del ya existente con los mismos datos)
+    """
+    return generar_carta('presentacion', estudiante_data, empresa_data, fecha_actual)[0]
 
 def generar_carta_estudiante(estudiante_data, empresa_data, fecha_actual=None):
     """
@@ -171,127 +491,9 @@ def generar_carta_estudiante(estudiante_data, empresa_data, fecha_actual=None):
         fecha_actual: Fecha actual (opcional)
     
     Returns:
-        str: Ruta del archivo PDF generado
+        str: Ruta del archivo PDF generado (o del ya existente con los mismos datos)
     """
-    
-    if fecha_actual is None:
-        fecha_actual = datetime.now().strftime("%d de %B de %Y")
-    
-    # Crear nombre del archivo
-    filename = f"carta_estudiante_{estudiante_data['codigo']}_{empresa_data['ruc']}.pdf"
-    
-    # Crear el documento
-    doc = SimpleDocTemplate(filename, pagesize=A4)
-    story = []
-    
-    # Obtener estilos
-    styles = getSampleStyleSheet()
-    
-    # Estilos personalizados
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        alignment=TA_JUSTIFY,
-        leading=18
-    )
-    
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        leading=16
-    )
-    
-    # Encabezado del estudiante
-    story.append(Paragraph(f"<b>{estudiante_data['nombres']} {estudiante_data['apellidos']}</b>", header_style))
-    story.append(Paragraph(f"Código: {estudiante_data['codigo']}", header_style))
-    story.append(Paragraph(f"DNI: {estudiante_data['dni']}", header_style))
-    story.append(Paragraph(f"Carrera: {estudiante_data['carrera']}", header_style))
-    story.append(Paragraph(f"Ciclo: {estudiante_data['ciclo']}", header_style))
-    story.append(Paragraph("Universidad Nacional de Ingeniería", header_style))
-    story.append(Paragraph("Facultad de Ingeniería Industrial y de Sistemas", header_style))
-    story.append(Spacer(1, 20))
-    
-    # Fecha
-    story.append(Paragraph(f"Lima, {fecha_actual}", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # Datos de la empresa
-    story.append(Paragraph(f"<b>Señores:</b>", normal_style))
-    story.append(Paragraph(f"<b>{empresa_data['nombre']}</b>", normal_style))
-    story.append(Paragraph(f"<b>RUC: {empresa_data['ruc']}</b>", normal_style))
-    story.append(Paragraph(f"<b>Dirección: {empresa_data['direccion']}</b>", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # Gerente general
-    if empresa_data.get('gerente_general'):
-        story.append(Paragraph(f"<b>Atención: {empresa_data['gerente_general']} (Gerente General)</b>", normal_style))
-    
-    # Saludo
-    story.append(Paragraph("Estimados señores:", normal_style))
-    story.append(Spacer(1, 15))
-    
-    # Cuerpo de la carta
-    story.append(Paragraph(f"""
-    Me dirijo a ustedes para expresar mi interés en realizar mis <b>Prácticas Pre Profesionales</b> en su distinguida empresa. 
-    Soy {estudiante_data['nombres']} {estudiante_data['apellidos']}, estudiante del {estudiante_data['ciclo']} ciclo 
-    de la carrera de <b>{estudiante_data['carrera']}</b> en la Universidad Nacional de Ingeniería.
-    """, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    Durante mi formación académica, he desarrollado sólidos conocimientos en mi área de estudio y he participado 
-    en diversos proyectos que me han permitido aplicar la teoría en situaciones prácticas. Considero que su empresa 
-    ofrece un excelente entorno para continuar mi desarrollo profesional.
-    """, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    Estoy comprometido con el aprendizaje continuo y tengo la capacidad de adaptarme rápidamente a nuevos entornos 
-    y tecnologías. Mi objetivo es contribuir de manera efectiva a los proyectos de su organización mientras 
-    adquiero experiencia valiosa en el campo profesional.
-    """, normal_style))
-    story.append(Spacer(1, 15))
-    
-    story.append(Paragraph("""
-    Agradezco de antemano su consideración y quedo a la espera de una respuesta favorable. 
-    Estoy disponible para una entrevista personal en el momento que consideren conveniente.
-    """, normal_style))
-    story.append(Spacer(1, 30))
-    
-    # Despedida
-    story.append(Paragraph("Atentamente,", normal_style))
-    story.append(Spacer(1, 40))
-    
-    # Firma del estudiante
-    story.append(Paragraph("_________________________", header_style))
-    story.append(Paragraph(f"<b>{estudiante_data['nombres']} {estudiante_data['apellidos']}</b>", header_style))
-    story.append(Paragraph(f"<b>Estudiante de {estudiante_data['carrera']}</b>", header_style))
-    story.append(Paragraph("<b>Universidad Nacional de Ingeniería</b>", header_style))
-    story.append(Spacer(1, 20))
-    
-    # Información de contacto del estudiante
-    story.append(Paragraph("Información de contacto:", normal_style))
-    story.append(Paragraph("Email: [email del estudiante]", header_style))
-    story.append(Paragraph("Teléfono: [teléfono del estudiante]", header_style))
-    
-    # Construir el PDF
-    doc.build(story)
-    
-    return filename
+    return generar_carta('estudiante', estudiante_data, empresa_data, fecha_actual)[0]
 
 if __name__ == "__main__":
     # Ejemplo de uso
@@ -312,24 +514,6 @@ if __name__ == "__main__":
         'contacto_email': 'contacto@techsolutions.com'
     }
     
-    # Supón que tienes estudiante_id y empresa_id
-    if existe_carta_para_estudiante_y_empresa(estudiante_id, empresa_id):
-        update.message.reply_text("❌ Ya has generado una carta para esta empresa. No puedes generar otra.")
-    # Si no existe, continúa con la generación
-    
     # Generar carta
     archivo = generar_carta_presentacion(estudiante_ejemplo, empresa_ejemplo)
     print(f"Carta generada: {archivo}")
-
-def recibir_codigo_estudiante(update: Update, context: CallbackContext):
-    # ... código existente ...
-    if context.user_data.get('ultima_opcion') == "6. Ver mis cartas generadas":
-        estudiante_id = obtener_estudiante_id(codigo_estudiante)
-        cartas = consultar_cartas_generadas(estudiante_id)
-        if cartas:
-            mensaje = "Tus cartas generadas:\n"
-            for nombre_empresa, ruta_pdf in cartas:
-                mensaje += f"• {nombre_empresa}: {os.path.basename(ruta_pdf) if ruta_pdf else 'Sin PDF'}\n"
-            update.message.reply_text(mensaje)
-        else:
-            update.message.reply_text("No tienes cartas generadas.")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Generación masiva de cartas de presentación para una promoción de estudiantes
+
+Lee la lista de estudiantes de un archivo CSV/JSON (o toma todos los de la
+tabla estudiantes), genera una carta por estudiante y empresa en un pool de
+procesos que usa todos los núcleos, registra todas las cartas en
+solicitudes_carta en una sola transacción (y en el manifiesto de cartas) y, si
+se pide, une los PDF en un solo archivo listo para imprimir. Una carta que falla
+no detiene el lote: se informa al final (y en --reporte) junto con la velocidad
+alcanzada.
+
+El archivo de estudiantes debe tener la columna `codigo`; las columnas
+nombres, apellidos, dni, carrera y ciclo son opcionales y reemplazan a los datos
+de la base. Una columna `empresa` (nombre o RUC) asigna la empresa de cada
+estudiante; si no está, cada estudiante recibe una carta por cada --empresa.
+
+Uso:
+    python cartas_masivas.py --roster promocion.csv --empresa "Tech Solutions S.A.C." --empresa 20123456789
+    python cartas_masivas.py --todos --empresa 20123456789 --unir static/lote_2025_1.pdf
+    python cartas_masivas.py --roster promocion.jsonl --procesos 8 --reporte fallidas.csv
+"""
+
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from carta_generator import asociar_cartas, leer_carta
+from importador_masivo import leer_registros
+from services.plantillas_cartas import campos_faltantes, obtener_definicion
+from services.database_service import (
+    consultar_estudiantes_para_cartas, obtener_empresa_por_ruc, registrar_cartas_masivas
+)
+
+CAMPOS_ROSTER = ('nombres', 'apellidos', 'dni', 'carrera', 'ciclo')
+
+def _iniciar_proceso():
+    from carta_generator import obtener_plantilla
+    obtener_plantilla()
+
+def _generar(tarea):
+    """Genera una carta en un proceso del pool; devuelve (indice, ruta_pdf, error)"""
+    from carta_generator import generar_carta_presentacion
+    indice, estudiante_data, empresa_data, fecha_carta = tarea
+    try:
+        return indice, generar_carta_presentacion(estudiante_data, empresa_data, fecha_carta), None
+    except Exception as e:
+        return indice, None, f"{e.__class__.__name__}: {e}"
+
+def _buscar_empresa(texto, empresas):
+    clave = texto.strip()
+    if clave not in empresas:
+        empresas[clave] = obtener_empresa_por_ruc(clave)
+    return empresas[clave]
+
+def preparar_tareas(registros, empresas_comunes, estudiantes=None):
+    """
+    Combina la lista de estudiantes con los datos de la base
+
+    Args:
+        registros: Diccionarios con codigo (y opcionalmente empresa y datos del estudiante)
+        empresas_comunes: Nombres o RUC de las empresas para las filas sin empresa
+        estudiantes: Resultado de consultar_estudiantes_para_cartas, si ya se consultó
+
+    Returns:
+        tuple: (tareas, fallidas); cada tarea es un diccionario con estudiante,
+        empresa, estudiante_id y empresa_id, y cada fallida (codigo, empresa, error)
+    """
+    registros = list(registros)
+    codigos = [str(registro.get('codigo') or '').strip() for registro in registros]
+    if estudiantes is None:
+        estudiantes = consultar_estudiantes_para_cartas([codigo for codigo in codigos if codigo])
+    if estudiantes is None:
+        raise RuntimeError("No se pudo consultar la tabla estudiantes")
+
+    empresas = {}
+    definicion = obtener_definicion('presentacion')
+    tareas, fallidas = [], []
+    for registro, codigo in zip(registros, codigos):
+        nombres_empresa = [registro['empresa']] if registro.get('empresa') else empresas_comunes
+        if not codigo:
+            fallidas.append(('', '', "Fila sin código de estudiante"))
+            continue
+        if codigo not in estudiantes:
+            for nombre_empresa in nombres_empresa or ['']:
+                fallidas.append((codigo, nombre_empresa, "Estudiante no encontrado"))
+            continue
+        if not nombres_empresa:
+            fallidas.append((codigo, '', "Sin empresa (usa la columna empresa o --empresa)"))
+            continue
+
+        estudiante = dict(estudiantes[codigo])
+        estudiante.update({campo: registro[campo] for campo in CAMPOS_ROSTER if registro.get(campo)})
+        for nombre_empresa in nombres_empresa:
+            empresa = _buscar_empresa(nombre_empresa, empresas)
+            if empresa is None:
+                fallidas.append((codigo, nombre_empresa, "Empresa no encontrada"))
+                continue
+            datos_empresa = {
+                'nombre': empresa['nombre'],
+                'ruc': empresa.get('ruc') or '',
+                'direccion': empresa.get('direccion') or '',
+            }
+            # Se descartan aquí las cartas a las que les faltan datos, antes de repartir el lote
+            faltantes = campos_faltantes(definicion, estudiante, datos_empresa)
+            if faltantes:
+                fallidas.append((codigo, nombre_empresa, "Faltan datos: " + ', '.join(
+                    f"{grupo}.{campo}" for grupo, campo in faltantes)))
+                continue
+            tareas.append({
+                'estudiante': estudiante,
+                'empresa': datos_empresa,
+                'estudiante_id': estudiante['id'],
+                'empresa_id': empresa['id'],
+            })
+    return tareas, fallidas
+
+def generar_lote(tareas, procesos=None, fecha_carta=None):
+    """
+    Genera las cartas en paralelo
+
+    Returns:
+        list: (tarea, ruta_pdf, error) en el mismo orden que `tareas`
+    """
+    resultados = [None] * len(tareas)
+    argumentos = [(indice, tarea['estudiante'], tarea['empresa'], fecha_carta)
+                  for indice, tarea in enumerate(tareas)]
+    procesos = procesos or os.cpu_count() or 1
+    inicio = time.monotonic()
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_iniciar_proceso) as ejecutor:
+        # Bloques de varias cartas por envío para no pagar la comunicación entre procesos por cada una
+        bloque = max(1, min(50, len(argumentos) // (procesos * 4) or 1))
+        for terminadas, (indice, ruta_pdf, error) in enumerate(ejecutor.map(_generar, argumentos, chunksize=bloque), 1):
+            resultados[indice] = (tareas[indice], ruta_pdf, error)
+            if terminadas % 100 == 0:
+                transcurrido = time.monotonic() - inicio
+                print(f"  {terminadas}/{len(tareas)} cartas ({terminadas / transcurrido:.1f} cartas/s)")
+    return resultados
+
+def unir_pdfs(rutas, destino):
+    """Une los PDF en un solo archivo para imprimir (requiere pypdf)"""
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        raise RuntimeError("Para unir las cartas instala pypdf (pip install pypdf)")
+    escritor = PdfWriter()
+    for ruta in rutas:
+        # leer_carta sirve tanto para cartas locales como para las guardadas en S3
+        escritor.append(io.BytesIO(leer_carta(ruta)))
+    directorio = os.path.dirname(destino)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with open(destino, 'wb') as archivo:
+        escritor.write(archivo)
+    escritor.close()
+
+def _escribir_reporte(ruta, fallidas):
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(['codigo', 'empresa', 'error'])
+        escritor.writerows(fallidas)
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Genera y registra cartas de presentación para muchos estudiantes")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument('--roster', help="archivo CSV, JSON (arreglo) o JSONL con la columna codigo")
+    origen.add_argument('--todos', action='store_true', help="todos los estudiantes de la tabla estudiantes")
+    parser.add_argument('--empresa', action='append', default=[],
+                        help="nombre o RUC de la empresa (se puede repetir)")
+    parser.add_argument('--procesos', type=int, default=None, help="procesos en paralelo (default: núcleos)")
+    parser.add_argument('--fecha', default=None, help="fecha escrita en las cartas (default: hoy)")
+    parser.add_argument('--unir', default=None, help="une todas las cartas en este PDF")
+    parser.add_argument('--reporte', default=None, help="CSV con las cartas que fallaron")
+    args = parser.parse_args()
+
+    estudiantes = None
+    if args.todos:
+        estudiantes = consultar_estudiantes_para_cartas()
+        if estudiantes is None:
+            print("❌ Error: No se pudo consultar la base de datos", file=sys.stderr)
+            return 1
+        registros = [{'codigo': codigo} for codigo in estudiantes]
+    else:
+        registros = leer_registros(args.roster)
+
+    try:
+        tareas, fallidas = preparar_tareas(registros, args.empresa, estudiantes)
+    except RuntimeError as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"🚀 Generando {len(tareas)} carta(s)...")
+    inicio = time.monotonic()
+    resultados = generar_lote(tareas, args.procesos, args.fecha) if tareas else []
+    transcurrido = time.monotonic() - inicio
+
+    generadas = []
+    for tarea, ruta_pdf, error in resultados:
+        if error:
+            fallidas.append((tarea['estudiante']['codigo'], tarea['empresa']['nombre'], error))
+        else:
+            generadas.append((tarea, ruta_pdf))
+
+    if generadas:
+        fecha_solicitud = date.today()
+        registradas = registrar_cartas_masivas([
+            (tarea['estudiante_id'], tarea['empresa_id'], fecha_solicitud, ruta_pdf)
+            for tarea, ruta_pdf in generadas
+        ])
+        if registradas is None:
+            print("❌ Error: Las cartas se generaron pero no se pudieron registrar en solicitudes_carta", file=sys.stderr)
+            return 1
+        # Sin esto mantener_cartas.py (--retener, --huerfanas) no vería las cartas del lote
+        asociar_cartas(registradas)
+        print(f"📝 {len(registradas)} carta(s) registradas en solicitudes_carta")
+
+    union_fallida = False
+    if args.unir and generadas:
+        try:
+            unir_pdfs([ruta_pdf for _, ruta_pdf in generadas], args.unir)
+            print(f"📄 Cartas unidas en {args.unir}")
+        except Exception as e:
+            union_fallida = True
+            print(f"❌ Error al unir las cartas: {e}", file=sys.stderr)
+
+    for codigo, empresa, error in fallidas:
+        print(f"⚠️  {codigo} / {empresa}: {error}", file=sys.stderr)
+    if args.reporte:
+        _escribir_reporte(args.reporte, fallidas)
+
+    velocidad = len(resultados) / transcurrido if transcurrido else 0.0
+    print(f"\n✅ {len(generadas)} carta(s) generadas, {len(fallidas)} fallida(s) "
+          f"en {transcurrido:.1f} s ({velocidad:.1f} cartas/s)")
+    if union_fallida:
+        return 1
+    return 0 if not fallidas else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,7 @@
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 class Config:
     MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
@@ -7,8 +10,86 @@ class Config:
     MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "1234")
     MYSQL_DB = os.getenv("MYSQL_DB", "ppp")
 
+    # Réplicas de lectura ("host" o "host:puerto" separados por comas; mismo usuario y base)
+    MYSQL_REPLICAS = [r.strip() for r in os.getenv("MYSQL_REPLICAS", "").split(",") if r.strip()]
+    REPLICA_MAX_RETRASO = float(os.getenv("REPLICA_MAX_RETRASO", 5))  # segundos de retraso tolerados
+    REPLICA_INTERVALO_REVISION = float(os.getenv("REPLICA_INTERVALO_REVISION", 10))
+    REPLICA_PRIMARIO_TRAS_ESCRITURA = int(os.getenv("REPLICA_PRIMARIO_TRAS_ESCRITURA", 30))
+    REPLICA_ESPERA_CONEXION = float(os.getenv("REPLICA_ESPERA_CONEXION", 0))  # con el pool de la réplica lleno
+
+    # Motor de base de datos: 'mysql' o 'sqlite' (embebido, para una sola máquina)
+    DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+    SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("static", "ppp.sqlite3"))
+
+    # Pool de conexiones
+    MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 8))
+    MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", 10))  # segundos esperando una conexión libre
+    MYSQL_POOL_RECYCLE = int(os.getenv("MYSQL_POOL_RECYCLE", 3600))  # segundos de vida de cada conexión
+    MYSQL_POOL_PING_AFTER = float(os.getenv("MYSQL_POOL_PING_AFTER", 5))  # inactividad antes de hacer ping
+
+    # Métricas de consultas: umbral del registro de consultas lentas y cuántas se conservan
+    CONSULTA_LENTA_MS = float(os.getenv("CONSULTA_LENTA_MS", 200))
+    CONSULTAS_LENTAS_MAX = int(os.getenv("CONSULTAS_LENTAS_MAX", 100))
+
+    # Índice en memoria de empresas: segundos entre cargas de empresas nuevas y
+    # entre cargas completas (para quitar las renombradas y eliminadas)
+    INDICE_EMPRESAS_REFRESCO = int(os.getenv("INDICE_EMPRESAS_REFRESCO", 60))
+    INDICE_EMPRESAS_RECONSTRUIR = int(os.getenv("INDICE_EMPRESAS_RECONSTRUIR", 3600))
+    EMPRESAS_SUGERIDAS = int(os.getenv("EMPRESAS_SUGERIDAS", 5))  # botones ofrecidos en el bot
+
+    # Paginación de listados (oportunidades y cartas generadas)
+    PAGINA_TAMANO = int(os.getenv("PAGINA_TAMANO", 20))
+    PAGINA_TAMANO_MAX = int(os.getenv("PAGINA_TAMANO_MAX", 100))
+    PAGINA_TAMANO_BOT = int(os.getenv("PAGINA_TAMANO_BOT", 5))
+
+    # Caché de consultas globales (segundos)
+    CACHE_TTL_FECHAS_CRITICAS = int(os.getenv("CACHE_TTL_FECHAS_CRITICAS", 300))
+    CACHE_TTL_OPORTUNIDADES = int(os.getenv("CACHE_TTL_OPORTUNIDADES", 300))
+    CACHE_MAX_PAGINAS = int(os.getenv("CACHE_MAX_PAGINAS", 256))  # páginas de oportunidades en caché
+    # Archivo que se actualiza al escribir fechas críticas u oportunidades (invalida la caché en todos los procesos)
+    CACHE_MARCA_CONSULTAS = os.getenv("CACHE_MARCA_CONSULTAS", os.path.join("static", ".cache_consultas"))
+
+    # Caché de estudiantes (obtener_estudiante_id / validar_estudiante_completo)
+    CACHE_TTL_ESTUDIANTES = int(os.getenv("CACHE_TTL_ESTUDIANTES", 3600))
+    CACHE_TTL_ESTUDIANTES_NEGATIVO = int(os.getenv("CACHE_TTL_ESTUDIANTES_NEGATIVO", 30))  # códigos inexistentes
+    CACHE_MAX_ESTUDIANTES = int(os.getenv("CACHE_MAX_ESTUDIANTES", 50000))
+    CACHE_MARCA_ESTUDIANTES = os.getenv("CACHE_MARCA_ESTUDIANTES", os.path.join("static", ".cache_estudiantes"))
+    # Archivo que se actualiza tras una importación de empresas (recarga el índice de empresas en todos los procesos)
+    CACHE_MARCA_EMPRESAS = os.getenv("CACHE_MARCA_EMPRESAS", os.path.join("static", ".cache_empresas"))
+
+    # Generación de cartas en un pool de procesos (services/render_service.py)
+    RENDER_PROCESOS = int(os.getenv("RENDER_PROCESOS", min(4, os.cpu_count() or 1)))
+    RENDER_MAX_PENDIENTES = int(os.getenv("RENDER_MAX_PENDIENTES", 50))  # cartas sin terminar antes de rechazar
+    RENDER_CONSERVAR_TRABAJOS = int(os.getenv("RENDER_CONSERVAR_TRABAJOS", 3600))  # segundos que se puede consultar un trabajo terminado
+    # Segundos tras los que una solicitud 'pendiente' se da por abandonada (p. ej. el proceso
+    # que la generaba se cayó) y otro pedido de la misma carta puede volver a generarla
+    CARTAS_PENDIENTE_MAX = int(os.getenv("CARTAS_PENDIENTE_MAX", 600))
+
+    # Caché de PDF en static/cartas (services/cache_cartas.py)
+    CARTAS_CACHE_MAX_MB = int(os.getenv("CARTAS_CACHE_MAX_MB", 1024))
+    CARTAS_CACHE_MAX_DIAS = int(os.getenv("CARTAS_CACHE_MAX_DIAS", 180))  # días sin uso antes de eliminar una carta
+    CARTAS_CACHE_LIMPIEZA = int(os.getenv("CARTAS_CACHE_LIMPIEZA", 3600))  # segundos entre limpiezas
+    # Almacén de static/cartas (services/almacen_cartas.py) y su mantenimiento (mantener_cartas.py)
+    CARTAS_NIVELES = int(os.getenv("CARTAS_NIVELES", 2))  # subcarpetas por hash (0: todas en static/cartas)
+    CARTAS_MANIFIESTO = os.getenv("CARTAS_MANIFIESTO", os.path.join("static", "cartas_manifiesto.sqlite3"))  # '' sin manifiesto
+    # Días sin uso antes de archivar (o eliminar) una carta; menor que CARTAS_CACHE_MAX_DIAS para
+    # archivarla antes de que la caché la elimine
+    CARTAS_RETENCION_DIAS = int(os.getenv("CARTAS_RETENCION_DIAS", 90))
+    CARTAS_ARCHIVO = os.getenv("CARTAS_ARCHIVO", os.path.join("static", "cartas_archivo"))  # '' elimina en lugar de archivar
+    CARTAS_LOTE_MANTENIMIENTO = int(os.getenv("CARTAS_LOTE_MANTENIMIENTO", 500))  # cartas por transacción
+    # Directorio con las plantillas de cartas en JSON (services/plantillas_cartas.py)
+    CARTAS_PLANTILLAS = os.getenv("CARTAS_PLANTILLAS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "plantillas_cartas"))
+    # Dibujar los datos sobre las partes fijas ya maquetadas (False: Platypus completo en cada carta)
+    CARTAS_MEMBRETE = os.getenv("CARTAS_MEMBRETE", "True") == "True"
+
     AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
     AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
     AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
 
     SAVE_LOCAL = os.getenv("SAVE_LOCAL", "True") == "True"  # True en local, False en AWS
+
+    # Token de los endpoints de administración de app.py (cabecera X-Admin-Token); vacío los deshabilita
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+    # Verificación de planes de ejecución (migraciones.py --verificar)
+    EXPLAIN_MAX_FILAS_ESCANEO = int(os.getenv("EXPLAIN_MAX_FILAS_ESCANEO", 1000))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Exportación de solicitudes de carta (con estudiante y empresa) a CSV o NDJSON
+
+Las filas se leen del servidor por lotes y se escriben a medida que llegan, así
+el uso de memoria no depende del número de solicitudes.
+
+Uso:
+    python exportar_solicitudes.py > solicitudes.csv
+    python exportar_solicitudes.py --formato ndjson --desde 2024-03-01 --hasta 2024-03-31
+    python exportar_solicitudes.py --salida reporte.csv
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+from services.database_service import exportar_solicitudes_carta, COLUMNAS_EXPORTACION
+from services.exportacion_service import exportar, FORMATOS
+
+def _fecha(texto):
+    try:
+        return datetime.strptime(texto, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha no válida: {texto} (usa AAAA-MM-DD)")
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Exporta las solicitudes de carta a CSV o NDJSON")
+    parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv', help="formato de salida (default: csv)")
+    parser.add_argument('--desde', type=_fecha, default=None, help="fecha_solicitud mínima (AAAA-MM-DD)")
+    parser.add_argument('--hasta', type=_fecha, default=None, help="fecha_solicitud máxima (AAAA-MM-DD)")
+    parser.add_argument('--salida', default=None, help="archivo de salida (por defecto la salida estándar)")
+    parser.add_argument('--lote', type=int, default=1000, help="filas leídas del servidor por vez (default: 1000)")
+    args = parser.parse_args()
+
+    filas = exportar_solicitudes_carta(args.desde, args.hasta, args.lote)
+    if filas is None:
+        print("❌ Error: No se pudo consultar la base de datos", file=sys.stderr)
+        return 1
+
+    contador = {'filas': 0}
+
+    def contar(filas):
+        for fila in filas:
+            contador['filas'] += 1
+            yield fila
+
+    salida = open(args.salida, 'w', encoding='utf-8', newline='') if args.salida else sys.stdout
+    try:
+        for bloque in exportar(args.formato, COLUMNAS_EXPORTACION, contar(filas)):
+            salida.write(bloque)
+    finally:
+        if args.salida:
+            salida.close()
+    print(f"✅ {contador['filas']} solicitud(es) exportada(s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Importador masivo de estudiantes, empresas y prácticas desde CSV o JSON
+
+Lee el archivo por partes, inserta cada lote con executemany y confirma por
+lote. El avance se guarda en la tabla importaciones_progreso dentro de la misma
+transacción que el lote, así una importación interrumpida se puede relanzar y
+continúa donde se quedó sin duplicar filas. El avance se identifica por la ruta,
+el tamaño y la fecha de modificación del archivo: si el archivo cambia se importa
+desde el principio, y uno que ya se importó completo no se vuelve a importar
+(salvo con --reiniciar).
+
+Uso:
+    python importador_masivo.py estudiantes matricula.csv
+    python importador_masivo.py empresas empresas.jsonl --lote 2000
+    python importador_masivo.py practicas horas.json --reiniciar
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+from config import Config
+from mantener_horas import diferencias_horas, reconstruir_horas
+from services.database_service import get_connection, invalidar_cache_estudiantes, invalidar_indice_empresas
+
+# Columnas que se leen del archivo para cada tabla. `obligatorias` no pueden venir
+# vacías y `actualizar` son las que se sobrescriben si el registro ya existe
+TABLAS = {
+    'estudiantes': {
+        'columnas': ['codigo', 'dni', 'nombre', 'correo', 'direccion'],
+        'obligatorias': ['codigo', 'dni', 'nombre'],
+        'actualizar': ['dni', 'nombre', 'correo', 'direccion'],
+    },
+    'empresas': {
+        'columnas': ['nombre', 'ruc', 'direccion', 'contacto_email'],
+        'obligatorias': ['nombre'],
+        'actualizar': ['ruc', 'direccion', 'contacto_email'],
+    },
+    'practicas': {
+        'columnas': ['estudiante_empresa_id', 'horas'],
+        'obligatorias': ['estudiante_empresa_id', 'horas'],
+        'actualizar': [],
+    },
+}
+
+TAMANO_LECTURA = 64 * 1024
+
+def _leer_csv(ruta):
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        for fila in csv.DictReader(archivo):
+            yield fila
+
+def _leer_json_lineas(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        for linea in archivo:
+            linea = linea.strip()
+            if linea:
+                yield json.loads(linea)
+
+def _leer_json_arreglo(ruta):
+    """Recorre un arreglo JSON objeto por objeto sin cargar el archivo completo"""
+    decodificador = json.JSONDecoder()
+    with open(ruta, encoding='utf-8') as archivo:
+        buffer = archivo.read(TAMANO_LECTURA).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError("El archivo JSON debe contener un arreglo de objetos")
+        buffer = buffer[1:]
+        fin_archivo = False
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                objeto, posicion = decodificador.raw_decode(buffer)
+            except ValueError:
+                if fin_archivo:
+                    raise
+                # El objeto quedó cortado entre dos lecturas: se lee más
+                datos = archivo.read(TAMANO_LECTURA)
+                fin_archivo = not datos
+                buffer += datos
+                continue
+            yield objeto
+            buffer = buffer[posicion:]
+            if len(buffer) < TAMANO_LECTURA and not fin_archivo:
+                datos = archivo.read(TAMANO_LECTURA)
+                fin_archivo = not datos
+                buffer += datos
+
+def leer_registros(ruta, formato=None):
+    """
+    Devuelve un generador de diccionarios con las filas del archivo
+
+    Args:
+        ruta: Ruta del archivo
+        formato: 'csv', 'json' (arreglo) o 'jsonl' (un objeto por línea);
+            si no se indica se deduce de la extensión
+    """
+    if formato is None:
+        extension = os.path.splitext(ruta)[1].lower()
+        formato = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension, 'csv')
+    if formato == 'csv':
+        return _leer_csv(ruta)
+    if formato == 'jsonl':
+        return _leer_json_lineas(ruta)
+    return _leer_json_arreglo(ruta)
+
+def _sql_insercion(tabla):
+    especificacion = TABLAS[tabla]
+    columnas = especificacion['columnas']
+    query = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(['%s'] * len(columnas))})"
+    if especificacion['actualizar'] and tabla != 'empresas':
+        if Config.DB_BACKEND == 'sqlite':
+            query += f" ON CONFLICT ({columnas[0]}) DO UPDATE SET " + ", ".join(
+                f"{columna} = excluded.{columna}" for columna in especificacion['actualizar']
+            )
+        else:
+            query += " ON DUPLICATE KEY UPDATE " + ", ".join(
+                f"{columna} = VALUES({columna})" for columna in especificacion['actualizar']
+            )
+    return query
+
+def _insertar_estudiantes(cursor, filas):
+    """Inserta o actualiza por código; los códigos que ya existían (o se repiten en el lote) cuentan como actualizados"""
+    codigos = list({fila[0] for fila in filas})
+    cursor.execute(
+        f"SELECT codigo FROM estudiantes WHERE codigo IN ({', '.join(['%s'] * len(codigos))})",
+        codigos
+    )
+    vistos = {fila[0] for fila in cursor.fetchall()}
+    cursor.executemany(_sql_insercion('estudiantes'), filas)
+
+    insertadas = 0
+    for fila in filas:
+        if fila[0] not in vistos:
+            vistos.add(fila[0])
+            insertadas += 1
+    return insertadas, len(filas) - insertadas
+
+def _insertar_empresas(cursor, filas):
+    """empresas no tiene clave única en nombre: se separan nuevas y existentes con una consulta por lote"""
+    nombres = list({fila[0] for fila in filas})
+    cursor.execute(
+        f"SELECT nombre FROM empresas WHERE nombre IN ({', '.join(['%s'] * len(nombres))})",
+        nombres
+    )
+    existentes = {fila[0] for fila in cursor.fetchall()}
+
+    nuevas, vistas = [], set()
+    actualizar = []
+    for nombre, ruc, direccion, contacto_email in filas:
+        if nombre in existentes:
+            actualizar.append((ruc, direccion, contacto_email, nombre))
+        elif nombre not in vistas:
+            vistas.add(nombre)
+            nuevas.append((nombre, ruc, direccion, contacto_email))
+    if nuevas:
+        cursor.executemany(_sql_insercion('empresas'), nuevas)
+    if actualizar:
+        cursor.executemany(
+            "UPDATE empresas SET ruc = COALESCE(%s, ruc), direccion = %s, contacto_email = %s WHERE nombre = %s",
+            actualizar
+        )
+    return len(nuevas), len(actualizar)
+
+def _insertar_lote(cursor, tabla, filas):
+    """Inserta un lote y devuelve (insertadas, actualizadas)"""
+    if tabla == 'empresas':
+        return _insertar_empresas(cursor, filas)
+    if tabla == 'estudiantes':
+        return _insertar_estudiantes(cursor, filas)
+    cursor.executemany(_sql_insercion(tabla), filas)
+    return len(filas), 0
+
+SQL_CREAR_PROGRESO = {
+    'mysql': """
+        CREATE TABLE IF NOT EXISTS importaciones_progreso (
+            clave VARCHAR(255) PRIMARY KEY,
+            tabla VARCHAR(50) NOT NULL,
+            filas_procesadas BIGINT NOT NULL DEFAULT 0,
+            terminado BOOLEAN NOT NULL DEFAULT FALSE,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+    'sqlite': """
+        CREATE TABLE IF NOT EXISTS importaciones_progreso (
+            clave TEXT PRIMARY KEY,
+            tabla TEXT NOT NULL,
+            filas_procesadas INTEGER NOT NULL DEFAULT 0,
+            terminado INTEGER NOT NULL DEFAULT 0,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+SQL_GUARDAR_PROGRESO = {
+    'mysql': """
+        INSERT INTO importaciones_progreso (clave, tabla, filas_procesadas, terminado) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE filas_procesadas = VALUES(filas_procesadas), terminado = VALUES(terminado)
+    """,
+    'sqlite': """
+        INSERT INTO importaciones_progreso (clave, tabla, filas_procesadas, terminado) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (clave) DO UPDATE SET filas_procesadas = excluded.filas_procesadas,
+            terminado = excluded.terminado, actualizado_en = CURRENT_TIMESTAMP
+    """,
+}
+
+def _asegurar_tabla_progreso(cursor):
+    cursor.execute(SQL_CREAR_PROGRESO[Config.DB_BACKEND])
+    # Tablas creadas por versiones anteriores del importador no tienen la columna terminado
+    try:
+        cursor.execute("SELECT terminado FROM importaciones_progreso LIMIT 0")
+        cursor.fetchall()
+    except Exception:
+        cursor.execute("ALTER TABLE importaciones_progreso ADD COLUMN terminado BOOLEAN NOT NULL DEFAULT FALSE")
+
+def _clave_importacion(tabla, ruta):
+    """Identifica el archivo por ruta, tamaño y fecha de modificación (cabe en VARCHAR(255))"""
+    estado = os.stat(ruta)
+    huella = f"{os.path.abspath(ruta)}|{estado.st_size}|{estado.st_mtime_ns}"
+    return f"{tabla}:{hashlib.sha256(huella.encode('utf-8')).hexdigest()}"
+
+def _progreso(cursor, clave):
+    """Devuelve (filas_procesadas, terminado) del archivo"""
+    cursor.execute("SELECT filas_procesadas, terminado FROM importaciones_progreso WHERE clave = %s", (clave,))
+    fila = cursor.fetchone()
+    return (fila[0], bool(fila[1])) if fila else (0, False)
+
+def _guardar_progreso(cursor, clave, tabla, filas_procesadas, terminado=False):
+    cursor.execute(SQL_GUARDAR_PROGRESO[Config.DB_BACKEND], (clave, tabla, filas_procesadas, terminado))
+
+def _verificar_horas(connection):
+    """
+    Comprueba después de importar prácticas que los totales de horas materializados
+    coinciden con practicas y los recalcula si no (por ejemplo, si faltan los triggers)
+    """
+    cursor = connection.cursor()
+    try:
+        diferencias = diferencias_horas(cursor)
+        if diferencias:
+            print(f"⚠️  {len(diferencias)} totales de horas no coinciden con practicas: recalculando")
+            reconstruir_horas(cursor)
+            connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print(f"⚠️  No se pudieron verificar los totales de horas: {e}")
+        print("   Ejecuta python mantener_horas.py --reconstruir")
+    finally:
+        cursor.close()
+
+def _normalizar(registro, especificacion):
+    """Convierte un registro del archivo en la tupla de columnas; None si le faltan datos"""
+    valores = []
+    for columna in especificacion['columnas']:
+        valor = registro.get(columna)
+        if isinstance(valor, str):
+            valor = valor.strip()
+        if valor in ('', None):
+            if columna in especificacion['obligatorias']:
+                return None
+            valor = None
+        valores.append(valor)
+    return tuple(valores)
+
+def importar(tabla, ruta, formato=None, tamano_lote=1000, reiniciar=False):
+    """
+    Importa un archivo a la tabla indicada
+
+    Args:
+        tabla: 'estudiantes', 'empresas' o 'practicas'
+        ruta: Archivo CSV o JSON de origen
+        formato: Formato del archivo (opcional, se deduce de la extensión)
+        tamano_lote: Filas por lote (una transacción por lote)
+        reiniciar: Ignora el avance guardado y empieza desde la primera fila
+
+    Returns:
+        dict: Filas insertadas, actualizadas, rechazadas, omitidas por reanudación
+        y filas/segundo; None si la importación falló
+    """
+    especificacion = TABLAS[tabla]
+    try:
+        clave = _clave_importacion(tabla, ruta)
+    except OSError as e:
+        print(f"❌ Error: No se pudo leer {ruta}: {e}")
+        return None
+
+    connection = get_connection()
+    if connection is None:
+        print("❌ Error: No se pudo conectar a la base de datos")
+        return None
+
+    resultado = {'insertadas': 0, 'actualizadas': 0, 'rechazadas': 0, 'omitidas': 0, 'filas_por_segundo': 0.0}
+    inicio = time.monotonic()
+    try:
+        cursor = connection.cursor()
+        _asegurar_tabla_progreso(cursor)
+        if reiniciar:
+            _guardar_progreso(cursor, clave, tabla, 0)
+        connection.commit()
+        ya_procesadas, terminado = _progreso(cursor, clave)
+        if terminado:
+            print(f"↩️  Este archivo ya se importó completo ({ya_procesadas} filas); usa --reiniciar para repetirlo")
+            resultado['omitidas'] = ya_procesadas
+            cursor.close()
+            return resultado
+        if ya_procesadas:
+            print(f"↩️  Reanudando después de {ya_procesadas} filas ya importadas")
+
+        procesadas = 0
+        lote = []
+
+        def confirmar_lote(terminado=False):
+            if lote:
+                insertadas, actualizadas = _insertar_lote(cursor, tabla, lote)
+                resultado['insertadas'] += insertadas
+                resultado['actualizadas'] += actualizadas
+            _guardar_progreso(cursor, clave, tabla, procesadas, terminado)
+            connection.commit()
+            transcurrido = time.monotonic() - inicio
+            escritas = resultado['insertadas'] + resultado['actualizadas']
+            velocidad = escritas / transcurrido if transcurrido else 0.0
+            print(f"  {procesadas} filas procesadas ({velocidad:.0f} filas/s)")
+            lote.clear()
+
+        for registro in leer_registros(ruta, formato):
+            procesadas += 1
+            if procesadas <= ya_procesadas:
+                resultado['omitidas'] += 1
+                continue
+            fila = _normalizar(registro, especificacion)
+            if fila is None:
+                resultado['rechazadas'] += 1
+                print(f"⚠️  Fila {procesadas} rechazada: faltan columnas obligatorias", file=sys.stderr)
+            else:
+                lote.append(fila)
+            if len(lote) >= tamano_lote:
+                confirmar_lote()
+
+        # El último lote marca el archivo como terminado en la misma transacción
+        confirmar_lote(terminado=True)
+        cursor.close()
+
+        if tabla == 'practicas' and resultado['insertadas']:
+            _verificar_horas(connection)
+    except Exception as e:
+        connection.rollback()
+        print(f"❌ Error al importar {tabla}: {e}")
+        print("   Vuelve a ejecutar el mismo comando para continuar desde el último lote confirmado")
+        return None
+    finally:
+        connection.close()
+        if resultado['insertadas'] or resultado['actualizadas']:
+            if tabla == 'estudiantes':
+                invalidar_cache_estudiantes()
+            elif tabla == 'empresas':
+                invalidar_indice_empresas()
+
+    transcurrido = time.monotonic() - inicio
+    escritas = resultado['insertadas'] + resultado['actualizadas']
+    resultado['filas_por_segundo'] = round(escritas / transcurrido, 1) if transcurrido else 0.0
+    return resultado
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Importación masiva de datos a la base de datos")
+    parser.add_argument('tabla', choices=sorted(TABLAS), help="tabla de destino")
+    parser.add_argument('archivo', help="archivo CSV, JSON (arreglo) o JSONL de origen")
+    parser.add_argument('--formato', choices=['csv', 'json', 'jsonl'], default=None,
+                        help="formato del archivo (por defecto según la extensión)")
+    parser.add_argument('--lote', type=int, default=1000, help="filas por lote (default: 1000)")
+    parser.add_argument('--reiniciar', action='store_true', help="ignora el avance guardado")
+    args = parser.parse_args()
+
+    print(f"🚀 Importando {args.archivo} en '{args.tabla}'...")
+    resultado = importar(args.tabla, args.archivo, args.formato, args.lote, args.reiniciar)
+    if resultado is None:
+        return 1
+    print(f"\n✅ Importación completada: {resultado['insertadas']} filas insertadas, "
+          f"{resultado['actualizadas']} actualizadas, {resultado['rechazadas']} rechazadas, {resultado['omitidas']} omitidas por reanudación "
+          f"({resultado['filas_por_segundo']} filas/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento de los PDF de cartas guardados en static/cartas
+
+Las cartas se reparten en subcarpetas por hash y cada archivo, con la solicitud
+a la que pertenece, se anota en un manifiesto (services/almacen_cartas.py). Las
+tareas trabajan por lotes de Config.CARTAS_LOTE_MANTENIMIENTO cartas y cada lote
+se guarda en solicitudes_carta en su propia transacción:
+
+    --migrar     Mueve a su subcarpeta las cartas que siguen sueltas en static/cartas
+    --indexar    Reconstruye el manifiesto desde las carpetas y solicitudes_carta
+                 (y elimina los temporales de generaciones interrumpidas)
+    --retener    Archiva en Config.CARTAS_ARCHIVO (o elimina, con --eliminar) las
+                 cartas sin uso desde hace más de Config.CARTAS_RETENCION_DIAS días
+    --huerfanas  Deja como 'expirada' y sin ruta_pdf las solicitudes cuyo PDF ya no existe
+
+Uso:
+    python mantener_cartas.py --migrar --indexar
+    python mantener_cartas.py --retener --huerfanas
+    python mantener_cartas.py --retener --dias 30 --eliminar --simular
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+from config import Config
+from carta_generator import obtener_cache_cartas
+from services.almacen_cartas import ruta_fragmentada
+from services.database_service import consultar_rutas_cartas, actualizar_rutas_cartas
+from services.s3_service import es_ruta_s3
+
+def _lotes(elementos, tamano):
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+def _actualizar(cambios):
+    actualizadas = actualizar_rutas_cartas(cambios)
+    if actualizadas is None:
+        raise RuntimeError("No se pudo actualizar solicitudes_carta")
+    return actualizadas
+
+def recorrer_solicitudes(tamano_lote):
+    """
+    Yields:
+        list: Lotes de (id, ruta_pdf) de las solicitudes con PDF
+
+    Raises:
+        RuntimeError: Si falla la consulta
+    """
+    despues = 0
+    while True:
+        lote = consultar_rutas_cartas(despues, tamano_lote)
+        if lote is None:
+            raise RuntimeError("No se pudieron leer las solicitudes de carta")
+        if lote:
+            yield lote
+        if len(lote) < tamano_lote:
+            return
+        despues = lote[-1][0]
+
+def migrar(cache, tamano_lote, simular=False):
+    """
+    Mueve los PDF sueltos en la raíz del almacén a su subcarpeta y actualiza su ruta_pdf
+
+    Si no se puede guardar un lote en la base de datos, sus archivos vuelven a
+    la raíz y la tarea se puede repetir.
+
+    Returns:
+        int: Cartas movidas (o que se moverían, con `simular`)
+    """
+    if cache.niveles == 0:
+        return 0
+    try:
+        entradas = list(os.scandir(cache.directorio))
+    except FileNotFoundError:
+        return 0
+    sueltos = {
+        os.path.normpath(entrada.path): cache.ruta(entrada.name)
+        for entrada in entradas
+        if entrada.is_file() and entrada.name.endswith(cache.extension)
+    }
+    if simular or not sueltos:
+        return len(sueltos)
+
+    solicitudes = {}
+    for lote in recorrer_solicitudes(tamano_lote):
+        for solicitud_id, ruta in lote:
+            if not es_ruta_s3(ruta) and os.path.normpath(ruta) in sueltos:
+                solicitudes.setdefault(os.path.normpath(ruta), []).append((solicitud_id, ruta))
+
+    movidas = 0
+    for lote in _lotes(list(sueltos.items()), tamano_lote):
+        cambios = []
+        for origen, destino in lote:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(origen, destino)
+            cambios.extend((solicitud_id, ruta, destino) for solicitud_id, ruta in solicitudes.get(origen, []))
+        try:
+            _actualizar(cambios)
+        except RuntimeError:
+            for origen, destino in lote:
+                os.replace(destino, origen)
+            raise
+        if cache.manifiesto is not None:
+            cache.manifiesto.registrar_varios(
+                [(destino, os.path.getsize(destino), os.path.getmtime(destino)) for _, destino in lote]
+            )
+            cache.manifiesto.asociar_varias([(solicitud_id, destino) for solicitud_id, _, destino in cambios])
+        movidas += len(lote)
+    return movidas
+
+def indexar(cache, tamano_lote):
+    """
+    Reconstruye el manifiesto: archivos desde las carpetas y solicitudes desde solicitudes_carta
+
+    Returns:
+        dict: 'archivos', 'solicitudes' y 'temporales' (eliminados)
+    """
+    manifiesto = cache.manifiesto
+    manifiesto.vaciar()
+    ahora = time.time()
+    resultado = {'archivos': 0, 'solicitudes': 0, 'temporales': 0}
+
+    archivos = []
+    for entrada, temporal in cache.recorrer_archivos():
+        try:
+            estado = entrada.stat()
+            if temporal:
+                # Los de menos de una hora pueden ser de una carta que se está generando
+                if ahora - estado.st_mtime > 3600:
+                    os.remove(entrada.path)
+                    resultado['temporales'] += 1
+                continue
+        except FileNotFoundError:
+            continue
+        archivos.append((entrada.path, estado.st_size, estado.st_mtime))
+        if len(archivos) >= tamano_lote:
+            manifiesto.registrar_varios(archivos)
+            resultado['archivos'] += len(archivos)
+            archivos = []
+    manifiesto.registrar_varios(archivos)
+    resultado['archivos'] += len(archivos)
+
+    # Las solicitudes cuyo archivo no está quedan como huérfanas en el manifiesto
+    raiz = os.path.normpath(cache.directorio) + os.sep
+    for lote in recorrer_solicitudes(tamano_lote):
+        locales = [(solicitud_id, ruta) for solicitud_id, ruta in lote
+                   if not es_ruta_s3(ruta) and os.path.normpath(ruta).startswith(raiz)]
+        manifiesto.asociar_varias(locales)
+        resultado['solicitudes'] += len(locales)
+    return resultado
+
+def aplicar_retencion(cache, dias, archivo, tamano_lote, simular=False):
+    """
+    Archiva o elimina las cartas sin uso desde hace más de `dias` días
+
+    Las solicitudes de una carta archivada pasan a apuntar a su copia en
+    `archivo`; las de una carta eliminada quedan como 'expirada'.
+
+    Args:
+        archivo: Carpeta donde se archivan (None o '' para eliminarlas)
+
+    Returns:
+        int: Cartas archivadas o eliminadas (o que lo serían, con `simular`)
+    """
+    manifiesto = cache.manifiesto
+    limite = time.time() - dias * 86400
+    vencidas = [ruta for ruta, _, _ in manifiesto.recorrer_por_uso(tamano_lote, antes_de=limite)]
+    if simular:
+        return len(vencidas)
+
+    procesadas = 0
+    for lote in _lotes(vencidas, tamano_lote):
+        cambios = []
+        copias = []
+        rutas = []
+        solicitud_ids = []
+        for ruta in lote:
+            try:
+                if os.path.getmtime(ruta) >= limite:
+                    continue  # se volvió a usar mientras tanto; el manifiesto se actualizará en su próximo uso
+            except OSError:
+                pass  # ya no existe: sus solicitudes se expiran
+            destino = None
+            if archivo and os.path.exists(ruta):
+                destino = ruta_fragmentada(archivo, os.path.basename(ruta), cache.niveles)
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                shutil.copy2(ruta, destino)
+                copias.append(destino)
+            ids = manifiesto.solicitudes_de(ruta)
+            cambios.extend((solicitud_id, ruta, destino) for solicitud_id in ids)
+            solicitud_ids.extend(ids)
+            rutas.append(ruta)
+        try:
+            _actualizar(cambios)
+        except RuntimeError:
+            for copia in copias:
+                os.remove(copia)
+            raise
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+        manifiesto.olvidar(rutas)
+        manifiesto.desasociar(solicitud_ids)
+        procesadas += len(rutas)
+    return procesadas
+
+def limpiar_huerfanas(cache, tamano_lote, simular=False):
+    """
+    Deja sin ruta_pdf (estado 'expirada') las solicitudes cuyo PDF ya no existe
+
+    Returns:
+        int: Solicitudes expiradas (o que se expirarían, con `simular`)
+    """
+    manifiesto = cache.manifiesto
+    despues = 0
+    expiradas = 0
+    while True:
+        lote = manifiesto.huerfanas(despues, tamano_lote)
+        if not lote:
+            return expiradas
+        despues = lote[-1][0]
+        # Un archivo generado sin anotarse en el manifiesto sigue siendo válido
+        presentes = {ruta for _, ruta in lote if os.path.exists(ruta)}
+        huerfanas = [(solicitud_id, ruta) for solicitud_id, ruta in lote if ruta not in presentes]
+        expiradas += len(huerfanas)
+        if simular:
+            continue
+        manifiesto.registrar_varios([(ruta, os.path.getsize(ruta), os.path.getmtime(ruta)) for ruta in presentes])
+        _actualizar([(solicitud_id, ruta, None) for solicitud_id, ruta in huerfanas])
+        manifiesto.desasociar([solicitud_id for solicitud_id, _ in huerfanas])
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Mantenimiento de los PDF de cartas en static/cartas")
+    parser.add_argument('--migrar', action='store_true', help="mueve las cartas sueltas a su subcarpeta")
+    parser.add_argument('--indexar', action='store_true', help="reconstruye el manifiesto de cartas")
+    parser.add_argument('--retener', action='store_true', help="archiva o elimina las cartas sin uso reciente")
+    parser.add_argument('--huerfanas', action='store_true', help="expira las solicitudes cuyo PDF ya no existe")
+    parser.add_argument('--dias', type=int, default=Config.CARTAS_RETENCION_DIAS,
+                        help="días sin uso antes de archivar una carta (por defecto, CARTAS_RETENCION_DIAS)")
+    parser.add_argument('--eliminar', action='store_true', help="con --retener, elimina en lugar de archivar")
+    parser.add_argument('--lote', type=int, default=Config.CARTAS_LOTE_MANTENIMIENTO, help="cartas por transacción")
+    parser.add_argument('--simular', action='store_true', help="solo informa lo que se haría")
+    args = parser.parse_args()
+    if not (args.migrar or args.indexar or args.retener or args.huerfanas):
+        parser.error("indica al menos una tarea: --migrar, --indexar, --retener o --huerfanas")
+
+    cache = obtener_cache_cartas()
+    if cache.manifiesto is None and (args.indexar or args.retener or args.huerfanas):
+        print("❌ Error: No hay manifiesto de cartas (Config.CARTAS_MANIFIESTO está vacío)")
+        return 1
+    prefijo = "(simulación) " if args.simular else ""
+    try:
+        if args.migrar:
+            movidas = migrar(cache, args.lote, args.simular)
+            print(f"✅ {prefijo}{movidas} carta(s) movidas a su subcarpeta")
+        if args.indexar and args.simular:
+            print("⚠️  --indexar no se simula (solo reconstruye el manifiesto)")
+        elif args.indexar:
+            resultado = indexar(cache, args.lote)
+            print(f"✅ Manifiesto reconstruido: {resultado['archivos']} archivo(s), "
+                  f"{resultado['solicitudes']} solicitud(es), {resultado['temporales']} temporal(es) eliminados")
+        if args.retener:
+            archivo = None if args.eliminar else Config.CARTAS_ARCHIVO
+            procesadas = aplicar_retencion(cache, args.dias, archivo, args.lote, args.simular)
+            accion = f"archivadas en {archivo}" if archivo else "eliminadas"
+            print(f"✅ {prefijo}{procesadas} carta(s) sin uso en {args.dias} días {accion}")
+        if args.huerfanas:
+            expiradas = limpiar_huerfanas(cache, args.lote, args.simular)
+            print(f"✅ {prefijo}{expiradas} solicitud(es) sin PDF marcadas como expiradas")
+        return 0
+    except Exception as e:
+        print(f"❌ Error al mantener las cartas: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
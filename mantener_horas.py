@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento de los totales de horas materializados
+
+Las tablas horas_estudiante (total por estudiante) y horas_estudiante_empresa
+(desglose por empresa) se actualizan con triggers sobre practicas. Este script
+permite recalcularlas desde cero o comprobar que coinciden con practicas.
+
+Uso:
+    python mantener_horas.py --verificar
+    python mantener_horas.py --reconstruir
+"""
+
+import argparse
+import sys
+
+from services.database_service import get_connection
+
+SQL_CREAR_TABLAS = [
+    """
+    CREATE TABLE IF NOT EXISTS horas_estudiante (
+        estudiante_id INT PRIMARY KEY,
+        total_horas DECIMAL(12, 2) NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS horas_estudiante_empresa (
+        estudiante_id INT NOT NULL,
+        empresa_id INT NOT NULL,
+        horas DECIMAL(12, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (estudiante_id, empresa_id)
+    )
+    """,
+]
+
+# Suma (o resta, con delta negativo) horas al estudiante y empresa de una práctica
+SQL_CREAR_PROCEDIMIENTO = """
+    CREATE PROCEDURE ajustar_horas_practica(IN p_estudiante_empresa_id INT, IN p_delta DECIMAL(12, 2))
+    BEGIN
+        DECLARE v_estudiante_id INT DEFAULT NULL;
+        DECLARE v_empresa_id INT DEFAULT NULL;
+        SELECT estudiante_id, empresa_id INTO v_estudiante_id, v_empresa_id
+        FROM estudiantes_empresas WHERE id = p_estudiante_empresa_id;
+        IF v_estudiante_id IS NOT NULL AND p_delta IS NOT NULL AND p_delta <> 0 THEN
+            INSERT INTO horas_estudiante_empresa (estudiante_id, empresa_id, horas)
+            VALUES (v_estudiante_id, v_empresa_id, p_delta)
+            ON DUPLICATE KEY UPDATE horas = horas + p_delta;
+            INSERT INTO horas_estudiante (estudiante_id, total_horas)
+            VALUES (v_estudiante_id, p_delta)
+            ON DUPLICATE KEY UPDATE total_horas = total_horas + p_delta;
+        END IF;
+    END
+"""
+
+SQL_CREAR_TRIGGERS = {
+    'trg_practicas_horas_insert': """
+        CREATE TRIGGER trg_practicas_horas_insert AFTER INSERT ON practicas FOR EACH ROW
+        CALL ajustar_horas_practica(NEW.estudiante_empresa_id, NEW.horas)
+    """,
+    'trg_practicas_horas_update': """
+        CREATE TRIGGER trg_practicas_horas_update AFTER UPDATE ON practicas FOR EACH ROW
+        BEGIN
+            CALL ajustar_horas_practica(OLD.estudiante_empresa_id, -OLD.horas);
+            CALL ajustar_horas_practica(NEW.estudiante_empresa_id, NEW.horas);
+        END
+    """,
+    'trg_practicas_horas_delete': """
+        CREATE TRIGGER trg_practicas_horas_delete AFTER DELETE ON practicas FOR EACH ROW
+        CALL ajustar_horas_practica(OLD.estudiante_empresa_id, -OLD.horas)
+    """,
+}
+
+SQL_HORAS_DESDE_PRACTICAS = """
+    SELECT estudiantes_empresas.estudiante_id, estudiantes_empresas.empresa_id, SUM(practicas.horas)
+    FROM practicas
+    JOIN estudiantes_empresas ON practicas.estudiante_empresa_id = estudiantes_empresas.id
+    GROUP BY estudiantes_empresas.estudiante_id, estudiantes_empresas.empresa_id
+"""
+
+def crear_agregados(cursor):
+    """Crea las tablas, el procedimiento y los triggers (se puede ejecutar más de una vez)"""
+    for query in SQL_CREAR_TABLAS:
+        cursor.execute(query)
+    cursor.execute("DROP PROCEDURE IF EXISTS ajustar_horas_practica")
+    cursor.execute(SQL_CREAR_PROCEDIMIENTO)
+    for nombre, query in SQL_CREAR_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+        cursor.execute(query)
+
+def reconstruir_horas(cursor):
+    """Recalcula ambas tablas a partir de practicas (no hace commit)"""
+    cursor.execute("DELETE FROM horas_estudiante_empresa")
+    cursor.execute("DELETE FROM horas_estudiante")
+    cursor.execute(f"""
+        INSERT INTO horas_estudiante_empresa (estudiante_id, empresa_id, horas)
+        {SQL_HORAS_DESDE_PRACTICAS}
+    """)
+    cursor.execute("""
+        INSERT INTO horas_estudiante (estudiante_id, total_horas)
+        SELECT estudiante_id, SUM(horas) FROM horas_estudiante_empresa GROUP BY estudiante_id
+    """)
+
+def diferencias_horas(cursor):
+    """
+    Compara los totales materializados con los calculados desde practicas
+
+    Returns:
+        list: (estudiante_id, empresa_id, horas_calculadas, horas_materializadas)
+        por cada diferencia; empresa_id es None para el total del estudiante
+    """
+    cursor.execute(SQL_HORAS_DESDE_PRACTICAS)
+    calculadas = {(e, m): h or 0 for e, m, h in cursor.fetchall()}
+    cursor.execute("SELECT estudiante_id, empresa_id, horas FROM horas_estudiante_empresa")
+    materializadas = {(e, m): h for e, m, h in cursor.fetchall()}
+
+    diferencias = []
+    for clave in sorted(set(calculadas) | set(materializadas)):
+        esperado = calculadas.get(clave, 0)
+        actual = materializadas.get(clave, 0)
+        if esperado != actual:
+            diferencias.append((clave[0], clave[1], esperado, actual))
+
+    totales = {}
+    for (estudiante_id, _), horas in calculadas.items():
+        totales[estudiante_id] = totales.get(estudiante_id, 0) + horas
+    cursor.execute("SELECT estudiante_id, total_horas FROM horas_estudiante")
+    totales_materializados = dict(cursor.fetchall())
+    for estudiante_id in sorted(set(totales) | set(totales_materializados)):
+        esperado = totales.get(estudiante_id, 0)
+        actual = totales_materializados.get(estudiante_id, 0)
+        if esperado != actual:
+            diferencias.append((estudiante_id, None, esperado, actual))
+    return diferencias
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Mantenimiento de los totales de horas materializados")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--verificar', action='store_true', help="compara los totales con practicas")
+    grupo.add_argument('--reconstruir', action='store_true', help="recalcula los totales desde practicas")
+    args = parser.parse_args()
+
+    connection = get_connection()
+    if connection is None:
+        print("❌ Error: No se pudo conectar a la base de datos")
+        return 1
+    try:
+        cursor = connection.cursor()
+        if args.reconstruir:
+            reconstruir_horas(cursor)
+            connection.commit()
+            print("✅ Totales de horas reconstruidos")
+            return 0
+
+        diferencias = diferencias_horas(cursor)
+        for estudiante_id, empresa_id, esperado, actual in diferencias:
+            detalle = f"empresa {empresa_id}" if empresa_id is not None else "total"
+            print(f"❌ Estudiante {estudiante_id} ({detalle}): practicas={esperado}, materializado={actual}")
+        if diferencias:
+            print(f"\n❌ {len(diferencias)} diferencia(s); ejecuta --reconstruir para corregirlas")
+            return 1
+        print("✅ Los totales de horas coinciden con practicas")
+        return 0
+    except Exception as e:
+        connection.rollback()
+        print(f"❌ Error al mantener los totales de horas: {e}")
+        return 1
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
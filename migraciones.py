@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Migraciones versionadas del esquema y verificación de planes de ejecución
+
+Uso:
+    python migraciones.py              Aplica las migraciones pendientes
+    python migraciones.py --estado     Muestra las migraciones aplicadas y pendientes
+    python migraciones.py --verificar  Ejecuta EXPLAIN sobre las consultas de
+                                       database_service y falla si alguna recorre
+                                       una tabla completa por encima del umbral
+"""
+
+import argparse
+import sys
+
+from config import Config
+from services.database_service import get_connection, CONSULTAS_LECTURA
+from mantener_horas import crear_agregados, reconstruir_horas
+
+def _existe_tabla(cursor, tabla):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (tabla,)
+    )
+    return cursor.fetchone()[0] > 0
+
+def _columnas_de_tabla(cursor, tabla):
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (tabla,))
+    return {fila[0] for fila in cursor.fetchall()}
+
+def _indices_de_tabla(cursor, tabla):
+    """Devuelve {nombre_indice: ([columnas en orden], es_unico)} de una tabla"""
+    cursor.execute("""
+        SELECT INDEX_NAME, COLUMN_NAME, NON_UNIQUE
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (tabla,))
+    indices = {}
+    for nombre, columna, no_unico in cursor.fetchall():
+        columnas, _ = indices.get(nombre, ([], False))
+        indices[nombre] = (columnas + [columna], not no_unico)
+    return indices
+
+def _crear_indice(cursor, tabla, nombre, columnas, unico=False):
+    """
+    Crea el índice salvo que la tabla no exista o ya haya uno que lo cubra
+    (uno que empiece por esas columnas o, si es único, otro único con las mismas columnas)
+    """
+    if not _existe_tabla(cursor, tabla):
+        print(f"  ⚠️  La tabla '{tabla}' no existe, se omite el índice {nombre}")
+        return
+    for existente, (columnas_existentes, es_unico) in _indices_de_tabla(cursor, tabla).items():
+        if unico:
+            cubierto = es_unico and columnas_existentes == list(columnas)
+        else:
+            cubierto = columnas_existentes[:len(columnas)] == list(columnas)
+        if cubierto:
+            print(f"  - {tabla}({', '.join(columnas)}) ya está cubierto por {existente}")
+            return
+    tipo = "UNIQUE INDEX" if unico else "INDEX"
+    cursor.execute(f"CREATE {tipo} {nombre} ON {tabla} ({', '.join(columnas)})")
+    print(f"  ✅ Índice {nombre} creado en {tabla}({', '.join(columnas)})")
+
+# Migración 1: índices secundarios para las búsquedas y joins de database_service
+def _migracion_001_indices(cursor):
+    _crear_indice(cursor, 'estudiantes', 'idx_estudiantes_codigo', ['codigo'])
+    _crear_indice(cursor, 'empresas', 'idx_empresas_nombre', ['nombre'])
+    _crear_indice(cursor, 'solicitudes_carta', 'idx_solicitudes_estudiante_empresa', ['estudiante_id', 'empresa_id'])
+    _crear_indice(cursor, 'fechas_criticas', 'idx_fechas_criticas_estado', ['estado'])
+    _crear_indice(cursor, 'oportunidades_practicas', 'idx_oportunidades_estado', ['estado'])
+    _crear_indice(cursor, 'estudiantes_empresas', 'idx_estudiantes_empresas_estudiante', ['estudiante_id'])
+    _crear_indice(cursor, 'estudiantes_empresas', 'idx_estudiantes_empresas_empresa', ['empresa_id'])
+    _crear_indice(cursor, 'practicas', 'idx_practicas_estudiante_empresa', ['estudiante_empresa_id'])
+
+# Migración 2: totales de horas materializados y mantenidos por triggers sobre practicas
+def _migracion_002_horas_materializadas(cursor):
+    crear_agregados(cursor)
+    reconstruir_horas(cursor)
+    print("  ✅ Totales de horas creados y calculados desde practicas")
+
+# Migración 3: ciclo de vida de solicitudes_carta y una sola carta por estudiante y empresa
+def _migracion_003_solicitudes_unicas(cursor):
+    columnas = _columnas_de_tabla(cursor, 'solicitudes_carta')
+    if 'ruta_pdf' not in columnas:
+        cursor.execute("ALTER TABLE solicitudes_carta ADD COLUMN ruta_pdf VARCHAR(500) NULL")
+    if 'estado' in columnas:
+        # MODIFY ... NOT NULL falla en modo estricto si alguna fila tiene estado NULL
+        cursor.execute("UPDATE solicitudes_carta SET estado = 'pendiente' WHERE estado IS NULL")
+        cursor.execute("ALTER TABLE solicitudes_carta MODIFY COLUMN estado VARCHAR(20) NOT NULL DEFAULT 'pendiente'")
+    else:
+        cursor.execute("ALTER TABLE solicitudes_carta ADD COLUMN estado VARCHAR(20) NOT NULL DEFAULT 'pendiente'")
+    cursor.execute("""
+        UPDATE solicitudes_carta SET estado = 'generada'
+        WHERE ruta_pdf IS NOT NULL AND estado = 'pendiente'
+    """)
+
+    # Antes se insertaban dos filas por carta: se conserva la que tiene PDF (y la más reciente).
+    # Las demás se copian a solicitudes_carta_duplicadas antes de borrarlas, para poder revisarlas
+    cursor.execute("CREATE TABLE IF NOT EXISTS solicitudes_carta_duplicadas LIKE solicitudes_carta")
+    cursor.execute("""
+        INSERT IGNORE INTO solicitudes_carta_duplicadas
+        SELECT DISTINCT s1.* FROM solicitudes_carta s1
+        JOIN solicitudes_carta s2
+          ON s1.estudiante_id = s2.estudiante_id
+         AND s1.empresa_id = s2.empresa_id
+         AND (
+              (s2.ruta_pdf IS NOT NULL AND s1.ruta_pdf IS NULL)
+              OR ((s1.ruta_pdf IS NULL) = (s2.ruta_pdf IS NULL) AND s2.id > s1.id)
+         )
+    """)
+    cursor.execute("""
+        DELETE s1 FROM solicitudes_carta s1
+        JOIN solicitudes_carta_duplicadas d ON s1.id = d.id
+    """)
+    print(f"  ✅ {cursor.rowcount} solicitud(es) duplicada(s) movida(s) a solicitudes_carta_duplicadas")
+
+    _crear_indice(cursor, 'solicitudes_carta', 'uq_solicitudes_estudiante_empresa',
+                  ['estudiante_id', 'empresa_id'], unico=True)
+    # El índice de la migración 1 queda cubierto por el único
+    if 'idx_solicitudes_estudiante_empresa' in _indices_de_tabla(cursor, 'solicitudes_carta'):
+        cursor.execute("DROP INDEX idx_solicitudes_estudiante_empresa ON solicitudes_carta")
+
+# Migración 4: exportación de solicitudes por rango de fechas sin ordenar en memoria
+def _migracion_004_solicitudes_por_fecha(cursor):
+    _crear_indice(cursor, 'solicitudes_carta', 'idx_solicitudes_fecha', ['fecha_solicitud'])
+
+# Migración 5: RUC de las empresas (búsqueda exacta por RUC)
+def _migracion_005_ruc_empresas(cursor):
+    if 'ruc' not in _columnas_de_tabla(cursor, 'empresas'):
+        cursor.execute("ALTER TABLE empresas ADD COLUMN ruc VARCHAR(20) NULL AFTER nombre")
+    _crear_indice(cursor, 'empresas', 'idx_empresas_ruc', ['ruc'])
+
+# Migración 6: quién está generando cada solicitud 'pendiente' (services/database_service.py, 3.1)
+def _migracion_006_solicitudes_iniciadas(cursor):
+    if 'iniciada_en' not in _columnas_de_tabla(cursor, 'solicitudes_carta'):
+        cursor.execute("ALTER TABLE solicitudes_carta ADD COLUMN iniciada_en DATETIME NULL")
+
+# Lista ordenada de migraciones: (versión, descripción, función que recibe el cursor)
+# Cada función debe poder ejecutarse de nuevo sin error, porque en MySQL el DDL
+# hace commit implícito y una migración puede quedar a medias
+MIGRACIONES = [
+    (1, "Índices secundarios para búsquedas y joins", _migracion_001_indices),
+    (2, "Totales de horas por estudiante y empresa", _migracion_002_horas_materializadas),
+    (3, "Una solicitud de carta por estudiante y empresa", _migracion_003_solicitudes_unicas),
+    (4, "Índice de solicitudes por fecha para exportaciones", _migracion_004_solicitudes_por_fecha),
+    (5, "Columna ruc en empresas", _migracion_005_ruc_empresas),
+    (6, "Inicio de la generación de cada solicitud de carta", _migracion_006_solicitudes_iniciadas),
+]
+
+def _asegurar_tabla_migraciones(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            descripcion VARCHAR(200) NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _versiones_aplicadas(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {fila[0] for fila in cursor.fetchall()}
+
+def aplicar_migraciones():
+    """Aplica en orden las migraciones que aún no están registradas en schema_migrations"""
+    connection = get_connection()
+    if connection is None:
+        print("❌ Error: No se pudo conectar a la base de datos")
+        return False
+    try:
+        cursor = connection.cursor()
+        _asegurar_tabla_migraciones(cursor)
+        aplicadas = _versiones_aplicadas(cursor)
+
+        pendientes = [m for m in MIGRACIONES if m[0] not in aplicadas]
+        if not pendientes:
+            print("✅ El esquema está al día")
+            return True
+
+        for version, descripcion, migrar in pendientes:
+            print(f"🔧 Aplicando migración {version}: {descripcion}")
+            migrar(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, descripcion) VALUES (%s, %s)",
+                (version, descripcion)
+            )
+            connection.commit()
+        cursor.close()
+        print(f"\n✅ {len(pendientes)} migración(es) aplicada(s)")
+        return True
+    except Exception as e:
+        connection.rollback()
+        print(f"❌ Error al aplicar migraciones: {e}")
+        return False
+    finally:
+        connection.close()
+
+def mostrar_estado():
+    """Muestra qué migraciones están aplicadas y cuáles pendientes"""
+    connection = get_connection()
+    if connection is None:
+        print("❌ Error: No se pudo conectar a la base de datos")
+        return False
+    try:
+        cursor = connection.cursor()
+        _asegurar_tabla_migraciones(cursor)
+        aplicadas = _versiones_aplicadas(cursor)
+        cursor.close()
+        for version, descripcion, _ in MIGRACIONES:
+            marca = "✅" if version in aplicadas else "⏳"
+            print(f"{marca} {version:03d} {descripcion}")
+        return True
+    except Exception as e:
+        print(f"❌ Error al consultar migraciones: {e}")
+        return False
+    finally:
+        connection.close()
+
+def verificar_planes(max_filas=None):
+    """
+    Ejecuta EXPLAIN sobre cada consulta de lectura de database_service
+
+    Args:
+        max_filas: Filas estimadas a partir de las cuales un recorrido completo
+            de tabla se considera un problema (por defecto Config.EXPLAIN_MAX_FILAS_ESCANEO)
+
+    Returns:
+        list: Problemas encontrados como (consulta, tabla, filas estimadas);
+        None si no se pudo conectar
+    """
+    if max_filas is None:
+        max_filas = Config.EXPLAIN_MAX_FILAS_ESCANEO
+
+    connection = get_connection()
+    if connection is None:
+        print("❌ Error: No se pudo conectar a la base de datos")
+        return None
+
+    problemas = []
+    try:
+        cursor = connection.cursor(dictionary=True)
+        for nombre, (query, parametros) in CONSULTAS_LECTURA.items():
+            try:
+                cursor.execute("EXPLAIN " + query, parametros)
+                pasos = cursor.fetchall()
+            except Exception as e:
+                problemas.append((nombre, None, None))
+                print(f"❌ {nombre}: no se pudo ejecutar EXPLAIN ({e})")
+                continue
+            for paso in pasos:
+                filas = paso.get('rows') or 0
+                if paso.get('type') == 'ALL' and filas > max_filas:
+                    problemas.append((nombre, paso.get('table'), filas))
+                    print(f"❌ {nombre}: recorrido completo de '{paso.get('table')}' (~{filas} filas)")
+                    break
+            else:
+                print(f"✅ {nombre}")
+        cursor.close()
+    finally:
+        connection.close()
+    return problemas
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de la base de datos")
+    parser.add_argument('--estado', action='store_true', help="muestra las migraciones aplicadas y pendientes")
+    parser.add_argument('--verificar', action='store_true', help="revisa los planes de ejecución con EXPLAIN")
+    parser.add_argument('--max-filas', type=int, default=None,
+                        help="umbral de filas para considerar un recorrido completo como problema")
+    args = parser.parse_args()
+
+    if args.estado:
+        return 0 if mostrar_estado() else 1
+
+    if args.verificar:
+        problemas = verificar_planes(args.max_filas)
+        if problemas is None:
+            return 1
+        if problemas:
+            print(f"\n❌ {len(problemas)} consulta(s) recorren tablas completas")
+            return 1
+        print("\n✅ Ninguna consulta recorre tablas completas por encima del umbral")
+        return 0
+
+    return 0 if aplicar_migraciones() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Almacén de cartas PDF en subcarpetas por hash, con un manifiesto en disco
+
+Con miles de cartas en una sola carpeta, listar static/cartas (y respaldarla)
+se vuelve lento. Cada carta se guarda en static/cartas/ab/cd/<nombre>, donde
+ab y cd son los primeros caracteres del sha256 del nombre, así ninguna carpeta
+acumula más que unas decenas de archivos. El manifiesto es una base SQLite con
+el tamaño y el último uso de cada archivo y el archivo de cada solicitud de
+carta (solicitudes_carta.id): la limpieza de la caché (services/cache_cartas.py)
+y el mantenimiento (mantener_cartas.py) lo consultan en lugar de recorrer las
+carpetas.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+SQL_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    ruta TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL,
+    usado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_archivos_usado ON archivos (usado, ruta);
+
+CREATE TABLE IF NOT EXISTS solicitudes (
+    solicitud_id INTEGER PRIMARY KEY,
+    ruta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_solicitudes_ruta ON solicitudes (ruta);
+"""
+
+# Lo escriben a la vez el proceso principal y los procesos del pool de render
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 30000",
+]
+
+SQL_REGISTRAR_ARCHIVO = """
+    INSERT INTO archivos (ruta, bytes, usado) VALUES (?, ?, ?)
+    ON CONFLICT (ruta) DO UPDATE SET bytes = excluded.bytes, usado = excluded.usado
+"""
+
+SQL_ARCHIVOS_POR_USO = """
+    SELECT ruta, bytes, usado FROM archivos
+    WHERE (usado, ruta) > (?, ?)
+    ORDER BY usado, ruta LIMIT ?
+"""
+
+# Solicitudes cuyo archivo ya no está en el almacén (la caché lo eliminó)
+SQL_HUERFANAS = """
+    SELECT solicitudes.solicitud_id, solicitudes.ruta FROM solicitudes
+    LEFT JOIN archivos ON archivos.ruta = solicitudes.ruta
+    WHERE archivos.ruta IS NULL AND solicitudes.solicitud_id > ?
+    ORDER BY solicitudes.solicitud_id LIMIT ?
+"""
+
+def ruta_fragmentada(directorio, nombre, niveles=2):
+    """
+    Args:
+        directorio: Carpeta raíz del almacén
+        nombre: Nombre del archivo
+        niveles: Subcarpetas de dos caracteres del sha256 del nombre (0: directamente en `directorio`)
+
+    Returns:
+        str: directorio/ab/cd/nombre
+    """
+    resumen = hashlib.sha256(nombre.encode('utf-8')).hexdigest()
+    return os.path.join(directorio, *(resumen[2 * i:2 * i + 2] for i in range(niveles)), nombre)
+
+class ManifiestoCartas:
+    """
+    Índice en disco de los archivos del almacén y de la solicitud de cada uno
+
+    Cada proceso abre su propia conexión la primera vez que lo usa: los procesos
+    'spawn' del pool de render crean su propio manifiesto, y si uno se hereda por
+    fork la conexión del padre no se reutiliza (cambia el pid). Los errores de SQLite se
+    informan y no interrumpen la generación de cartas: el manifiesto se puede
+    reconstruir con `python mantener_cartas.py --indexar`.
+
+    Args:
+        ruta: Archivo SQLite del manifiesto
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = None
+        self._pid = None
+
+    def _conectar(self):
+        if self._conexion is None or self._pid != os.getpid():
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conexion.execute(pragma)
+            conexion.executescript(SQL_ESQUEMA)
+            self._conexion = conexion
+            self._pid = os.getpid()
+        return self._conexion
+
+    def _consultar(self, query, parametros=()):
+        try:
+            with self._lock:
+                return self._conectar().execute(query, parametros).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error al consultar el manifiesto de cartas: {e}")
+            return []
+
+    def _escribir(self, sentencias):
+        """Ejecuta [(query, filas)] en una sola transacción; False si falló"""
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                with conexion:
+                    for query, filas in sentencias:
+                        conexion.executemany(query, filas)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error al actualizar el manifiesto de cartas: {e}")
+            return False
+
+    def registrar(self, ruta, tamano, usado=None):
+        """Agrega (o actualiza) un archivo; `usado` es su último uso (por defecto, ahora)"""
+        return self.registrar_varios([(ruta, tamano, time.time() if usado is None else usado)])
+
+    def registrar_varios(self, archivos):
+        """archivos: Lista de (ruta, bytes, usado)"""
+        filas = [(os.path.normpath(ruta), tamano, usado) for ruta, tamano, usado in archivos]
+        return self._escribir([(SQL_REGISTRAR_ARCHIVO, filas)])
+
+    def olvidar(self, rutas):
+        """Quita archivos del índice; sus solicitudes quedan como huérfanas"""
+        filas = [(os.path.normpath(ruta),) for ruta in rutas]
+        return self._escribir([("DELETE FROM archivos WHERE ruta = ?", filas)])
+
+    def vaciar(self):
+        """Borra el índice (antes de reconstruirlo desde las carpetas y solicitudes_carta)"""
+        return self._escribir([("DELETE FROM archivos", [()]), ("DELETE FROM solicitudes", [()])])
+
+    def asociar(self, solicitud_id, ruta):
+        return self.asociar_varias([(solicitud_id, ruta)])
+
+    def asociar_varias(self, solicitudes):
+        """solicitudes: Lista de (solicitud_id, ruta)"""
+        filas = [(solicitud_id, os.path.normpath(ruta)) for solicitud_id, ruta in solicitudes]
+        return self._escribir([("INSERT OR REPLACE INTO solicitudes (solicitud_id, ruta) VALUES (?, ?)", filas)])
+
+    def desasociar(self, solicitud_ids):
+        filas = [(solicitud_id,) for solicitud_id in solicitud_ids]
+        return self._escribir([("DELETE FROM solicitudes WHERE solicitud_id = ?", filas)])
+
+    def ruta_solicitud(self, solicitud_id):
+        """Returns: str: Archivo de la solicitud, o None si no está en el manifiesto"""
+        filas = self._consultar("SELECT ruta FROM solicitudes WHERE solicitud_id = ?", (solicitud_id,))
+        return filas[0][0] if filas else None
+
+    def solicitudes_de(self, ruta):
+        """Returns: list: IDs de las solicitudes que apuntan a `ruta`"""
+        filas = self._consultar(
+            "SELECT solicitud_id FROM solicitudes WHERE ruta = ? ORDER BY solicitud_id", (os.path.normpath(ruta),)
+        )
+        return [solicitud_id for solicitud_id, in filas]
+
+    def recorrer_por_uso(self, tamano_lote=500, antes_de=None):
+        """
+        Recorre los archivos del usado hace más tiempo al más reciente (keyset por uso y ruta)
+
+        Args:
+            tamano_lote: Filas por consulta
+            antes_de: Si se indica, termina en el primer archivo usado después de este instante
+
+        Yields:
+            tuple: (ruta, bytes, usado)
+        """
+        despues = (float('-inf'), '')
+        while True:
+            lote = self._consultar(SQL_ARCHIVOS_POR_USO, despues + (tamano_lote,))
+            for ruta, tamano, usado in lote:
+                if antes_de is not None and usado >= antes_de:
+                    return
+                yield ruta, tamano, usado
+            if len(lote) < tamano_lote:
+                return
+            despues = (lote[-1][2], lote[-1][0])
+
+    def huerfanas(self, despues_id=0, limite=500):
+        """Returns: list: (solicitud_id, ruta) de las solicitudes cuyo archivo ya no está en el índice"""
+        return self._consultar(SQL_HUERFANAS, (despues_id, limite))
+
+    def total_bytes(self):
+        filas = self._consultar("SELECT COALESCE(SUM(bytes), 0) FROM archivos")
+        return filas[0][0] if filas else 0
+
+    def estadisticas(self):
+        archivos = self._consultar("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM archivos")
+        solicitudes = self._consultar("SELECT COUNT(*) FROM solicitudes")
+        return {
+            'archivos': archivos[0][0] if archivos else None,
+            'bytes': archivos[0][1] if archivos else None,
+            'solicitudes': solicitudes[0][0] if solicitudes else None,
+        }
+
+    def cerrar(self):
+        with self._lock:
+            if self._conexion is not None and self._pid == os.getpid():
+                self._conexion.close()
+            self._conexion = None
@@ -0,0 +1,217 @@
+"""
+Caché en disco de cartas PDF direccionada por contenido
+
+El nombre de cada archivo incluye el sha256 de los datos que determinan la
+carta (datos normalizados del estudiante y la empresa, versión de la plantilla
+y fecha), así una solicitud idéntica devuelve el PDF ya generado en lugar de
+volver a maquetarlo. Los PDF se escriben en un archivo temporal y se renombran,
+de modo que nunca se sirve un archivo a medio escribir aunque dos procesos
+generen la misma carta a la vez. De vez en cuando se eliminan los archivos más
+antiguos que la edad máxima y, si el directorio supera el tamaño máximo, los
+usados hace más tiempo.
+
+Con `niveles` los archivos se reparten en subcarpetas por hash y con un
+manifiesto (services/almacen_cartas.py) la limpieza lee el tamaño y el último
+uso de cada archivo del manifiesto en lugar de recorrer las carpetas.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from services.almacen_cartas import ruta_fragmentada
+
+def normalizar_valor(valor):
+    """Texto sin espacios repetidos ni en los extremos ('' para None)"""
+    if valor is None:
+        return ''
+    return ' '.join(str(valor).split())
+
+def clave_contenido(datos):
+    """sha256 (hex) de un diccionario, independiente del orden de las claves"""
+    texto = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+class CacheArchivos:
+    """
+    Args:
+        directorio: Carpeta donde se guardan los archivos
+        max_bytes: Tamaño total a partir del cual se eliminan los archivos usados hace más tiempo
+        max_edad: Segundos sin uso tras los cuales se elimina un archivo
+        intervalo_limpieza: Segundos mínimos entre dos limpiezas automáticas
+        extension: Solo se eliminan archivos con esta extensión (y sus temporales)
+        niveles: Subcarpetas por hash del nombre (0: todos los archivos en `directorio`)
+        manifiesto: ManifiestoCartas donde se anotan los archivos (None: la limpieza recorre las carpetas)
+    """
+
+    def __init__(self, directorio, max_bytes=1024 * 1024 * 1024, max_edad=180 * 86400, intervalo_limpieza=3600,
+                 extension='.pdf', niveles=0, manifiesto=None):
+        self.directorio = directorio
+        self.extension = extension
+        self.niveles = niveles
+        self.manifiesto = manifiesto
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.intervalo_limpieza = intervalo_limpieza
+        self._lock = threading.Lock()
+        self._limpiado_en = None
+        self._aciertos = 0
+        self._generados = 0
+        self._eliminados = 0
+
+    def ruta(self, nombre):
+        """Ruta donde se guarda (o se guardaría) el archivo `nombre`"""
+        return ruta_fragmentada(self.directorio, nombre, self.niveles)
+
+    def obtener_o_generar(self, nombre, generar):
+        """
+        Devuelve la ruta de `nombre` en el directorio, generándolo si no existe
+
+        Args:
+            nombre: Nombre del archivo (debe incluir la clave de contenido)
+            generar: Función que recibe una ruta temporal y escribe ahí el archivo
+
+        Returns:
+            str: Ruta del archivo
+        """
+        ruta = self.ruta(nombre)
+        try:
+            tamano = os.path.getsize(ruta)
+        except OSError:
+            tamano = None
+        if tamano is not None:
+            try:
+                # La fecha de modificación marca el último uso para la limpieza
+                os.utime(ruta)
+            except OSError:
+                pass
+            if self.manifiesto is not None:
+                self.manifiesto.registrar(ruta, tamano)
+            with self._lock:
+                self._aciertos += 1
+            return ruta
+
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            generar(temporal)
+            os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        if self.manifiesto is not None:
+            self.manifiesto.registrar(ruta, os.path.getsize(ruta))
+        with self._lock:
+            self._generados += 1
+        self._limpiar_si_toca()
+        return ruta
+
+    def _limpiar_si_toca(self):
+        ahora = time.monotonic()
+        with self._lock:
+            if self._limpiado_en is not None and ahora - self._limpiado_en < self.intervalo_limpieza:
+                return
+            self._limpiado_en = ahora
+        self.limpiar()
+
+    def limpiar(self, proteger=()):
+        """
+        Elimina los archivos vencidos y, si hace falta, los usados hace más tiempo
+
+        Args:
+            proteger: Rutas que no se deben eliminar
+
+        Returns:
+            int: Archivos eliminados
+        """
+        protegidos = {os.path.abspath(ruta) for ruta in proteger}
+        if self.manifiesto is not None:
+            eliminados = self._limpiar_con_manifiesto(protegidos)
+        else:
+            eliminados = self._limpiar_recorriendo(protegidos)
+        with self._lock:
+            self._eliminados += eliminados
+        return eliminados
+
+    def recorrer_archivos(self):
+        """
+        Recorre el directorio y sus subcarpetas
+
+        Yields:
+            tuple: (os.DirEntry, es_temporal) de cada archivo con la extensión de la caché o temporal suyo
+        """
+        pendientes = [self.directorio]
+        while pendientes:
+            try:
+                entradas = list(os.scandir(pendientes.pop()))
+            except FileNotFoundError:
+                continue
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    pendientes.append(entrada.path)
+                    continue
+                temporal = entrada.name.endswith('.tmp') and f"{self.extension}." in entrada.name
+                if entrada.is_file() and (entrada.name.endswith(self.extension) or temporal):
+                    yield entrada, temporal
+
+    def _limpiar_recorriendo(self, protegidos):
+        ahora = time.time()
+        archivos = []
+        for entrada, temporal in self.recorrer_archivos():
+            try:
+                estado = entrada.stat()
+            except FileNotFoundError:
+                continue
+            # Temporales de una generación que se interrumpió
+            if temporal and ahora - estado.st_mtime < 3600:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, entrada.path))
+
+        archivos.sort()
+        total = sum(tamano for _, tamano, _ in archivos)
+        eliminados = 0
+        for modificado, tamano, ruta in archivos:
+            vencido = ahora - modificado > self.max_edad or ruta.endswith('.tmp')
+            if not vencido and total <= self.max_bytes:
+                continue
+            if os.path.abspath(ruta) in protegidos:
+                continue
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+            eliminados += 1
+        return eliminados
+
+    def _limpiar_con_manifiesto(self, protegidos):
+        # Los temporales no están en el manifiesto; los elimina mantener_cartas.py --indexar
+        ahora = time.time()
+        total = self.manifiesto.total_bytes()
+        eliminadas = []
+        for ruta, tamano, usado in self.manifiesto.recorrer_por_uso():
+            # Van del usado hace más tiempo al más reciente: los siguientes tampoco sobran
+            if ahora - usado <= self.max_edad and total <= self.max_bytes:
+                break
+            if os.path.abspath(ruta) in protegidos:
+                continue
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+            eliminadas.append(ruta)
+        self.manifiesto.olvidar(eliminadas)
+        return len(eliminadas)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'aciertos': self._aciertos,
+                'generados': self._generados,
+                'eliminados': self._eliminados,
+                'max_bytes': self.max_bytes,
+                'max_edad': self.max_edad,
+            }
@@ -0,0 +1,185 @@
+"""
+Caché en memoria con expiración por clave para resultados de consultas
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Número de candados de recarga; las claves se reparten entre ellos por hash
+_NUM_CANDADOS = 64
+
+
+class _Entrada:
+    def __init__(self, valor, expira_en):
+        self.valor = valor
+        self.expira_en = expira_en
+
+
+class CacheTTL:
+    """
+    Caché de lectura con TTL por clave.
+
+    Cuando una clave expira solo un hilo ejecuta la recarga; mientras tanto el
+    resto recibe el valor anterior (o espera si todavía no hay ninguno), así una
+    ráfaga de peticiones no se traduce en una ráfaga de consultas.
+
+    Con `max_entradas` la caché queda acotada y descarta primero las entradas
+    usadas hace más tiempo (LRU).
+
+    Args:
+        ttl_defecto: Segundos de vida de una entrada si no se indica otro valor
+        max_entradas: Número máximo de entradas (None = sin límite)
+    """
+
+    def __init__(self, ttl_defecto=60, max_entradas=None):
+        self.ttl_defecto = ttl_defecto
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._candados = [threading.Lock() for _ in range(_NUM_CANDADOS)]
+        self._lock = threading.Lock()
+        self._version = 0
+
+        self._aciertos = 0
+        self._fallos = 0
+        self._obsoletos_servidos = 0
+        self._cargas = 0
+        self._errores_carga = 0
+        self._invalidaciones = 0
+        self._desalojos = 0
+
+    def _candado(self, clave):
+        return self._candados[hash(clave) % _NUM_CANDADOS]
+
+    def _guardar_entrada(self, clave, valor, ttl):
+        # Se llama con self._lock tomado
+        self._entradas[clave] = _Entrada(valor, time.monotonic() + ttl)
+        self._entradas.move_to_end(clave)
+        if self.max_entradas is not None:
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._desalojos += 1
+
+    def obtener(self, clave):
+        """
+        Busca una clave vigente sin cargarla
+
+        Returns:
+            tuple: (encontrado, valor)
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.expira_en > time.monotonic():
+                self._aciertos += 1
+                self._entradas.move_to_end(clave)
+                return True, entrada.valor
+            self._fallos += 1
+            return False, None
+
+    def guardar(self, clave, valor, ttl=None):
+        """Guarda un valor con el TTL indicado (o el TTL por defecto)."""
+        ttl = self.ttl_defecto if ttl is None else ttl
+        with self._lock:
+            self._guardar_entrada(clave, valor, ttl)
+
+    def obtener_o_cargar(self, clave, cargar, ttl=None, ttl_negativo=None):
+        """
+        Devuelve el valor de la clave, cargándolo con `cargar()` si no está vigente
+
+        Args:
+            clave: Clave de la entrada
+            cargar: Función sin argumentos que obtiene el valor desde el origen
+            ttl: Segundos de vida del valor cargado (opcional)
+            ttl_negativo: Segundos de vida cuando `cargar()` devuelve None;
+                permite recordar por poco tiempo que algo no existe (opcional)
+
+        Returns:
+            El valor en caché o el recién cargado. Si `cargar` lanza una
+            excepción no se guarda nada y la excepción se propaga.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.expira_en > ahora:
+                self._aciertos += 1
+                self._entradas.move_to_end(clave)
+                return entrada.valor
+
+        candado = self._candado(clave)
+        if entrada is not None and not candado.acquire(blocking=False):
+            # Otro hilo ya está recargando: se sirve el valor anterior
+            with self._lock:
+                self._obsoletos_servidos += 1
+            return entrada.valor
+        if entrada is None:
+            candado.acquire()
+
+        try:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada is not None and entrada.expira_en > time.monotonic():
+                    # Lo cargó el hilo que tenía el candado mientras esperábamos
+                    self._aciertos += 1
+                    return entrada.valor
+                self._fallos += 1
+                self._cargas += 1
+                version = self._version
+
+            try:
+                valor = cargar()
+            except Exception:
+                with self._lock:
+                    self._errores_carga += 1
+                raise
+
+            with self._lock:
+                # Si se invalidó durante la carga el valor puede estar desfasado
+                if version == self._version:
+                    if valor is None and ttl_negativo is not None:
+                        ttl_efectivo = ttl_negativo
+                    else:
+                        ttl_efectivo = self.ttl_defecto if ttl is None else ttl
+                    self._guardar_entrada(clave, valor, ttl_efectivo)
+            return valor
+        finally:
+            candado.release()
+
+    def invalidar(self, clave=None):
+        """Elimina una clave, o todas si no se indica ninguna."""
+        with self._lock:
+            self._version += 1
+            self._invalidaciones += 1
+            if clave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(clave, None)
+
+    def invalidar_donde(self, condicion):
+        """Elimina las claves para las que `condicion(clave)` es verdadera."""
+        with self._lock:
+            self._version += 1
+            self._invalidaciones += 1
+            for clave in [clave for clave in self._entradas if condicion(clave)]:
+                del self._entradas[clave]
+
+    def estadisticas(self):
+        """
+        Devuelve los contadores de la caché para monitoreo
+
+        Returns:
+            dict: Entradas, aciertos, fallos, cargas e invalidaciones
+        """
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'tasa_aciertos': round(self._aciertos / consultas, 4) if consultas else 0.0,
+                'obsoletos_servidos': self._obsoletos_servidos,
+                'cargas': self._cargas,
+                'errores_carga': self._errores_carga,
+                'invalidaciones': self._invalidaciones,
+                'desalojos': self._desalojos,
+            }
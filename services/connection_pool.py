@@ -0,0 +1,294 @@
+"""
+Pool de conexiones reutilizables para la base de datos
+"""
+
+import threading
+import time
+import weakref
+from collections import deque
+
+
+class PoolAgotadoError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera del pool."""
+
+
+class _RegistroConexion:
+    """Conexión física junto con los tiempos que el pool necesita para gestionarla."""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.creada_en = time.monotonic()
+        self.ultimo_uso = self.creada_en
+
+
+class ConexionPool:
+    """
+    Conexión prestada por el pool.
+
+    Se comporta como la conexión original, pero close() la devuelve al pool
+    en lugar de cerrarla, así el código existente no necesita cambios. Si se
+    pierde sin llamar a close() (p. ej. por una excepción), al recolectarla se
+    cierra la conexión física y su hueco vuelve a quedar libre.
+    """
+
+    def __init__(self, pool, registro):
+        self._pool = pool
+        self._registro = registro
+        self._finalizador = weakref.finalize(self, pool._recuperar, registro)
+
+    def __getattr__(self, nombre):
+        return getattr(self._registro.conexion, nombre)
+
+    @property
+    def conexion_fisica(self):
+        """Conexión original; sirve para asociarle estado que dura entre préstamos."""
+        return self._registro.conexion
+
+    def close(self):
+        if self._registro is not None:
+            registro, self._registro = self._registro, None
+            self._finalizador.detach()
+            self._pool._devolver(registro)
+
+    def descartar(self):
+        """Cierra la conexión física en lugar de devolverla (p. ej. con resultados a medio leer)."""
+        if self._registro is not None:
+            registro, self._registro = self._registro, None
+            self._finalizador.detach()
+            self._pool._descartar(registro)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _verificar_conexion(conexion):
+    """Comprueba que la conexión sigue viva; lanza una excepción si no lo está."""
+    if hasattr(conexion, 'ping'):
+        conexion.ping()
+    elif hasattr(conexion, 'is_connected') and not conexion.is_connected():
+        raise ConnectionError("La conexión ya no está disponible")
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones con tamaño máximo, verificación previa al préstamo,
+    reciclaje por antigüedad y tiempo máximo de espera cuando está agotado.
+
+    Args:
+        crear_conexion: Función sin argumentos que abre una conexión nueva
+        tamano: Número máximo de conexiones abiertas a la vez
+        tiempo_espera: Segundos que se espera una conexión libre antes de fallar
+        reciclar_tras: Segundos de vida de una conexión antes de reemplazarla
+        verificar_tras: Segundos de inactividad a partir de los cuales se hace
+            ping antes de prestar la conexión (0 = siempre)
+        verificar_conexion: Función que recibe la conexión y lanza si está caída
+    """
+
+    def __init__(self, crear_conexion, tamano=5, tiempo_espera=10.0, reciclar_tras=3600,
+                 verificar_tras=0, verificar_conexion=_verificar_conexion):
+        self._crear_conexion = crear_conexion
+        self._verificar_conexion = verificar_conexion
+        self.tamano = tamano
+        self.tiempo_espera = tiempo_espera
+        self.reciclar_tras = reciclar_tras
+        self.verificar_tras = verificar_tras
+
+        self._condicion = threading.Condition()
+        self._libres = deque()
+        self._abiertas = 0
+        self._en_uso = 0
+        self._en_espera = 0
+
+        self._prestamos = 0
+        self._esperas = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+        self._agotados = 0
+        self._creadas = 0
+        self._recicladas = 0
+        self._descartadas = 0
+        self._recuperadas = 0
+
+    def obtener(self, tiempo_espera=None):
+        """
+        Presta una conexión del pool.
+
+        Args:
+            tiempo_espera: Segundos de espera para este préstamo (default: los del pool;
+                0 para no esperar si está agotado)
+
+        Returns:
+            ConexionPool: Conexión prestada; llamar a close() para devolverla
+
+        Raises:
+            PoolAgotadoError: Si no se libera ninguna conexión a tiempo
+        """
+        if tiempo_espera is None:
+            tiempo_espera = self.tiempo_espera
+        inicio = time.monotonic()
+        limite = inicio + tiempo_espera
+        espero = False
+
+        with self._condicion:
+            self._en_espera += 1
+            try:
+                while True:
+                    if self._libres:
+                        registro = self._libres.pop()
+                        break
+                    if self._abiertas < self.tamano:
+                        # Se reserva el hueco ahora y se conecta fuera del lock
+                        self._abiertas += 1
+                        registro = None
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._agotados += 1
+                        raise PoolAgotadoError(
+                            f"No hay conexiones libres tras {tiempo_espera} segundos "
+                            f"({self.tamano} en uso)"
+                        )
+                    espero = True
+                    self._condicion.wait(restante)
+            finally:
+                self._en_espera -= 1
+
+            esperado = time.monotonic() - inicio
+            self._prestamos += 1
+            if espero:
+                self._esperas += 1
+            self._tiempo_espera_total += esperado
+            self._tiempo_espera_max = max(self._tiempo_espera_max, esperado)
+
+        if registro is not None:
+            registro = self._preparar(registro)
+
+        if registro is None:
+            try:
+                registro = _RegistroConexion(self._crear_conexion())
+            except Exception:
+                with self._condicion:
+                    self._abiertas -= 1
+                    self._condicion.notify()
+                raise
+            with self._condicion:
+                self._creadas += 1
+
+        with self._condicion:
+            self._en_uso += 1
+        return ConexionPool(self, registro)
+
+    def _preparar(self, registro):
+        """Recicla o verifica una conexión libre; devuelve None si hay que abrir otra."""
+        ahora = time.monotonic()
+        if ahora - registro.creada_en >= self.reciclar_tras:
+            self._cerrar_registro(registro)
+            with self._condicion:
+                self._recicladas += 1
+            return None
+        if ahora - registro.ultimo_uso >= self.verificar_tras:
+            try:
+                self._verificar_conexion(registro.conexion)
+            except Exception:
+                self._cerrar_registro(registro)
+                with self._condicion:
+                    self._descartadas += 1
+                return None
+        return registro
+
+    def _devolver(self, registro):
+        """Limpia el estado de la conexión y la deja disponible para otro préstamo."""
+        conexion = registro.conexion
+        reutilizable = True
+        try:
+            # Descarta resultados sin leer y cierra la transacción abierta para que
+            # el siguiente préstamo no vea una instantánea antigua de los datos
+            if hasattr(conexion, 'consume_results'):
+                conexion.consume_results()
+            conexion.rollback()
+        except Exception:
+            reutilizable = False
+
+        if reutilizable and time.monotonic() - registro.creada_en >= self.reciclar_tras:
+            reutilizable = False
+            with self._condicion:
+                self._recicladas += 1
+
+        if not reutilizable:
+            self._cerrar_registro(registro)
+
+        with self._condicion:
+            self._en_uso -= 1
+            if reutilizable:
+                registro.ultimo_uso = time.monotonic()
+                self._libres.append(registro)
+            else:
+                self._abiertas -= 1
+            self._condicion.notify()
+
+    def _descartar(self, registro):
+        self._cerrar_registro(registro)
+        with self._condicion:
+            self._en_uso -= 1
+            self._abiertas -= 1
+            self._descartadas += 1
+            self._condicion.notify()
+
+    def _recuperar(self, registro):
+        """Conexión prestada que se recolectó sin close(): no se sabe en qué estado quedó, así que se cierra."""
+        self._cerrar_registro(registro)
+        with self._condicion:
+            self._en_uso -= 1
+            self._abiertas -= 1
+            self._recuperadas += 1
+            self._condicion.notify()
+
+    def _cerrar_registro(self, registro):
+        try:
+            registro.conexion.close()
+        except Exception:
+            pass
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool."""
+        with self._condicion:
+            libres = list(self._libres)
+            self._libres.clear()
+            self._abiertas -= len(libres)
+        for registro in libres:
+            self._cerrar_registro(registro)
+
+    def carga(self):
+        """Fracción del pool ocupada: conexiones en uso más hilos esperando, sobre el tamaño."""
+        with self._condicion:
+            return (self._en_uso + self._en_espera) / self.tamano
+
+    def estadisticas(self):
+        """
+        Devuelve el estado actual del pool para monitoreo
+
+        Returns:
+            dict: Conexiones abiertas, en uso, libres, en espera y tiempos de espera
+        """
+        with self._condicion:
+            promedio = self._tiempo_espera_total / self._prestamos if self._prestamos else 0.0
+            return {
+                'tamano': self.tamano,
+                'abiertas': self._abiertas,
+                'en_uso': self._en_uso,
+                'libres': len(self._libres),
+                'en_espera': self._en_espera,
+                'prestamos': self._prestamos,
+                'prestamos_con_espera': self._esperas,
+                'tiempo_espera_promedio_ms': round(promedio * 1000, 3),
+                'tiempo_espera_max_ms': round(self._tiempo_espera_max * 1000, 3),
+                'agotados': self._agotados,
+                'creadas': self._creadas,
+                'recicladas': self._recicladas,
+                'descartadas': self._descartadas,
+                'recuperadas': self._recuperadas,
+            }
@@ -0,0 +1,791 @@
+"""
+Versión asíncrona (asyncio) de las funciones de database_service
+
+Usa aiomysql con su propio pool de conexiones. Las funciones tienen los mismos
+nombres, parámetros y valores de retorno que las de database_service, usan las
+mismas consultas SQL y comparten sus cachés, de modo que un manejador puede
+lanzar varias consultas a la vez con asyncio.gather sin ocupar un hilo por cada una.
+
+Ejemplo:
+    horas, empresas = await asyncio.gather(
+        consultar_horas(codigo), consultar_empresas(codigo)
+    )
+
+Desde código con hilos (los manejadores del bot corren en los hilos del
+Dispatcher) se usa ejecutar_en_segundo_plano: la corrutina corre en el event
+loop propio de esta capa y el hilo que la lanzó queda libre.
+"""
+
+import asyncio
+import threading
+
+import aiomysql
+from pymysql.err import IntegrityError, ProgrammingError
+
+from config import Config
+from services import database_service as db
+
+ER_DUP_ENTRY = 1062
+ER_NO_SUCH_TABLE = 1146
+
+_pool = None
+_pool_lock = None
+_cargas_en_curso = {}
+_loop = None
+_loop_lock = threading.Lock()
+
+# Pool asíncrono compartido (se crea en el primer uso, dentro del event loop actual)
+async def obtener_pool():
+    global _pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aiomysql.create_pool(
+                    host=Config.MYSQL_HOST,
+                    port=Config.MYSQL_PORT,
+                    user=Config.MYSQL_USER,
+                    password=Config.MYSQL_PASSWORD,
+                    db=Config.MYSQL_DB,
+                    minsize=1,
+                    maxsize=Config.MYSQL_POOL_SIZE,
+                    pool_recycle=Config.MYSQL_POOL_RECYCLE,
+                    autocommit=True
+                )
+    return _pool
+
+async def cerrar_pool():
+    """Cierra el pool asíncrono (llamar al apagar la aplicación)."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+async def get_connection():
+    """
+    Toma una conexión del pool asíncrono
+
+    Returns:
+        Conexión de aiomysql (devolverla con liberar_conexion) o None si no se pudo obtener
+    """
+    try:
+        pool = await obtener_pool()
+        return await asyncio.wait_for(pool.acquire(), timeout=Config.MYSQL_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Error al conectar a la base de datos: no hay conexiones libres tras {Config.MYSQL_POOL_TIMEOUT} segundos")
+        return None
+    except Exception as e:
+        print(f"Error al conectar a la base de datos: {e}")
+        return None
+
+# Event loop propio (un hilo, creado en el primer uso): el pool de aiomysql queda
+# ligado a un solo loop aunque las corrutinas se lancen desde muchos hilos
+def _obtener_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='database-async', daemon=True).start()
+            _loop = loop
+    return _loop
+
+def _avisar_error(futuro):
+    if not futuro.cancelled() and futuro.exception() is not None:
+        print(f"Error en tarea asíncrona: {futuro.exception()}")
+
+def ejecutar_en_segundo_plano(corrutina):
+    """
+    Programa la corrutina en el event loop de esta capa sin esperar a que termine
+
+    Returns:
+        concurrent.futures.Future con su resultado (los errores también se imprimen)
+    """
+    futuro = asyncio.run_coroutine_threadsafe(corrutina, _obtener_loop())
+    futuro.add_done_callback(_avisar_error)
+    return futuro
+
+def liberar_conexion(connection):
+    if _pool is not None:
+        _pool.release(connection)
+
+def obtener_estadisticas_pool():
+    if _pool is None:
+        return {'tamano': Config.MYSQL_POOL_SIZE, 'abiertas': 0, 'libres': 0, 'en_uso': 0}
+    return {
+        'tamano': _pool.maxsize,
+        'abiertas': _pool.size,
+        'libres': _pool.freesize,
+        'en_uso': _pool.size - _pool.freesize,
+    }
+
+async def _consultar(query, parametros=(), todas=False):
+    """Ejecuta una consulta de lectura y devuelve fetchone() o fetchall()"""
+    connection = await get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, parametros)
+            return await cursor.fetchall() if todas else await cursor.fetchone()
+    finally:
+        liberar_conexion(connection)
+
+async def _escribir(query, parametros):
+    """Ejecuta una sentencia de escritura (autocommit) y devuelve las filas afectadas"""
+    connection = await get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, parametros)
+            return cursor.rowcount
+    finally:
+        liberar_conexion(connection)
+
+async def _insertar(query, parametros):
+    """Como _escribir, pero devuelve el id de la fila insertada"""
+    connection = await get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, parametros)
+            return cursor.lastrowid
+    finally:
+        liberar_conexion(connection)
+
+def _es_clave_duplicada(error):
+    return isinstance(error, IntegrityError) and bool(error.args) and error.args[0] == ER_DUP_ENTRY
+
+def _es_tabla_inexistente(error):
+    return isinstance(error, ProgrammingError) and bool(error.args) and error.args[0] == ER_NO_SUCH_TABLE
+
+async def _leer_horas(materializadas, suma):
+    """Como database_service._leer_horas: sin las tablas de horas se suma desde practicas"""
+    if db._horas_materializadas():
+        try:
+            return await materializadas()
+        except Exception as e:
+            if not _es_tabla_inexistente(e):
+                raise
+            db._marcar_sin_horas_materializadas()
+    return await suma()
+
+async def _obtener_o_cargar(cache, clave, cargar, ttl=None, ttl_negativo=None):
+    """
+    Equivalente asíncrono de CacheTTL.obtener_o_cargar sobre la misma caché:
+    si otra corrutina ya está cargando la clave se espera su resultado
+    """
+    encontrado, valor = cache.obtener(clave)
+    if encontrado:
+        return valor
+
+    clave_carga = (id(cache), clave)
+    en_curso = _cargas_en_curso.get(clave_carga)
+    if en_curso is not None:
+        try:
+            return await asyncio.shield(en_curso)
+        except asyncio.CancelledError:
+            if not en_curso.cancelled():
+                raise  # se canceló esta corrutina, no la carga
+            # Se canceló la corrutina que cargaba: se vuelve a intentar desde aquí
+            return await _obtener_o_cargar(cache, clave, cargar, ttl, ttl_negativo)
+
+    futuro = asyncio.get_running_loop().create_future()
+    _cargas_en_curso[clave_carga] = futuro
+    try:
+        valor = await cargar()
+    except Exception as e:
+        futuro.set_exception(e)
+        futuro.exception()  # evita el aviso de excepción no recuperada si nadie espera
+        raise
+    except BaseException:
+        # CancelledError (o KeyboardInterrupt): quienes esperaban no deben quedarse colgados
+        futuro.cancel()
+        raise
+    else:
+        futuro.set_result(valor)
+        if valor is None and ttl_negativo is not None:
+            cache.guardar(clave, valor, ttl_negativo)
+        else:
+            cache.guardar(clave, valor, ttl)
+        return valor
+    finally:
+        del _cargas_en_curso[clave_carga]
+
+# 1. Función para obtener el ID del estudiante por su código
+async def _cargar_estudiante_id(codigo_estudiante):
+    estudiante_id = await _consultar(db.SQL_ESTUDIANTE_ID, (codigo_estudiante,))
+    if estudiante_id:
+        return estudiante_id[0]
+    print(f"Estudiante con código {codigo_estudiante} no encontrado")
+    return None
+
+async def obtener_estudiante_id(codigo_estudiante):
+    try:
+        db._revisar_marca_estudiantes()
+        return await _obtener_o_cargar(
+            db._cache_estudiantes,
+            ('id', codigo_estudiante),
+            lambda: _cargar_estudiante_id(codigo_estudiante),
+            ttl_negativo=Config.CACHE_TTL_ESTUDIANTES_NEGATIVO
+        )
+    except Exception as e:
+        print(f"Error al obtener estudiante ID: {e}")
+        return None
+
+# 1.1. Función para validar estudiante completo (código, DNI, nombres)
+async def _cargar_validacion_estudiante(codigo_estudiante, dni, nombres):
+    estudiante = await _consultar(db.SQL_VALIDAR_ESTUDIANTE, (codigo_estudiante, dni, nombres))
+    if estudiante:
+        return {
+            'id': estudiante[0],
+            'codigo': estudiante[1],
+            'dni': estudiante[2],
+            'nombres': estudiante[3],
+            'apellidos': '',  # No existe en la tabla actual
+            'carrera': 'Ingeniería de Sistemas',  # Valor por defecto
+            'ciclo': '8vo'  # Valor por defecto
+        }
+    print(f"Estudiante no encontrado o datos incorrectos")
+    return None
+
+async def validar_estudiante_completo(codigo_estudiante, dni, nombres):
+    try:
+        db._revisar_marca_estudiantes()
+        estudiante = await _obtener_o_cargar(
+            db._cache_estudiantes,
+            ('validacion', codigo_estudiante, dni, nombres),
+            lambda: _cargar_validacion_estudiante(codigo_estudiante, dni, nombres),
+            ttl_negativo=Config.CACHE_TTL_ESTUDIANTES_NEGATIVO
+        )
+        return dict(estudiante) if estudiante else None
+    except Exception as e:
+        print(f"Error al validar estudiante: {e}")
+        return None
+
+# 2. Función para obtener el ID de la empresa por su nombre (primero en el
+# índice de empresas, como database_service)
+async def obtener_empresa_id(empresa_nombre):
+    empresa = await _buscar_en_indice(lambda indice: indice.por_nombre(empresa_nombre))
+    if empresa:
+        return empresa['id']
+    try:
+        resultado = await _consultar(db.SQL_EMPRESA_ID, (empresa_nombre,))
+        if resultado:
+            return resultado[0]
+        print(f"Empresa '{empresa_nombre}' no encontrada")
+        return None
+    except Exception as e:
+        print(f"Error al obtener empresa ID: {e}")
+        return None
+
+# El índice de empresas es el mismo de database_service; como al refrescarse
+# consulta la base de datos, se usa desde un hilo para no bloquear el event loop
+async def _buscar_en_indice(consulta):
+    return await asyncio.to_thread(db._buscar_en_indice, consulta)
+
+# 2.1. Función para obtener empresa por RUC
+async def obtener_empresa_por_ruc(ruc):
+    empresa = await _buscar_en_indice(lambda indice: indice.por_ruc(ruc))
+    if empresa:
+        return empresa
+    try:
+        resultado = await _consultar(db.SQL_EMPRESA_POR_RUC, (ruc, ruc))
+        if resultado:
+            return {
+                'id': resultado[0],
+                'nombre': resultado[1],
+                'direccion': resultado[2],
+                'contacto_email': resultado[3],
+                'ruc': resultado[4] or ruc
+            }
+        print(f"Empresa con nombre {ruc} no encontrada")
+        return None
+    except Exception as e:
+        print(f"Error al obtener empresa por RUC: {e}")
+        return None
+
+# 2.2. Búsqueda aproximada de empresas por nombre (para sugerir opciones al usuario)
+async def buscar_empresas(texto, limite=5):
+    return await _buscar_en_indice(lambda indice: indice.buscar(texto, limite)) or []
+
+# 2.3. Función para crear nueva empresa
+async def crear_empresa(ruc, nombre, direccion, contacto_email):
+    connection = await get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO empresas (nombre, ruc, direccion, contacto_email)
+                VALUES (%s, %s, %s, %s)
+            """, (nombre, ruc, direccion, contacto_email))
+            empresa_id = cursor.lastrowid
+    except Exception as e:
+        print(f"Error al crear empresa: {e}")
+        return None
+    finally:
+        liberar_conexion(connection)
+
+    await _buscar_en_indice(lambda indice: indice.agregar({
+        'id': empresa_id, 'nombre': nombre, 'ruc': ruc,
+        'direccion': direccion, 'contacto_email': contacto_email
+    }))
+    print(f"Empresa creada con ID: {empresa_id}")
+    return empresa_id
+
+# 3. Función para registrar una solicitud de carta
+async def registrar_solicitud_carta(estudiante_id, empresa_id, fecha_solicitud, ruta_pdf=None):
+    connection = await get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return False
+    try:
+        async with connection.cursor() as cursor:
+            if ruta_pdf:
+                await cursor.execute("""
+                    INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf)
+                    VALUES (%s, %s, %s, %s)
+                """, (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf))
+            else:
+                await cursor.execute("""
+                    INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud)
+                    VALUES (%s, %s, %s)
+                """, (estudiante_id, empresa_id, fecha_solicitud))
+        return True
+    except Exception as e:
+        print(f"Error al registrar solicitud de carta: {e}")
+        return False
+    finally:
+        liberar_conexion(connection)
+
+# 3.1. Ciclo de vida de una carta (ver database_service): 'pendiente' y después
+# completar_carta con su ruta o cancelar_carta
+async def iniciar_carta(estudiante_id, empresa_id, fecha_solicitud):
+    """
+    Registra la solicitud como 'pendiente' antes de generar el PDF
+
+    Returns:
+        dict: 'estado' ('nueva', 'duplicada', 'en_curso' o 'error'), 'solicitud_id' y 'ruta_pdf'.
+        Con 'nueva' también 'iniciada_en' y 'estado_anterior': hay que generar el PDF
+        y llamar a completar_carta o a cancelar_carta con ellos.
+    """
+    resultado = {'estado': 'error', 'solicitud_id': None, 'ruta_pdf': None}
+    connection = await get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return resultado
+
+    iniciada_en = db._marca_inicio()
+    try:
+        await connection.begin()
+        estado_anterior = None
+        async with connection.cursor() as cursor:
+            try:
+                await cursor.execute(db.SQL_INSERTAR_SOLICITUD_PENDIENTE,
+                                     (estudiante_id, empresa_id, fecha_solicitud, iniciada_en))
+                solicitud_id = cursor.lastrowid
+            except IntegrityError as e:
+                if not _es_clave_duplicada(e):
+                    raise
+                await cursor.execute(db.SQL_SOLICITUD_EXISTENTE, (estudiante_id, empresa_id))
+                solicitud_id, ruta_existente, estado_anterior = await cursor.fetchone()
+                if estado_anterior != 'pendiente' and db._pdf_disponible(ruta_existente):
+                    await connection.rollback()
+                    return {'estado': 'duplicada', 'solicitud_id': solicitud_id, 'ruta_pdf': ruta_existente}
+                await cursor.execute(db.SQL_RECLAMAR_SOLICITUD, (
+                    fecha_solicitud, iniciada_en, solicitud_id, db._marca_inicio(Config.CARTAS_PENDIENTE_MAX)
+                ))
+                if cursor.rowcount == 0:
+                    await connection.rollback()
+                    return {'estado': 'en_curso', 'solicitud_id': solicitud_id, 'ruta_pdf': None}
+        await connection.commit()
+        return {'estado': 'nueva', 'solicitud_id': solicitud_id, 'ruta_pdf': None,
+                'iniciada_en': iniciada_en, 'estado_anterior': estado_anterior}
+    except Exception as e:
+        await connection.rollback()
+        print(f"Error al iniciar carta: {e}")
+        return resultado
+    finally:
+        liberar_conexion(connection)
+
+async def completar_carta(solicitud_id, ruta_pdf):
+    """
+    Guarda la ruta del PDF generado y marca la solicitud como 'generada'
+
+    Returns:
+        bool: False si falló o si la solicitud ya no existe
+    """
+    try:
+        completada = await _escribir(db.SQL_COMPLETAR_SOLICITUD, (ruta_pdf, solicitud_id)) > 0
+        if not completada:
+            completada = await _consultar(db.SQL_SOLICITUD_CON_RUTA, (solicitud_id, ruta_pdf)) is not None
+        if not completada:
+            print(f"Error al completar carta: la solicitud {solicitud_id} ya no existe")
+        return completada
+    except Exception as e:
+        print(f"Error al completar carta: {e}")
+        return False
+
+async def cancelar_carta(solicitud_id, iniciada_en, estado_anterior=None):
+    """Borra la solicitud nueva o devuelve la reclamada a su estado anterior (ver database_service)"""
+    try:
+        if estado_anterior in (None, 'pendiente'):
+            await _escribir(db.SQL_CANCELAR_SOLICITUD, (solicitud_id, iniciada_en))
+        else:
+            await _escribir(db.SQL_RESTAURAR_SOLICITUD, (estado_anterior, solicitud_id, iniciada_en))
+        return True
+    except Exception as e:
+        print(f"Error al cancelar carta: {e}")
+        return False
+
+# 4. Función para consultar las horas acumuladas por el estudiante
+async def consultar_horas(codigo_estudiante):
+    try:
+        estudiante_id = await obtener_estudiante_id(codigo_estudiante)
+        if estudiante_id is None:
+            return db._a_decimal(0)
+        resultado = await _leer_horas(
+            lambda: _consultar(db.SQL_HORAS, (estudiante_id,)),
+            lambda: _consultar(db.SQL_HORAS_SUMA, (estudiante_id,))
+        )
+        return db._a_decimal(resultado[0] if resultado else None)
+    except Exception as e:
+        print(f"Error al consultar horas: {e}")
+        return db._a_decimal(0)
+
+# 4.1. Función para consultar las horas del estudiante desglosadas por empresa
+async def consultar_horas_por_empresa(codigo_estudiante):
+    try:
+        estudiante_id = await obtener_estudiante_id(codigo_estudiante)
+        if estudiante_id is None:
+            return []
+        filas = await _leer_horas(
+            lambda: _consultar(db.SQL_HORAS_POR_EMPRESA, (estudiante_id,), todas=True),
+            lambda: _consultar(db.SQL_HORAS_POR_EMPRESA_SUMA, (estudiante_id,), todas=True)
+        )
+        return [(nombre, db._a_decimal(horas)) for nombre, horas in filas]
+    except Exception as e:
+        print(f"Error al consultar horas por empresa: {e}")
+        return []
+
+# 5. Función para consultar las empresas en las que el estudiante realizó prácticas
+async def consultar_empresas(codigo_estudiante):
+    try:
+        empresas = await _consultar(db.SQL_EMPRESAS_ESTUDIANTE, (codigo_estudiante,), todas=True)
+        return [empresa[0] for empresa in empresas] if empresas else []
+    except Exception as e:
+        print(f"Error al consultar empresas: {e}")
+        return []
+
+# 6. Función para obtener todas las fechas críticas (que están pendientes)
+async def consultar_fechas_criticas():
+    try:
+        db._revisar_marca_consultas()
+        fechas_criticas = await _obtener_o_cargar(
+            db._cache_consultas, 'fechas_criticas',
+            lambda: _consultar(db.SQL_FECHAS_CRITICAS, todas=True),
+            Config.CACHE_TTL_FECHAS_CRITICAS
+        )
+        return list(fechas_criticas)
+    except Exception as e:
+        print(f"Error al consultar fechas críticas: {e}")
+        return []
+
+# 6.1. Alta de fechas críticas y cambio de estado; invalidan la caché compartida
+async def crear_fecha_critica(descripcion, fecha):
+    """Returns: int: ID de la fecha crítica creada, o None si falló"""
+    try:
+        fecha_id = await _insertar(db.SQL_CREAR_FECHA_CRITICA, (descripcion, fecha))
+    except Exception as e:
+        print(f"Error al crear fecha crítica: {e}")
+        return None
+    db.invalidar_fechas_criticas()
+    return fecha_id
+
+async def actualizar_estado_fecha_critica(fecha_id, estado):
+    """Returns: bool: True si se actualizó la fecha crítica"""
+    try:
+        actualizadas = await _escribir(db.SQL_ESTADO_FECHA_CRITICA, (estado, fecha_id))
+    except Exception as e:
+        print(f"Error al actualizar fecha crítica: {e}")
+        return False
+    if not actualizadas:
+        return False
+    db.invalidar_fechas_criticas()
+    return True
+
+# 7. Función para obtener todas las oportunidades de prácticas activas
+async def consultar_oportunidades_practicas():
+    try:
+        db._revisar_marca_consultas()
+        oportunidades = await _obtener_o_cargar(
+            db._cache_consultas, 'oportunidades_practicas',
+            lambda: _consultar(db.SQL_OPORTUNIDADES, todas=True),
+            Config.CACHE_TTL_OPORTUNIDADES
+        )
+        return list(oportunidades)
+    except Exception as e:
+        print(f"Error al consultar oportunidades: {e}")
+        return []
+
+# 7.1. Página de oportunidades activas (keyset por id), en la misma caché de páginas
+async def _cargar_pagina_oportunidades(despues_id, limite):
+    filas = await _consultar(db.SQL_OPORTUNIDADES_PAGINA, (despues_id, limite + 1), todas=True)
+    return db._cortar_pagina(filas, limite)
+
+async def consultar_oportunidades_pagina(limite=None, despues=None):
+    """
+    Returns:
+        tuple: (oportunidades, token de la siguiente página o None si es la última)
+
+    Raises:
+        ValueError: Si el token no es válido
+    """
+    despues_id = db.decodificar_token_pagina(despues)
+    limite = db._limite_pagina(limite)
+    try:
+        db._revisar_marca_consultas()
+        oportunidades, siguiente = await _obtener_o_cargar(
+            db._cache_paginas, ('oportunidades_practicas', despues_id, limite),
+            lambda: _cargar_pagina_oportunidades(despues_id, limite),
+            Config.CACHE_TTL_OPORTUNIDADES
+        )
+        return list(oportunidades), siguiente
+    except Exception as e:
+        print(f"Error al consultar oportunidades: {e}")
+        return [], None
+
+# 7.2. Alta de oportunidades y cambio de estado; invalidan la lista y sus páginas
+async def crear_oportunidad_practica(empresa_id, descripcion, fecha_inicio, fecha_fin):
+    """Returns: int: ID de la oportunidad creada, o None si falló"""
+    try:
+        oportunidad_id = await _insertar(
+            db.SQL_CREAR_OPORTUNIDAD, (empresa_id, descripcion, fecha_inicio, fecha_fin)
+        )
+    except Exception as e:
+        print(f"Error al crear oportunidad: {e}")
+        return None
+    db.invalidar_oportunidades_practicas()
+    return oportunidad_id
+
+async def actualizar_estado_oportunidad(oportunidad_id, estado):
+    """Returns: bool: True si se actualizó la oportunidad"""
+    try:
+        actualizadas = await _escribir(db.SQL_ESTADO_OPORTUNIDAD, (estado, oportunidad_id))
+    except Exception as e:
+        print(f"Error al actualizar oportunidad: {e}")
+        return False
+    if not actualizadas:
+        return False
+    db.invalidar_oportunidades_practicas()
+    return True
+
+# 8. Función para consultar todas las cartas generadas por un estudiante
+async def consultar_cartas_generadas(estudiante_id):
+    try:
+        return list(await _consultar(db.SQL_CARTAS_GENERADAS, (estudiante_id,), todas=True))
+    except Exception as e:
+        print(f"Error al consultar cartas generadas: {e}")
+        return []
+
+# 8.1. Página de cartas generadas por un estudiante (keyset por id)
+async def consultar_cartas_pagina(estudiante_id, limite=None, despues=None):
+    """
+    Returns:
+        tuple: ([(solicitud_id, nombre_empresa, ruta_pdf)], token de la siguiente página o None)
+
+    Raises:
+        ValueError: Si el token no es válido
+    """
+    despues_id = db.decodificar_token_pagina(despues)
+    limite = db._limite_pagina(limite)
+    try:
+        filas = await _consultar(db.SQL_CARTAS_GENERADAS_PAGINA, (estudiante_id, despues_id, limite + 1), todas=True)
+        return db._cortar_pagina(filas, limite, quitar_id=False)
+    except Exception as e:
+        print(f"Error al consultar cartas generadas: {e}")
+        return [], None
+
+# 8.2. Ruta del PDF de una solicitud, solo si es del estudiante indicado
+async def obtener_ruta_carta(solicitud_id, estudiante_id):
+    try:
+        fila = await _consultar(db.SQL_RUTA_CARTA_ESTUDIANTE, (solicitud_id, estudiante_id))
+        return fila[0] if fila else None
+    except Exception as e:
+        print(f"Error al obtener la ruta de la carta: {e}")
+        return None
+
+# 9. Función para verificar si ya existe una carta para un estudiante y empresa
+async def existe_carta_para_estudiante_y_empresa(estudiante_id, empresa_id):
+    try:
+        return await _consultar(db.SQL_EXISTE_CARTA, (estudiante_id, empresa_id)) is not None
+    except Exception as e:
+        print(f"Error al verificar carta existente: {e}")
+        return False
+
+# 10. Función para obtener el resumen de un estudiante en una sola consulta
+async def consultar_resumen_estudiante(codigo_estudiante):
+    try:
+        filas = await _leer_horas(
+            lambda: _consultar(db.SQL_RESUMEN_ESTUDIANTE, (codigo_estudiante,) * 4, todas=True),
+            lambda: _consultar(db.SQL_RESUMEN_ESTUDIANTE_SUMA, (codigo_estudiante,) * 4, todas=True)
+        )
+        resumen = db._armar_resumen(codigo_estudiante, filas)
+        if resumen['estudiante_id'] is None:
+            print(f"Estudiante con código {codigo_estudiante} no encontrado")
+            return None
+
+        db._cache_estudiantes.guardar(('id', codigo_estudiante), resumen['estudiante_id'])
+        return resumen
+    except Exception as e:
+        print(f"Error al consultar resumen del estudiante: {e}")
+        return None
+
+# 11. Exportación de solicitudes de carta con un cursor sin búfer (SSCursor)
+async def _recorrer_cursor(connection, cursor, tamano_lote):
+    completo = False
+    try:
+        while True:
+            filas = await cursor.fetchmany(tamano_lote)
+            if not filas:
+                break
+            for fila in filas:
+                yield fila
+        completo = True
+    finally:
+        if completo:
+            await cursor.close()
+        else:
+            # Quedan filas sin leer: se cierra la conexión y el pool la descarta
+            connection.close()
+        liberar_conexion(connection)
+
+async def exportar_solicitudes_carta(desde=None, hasta=None, tamano_lote=1000):
+    """
+    Recorre las solicitudes de carta sin cargarlas en memoria
+
+    La conexión queda ocupada hasta que el iterador termina o se cierra (aclose).
+
+    Returns:
+        iterador asíncrono de tuplas en el orden de db.COLUMNAS_EXPORTACION; None si no se pudo consultar
+    """
+    connection = await get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        query, parametros = db._sql_exportar_solicitudes(desde, hasta)
+        cursor = await connection.cursor(aiomysql.SSCursor)
+        await cursor.execute(query, parametros)
+    except Exception as e:
+        connection.close()
+        liberar_conexion(connection)
+        print(f"Error al exportar solicitudes de carta: {e}")
+        return None
+    return _recorrer_cursor(connection, cursor, tamano_lote)
+
+# 12. Cartas masivas (ver database_service): estudiantes por lotes y registro en una transacción
+async def consultar_estudiantes_para_cartas(codigos=None, tamano_lote=1000):
+    """
+    Returns:
+        dict: codigo -> {'id', 'codigo', 'dni', 'nombres'}; None si falló la consulta
+    """
+    try:
+        if codigos is None:
+            consultas = [(db.SQL_ESTUDIANTES_CARTAS + " ORDER BY id", ())]
+        else:
+            codigos = list(dict.fromkeys(codigos))
+            lotes = [codigos[i:i + tamano_lote] for i in range(0, len(codigos), tamano_lote)]
+            consultas = [(db.SQL_ESTUDIANTES_CARTAS + f" WHERE codigo IN ({', '.join(['%s'] * len(lote))})", lote)
+                         for lote in lotes]
+        # Los lotes son independientes: se consultan a la vez
+        resultados = await asyncio.gather(*(_consultar(query, parametros, todas=True)
+                                            for query, parametros in consultas))
+        estudiantes = {}
+        for filas in resultados:
+            for estudiante_id, codigo, dni, nombre in filas:
+                estudiantes[codigo] = {'id': estudiante_id, 'codigo': codigo, 'dni': dni, 'nombres': nombre}
+        return estudiantes
+    except Exception as e:
+        print(f"Error al consultar estudiantes: {e}")
+        return None
+
+async def registrar_cartas_masivas(cartas, tamano_lote=1000):
+    """
+    Registra (o actualiza) las solicitudes de muchas cartas ya generadas
+
+    Returns:
+        list: (solicitud_id, ruta_pdf) de las cartas registradas; None si falló (no se registra ninguna)
+    """
+    connection = await get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        await connection.begin()
+        filas = [(estudiante_id, empresa_id, fecha, ruta_pdf, 'generada')
+                 for estudiante_id, empresa_id, fecha, ruta_pdf in cartas]
+        rutas = list(dict.fromkeys(fila[3] for fila in filas))
+        registradas = []
+        async with connection.cursor() as cursor:
+            for inicio in range(0, len(filas), tamano_lote):
+                await cursor.executemany(db.SQL_REGISTRAR_CARTAS['mysql'], filas[inicio:inicio + tamano_lote])
+            for inicio in range(0, len(rutas), tamano_lote):
+                lote = rutas[inicio:inicio + tamano_lote]
+                await cursor.execute(db.SQL_SOLICITUDES_POR_RUTA.format(', '.join(['%s'] * len(lote))), lote)
+                registradas.extend(await cursor.fetchall())
+        await connection.commit()
+        return registradas
+    except Exception as e:
+        await connection.rollback()
+        print(f"Error al registrar cartas masivas: {e}")
+        return None
+    finally:
+        liberar_conexion(connection)
+
+# 13. Mantenimiento de los PDF de cartas (ver database_service)
+async def consultar_rutas_cartas(despues_id=0, limite=1000):
+    """
+    Returns:
+        list: (id, ruta_pdf) de las solicitudes con PDF, en orden de id; None si falló la consulta
+    """
+    try:
+        return list(await _consultar(db.SQL_RUTAS_CARTAS, (despues_id, limite), todas=True))
+    except Exception as e:
+        print(f"Error al consultar rutas de cartas: {e}")
+        return None
+
+async def actualizar_rutas_cartas(cambios):
+    """
+    Cambia la ruta_pdf de un lote de solicitudes en una sola transacción
+
+    Returns:
+        int: Solicitudes actualizadas (no cuentan las que ya tenían otra ruta); None si falló
+    """
+    connection = await get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        await connection.begin()
+        actualizadas = 0
+        async with connection.cursor() as cursor:
+            for solicitud_id, ruta_actual, ruta_nueva in cambios:
+                if ruta_nueva is None:
+                    await cursor.execute(db.SQL_EXPIRAR_CARTA, (solicitud_id, ruta_actual))
+                else:
+                    await cursor.execute(db.SQL_MOVER_CARTA, (ruta_nueva, solicitud_id, ruta_actual))
+                actualizadas += cursor.rowcount
+        await connection.commit()
+        return actualizadas
+    except Exception as e:
+        await connection.rollback()
+        print(f"Error al actualizar rutas de cartas: {e}")
+        return None
+    finally:
+        liberar_conexion(connection)
@@ -1,98 +1,486 @@
+import base64
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from decimal import Decimal
+
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, IntegrityError, errorcode
+
+from config import Config
+from services.connection_pool import PoolConexiones, PoolAgotadoError
+from services.cache_service import CacheTTL
+from services.indice_empresas import IndiceEmpresas
+from services import sqlite_backend
+from services.s3_service import es_ruta_s3
+from services.replicas_service import (
+    EnrutadorReplicas, solo_lectura, escritura, en_lectura, debe_usar_primario
+)
+from services.metricas_service import (
+    medir_consulta, conectar_medido, obtener_metricas, registrar_consulta, funcion_actual
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+_enrutador = None
+_indice_empresas = None
+
+# Caché compartida para las consultas globales (iguales para todos los usuarios)
+_cache_consultas = CacheTTL()
+
+# Páginas de oportunidades: el token de continuación lo elige el cliente, así que
+# la caché es acotada (LRU) para que tokens distintos no la hagan crecer sin límite
+_cache_paginas = CacheTTL(max_entradas=Config.CACHE_MAX_PAGINAS)
+
+# Caché acotada (LRU) de identidades de estudiantes; también recuerda por poco
+# tiempo los códigos que no existen
+_cache_estudiantes = CacheTTL(
+    ttl_defecto=Config.CACHE_TTL_ESTUDIANTES,
+    max_entradas=Config.CACHE_MAX_ESTUDIANTES
+)
+
+# Con Config.DB_BACKEND = 'sqlite' las conexiones son de la base embebida, que
+# acepta las mismas consultas de este módulo (ver services/sqlite_backend.py)
+def _crear_conexion():
+    if Config.DB_BACKEND == 'sqlite':
+        return sqlite_backend.crear_conexion(Config.SQLITE_PATH)
+    return _conectar_mysql(Config.MYSQL_HOST, Config.MYSQL_PORT)
+
+def _conectar_mysql(host, port):
+    return mysql.connector.connect(
+        host=host,
+        port=port,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB
+    )
+
+def _crear_pool(crear_conexion):
+    return PoolConexiones(
+        crear_conexion,
+        tamano=Config.MYSQL_POOL_SIZE,
+        tiempo_espera=Config.MYSQL_POOL_TIMEOUT,
+        reciclar_tras=Config.MYSQL_POOL_RECYCLE,
+        verificar_tras=Config.MYSQL_POOL_PING_AFTER
+    )
+
+# Pool compartido por todas las funciones de este módulo (se crea en el primer uso)
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _crear_pool(_crear_conexion)
+    return _pool
+
+# Enrutador de lecturas a las réplicas de Config.MYSQL_REPLICAS (None si no hay réplicas)
+def obtener_enrutador():
+    global _enrutador
+    if _enrutador is None and Config.DB_BACKEND == 'mysql' and Config.MYSQL_REPLICAS:
+        with _pool_lock:
+            if _enrutador is None:
+                replicas = []
+                for direccion in Config.MYSQL_REPLICAS:
+                    host, _, port = direccion.partition(':')
+                    port = int(port) if port else Config.MYSQL_PORT
+                    replicas.append((direccion, _crear_pool(lambda h=host, p=port: _conectar_mysql(h, p))))
+                _enrutador = EnrutadorReplicas(
+                    replicas,
+                    max_retraso=Config.REPLICA_MAX_RETRASO,
+                    intervalo_revision=Config.REPLICA_INTERVALO_REVISION,
+                    espera_conexion=Config.REPLICA_ESPERA_CONEXION
+                )
+    return _enrutador
+
+# Las funciones @solo_lectura usan una réplica si hay alguna al día, salvo que la
+# conversación haya escrito hace poco; todo lo demás va al primario
+def _obtener_conexion():
+    if en_lectura() and not debe_usar_primario():
+        enrutador = obtener_enrutador()
+        if enrutador is not None:
+            conexion = enrutador.obtener()
+            if conexion is not None:
+                return conexion
+    return obtener_pool().obtener()
 
 # Función para obtener la conexión a la base de datos
+# La conexión se toma prestada del pool; connection.close() la devuelve.
+# Los tiempos de conexión y de cada consulta se registran en metricas_service
 def get_connection():
     try:
-        connection = mysql.connector.connect(
-            host="localhost",  # Cambiar según el servidor
-            user="root",  # Cambiar con tu usuario
-            password="",  # Cambiar con tu contraseña
-            database="ppp"  # Nombre de tu base de datos
-        )
-        if connection.is_connected():
-            return connection
-    except Error as e:
+        return conectar_medido(_obtener_conexion)
+    except PoolAgotadoError as e:
+        print(f"Error al conectar a la base de datos: {e}")
+        return None
+    except (Error, sqlite3.Error) as e:
         print(f"Error al conectar a la base de datos: {e}")
         return None
 
-# 1. Función para obtener el ID del estudiante por su código
-def obtener_estudiante_id(codigo_estudiante):
+# Violación de una clave única en cualquiera de los dos motores
+def _es_clave_duplicada(error):
+    if isinstance(error, IntegrityError):
+        return error.errno == errorcode.ER_DUP_ENTRY
+    return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE' in str(error)
+
+# Tabla inexistente en cualquiera de los dos motores
+def _es_tabla_inexistente(error):
+    if isinstance(error, Error):
+        return error.errno == errorcode.ER_NO_SUCH_TABLE
+    return isinstance(error, sqlite3.OperationalError) and 'no such table' in str(error)
+
+# Indica si el PDF de una solicitud sigue guardado. Las cartas en S3 se dan por
+# existentes (comprobarlo costaría una petición); las locales pueden haber sido
+# eliminadas por la limpieza de la caché de cartas
+def _pdf_disponible(ruta_pdf):
+    return bool(ruta_pdf) and (es_ruta_s3(ruta_pdf) or os.path.exists(ruta_pdf))
+
+# Estadísticas del pool para monitoreo
+def obtener_estadisticas_pool():
+    return obtener_pool().estadisticas()
+
+# Histogramas de tiempos por función y registro de consultas lentas
+def obtener_metricas_consultas():
+    return obtener_metricas()
+
+# Sentencias preparadas: las consultas de SENTENCIAS_PREPARADAS (al final del
+# módulo) se preparan una vez por conexión física del pool y se reutilizan en
+# los préstamos siguientes. Los cursores se guardan por conexión y desaparecen
+# con ella cuando el pool la recicla o la descarta
+_cursores_preparados = weakref.WeakKeyDictionary()
+_preparadas_lock = threading.Lock()
+_contadores_sentencias = {}
+
+def ejecutar_preparada(connection, nombre, parametros):
+    """
+    Ejecuta una sentencia del registro con el cursor preparado de la conexión
+
+    Args:
+        connection: Conexión obtenida con get_connection()
+        nombre: Clave de la sentencia en SENTENCIAS_PREPARADAS
+        parametros: Valores de los marcadores %s
+
+    Returns:
+        list: Todas las filas (se leen siempre completas para poder reutilizar el cursor)
+    """
+    query = SENTENCIAS_PREPARADAS[nombre]
+    fisica = connection.conexion_fisica
+    with _preparadas_lock:
+        cursores = _cursores_preparados.setdefault(fisica, {})
+        contador = _contadores_sentencias.setdefault(nombre, {'preparadas': 0, 'ejecutadas': 0, 'errores': 0})
+    cursor = cursores.get(nombre)
+    if cursor is None:
+        cursor = fisica.cursor(prepared=True)
+        cursores[nombre] = cursor
+        with _preparadas_lock:
+            contador['preparadas'] += 1
+
+    inicio = time.perf_counter()
+    try:
+        cursor.execute(query, parametros)
+        filas = cursor.fetchall()
+    except Exception:
+        # Se prepara de nuevo en el siguiente uso
+        cursores.pop(nombre, None)
+        with _preparadas_lock:
+            contador['errores'] += 1
+        raise
+    finally:
+        registrar_consulta(funcion_actual(), query, len(parametros), time.perf_counter() - inicio)
+    with _preparadas_lock:
+        contador['ejecutadas'] += 1
+    return filas
+
+# Preparaciones y ejecuciones por sentencia del registro
+def obtener_estadisticas_sentencias():
+    with _preparadas_lock:
+        sentencias = {nombre: dict(contador) for nombre, contador in _contadores_sentencias.items()}
+    preparadas = sum(contador['preparadas'] for contador in sentencias.values())
+    ejecutadas = sum(contador['ejecutadas'] for contador in sentencias.values())
+    return {
+        'preparadas': preparadas,
+        'ejecutadas': ejecutadas,
+        'reutilizadas': max(ejecutadas - preparadas, 0),
+        'sentencias': sentencias,
+    }
+
+# Estado de las réplicas de lectura para monitoreo
+def obtener_estadisticas_replicas():
+    enrutador = obtener_enrutador()
+    return enrutador.estadisticas() if enrutador is not None else None
+
+# Índice en memoria de empresas: se carga completo en el primer uso (o con
+# precargar_indice_empresas al arrancar) y después solo pide las empresas con id
+# mayor a la última cargada, como mucho cada Config.INDICE_EMPRESAS_REFRESCO segundos;
+# cada Config.INDICE_EMPRESAS_RECONSTRUIR segundos se vuelve a cargar completo
+SQL_EMPRESAS_DESDE_ID = """
+    SELECT id, nombre, ruc, direccion, contacto_email FROM empresas
+    WHERE id > %s ORDER BY id LIMIT %s
+"""
+
+def _cargar_empresas_desde(ultimo_id):
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
     try:
-        connection = get_connection()
-        if connection is None:
-            print("Error: No se pudo conectar a la base de datos")
-            return None
-            
         cursor = connection.cursor()
-        query = "SELECT id FROM estudiantes WHERE codigo = %s"
-        cursor.execute(query, (codigo_estudiante,))
-        estudiante_id = cursor.fetchone()
+        while True:
+            cursor.execute(SQL_EMPRESAS_DESDE_ID, (ultimo_id, 5000))
+            filas = cursor.fetchall()
+            for id_empresa, nombre, ruc, direccion, contacto_email in filas:
+                yield {'id': id_empresa, 'nombre': nombre, 'ruc': ruc,
+                       'direccion': direccion, 'contacto_email': contacto_email}
+            if len(filas) < 5000:
+                break
+            ultimo_id = filas[-1][0]
         cursor.close()
+    finally:
         connection.close()
-        
-        if estudiante_id:
-            return estudiante_id[0]  # Regresa el ID del estudiante
-        else:
-            print(f"Estudiante con código {codigo_estudiante} no encontrado")
-            return None  # Si no encuentra el estudiante, regresa None
+
+def obtener_indice_empresas():
+    global _indice_empresas
+    if _indice_empresas is None:
+        with _pool_lock:
+            if _indice_empresas is None:
+                _indice_empresas = IndiceEmpresas(
+                    _cargar_empresas_desde, Config.INDICE_EMPRESAS_REFRESCO, Config.INDICE_EMPRESAS_RECONSTRUIR
+                )
+    return _indice_empresas
+
+def precargar_indice_empresas():
+    try:
+        obtener_indice_empresas().refrescar(forzar=True)
+    except Exception as e:
+        print(f"Error al cargar el índice de empresas: {e}")
+
+# Consulta el índice (actualizándolo si toca); None si no se pudo cargar, para
+# que quien llama use la consulta a la base de datos
+def _buscar_en_indice(consulta):
+    try:
+        indice = obtener_indice_empresas()
+        _revisar_marca(Config.CACHE_MARCA_EMPRESAS, indice)
+        indice.refrescar()
+        return consulta(indice)
+    except Exception as e:
+        print(f"Error al consultar el índice de empresas: {e}")
+        return None
+
+def obtener_estadisticas_indice_empresas():
+    return obtener_indice_empresas().estadisticas()
+
+# Estadísticas de la caché de consultas para monitoreo
+def obtener_estadisticas_cache():
+    return dict(_cache_consultas.estadisticas(), paginas=_cache_paginas.estadisticas())
+
+# Archivos de marca: cada proceso (bot, API) recuerda la fecha de modificación de
+# la marca y descarta su caché cuando otro proceso la actualiza
+_marcas = {}
+_marcas_revisadas_en = {}
+
+def _tocar_marca(ruta):
+    try:
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(ruta, 'a'):
+            os.utime(ruta, None)
+    except OSError as e:
+        print(f"Error al actualizar la marca de caché {ruta}: {e}")
+
+# Revisa (como mucho una vez por segundo) si otro proceso invalidó la caché de la marca
+def _revisar_marca(ruta, *caches):
+    ahora = time.monotonic()
+    if ahora - _marcas_revisadas_en.get(ruta, 0.0) < 1:
+        return
+    _marcas_revisadas_en[ruta] = ahora
+    try:
+        marca = os.stat(ruta).st_mtime_ns
+    except OSError:
+        marca = None
+    if marca != _marcas.get(ruta):
+        _marcas[ruta] = marca
+        for cache in caches:
+            cache.invalidar()
+
+# Invalidación de la caché de estudiantes: llamar después de insertar o modificar
+# estudiantes. Además de limpiar la caché local actualiza el archivo de marca para
+# que el bot y la API (otros procesos) también descarten sus entradas
+def invalidar_cache_estudiantes(codigo_estudiante=None):
+    if codigo_estudiante is None:
+        _cache_estudiantes.invalidar()
+    else:
+        _cache_estudiantes.invalidar_donde(lambda clave: clave[1] == codigo_estudiante)
+    _tocar_marca(Config.CACHE_MARCA_ESTUDIANTES)
+
+def _revisar_marca_estudiantes():
+    _revisar_marca(Config.CACHE_MARCA_ESTUDIANTES, _cache_estudiantes)
+
+def obtener_estadisticas_cache_estudiantes():
+    return _cache_estudiantes.estadisticas()
+
+# Invalidación de la caché de consultas globales: la llaman las funciones que
+# escriben en fechas_criticas y oportunidades_practicas (sección 6 y 7). Los
+# demás procesos ven la marca y descartan sus consultas globales
+def invalidar_fechas_criticas():
+    _cache_consultas.invalidar('fechas_criticas')
+    _tocar_marca(Config.CACHE_MARCA_CONSULTAS)
+
+def invalidar_oportunidades_practicas():
+    _cache_consultas.invalidar('oportunidades_practicas')
+    _cache_paginas.invalidar()
+    _tocar_marca(Config.CACHE_MARCA_CONSULTAS)
+
+# Tras modificar empresas fuera de crear_empresa (importaciones): el índice se
+# vuelve a cargar completo en este proceso y en los que vean la marca
+def invalidar_indice_empresas():
+    if _indice_empresas is not None:
+        _indice_empresas.invalidar()
+    _tocar_marca(Config.CACHE_MARCA_EMPRESAS)
+
+def _revisar_marca_consultas():
+    _revisar_marca(Config.CACHE_MARCA_CONSULTAS, _cache_consultas, _cache_paginas)
+
+# Paginación por clave (keyset): el token de continuación guarda el último id
+# entregado y la siguiente página pide las filas con id mayor, usando el índice
+def codificar_token_pagina(ultimo_id):
+    return base64.urlsafe_b64encode(f"v1:{ultimo_id}".encode()).decode().rstrip('=')
+
+def decodificar_token_pagina(token):
+    """
+    Devuelve el último id guardado en el token (0 si no hay token)
+
+    Raises:
+        ValueError: Si el token no es uno generado por codificar_token_pagina
+    """
+    if not token:
+        return 0
+    try:
+        texto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        version, ultimo_id = texto.split(':', 1)
+        if version != 'v1':
+            raise ValueError(version)
+        return int(ultimo_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Token de página no válido: {token}") from e
+
+def _limite_pagina(limite):
+    if limite is None:
+        return Config.PAGINA_TAMANO
+    return max(1, min(int(limite), Config.PAGINA_TAMANO_MAX))
+
+def _cortar_pagina(filas, limite, quitar_id=True):
+    """Separa la fila extra que indica si hay otra página; las filas empiezan por id"""
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_token_pagina(filas[-1][0])
+    return [fila[1:] if quitar_id else tuple(fila) for fila in filas], siguiente
+
+# 1. Función para obtener el ID del estudiante por su código
+SQL_ESTUDIANTE_ID = "SELECT id FROM estudiantes WHERE codigo = %s"
+
+def _cargar_estudiante_id(codigo_estudiante):
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
+    try:
+        filas = ejecutar_preparada(connection, 'estudiante_id', (codigo_estudiante,))
+    finally:
+        connection.close()
+
+    if filas:
+        return filas[0][0]  # Regresa el ID del estudiante
+    print(f"Estudiante con código {codigo_estudiante} no encontrado")
+    return None  # Si no encuentra el estudiante, regresa None
+
+@medir_consulta
+@solo_lectura
+def obtener_estudiante_id(codigo_estudiante):
+    try:
+        _revisar_marca_estudiantes()
+        return _cache_estudiantes.obtener_o_cargar(
+            ('id', codigo_estudiante),
+            lambda: _cargar_estudiante_id(codigo_estudiante),
+            ttl_negativo=Config.CACHE_TTL_ESTUDIANTES_NEGATIVO
+        )
     except Exception as e:
         print(f"Error al obtener estudiante ID: {e}")
         return None
 
 # 1.1. Función para validar estudiante completo (código, DNI, nombres)
-def validar_estudiante_completo(codigo_estudiante, dni, nombres):
+SQL_VALIDAR_ESTUDIANTE = """
+    SELECT id, codigo, dni, nombre
+    FROM estudiantes
+    WHERE codigo = %s AND dni = %s AND nombre = %s
+"""
+
+def _cargar_validacion_estudiante(codigo_estudiante, dni, nombres):
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
     try:
-        connection = get_connection()
-        if connection is None:
-            print("Error: No se pudo conectar a la base de datos")
-            return None
-            
         cursor = connection.cursor()
-        query = """
-            SELECT id, codigo, dni, nombre 
-            FROM estudiantes 
-            WHERE codigo = %s AND dni = %s AND nombre = %s
-        """
-        cursor.execute(query, (codigo_estudiante, dni, nombres))
+        cursor.execute(SQL_VALIDAR_ESTUDIANTE, (codigo_estudiante, dni, nombres))
         estudiante = cursor.fetchone()
         cursor.close()
+    finally:
         connection.close()
-        
-        if estudiante:
-            return {
-                'id': estudiante[0],
-                'codigo': estudiante[1],
-                'dni': estudiante[2],
-                'nombres': estudiante[3],
-                'apellidos': '',  # No existe en la tabla actual
-                'carrera': 'Ingeniería de Sistemas',  # Valor por defecto
-                'ciclo': '8vo'  # Valor por defecto
-            }
-        else:
-            print(f"Estudiante no encontrado o datos incorrectos")
-            return None
+
+    if estudiante:
+        return {
+            'id': estudiante[0],
+            'codigo': estudiante[1],
+            'dni': estudiante[2],
+            'nombres': estudiante[3],
+            'apellidos': '',  # No existe en la tabla actual
+            'carrera': 'Ingeniería de Sistemas',  # Valor por defecto
+            'ciclo': '8vo'  # Valor por defecto
+        }
+    print(f"Estudiante no encontrado o datos incorrectos")
+    return None
+
+@medir_consulta
+@solo_lectura
+def validar_estudiante_completo(codigo_estudiante, dni, nombres):
+    try:
+        _revisar_marca_estudiantes()
+        estudiante = _cache_estudiantes.obtener_o_cargar(
+            ('validacion', codigo_estudiante, dni, nombres),
+            lambda: _cargar_validacion_estudiante(codigo_estudiante, dni, nombres),
+            ttl_negativo=Config.CACHE_TTL_ESTUDIANTES_NEGATIVO
+        )
+        return dict(estudiante) if estudiante else None
     except Exception as e:
         print(f"Error al validar estudiante: {e}")
         return None
 
 # 2. Función para obtener el ID de la empresa por su nombre
+# Se busca primero en el índice en memoria (nombre normalizado: sin tildes ni
+# mayúsculas; el sufijo S.A.C./S.R.L. debe coincidir si se escribió, y sin él solo
+# vale una empresa) y, si no está, con la consulta exacta
+SQL_EMPRESA_ID = "SELECT id FROM empresas WHERE nombre = %s"
+
+@medir_consulta
+@solo_lectura
 def obtener_empresa_id(empresa_nombre):
+    empresa = _buscar_en_indice(lambda indice: indice.por_nombre(empresa_nombre))
+    if empresa:
+        return empresa['id']
     try:
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
             return None
             
-        cursor = connection.cursor()
-        query = "SELECT id FROM empresas WHERE nombre = %s"
-        cursor.execute(query, (empresa_nombre,))
-        resultado = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        try:
+            filas = ejecutar_preparada(connection, 'empresa_id', (empresa_nombre,))
+        finally:
+            connection.close()
         
-        if resultado:
-            return resultado[0]  # Regresa el ID de la empresa
+        if filas:
+            return filas[0][0]  # Regresa el ID de la empresa
         else:
             print(f"Empresa '{empresa_nombre}' no encontrada")
             return None
@@ -101,20 +489,34 @@ def obtener_empresa_id(empresa_nombre):
         return None
 
 # 2.1. Función para obtener empresa por RUC
+# Las empresas registradas antes de la columna ruc (migración 5) se siguen
+# encontrando por nombre, como hasta ahora
+SQL_EMPRESA_POR_RUC = """
+    SELECT id, nombre, direccion, contacto_email, ruc FROM empresas WHERE ruc = %s
+    UNION ALL
+    SELECT id, nombre, direccion, contacto_email, ruc FROM empresas WHERE nombre = %s
+    LIMIT 1
+"""
+
+@medir_consulta
+@solo_lectura
 def obtener_empresa_por_ruc(ruc):
+    empresa = _buscar_en_indice(lambda indice: indice.por_ruc(ruc))
+    if empresa:
+        return empresa
     try:
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
             return None
             
-        cursor = connection.cursor()
-        # Como no hay columna RUC, usamos el nombre como identificador
-        query = "SELECT id, nombre, direccion, contacto_email FROM empresas WHERE nombre = %s"
-        cursor.execute(query, (ruc,))
-        resultado = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(SQL_EMPRESA_POR_RUC, (ruc, ruc))
+            resultado = cursor.fetchone()
+            cursor.close()
+        finally:
+            connection.close()
         
         if resultado:
             return {
@@ -122,7 +524,7 @@ def obtener_empresa_por_ruc(ruc):
                 'nombre': resultado[1],
                 'direccion': resultado[2],
                 'contacto_email': resultado[3],
-                'ruc': ruc  # Usar el RUC como nombre temporal
+                'ruc': resultado[4] or ruc
             }
         else:
             print(f"Empresa con nombre {ruc} no encontrada")
@@ -131,7 +533,20 @@ def obtener_empresa_por_ruc(ruc):
         print(f"Error al obtener empresa por RUC: {e}")
         return None
 
-# 2.2. Función para crear nueva empresa
+# 2.2. Búsqueda aproximada de empresas por nombre (para sugerir opciones al usuario)
+@medir_consulta
+@solo_lectura
+def buscar_empresas(texto, limite=5):
+    """
+    Returns:
+        list: Hasta `limite` empresas parecidas a `texto` (diccionarios con id,
+        nombre, ruc, direccion, contacto_email y similitud), la más parecida primero
+    """
+    return _buscar_en_indice(lambda indice: indice.buscar(texto, limite)) or []
+
+# 2.3. Función para crear nueva empresa
+@medir_consulta
+@escritura
 def crear_empresa(ruc, nombre, direccion, contacto_email):
     try:
         connection = get_connection()
@@ -139,16 +554,23 @@ def crear_empresa(ruc, nombre, direccion, contacto_email):
             print("Error: No se pudo conectar a la base de datos")
             return None
             
-        cursor = connection.cursor()
-        query = """
-            INSERT INTO empresas (nombre, direccion, contacto_email) 
-            VALUES (%s, %s, %s)
-        """
-        cursor.execute(query, (nombre, direccion, contacto_email))
-        connection.commit()
-        empresa_id = cursor.lastrowid
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor()
+            query = """
+                INSERT INTO empresas (nombre, ruc, direccion, contacto_email) 
+                VALUES (%s, %s, %s, %s)
+            """
+            cursor.execute(query, (nombre, ruc, direccion, contacto_email))
+            connection.commit()
+            empresa_id = cursor.lastrowid
+            cursor.close()
+        finally:
+            connection.close()
+
+        _buscar_en_indice(lambda indice: indice.agregar({
+            'id': empresa_id, 'nombre': nombre, 'ruc': ruc,
+            'direccion': direccion, 'contacto_email': contacto_email
+        }))
         
         print(f"Empresa creada con ID: {empresa_id}")
         return empresa_id
@@ -157,13 +579,14 @@ def crear_empresa(ruc, nombre, direccion, contacto_email):
         return None
 
 # 3. Función para registrar una solicitud de carta
+@medir_consulta
+@escritura
 def registrar_solicitud_carta(estudiante_id, empresa_id, fecha_solicitud, ruta_pdf=None):
     try:
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
             return False
-        cursor = connection.cursor()
         if ruta_pdf:
             query = """
                 INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf)
@@ -176,45 +599,305 @@ def registrar_solicitud_carta(estudiante_id, empresa_id, fecha_solicitud, ruta_p
                 VALUES (%s, %s, %s)
             """
             values = (estudiante_id, empresa_id, fecha_solicitud)
-        cursor.execute(query, values)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(query, values)
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        return True
+    except Exception as e:
+        print(f"Error al registrar solicitud de carta: {e}")
+        return False
+
+# 3.1. Ciclo de vida de una carta: la solicitud se inserta como 'pendiente' y,
+# cuando el PDF se genera en otro proceso (services/render_service.py), se
+# completa con su ruta o se cancela. La clave única (estudiante_id, empresa_id)
+# garantiza una carta activa por empresa. iniciada_en marca quién la está
+# generando: una solicitud 'pendiente' no se vuelve a reclamar hasta pasados
+# Config.CARTAS_PENDIENTE_MAX segundos, y cancelar_carta solo deshace la suya
+SQL_INSERTAR_SOLICITUD_PENDIENTE = """
+    INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, estado, iniciada_en)
+    VALUES (%s, %s, %s, 'pendiente', %s)
+"""
+
+SQL_SOLICITUD_EXISTENTE = """
+    SELECT id, ruta_pdf, estado FROM solicitudes_carta
+    WHERE estudiante_id = %s AND empresa_id = %s
+    FOR UPDATE
+"""
+
+# Una generada sin PDF, una expirada o una pendiente abandonada vuelven a 'pendiente'
+SQL_RECLAMAR_SOLICITUD = """
+    UPDATE solicitudes_carta SET estado = 'pendiente', fecha_solicitud = %s, iniciada_en = %s
+    WHERE id = %s AND (estado <> 'pendiente' OR iniciada_en IS NULL OR iniciada_en < %s)
+"""
+
+SQL_COMPLETAR_SOLICITUD = """
+    UPDATE solicitudes_carta SET ruta_pdf = %s, estado = 'generada'
+    WHERE id = %s
+"""
+
+SQL_SOLICITUD_CON_RUTA = "SELECT id FROM solicitudes_carta WHERE id = %s AND ruta_pdf = %s"
+
+SQL_CANCELAR_SOLICITUD = """
+    DELETE FROM solicitudes_carta
+    WHERE id = %s AND estado = 'pendiente' AND ruta_pdf IS NULL AND iniciada_en = %s
+"""
+
+SQL_RESTAURAR_SOLICITUD = """
+    UPDATE solicitudes_carta SET estado = %s
+    WHERE id = %s AND estado = 'pendiente' AND iniciada_en = %s
+"""
+
+def _marca_inicio(segundos_atras=0):
+    # Sin microsegundos: DATETIME de MySQL los descarta y cancelar_carta compara por igualdad
+    return (datetime.now() - timedelta(seconds=segundos_atras)).strftime('%Y-%m-%d %H:%M:%S')
+
+@medir_consulta
+@escritura
+def iniciar_carta(estudiante_id, empresa_id, fecha_solicitud):
+    """
+    Registra la solicitud como 'pendiente' antes de generar el PDF
+
+    Si ya hay una solicitud para el estudiante y la empresa: con su PDF guardado
+    es 'duplicada'; si otro proceso la está generando es 'en_curso'; si no (sin
+    PDF, expirada o pendiente abandonada) se reclama y es 'nueva'.
+
+    Returns:
+        dict: 'estado' ('nueva', 'duplicada', 'en_curso' o 'error'), 'solicitud_id' y 'ruta_pdf'.
+        Con 'nueva' también 'iniciada_en' y 'estado_anterior' (None si la fila es nueva):
+        hay que generar el PDF y llamar a completar_carta o a cancelar_carta con ellos.
+    """
+    resultado = {'estado': 'error', 'solicitud_id': None, 'ruta_pdf': None}
+    connection = get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return resultado
+
+    iniciada_en = _marca_inicio()
+    try:
+        cursor = connection.cursor()
+        estado_anterior = None
+        try:
+            cursor.execute(SQL_INSERTAR_SOLICITUD_PENDIENTE, (estudiante_id, empresa_id, fecha_solicitud, iniciada_en))
+            solicitud_id = cursor.lastrowid
+        except (IntegrityError, sqlite3.IntegrityError) as e:
+            if not _es_clave_duplicada(e):
+                raise
+            cursor.execute(SQL_SOLICITUD_EXISTENTE, (estudiante_id, empresa_id))
+            solicitud_id, ruta_existente, estado_anterior = cursor.fetchone()
+            if estado_anterior != 'pendiente' and _pdf_disponible(ruta_existente):
+                connection.rollback()
+                cursor.close()
+                return {'estado': 'duplicada', 'solicitud_id': solicitud_id, 'ruta_pdf': ruta_existente}
+            cursor.execute(SQL_RECLAMAR_SOLICITUD, (
+                fecha_solicitud, iniciada_en, solicitud_id, _marca_inicio(Config.CARTAS_PENDIENTE_MAX)
+            ))
+            if cursor.rowcount == 0:
+                connection.rollback()
+                cursor.close()
+                return {'estado': 'en_curso', 'solicitud_id': solicitud_id, 'ruta_pdf': None}
         connection.commit()
         cursor.close()
+        return {'estado': 'nueva', 'solicitud_id': solicitud_id, 'ruta_pdf': None,
+                'iniciada_en': iniciada_en, 'estado_anterior': estado_anterior}
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al iniciar carta: {e}")
+        return resultado
+    finally:
         connection.close()
+
+@medir_consulta
+@escritura
+def completar_carta(solicitud_id, ruta_pdf):
+    """
+    Guarda la ruta del PDF generado y marca la solicitud como 'generada'
+
+    Returns:
+        bool: False si falló o si la solicitud ya no existe (el PDF quedaría sin solicitud)
+    """
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return False
+        try:
+            cursor = connection.cursor()
+            cursor.execute(SQL_COMPLETAR_SOLICITUD, (ruta_pdf, solicitud_id))
+            completada = cursor.rowcount > 0
+            if not completada:
+                # MySQL no cuenta las filas que ya tenían estos valores
+                cursor.execute(SQL_SOLICITUD_CON_RUTA, (solicitud_id, ruta_pdf))
+                completada = cursor.fetchone() is not None
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        if not completada:
+            print(f"Error al completar carta: la solicitud {solicitud_id} ya no existe")
+        return completada
+    except Exception as e:
+        print(f"Error al completar carta: {e}")
+        return False
+
+@medir_consulta
+@escritura
+def cancelar_carta(solicitud_id, iniciada_en, estado_anterior=None):
+    """
+    Deshace iniciar_carta cuando no se pudo generar el PDF: borra la solicitud
+    nueva o devuelve la reclamada a su estado anterior. No toca la solicitud si
+    otro proceso la volvió a reclamar entre tanto.
+
+    Args:
+        solicitud_id, iniciada_en, estado_anterior: Los valores que devolvió iniciar_carta
+    """
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return False
+        if estado_anterior in (None, 'pendiente'):
+            query, parametros = SQL_CANCELAR_SOLICITUD, (solicitud_id, iniciada_en)
+        else:
+            query, parametros = SQL_RESTAURAR_SOLICITUD, (estado_anterior, solicitud_id, iniciada_en)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(query, parametros)
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
         return True
     except Exception as e:
-        print(f"Error al registrar solicitud de carta: {e}")
+        print(f"Error al cancelar carta: {e}")
         return False
 
 # 4. Función para consultar las horas acumuladas por el estudiante
+# Lee el total materializado en horas_estudiante (lo mantienen los triggers de practicas)
+SQL_HORAS = "SELECT total_horas FROM horas_estudiante WHERE estudiante_id = %s"
+
+# Sin la migración 2 no existen horas_estudiante ni horas_estudiante_empresa: hasta
+# que se aplique, las horas se suman desde practicas (se vuelve a probar cada minuto)
+SQL_HORAS_SUMA = """
+    SELECT SUM(practicas.horas)
+    FROM practicas
+    JOIN estudiantes_empresas ON practicas.estudiante_empresa_id = estudiantes_empresas.id
+    WHERE estudiantes_empresas.estudiante_id = %s
+"""
+
+_sin_horas_materializadas_en = None
+
+def _horas_materializadas():
+    return _sin_horas_materializadas_en is None or time.monotonic() - _sin_horas_materializadas_en >= 60
+
+def _marcar_sin_horas_materializadas():
+    global _sin_horas_materializadas_en
+    if _sin_horas_materializadas_en is None:
+        print("Aviso: faltan las tablas de horas materializadas (python migraciones.py); se suman desde practicas")
+    _sin_horas_materializadas_en = time.monotonic()
+
+def _leer_horas(materializadas, suma):
+    """Ejecuta materializadas(); si faltan las tablas de horas, ejecuta suma()"""
+    if _horas_materializadas():
+        try:
+            return materializadas()
+        except Exception as e:
+            if not _es_tabla_inexistente(e):
+                raise
+            _marcar_sin_horas_materializadas()
+    return suma()
+
+# Las horas se devuelven siempre como Decimal con dos decimales, como las columnas
+# DECIMAL de MySQL (en SQLite un SUM o un UNION devuelven float)
+def _a_decimal(horas):
+    if horas is None:
+        return Decimal('0.00')
+    if not isinstance(horas, Decimal):
+        horas = Decimal(str(horas))
+    return horas.quantize(Decimal('0.01'))
+
+@medir_consulta
+@solo_lectura
 def consultar_horas(codigo_estudiante):
     try:
+        estudiante_id = obtener_estudiante_id(codigo_estudiante)
+        if estudiante_id is None:
+            return _a_decimal(0)
+
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
-            return 0
+            return _a_decimal(0)
             
-        cursor = connection.cursor()
-        query = """
-            SELECT SUM(horas) 
-            FROM practicas
-            JOIN estudiantes_empresas ON practicas.estudiante_empresa_id = estudiantes_empresas.id
-            JOIN estudiantes ON estudiantes.id = estudiantes_empresas.estudiante_id
-            WHERE estudiantes.codigo = %s
-        """
-        cursor.execute(query, (codigo_estudiante,))
-        resultado = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        try:
+            filas = _leer_horas(
+                lambda: ejecutar_preparada(connection, 'horas', (estudiante_id,)),
+                lambda: ejecutar_preparada(connection, 'horas_suma', (estudiante_id,))
+            )
+        finally:
+            connection.close()
         
-        if resultado and resultado[0] is not None:
-            return resultado[0]
-        else:
-            return 0
+        return _a_decimal(filas[0][0] if filas else None)
     except Exception as e:
         print(f"Error al consultar horas: {e}")
-        return 0
+        return _a_decimal(0)
+
+# 4.1. Función para consultar las horas del estudiante desglosadas por empresa
+SQL_HORAS_POR_EMPRESA = """
+    SELECT empresas.nombre, horas_estudiante_empresa.horas
+    FROM horas_estudiante_empresa
+    JOIN empresas ON empresas.id = horas_estudiante_empresa.empresa_id
+    WHERE horas_estudiante_empresa.estudiante_id = %s
+"""
+
+SQL_HORAS_POR_EMPRESA_SUMA = """
+    SELECT empresas.nombre, SUM(practicas.horas)
+    FROM practicas
+    JOIN estudiantes_empresas ON practicas.estudiante_empresa_id = estudiantes_empresas.id
+    JOIN empresas ON empresas.id = estudiantes_empresas.empresa_id
+    WHERE estudiantes_empresas.estudiante_id = %s
+    GROUP BY empresas.id, empresas.nombre
+"""
+
+@medir_consulta
+@solo_lectura
+def consultar_horas_por_empresa(codigo_estudiante):
+    try:
+        estudiante_id = obtener_estudiante_id(codigo_estudiante)
+        if estudiante_id is None:
+            return []
+
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return []
+
+        try:
+            filas = _leer_horas(
+                lambda: ejecutar_preparada(connection, 'horas_por_empresa', (estudiante_id,)),
+                lambda: ejecutar_preparada(connection, 'horas_por_empresa_suma', (estudiante_id,))
+            )
+        finally:
+            connection.close()
+        return [(nombre, _a_decimal(horas)) for nombre, horas in filas]
+    except Exception as e:
+        print(f"Error al consultar horas por empresa: {e}")
+        return []
 
 # 5. Función para consultar las empresas en las que el estudiante realizó prácticas
+SQL_EMPRESAS_ESTUDIANTE = """
+    SELECT empresas.nombre
+    FROM empresas
+    JOIN estudiantes_empresas ON empresas.id = estudiantes_empresas.empresa_id
+    JOIN estudiantes ON estudiantes.id = estudiantes_empresas.estudiante_id
+    WHERE estudiantes.codigo = %s
+"""
+
+@medir_consulta
+@solo_lectura
 def consultar_empresas(codigo_estudiante):
     try:
         connection = get_connection()
@@ -222,101 +905,711 @@ def consultar_empresas(codigo_estudiante):
             print("Error: No se pudo conectar a la base de datos")
             return []
             
-        cursor = connection.cursor()
-        query = """
-            SELECT empresas.nombre 
-            FROM empresas
-            JOIN estudiantes_empresas ON empresas.id = estudiantes_empresas.empresa_id
-            JOIN estudiantes ON estudiantes.id = estudiantes_empresas.estudiante_id
-            WHERE estudiantes.codigo = %s
-        """
-        cursor.execute(query, (codigo_estudiante,))
-        empresas = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        try:
+            empresas = ejecutar_preparada(connection, 'empresas_estudiante', (codigo_estudiante,))
+        finally:
+            connection.close()
         return [empresa[0] for empresa in empresas] if empresas else []
     except Exception as e:
         print(f"Error al consultar empresas: {e}")
         return []
 
 # 6. Función para obtener todas las fechas críticas (que están pendientes)
-def consultar_fechas_criticas():
+SQL_FECHAS_CRITICAS = "SELECT descripcion, fecha FROM fechas_criticas WHERE estado = 'pendiente'"
+
+def _cargar_fechas_criticas():
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
     try:
-        connection = get_connection()
-        if connection is None:
-            print("Error: No se pudo conectar a la base de datos")
-            return []
-            
         cursor = connection.cursor()
-        query = "SELECT descripcion, fecha FROM fechas_criticas WHERE estado = 'pendiente'"
-        cursor.execute(query)
+        cursor.execute(SQL_FECHAS_CRITICAS)
         fechas_criticas = cursor.fetchall()
         cursor.close()
-        connection.close()
         return fechas_criticas
+    finally:
+        connection.close()
+
+@medir_consulta
+@solo_lectura
+def consultar_fechas_criticas():
+    try:
+        _revisar_marca_consultas()
+        fechas_criticas = _cache_consultas.obtener_o_cargar(
+            'fechas_criticas', _cargar_fechas_criticas, Config.CACHE_TTL_FECHAS_CRITICAS
+        )
+        return list(fechas_criticas)
     except Exception as e:
         print(f"Error al consultar fechas críticas: {e}")
         return []
 
-# 7. Función para obtener todas las oportunidades de prácticas activas
-def consultar_oportunidades_practicas():
+# 6.1. Alta de fechas críticas y cambio de estado ('pendiente' o 'completada');
+# invalidan la caché de consultar_fechas_criticas
+SQL_CREAR_FECHA_CRITICA = "INSERT INTO fechas_criticas (descripcion, fecha, estado) VALUES (%s, %s, 'pendiente')"
+SQL_ESTADO_FECHA_CRITICA = "UPDATE fechas_criticas SET estado = %s WHERE id = %s"
+
+def _escribir_fila(query, parametros, descripcion):
+    """Ejecuta una escritura; devuelve (lastrowid, filas afectadas) o None si falló"""
     try:
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
-            return []
-            
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute(query, parametros)
+            connection.commit()
+            resultado = (cursor.lastrowid, cursor.rowcount)
+            cursor.close()
+        finally:
+            connection.close()
+        return resultado
+    except Exception as e:
+        print(f"Error al {descripcion}: {e}")
+        return None
+
+@medir_consulta
+@escritura
+def crear_fecha_critica(descripcion, fecha):
+    """Returns: int: ID de la fecha crítica creada, o None si falló"""
+    resultado = _escribir_fila(SQL_CREAR_FECHA_CRITICA, (descripcion, fecha), "crear fecha crítica")
+    if resultado is None:
+        return None
+    invalidar_fechas_criticas()
+    return resultado[0]
+
+@medir_consulta
+@escritura
+def actualizar_estado_fecha_critica(fecha_id, estado):
+    """Returns: bool: True si se actualizó la fecha crítica"""
+    resultado = _escribir_fila(SQL_ESTADO_FECHA_CRITICA, (estado, fecha_id), "actualizar fecha crítica")
+    if resultado is None or not resultado[1]:
+        return False
+    invalidar_fechas_criticas()
+    return True
+
+# 7. Función para obtener todas las oportunidades de prácticas activas
+SQL_OPORTUNIDADES = "SELECT empresa_id, descripcion, fecha_inicio, fecha_fin FROM oportunidades_practicas WHERE estado = 'activo'"
+
+def _cargar_oportunidades_practicas():
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
+    try:
         cursor = connection.cursor()
-        query = "SELECT empresa_id, descripcion, fecha_inicio, fecha_fin FROM oportunidades_practicas WHERE estado = 'activo'"
-        cursor.execute(query)
+        cursor.execute(SQL_OPORTUNIDADES)
         oportunidades = cursor.fetchall()
         cursor.close()
-        connection.close()
         return oportunidades
+    finally:
+        connection.close()
+
+@medir_consulta
+@solo_lectura
+def consultar_oportunidades_practicas():
+    try:
+        _revisar_marca_consultas()
+        oportunidades = _cache_consultas.obtener_o_cargar(
+            'oportunidades_practicas', _cargar_oportunidades_practicas, Config.CACHE_TTL_OPORTUNIDADES
+        )
+        return list(oportunidades)
     except Exception as e:
         print(f"Error al consultar oportunidades: {e}")
         return []
 
+# 7.1. Página de oportunidades activas (keyset por id; el índice de estado ya
+# está ordenado por la clave primaria)
+SQL_OPORTUNIDADES_PAGINA = """
+    SELECT id, empresa_id, descripcion, fecha_inicio, fecha_fin
+    FROM oportunidades_practicas
+    WHERE estado = 'activo' AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+def _cargar_pagina_oportunidades(despues_id, limite):
+    connection = get_connection()
+    if connection is None:
+        raise ConnectionError("No se pudo conectar a la base de datos")
+    try:
+        cursor = connection.cursor()
+        cursor.execute(SQL_OPORTUNIDADES_PAGINA, (despues_id, limite + 1))
+        filas = cursor.fetchall()
+        cursor.close()
+        return _cortar_pagina(filas, limite)
+    finally:
+        connection.close()
+
+@medir_consulta
+@solo_lectura
+def consultar_oportunidades_pagina(limite=None, despues=None):
+    """
+    Devuelve una página de oportunidades activas
+
+    Args:
+        limite: Filas por página (por defecto Config.PAGINA_TAMANO, máximo Config.PAGINA_TAMANO_MAX)
+        despues: Token de continuación devuelto por la página anterior
+
+    Returns:
+        tuple: (oportunidades, token de la siguiente página o None si es la última)
+
+    Raises:
+        ValueError: Si el token no es válido
+    """
+    despues_id = decodificar_token_pagina(despues)
+    limite = _limite_pagina(limite)
+    try:
+        _revisar_marca_consultas()
+        oportunidades, siguiente = _cache_paginas.obtener_o_cargar(
+            ('oportunidades_practicas', despues_id, limite),
+            lambda: _cargar_pagina_oportunidades(despues_id, limite),
+            Config.CACHE_TTL_OPORTUNIDADES
+        )
+        return list(oportunidades), siguiente
+    except Exception as e:
+        print(f"Error al consultar oportunidades: {e}")
+        return [], None
+
+# 7.2. Alta de oportunidades y cambio de estado ('activo' o 'inactivo'); invalidan
+# la caché de la lista y de sus páginas
+SQL_CREAR_OPORTUNIDAD = """
+    INSERT INTO oportunidades_practicas (empresa_id, descripcion, fecha_inicio, fecha_fin, estado)
+    VALUES (%s, %s, %s, %s, 'activo')
+"""
+SQL_ESTADO_OPORTUNIDAD = "UPDATE oportunidades_practicas SET estado = %s WHERE id = %s"
+
+@medir_consulta
+@escritura
+def crear_oportunidad_practica(empresa_id, descripcion, fecha_inicio, fecha_fin):
+    """Returns: int: ID de la oportunidad creada, o None si falló"""
+    resultado = _escribir_fila(
+        SQL_CREAR_OPORTUNIDAD, (empresa_id, descripcion, fecha_inicio, fecha_fin), "crear oportunidad"
+    )
+    if resultado is None:
+        return None
+    invalidar_oportunidades_practicas()
+    return resultado[0]
+
+@medir_consulta
+@escritura
+def actualizar_estado_oportunidad(oportunidad_id, estado):
+    """Returns: bool: True si se actualizó la oportunidad"""
+    resultado = _escribir_fila(SQL_ESTADO_OPORTUNIDAD, (estado, oportunidad_id), "actualizar oportunidad")
+    if resultado is None or not resultado[1]:
+        return False
+    invalidar_oportunidades_practicas()
+    return True
+
 # 8. Función para consultar todas las cartas generadas por un estudiante
+SQL_CARTAS_GENERADAS = """
+    SELECT empresas.nombre, solicitudes_carta.ruta_pdf
+    FROM solicitudes_carta
+    JOIN empresas ON solicitudes_carta.empresa_id = empresas.id
+    WHERE solicitudes_carta.estudiante_id = %s
+"""
+
+@medir_consulta
+@solo_lectura
 def consultar_cartas_generadas(estudiante_id):
     try:
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
             return []
-        cursor = connection.cursor()
-        query = """
-            SELECT empresas.nombre, solicitudes_carta.ruta_pdf
-            FROM solicitudes_carta
-            JOIN empresas ON solicitudes_carta.empresa_id = empresas.id
-            WHERE solicitudes_carta.estudiante_id = %s
-        """
-        cursor.execute(query, (estudiante_id,))
-        cartas = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(SQL_CARTAS_GENERADAS, (estudiante_id,))
+            cartas = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
         return cartas
     except Exception as e:
         print(f"Error al consultar cartas generadas: {e}")
         return []
 
+# 8.1. Página de cartas generadas por un estudiante (keyset por id)
+SQL_CARTAS_GENERADAS_PAGINA = """
+    SELECT solicitudes_carta.id, empresas.nombre, solicitudes_carta.ruta_pdf
+    FROM solicitudes_carta
+    JOIN empresas ON solicitudes_carta.empresa_id = empresas.id
+    WHERE solicitudes_carta.estudiante_id = %s AND solicitudes_carta.id > %s
+    ORDER BY solicitudes_carta.id
+    LIMIT %s
+"""
+
+@medir_consulta
+@solo_lectura
+def consultar_cartas_pagina(estudiante_id, limite=None, despues=None):
+    """
+    Devuelve una página de las cartas generadas por un estudiante
+
+    Args:
+        estudiante_id: ID del estudiante
+        limite: Filas por página (por defecto Config.PAGINA_TAMANO, máximo Config.PAGINA_TAMANO_MAX)
+        despues: Token de continuación devuelto por la página anterior
+
+    Returns:
+        tuple: ([(solicitud_id, nombre_empresa, ruta_pdf)], token de la siguiente página o None)
+
+    Raises:
+        ValueError: Si el token no es válido
+    """
+    despues_id = decodificar_token_pagina(despues)
+    limite = _limite_pagina(limite)
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return [], None
+        try:
+            cursor = connection.cursor()
+            cursor.execute(SQL_CARTAS_GENERADAS_PAGINA, (estudiante_id, despues_id, limite + 1))
+            filas = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        return _cortar_pagina(filas, limite, quitar_id=False)
+    except Exception as e:
+        print(f"Error al consultar cartas generadas: {e}")
+        return [], None
+
+# 8.2. Ruta del PDF de una solicitud, solo si es del estudiante indicado (el bot
+# recibe el id de la solicitud desde un botón y no debe entregar cartas ajenas)
+SQL_RUTA_CARTA_ESTUDIANTE = """
+    SELECT ruta_pdf FROM solicitudes_carta WHERE id = %s AND estudiante_id = %s
+"""
+
+@medir_consulta
+@solo_lectura
+def obtener_ruta_carta(solicitud_id, estudiante_id):
+    """
+    Returns:
+        str: ruta_pdf de la solicitud, o None si no existe, no es del estudiante o no tiene PDF
+    """
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute(SQL_RUTA_CARTA_ESTUDIANTE, (solicitud_id, estudiante_id))
+            fila = cursor.fetchone()
+            cursor.close()
+        finally:
+            connection.close()
+        return fila[0] if fila else None
+    except Exception as e:
+        print(f"Error al obtener la ruta de la carta: {e}")
+        return None
+
 # 9. Función para verificar si ya existe una carta para un estudiante y empresa
+SQL_EXISTE_CARTA = """
+    SELECT id FROM solicitudes_carta
+    WHERE estudiante_id = %s AND empresa_id = %s
+"""
+
+@medir_consulta
+@solo_lectura
 def existe_carta_para_estudiante_y_empresa(estudiante_id, empresa_id):
     try:
         connection = get_connection()
         if connection is None:
             print("Error: No se pudo conectar a la base de datos")
             return False
-        cursor = connection.cursor()
-        query = """
-            SELECT id FROM solicitudes_carta
-            WHERE estudiante_id = %s AND empresa_id = %s
-        """
-        cursor.execute(query, (estudiante_id, empresa_id))
-        existe = cursor.fetchone() is not None
-        cursor.close()
-        connection.close()
+        try:
+            existe = bool(ejecutar_preparada(connection, 'existe_carta', (estudiante_id, empresa_id)))
+        finally:
+            connection.close()
         return existe
     except Exception as e:
         print(f"Error al verificar carta existente: {e}")
         return False
+
+# 10. Función para obtener el resumen de un estudiante (ID, horas, empresas y cartas)
+# en una sola consulta, en lugar de cuatro conexiones y cuatro consultas. Solo
+# cuenta las cartas generadas (las pendientes todavía no tienen PDF)
+_SQL_RESUMEN_ESTUDIANTE = """
+    SELECT 'estudiante', estudiantes.id, NULL, NULL, NULL
+    FROM estudiantes
+    WHERE estudiantes.codigo = %s
+    UNION ALL
+    {horas}
+    UNION ALL
+    SELECT 'empresa', NULL, NULL, empresas.nombre, NULL
+    FROM empresas
+    JOIN estudiantes_empresas ON empresas.id = estudiantes_empresas.empresa_id
+    JOIN estudiantes ON estudiantes.id = estudiantes_empresas.estudiante_id
+    WHERE estudiantes.codigo = %s
+    UNION ALL
+    SELECT 'carta', NULL, NULL, empresas.nombre, solicitudes_carta.ruta_pdf
+    FROM solicitudes_carta
+    JOIN empresas ON solicitudes_carta.empresa_id = empresas.id
+    JOIN estudiantes ON estudiantes.id = solicitudes_carta.estudiante_id
+    WHERE estudiantes.codigo = %s AND solicitudes_carta.estado = 'generada'
+"""
+
+SQL_RESUMEN_ESTUDIANTE = _SQL_RESUMEN_ESTUDIANTE.format(horas="""SELECT 'horas', NULL, horas_estudiante.total_horas, NULL, NULL
+    FROM horas_estudiante
+    JOIN estudiantes ON estudiantes.id = horas_estudiante.estudiante_id
+    WHERE estudiantes.codigo = %s""")
+
+SQL_RESUMEN_ESTUDIANTE_SUMA = _SQL_RESUMEN_ESTUDIANTE.format(horas="""SELECT 'horas', NULL, SUM(practicas.horas), NULL, NULL
+    FROM practicas
+    JOIN estudiantes_empresas ON practicas.estudiante_empresa_id = estudiantes_empresas.id
+    JOIN estudiantes ON estudiantes.id = estudiantes_empresas.estudiante_id
+    WHERE estudiantes.codigo = %s""")
+
+# Arma el diccionario del resumen a partir de las filas de SQL_RESUMEN_ESTUDIANTE
+def _armar_resumen(codigo_estudiante, filas):
+    resumen = {
+        'codigo': codigo_estudiante,
+        'estudiante_id': None,
+        'horas': _a_decimal(0),
+        'empresas': [],
+        'cartas': []
+    }
+    for tipo, estudiante_id, horas, nombre_empresa, ruta_pdf in filas:
+        if tipo == 'estudiante':
+            resumen['estudiante_id'] = estudiante_id
+        elif tipo == 'horas' and horas is not None:
+            resumen['horas'] = _a_decimal(horas)
+        elif tipo == 'empresa':
+            resumen['empresas'].append(nombre_empresa)
+        elif tipo == 'carta':
+            resumen['cartas'].append((nombre_empresa, ruta_pdf))
+    return resumen
+
+@medir_consulta
+@solo_lectura
+def consultar_resumen_estudiante(codigo_estudiante):
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return None
+        try:
+            cursor = connection.cursor()
+
+            def leer(query):
+                cursor.execute(query, (codigo_estudiante,) * 4)
+                return cursor.fetchall()
+
+            filas = _leer_horas(lambda: leer(SQL_RESUMEN_ESTUDIANTE), lambda: leer(SQL_RESUMEN_ESTUDIANTE_SUMA))
+            cursor.close()
+        finally:
+            connection.close()
+
+        resumen = _armar_resumen(codigo_estudiante, filas)
+        if resumen['estudiante_id'] is None:
+            print(f"Estudiante con código {codigo_estudiante} no encontrado")
+            return None
+
+        # Aprovecha la consulta para dejar el ID en la caché de estudiantes
+        _cache_estudiantes.guardar(('id', codigo_estudiante), resumen['estudiante_id'])
+        return resumen
+    except Exception as e:
+        print(f"Error al consultar resumen del estudiante: {e}")
+        return None
+
+# 11. Exportación de solicitudes de carta con datos del estudiante y la empresa
+# Se recorre con un cursor sin búfer en el orden del índice de fecha_solicitud
+# (que incluye el id), así no hay ordenamiento previo y las filas salen a medida
+# que el servidor las lee
+COLUMNAS_EXPORTACION = [
+    'solicitud_id', 'fecha_solicitud', 'estado', 'codigo_estudiante', 'dni',
+    'nombre_estudiante', 'correo', 'empresa', 'ruta_pdf'
+]
+
+SQL_EXPORTAR_SOLICITUDES = """
+    SELECT solicitudes_carta.id, solicitudes_carta.fecha_solicitud, solicitudes_carta.estado,
+           estudiantes.codigo, estudiantes.dni, estudiantes.nombre, estudiantes.correo,
+           empresas.nombre, solicitudes_carta.ruta_pdf
+    FROM solicitudes_carta
+    JOIN estudiantes ON estudiantes.id = solicitudes_carta.estudiante_id
+    JOIN empresas ON empresas.id = solicitudes_carta.empresa_id
+    {filtro}
+    ORDER BY solicitudes_carta.fecha_solicitud, solicitudes_carta.id
+"""
+
+def _sql_exportar_solicitudes(desde, hasta):
+    condiciones, parametros = [], []
+    if desde is not None:
+        condiciones.append("solicitudes_carta.fecha_solicitud >= %s")
+        parametros.append(desde)
+    if hasta is not None:
+        condiciones.append("solicitudes_carta.fecha_solicitud <= %s")
+        parametros.append(hasta)
+    filtro = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+    return SQL_EXPORTAR_SOLICITUDES.format(filtro=filtro), tuple(parametros)
+
+def _recorrer_cursor(connection, cursor, tamano_lote):
+    completo = False
+    try:
+        while True:
+            filas = cursor.fetchmany(tamano_lote)
+            if not filas:
+                break
+            yield from filas
+        completo = True
+    finally:
+        if completo:
+            cursor.close()
+            connection.close()
+        else:
+            # Quedan filas sin leer: devolverla al pool obligaría a leerlas todas
+            connection.descartar()
+
+@medir_consulta
+@solo_lectura
+def exportar_solicitudes_carta(desde=None, hasta=None, tamano_lote=1000):
+    """
+    Recorre las solicitudes de carta sin cargarlas en memoria
+
+    La consulta se ejecuta al llamar a la función; las filas se leen del servidor
+    de a `tamano_lote` mientras se consume el iterador. La conexión queda ocupada
+    hasta que el iterador termina o se cierra.
+
+    Args:
+        desde: Fecha mínima de fecha_solicitud (incluida), o None
+        hasta: Fecha máxima de fecha_solicitud (incluida), o None
+        tamano_lote: Filas que se piden al servidor en cada lectura
+
+    Returns:
+        iterador de tuplas en el orden de COLUMNAS_EXPORTACION; None si no se pudo consultar
+    """
+    connection = get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        query, parametros = _sql_exportar_solicitudes(desde, hasta)
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, parametros)
+    except Exception as e:
+        connection.descartar()
+        print(f"Error al exportar solicitudes de carta: {e}")
+        return None
+    return _recorrer_cursor(connection, cursor, tamano_lote)
+
+# 12. Cartas masivas (cartas_masivas.py): datos de muchos estudiantes en pocas
+# consultas y registro de todas las cartas generadas en una sola transacción
+SQL_ESTUDIANTES_CARTAS = "SELECT id, codigo, dni, nombre FROM estudiantes"
+
+SQL_REGISTRAR_CARTAS = {
+    'mysql': """
+        INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf, estado)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE fecha_solicitud = VALUES(fecha_solicitud),
+            ruta_pdf = VALUES(ruta_pdf), estado = VALUES(estado)
+    """,
+    'sqlite': """
+        INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf, estado)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (estudiante_id, empresa_id) DO UPDATE SET fecha_solicitud = excluded.fecha_solicitud,
+            ruta_pdf = excluded.ruta_pdf, estado = excluded.estado
+    """,
+}
+
+@medir_consulta
+@solo_lectura
+def consultar_estudiantes_para_cartas(codigos=None, tamano_lote=1000):
+    """
+    Args:
+        codigos: Códigos de los estudiantes, o None para todos
+        tamano_lote: Códigos por consulta (se usa una consulta IN por lote)
+
+    Returns:
+        dict: codigo -> {'id', 'codigo', 'dni', 'nombres'}; None si falló la consulta
+    """
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return None
+        try:
+            cursor = connection.cursor()
+            estudiantes = {}
+            if codigos is None:
+                lotes = [None]
+            else:
+                codigos = list(dict.fromkeys(codigos))
+                lotes = [codigos[i:i + tamano_lote] for i in range(0, len(codigos), tamano_lote)]
+            for lote in lotes:
+                if lote is None:
+                    cursor.execute(SQL_ESTUDIANTES_CARTAS + " ORDER BY id")
+                else:
+                    cursor.execute(
+                        SQL_ESTUDIANTES_CARTAS + f" WHERE codigo IN ({', '.join(['%s'] * len(lote))})", lote
+                    )
+                for estudiante_id, codigo, dni, nombre in cursor.fetchall():
+                    estudiantes[codigo] = {'id': estudiante_id, 'codigo': codigo, 'dni': dni, 'nombres': nombre}
+            cursor.close()
+        finally:
+            connection.close()
+        return estudiantes
+    except Exception as e:
+        print(f"Error al consultar estudiantes: {e}")
+        return None
+
+# Con ON DUPLICATE KEY no hay lastrowid por fila: los ids se leen por ruta_pdf
+SQL_SOLICITUDES_POR_RUTA = "SELECT id, ruta_pdf FROM solicitudes_carta WHERE ruta_pdf IN ({})"
+
+@medir_consulta
+@escritura
+def registrar_cartas_masivas(cartas, tamano_lote=1000):
+    """
+    Registra (o actualiza) las solicitudes de muchas cartas ya generadas
+
+    Args:
+        cartas: Lista de (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf)
+        tamano_lote: Filas por executemany; todas se confirman en una sola transacción
+
+    Returns:
+        list: (solicitud_id, ruta_pdf) de las cartas registradas, para anotarlas en el
+        manifiesto (carta_generator.asociar_cartas); None si falló (no se registra ninguna)
+    """
+    connection = get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        cursor = connection.cursor()
+        query = SQL_REGISTRAR_CARTAS[Config.DB_BACKEND]
+        filas = [(estudiante_id, empresa_id, fecha, ruta_pdf, 'generada')
+                 for estudiante_id, empresa_id, fecha, ruta_pdf in cartas]
+        for inicio in range(0, len(filas), tamano_lote):
+            cursor.executemany(query, filas[inicio:inicio + tamano_lote])
+        # Después de todo el lote, así una carta repetida solo aparece con su ruta final
+        rutas = list(dict.fromkeys(fila[3] for fila in filas))
+        registradas = []
+        for inicio in range(0, len(rutas), tamano_lote):
+            lote = rutas[inicio:inicio + tamano_lote]
+            cursor.execute(SQL_SOLICITUDES_POR_RUTA.format(', '.join(['%s'] * len(lote))), lote)
+            registradas.extend(cursor.fetchall())
+        connection.commit()
+        cursor.close()
+        return registradas
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al registrar cartas masivas: {e}")
+        return None
+    finally:
+        connection.close()
+
+# 13. Mantenimiento de los PDF de cartas (mantener_cartas.py): recorrido por lotes
+# (keyset por id) y cambios de ruta_pdf condicionados a la ruta leída, así no se
+# pisa una carta que se regeneró mientras tanto. Una carta expirada queda sin PDF
+# con estado 'expirada'; si se vuelve a pedir, iniciar_carta la genera de nuevo
+SQL_RUTAS_CARTAS = """
+    SELECT id, ruta_pdf FROM solicitudes_carta
+    WHERE id > %s AND ruta_pdf IS NOT NULL
+    ORDER BY id LIMIT %s
+"""
+
+SQL_MOVER_CARTA = "UPDATE solicitudes_carta SET ruta_pdf = %s WHERE id = %s AND ruta_pdf = %s"
+
+SQL_EXPIRAR_CARTA = """
+    UPDATE solicitudes_carta SET ruta_pdf = NULL, estado = 'expirada'
+    WHERE id = %s AND ruta_pdf = %s
+"""
+
+@medir_consulta
+def consultar_rutas_cartas(despues_id=0, limite=1000):
+    """
+    Args:
+        despues_id: Último id del lote anterior (0 para empezar)
+        limite: Solicitudes por lote
+
+    Returns:
+        list: (id, ruta_pdf) de las solicitudes con PDF, en orden de id; None si falló la consulta
+    """
+    try:
+        connection = get_connection()
+        if connection is None:
+            print("Error: No se pudo conectar a la base de datos")
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute(SQL_RUTAS_CARTAS, (despues_id, limite))
+            filas = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        return filas
+    except Exception as e:
+        print(f"Error al consultar rutas de cartas: {e}")
+        return None
+
+@medir_consulta
+@escritura
+def actualizar_rutas_cartas(cambios):
+    """
+    Cambia la ruta_pdf de un lote de solicitudes en una sola transacción
+
+    Args:
+        cambios: Lista de (solicitud_id, ruta_actual, ruta_nueva); con ruta_nueva None
+            la solicitud queda sin PDF y con estado 'expirada'
+
+    Returns:
+        int: Solicitudes actualizadas (no cuentan las que ya tenían otra ruta); None si falló
+    """
+    connection = get_connection()
+    if connection is None:
+        print("Error: No se pudo conectar a la base de datos")
+        return None
+    try:
+        cursor = connection.cursor()
+        actualizadas = 0
+        for solicitud_id, ruta_actual, ruta_nueva in cambios:
+            if ruta_nueva is None:
+                cursor.execute(SQL_EXPIRAR_CARTA, (solicitud_id, ruta_actual))
+            else:
+                cursor.execute(SQL_MOVER_CARTA, (ruta_nueva, solicitud_id, ruta_actual))
+            actualizadas += cursor.rowcount
+        connection.commit()
+        cursor.close()
+        return actualizadas
+    except Exception as e:
+        connection.rollback()
+        print(f"Error al actualizar rutas de cartas: {e}")
+        return None
+    finally:
+        connection.close()
+
+# Consultas de lectura de este módulo con parámetros de ejemplo; migraciones.py
+# las usa para revisar sus planes de ejecución con EXPLAIN
+CONSULTAS_LECTURA = {
+    'obtener_estudiante_id': (SQL_ESTUDIANTE_ID, ('20210001',)),
+    'validar_estudiante_completo': (SQL_VALIDAR_ESTUDIANTE, ('20210001', '12345678', 'Juan Carlos')),
+    'obtener_empresa_id': (SQL_EMPRESA_ID, ('Tech Solutions S.A.C.',)),
+    'obtener_empresa_por_ruc': (SQL_EMPRESA_POR_RUC, ('20123456789', 'Tech Solutions S.A.C.')),
+    'consultar_horas': (SQL_HORAS, (1,)),
+    'consultar_horas_por_empresa': (SQL_HORAS_POR_EMPRESA, (1,)),
+    'consultar_empresas': (SQL_EMPRESAS_ESTUDIANTE, ('20210001',)),
+    'consultar_fechas_criticas': (SQL_FECHAS_CRITICAS, ()),
+    'consultar_oportunidades_practicas': (SQL_OPORTUNIDADES, ()),
+    'consultar_oportunidades_pagina': (SQL_OPORTUNIDADES_PAGINA, (0, 11)),
+    'consultar_cartas_generadas': (SQL_CARTAS_GENERADAS, (1,)),
+    'consultar_cartas_pagina': (SQL_CARTAS_GENERADAS_PAGINA, (1, 0, 11)),
+    'obtener_ruta_carta': (SQL_RUTA_CARTA_ESTUDIANTE, (1, 1)),
+    'existe_carta_para_estudiante_y_empresa': (SQL_EXISTE_CARTA, (1, 1)),
+    'consultar_resumen_estudiante': (SQL_RESUMEN_ESTUDIANTE, ('20210001',) * 4),
+    'exportar_solicitudes_carta': _sql_exportar_solicitudes('2024-01-01', '2024-12-31'),
+    'consultar_estudiantes_para_cartas': (SQL_ESTUDIANTES_CARTAS + " WHERE codigo IN (%s)", ('20210001',)),
+    'consultar_rutas_cartas': (SQL_RUTAS_CARTAS, (0, 500)),
+}
+
+# Consultas de búsqueda más frecuentes, ejecutadas como sentencias preparadas
+# (ver ejecutar_preparada)
+SENTENCIAS_PREPARADAS = {
+    'estudiante_id': SQL_ESTUDIANTE_ID,
+    'empresa_id': SQL_EMPRESA_ID,
+    'horas': SQL_HORAS,
+    'horas_por_empresa': SQL_HORAS_POR_EMPRESA,
+    'horas_suma': SQL_HORAS_SUMA,
+    'horas_por_empresa_suma': SQL_HORAS_POR_EMPRESA_SUMA,
+    'empresas_estudiante': SQL_EMPRESAS_ESTUDIANTE,
+    'existe_carta': SQL_EXISTE_CARTA,
+}
@@ -0,0 +1,75 @@
+"""
+Conversión de filas a CSV o NDJSON por bloques, para exportaciones en streaming
+
+Las funciones reciben un iterador de filas y devuelven un generador de bloques
+de texto; así app.py y exportar_solicitudes.py pueden enviar o escribir cada
+bloque apenas está listo, sin juntar el resultado completo en memoria.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _valor_exportable(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+def a_csv(columnas, filas, filas_por_bloque=500):
+    """Genera el CSV (con encabezado) en bloques de `filas_por_bloque` filas"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    # El encabezado sale de inmediato, antes de leer la primera fila
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    pendientes = 0
+    for fila in filas:
+        escritor.writerow([_valor_exportable(valor) for valor in fila])
+        pendientes += 1
+        if pendientes >= filas_por_bloque:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    if pendientes:
+        yield buffer.getvalue()
+
+def a_ndjson(columnas, filas, filas_por_bloque=500):
+    """Genera un objeto JSON por línea, en bloques de `filas_por_bloque` filas"""
+    lineas = []
+    for fila in filas:
+        registro = {columna: _valor_exportable(valor) for columna, valor in zip(columnas, fila)}
+        lineas.append(json.dumps(registro, ensure_ascii=False, default=str))
+        if len(lineas) >= filas_por_bloque:
+            yield "\n".join(lineas) + "\n"
+            lineas = []
+    if lineas:
+        yield "\n".join(lineas) + "\n"
+
+def exportar(formato, columnas, filas, filas_por_bloque=500):
+    """
+    Args:
+        formato: 'csv' o 'ndjson'
+        columnas: Nombres de las columnas
+        filas: Iterador de tuplas
+        filas_por_bloque: Filas en cada bloque generado
+
+    Returns:
+        Generador de bloques de texto
+    """
+    if formato == 'csv':
+        return a_csv(columnas, filas, filas_por_bloque)
+    if formato == 'ndjson':
+        return a_ndjson(columnas, filas, filas_por_bloque)
+    raise ValueError(f"Formato de exportación no soportado: {formato}")
@@ -0,0 +1,196 @@
+"""
+Índice en memoria de empresas para búsquedas por RUC, por nombre y aproximadas
+
+Se carga completo en el primer uso y luego se actualiza pidiendo solo las
+empresas con id mayor al último cargado. Como así no se ven las empresas
+renombradas ni las eliminadas, cada cierto tiempo se vuelve a cargar completo
+(en un índice nuevo que reemplaza al anterior). Las búsquedas aproximadas usan
+trigramas del nombre normalizado (sin tildes, mayúsculas, puntuación ni
+sufijos societarios como S.A.C. o E.I.R.L.). La búsqueda exacta sí conserva el
+sufijo: 'Inversiones Lima S.R.L.' no es 'Inversiones Lima S.A.C.'.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+
+SUFIJOS_SOCIETARIOS = {'sa', 'sac', 'saa', 'srl', 'eirl', 'scrl', 'sas', 'ltda'}
+
+def normalizar_nombre(nombre, quitar_sufijos=True):
+    """'Tech Solutions S.A.C.' -> 'tech solutions' ('tech solutions sac' con quitar_sufijos=False)"""
+    texto = unicodedata.normalize('NFKD', nombre or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    # Las siglas con puntos (s.a.c.) se juntan antes de quitar la puntuación
+    texto = re.sub(r'\b(\w)\.(?=\w\.)', r'\1', texto).replace('.', '')
+    palabras = re.sub(r'[^a-z0-9]+', ' ', texto).split()
+    while quitar_sufijos and len(palabras) > 1 and palabras[-1] in SUFIJOS_SOCIETARIOS:
+        palabras.pop()
+    return ' '.join(palabras)
+
+def trigramas(texto):
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+class IndiceEmpresas:
+    """
+    Args:
+        cargar_desde: Función que recibe el último id cargado y devuelve las
+            empresas con id mayor, como diccionarios con id, nombre, ruc,
+            direccion y contacto_email, ordenadas por id
+        refrescar_tras: Segundos entre actualizaciones incrementales
+        reconstruir_tras: Segundos entre cargas completas
+    """
+
+    def __init__(self, cargar_desde, refrescar_tras=60, reconstruir_tras=3600):
+        self._cargar_desde = cargar_desde
+        self.refrescar_tras = refrescar_tras
+        self.reconstruir_tras = reconstruir_tras
+        self._lock = threading.RLock()
+        self._carga_lock = threading.Lock()
+        self._empresas = {}
+        self._por_ruc = {}
+        self._por_nombre = {}
+        self._por_base = {}
+        self._trigramas = {}
+        self._ultimo_id = 0
+        self._refrescado_en = None
+        self._reconstruido_en = None
+
+    def agregar(self, empresa):
+        """Agrega o reemplaza una empresa en el índice"""
+        with self._lock:
+            if empresa['id'] in self._empresas:
+                self._quitar(empresa['id'])
+            normalizado = normalizar_nombre(empresa['nombre'])
+            completo = normalizar_nombre(empresa['nombre'], quitar_sufijos=False)
+            self._empresas[empresa['id']] = dict(
+                empresa, normalizado=normalizado, completo=completo, num_trigramas=len(trigramas(normalizado))
+            )
+            if empresa.get('ruc'):
+                self._por_ruc[empresa['ruc'].strip()] = empresa['id']
+            self._por_nombre.setdefault(completo, []).append(empresa['id'])
+            self._por_base.setdefault(normalizado, []).append(empresa['id'])
+            for trigrama in trigramas(normalizado):
+                self._trigramas.setdefault(trigrama, set()).add(empresa['id'])
+            self._ultimo_id = max(self._ultimo_id, empresa['id'])
+
+    def _quitar(self, empresa_id):
+        anterior = self._empresas.pop(empresa_id)
+        if anterior.get('ruc') and self._por_ruc.get(anterior['ruc'].strip()) == empresa_id:
+            del self._por_ruc[anterior['ruc'].strip()]
+        for claves, clave in ((self._por_nombre, anterior['completo']), (self._por_base, anterior['normalizado'])):
+            ids = claves.get(clave, [])
+            if empresa_id in ids:
+                ids.remove(empresa_id)
+        for trigrama in trigramas(anterior['normalizado']):
+            self._trigramas.get(trigrama, set()).discard(empresa_id)
+
+    def _toca(self, desde, intervalo, ahora):
+        return desde is None or ahora - desde >= intervalo
+
+    def refrescar(self, forzar=False):
+        """
+        Carga las empresas nuevas si pasó el intervalo (o siempre con forzar=True),
+        o el índice completo si pasaron `reconstruir_tras` segundos desde la última carga completa
+        """
+        if not forzar and not self._toca(self._refrescado_en, self.refrescar_tras, time.monotonic()):
+            return
+        with self._carga_lock:
+            ahora = time.monotonic()
+            if not forzar and not self._toca(self._refrescado_en, self.refrescar_tras, ahora):
+                return
+            if self._toca(self._reconstruido_en, self.reconstruir_tras, ahora):
+                self._reconstruir()
+            else:
+                for empresa in self._cargar_desde(self._ultimo_id):
+                    self.agregar(empresa)
+            self._refrescado_en = time.monotonic()
+
+    def invalidar(self):
+        """Hace que el próximo refrescar cargue el índice completo"""
+        self._refrescado_en = None
+        self._reconstruido_en = None
+
+    def reconstruir(self):
+        """Vuelve a cargar todas las empresas (quita las renombradas y eliminadas)"""
+        with self._carga_lock:
+            self._reconstruir()
+            self._refrescado_en = self._reconstruido_en
+
+    def _reconstruir(self):
+        # Se carga en un índice aparte para no bloquear las búsquedas mientras tanto
+        with self._lock:
+            ultimo_id = self._ultimo_id
+        nuevo = IndiceEmpresas(self._cargar_desde)
+        for empresa in self._cargar_desde(0):
+            nuevo.agregar(empresa)
+        with self._lock:
+            # Se conservan las empresas agregadas (crear_empresa) mientras se cargaba
+            for empresa_id in list(self._empresas):
+                if empresa_id > max(ultimo_id, nuevo._ultimo_id):
+                    nuevo.agregar(self._publica(empresa_id))
+            self._empresas, self._por_ruc = nuevo._empresas, nuevo._por_ruc
+            self._por_nombre, self._trigramas = nuevo._por_nombre, nuevo._trigramas
+            self._por_base = nuevo._por_base
+            self._ultimo_id = nuevo._ultimo_id
+            self._reconstruido_en = time.monotonic()
+
+    def _publica(self, empresa_id):
+        empresa = dict(self._empresas[empresa_id])
+        del empresa['normalizado'], empresa['completo'], empresa['num_trigramas']
+        return empresa
+
+    def por_ruc(self, ruc):
+        with self._lock:
+            empresa_id = self._por_ruc.get((ruc or '').strip())
+            return self._publica(empresa_id) if empresa_id is not None else None
+
+    def por_nombre(self, nombre):
+        """
+        Empresa cuyo nombre normalizado coincide exactamente, sufijo incluido (la de
+        menor id si hay varias iguales). Sin sufijo ('Minera Andina') vale la única
+        empresa con ese nombre y cualquier sufijo; si hay varias no se elige ninguna.
+        """
+        completo = normalizar_nombre(nombre, quitar_sufijos=False)
+        with self._lock:
+            ids = self._por_nombre.get(completo)
+            if ids:
+                return self._publica(min(ids))
+            base = normalizar_nombre(nombre)
+            ids = self._por_base.get(base) if base == completo else None
+            return self._publica(ids[0]) if ids and len(ids) == 1 else None
+
+    def buscar(self, texto, limite=5, similitud_minima=0.3):
+        """
+        Empresas con nombre parecido, de mayor a menor similitud
+
+        Returns:
+            list: Diccionarios de empresa con la clave adicional 'similitud' (0 a 1)
+        """
+        consulta = trigramas(normalizar_nombre(texto))
+        if not consulta:
+            return []
+        with self._lock:
+            comunes = {}
+            for trigrama in consulta:
+                for empresa_id in self._trigramas.get(trigrama, ()):
+                    comunes[empresa_id] = comunes.get(empresa_id, 0) + 1
+            puntajes = []
+            for empresa_id, cantidad in comunes.items():
+                total = len(consulta) + self._empresas[empresa_id]['num_trigramas'] - cantidad
+                similitud = cantidad / total
+                if similitud >= similitud_minima:
+                    puntajes.append((similitud, empresa_id))
+            puntajes.sort(key=lambda par: (-par[0], par[1]))
+            return [dict(self._publica(empresa_id), similitud=round(similitud, 3))
+                    for similitud, empresa_id in puntajes[:limite]]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'empresas': len(self._empresas),
+                'con_ruc': len(self._por_ruc),
+                'trigramas': len(self._trigramas),
+                'ultimo_id': self._ultimo_id,
+            }
@@ -0,0 +1,256 @@
+"""
+Métricas de tiempo de las consultas a la base de datos
+
+Cada función de database_service decorada con medir_consulta registra por
+separado el tiempo de obtener la conexión y el de ejecutar la consulta y leer
+sus filas, en histogramas etiquetados con el nombre de la función. Las consultas
+que superan Config.CONSULTA_LENTA_MS se guardan (con el SQL normalizado y el
+número de parámetros) en un registro de consultas lentas.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache, wraps
+
+from config import Config
+
+# Límites superiores (en milisegundos) de los intervalos de los histogramas
+LIMITES_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+FUNCION_DESCONOCIDA = 'sin_funcion'
+
+_contexto = threading.local()
+
+class Histograma:
+    """Histograma de duraciones con intervalos fijos; no es seguro entre hilos por sí solo"""
+
+    def __init__(self):
+        self.conteos = [0] * (len(LIMITES_MS) + 1)
+        self.cantidad = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def registrar(self, duracion_ms):
+        indice = 0
+        while indice < len(LIMITES_MS) and duracion_ms > LIMITES_MS[indice]:
+            indice += 1
+        self.conteos[indice] += 1
+        self.cantidad += 1
+        self.total_ms += duracion_ms
+        self.max_ms = max(self.max_ms, duracion_ms)
+
+    def percentil(self, fraccion):
+        """Límite superior del intervalo donde cae el percentil (el máximo si es el último)"""
+        if not self.cantidad:
+            return 0.0
+        objetivo = fraccion * self.cantidad
+        acumulado = 0
+        for indice, conteo in enumerate(self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                if indice < len(LIMITES_MS):
+                    return min(float(LIMITES_MS[indice]), round(self.max_ms, 3))
+                break
+        return round(self.max_ms, 3)
+
+    def estadisticas(self):
+        intervalos = {f"<={limite}": conteo for limite, conteo in zip(LIMITES_MS, self.conteos)}
+        intervalos[f">{LIMITES_MS[-1]}"] = self.conteos[-1]
+        return {
+            'cantidad': self.cantidad,
+            'promedio_ms': round(self.total_ms / self.cantidad, 3) if self.cantidad else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentil(0.50),
+            'p95_ms': self.percentil(0.95),
+            'p99_ms': self.percentil(0.99),
+            'intervalos_ms': intervalos,
+        }
+
+_lock = threading.Lock()
+_histogramas = {}
+_consultas_lentas = deque(maxlen=Config.CONSULTAS_LENTAS_MAX)
+
+def registrar_tiempo(funcion, fase, segundos):
+    """
+    Suma una duración al histograma de una función
+
+    Args:
+        funcion: Nombre de la función de database_service
+        fase: 'conexion' o 'consulta' (ejecución más lectura de filas)
+        segundos: Duración medida
+    """
+    with _lock:
+        histograma = _histogramas.get((funcion, fase))
+        if histograma is None:
+            histograma = _histogramas[(funcion, fase)] = Histograma()
+        histograma.registrar(segundos * 1000)
+
+@lru_cache(maxsize=512)
+def normalizar_sql(query):
+    """Deja el SQL en una línea y reemplaza literales y marcadores por ?"""
+    query = re.sub(r"'(?:[^'\\]|\\.)*'", '?', query)
+    query = re.sub(r'\b\d+(?:\.\d+)?\b', '?', query)
+    query = query.replace('%s', '?')
+    return re.sub(r'\s+', ' ', query).strip()
+
+def registrar_consulta(funcion, query, num_parametros, segundos):
+    """Suma la duración de una consulta a su función y la guarda si es lenta"""
+    registrar_tiempo(funcion, 'consulta', segundos)
+    duracion_ms = segundos * 1000
+    if duracion_ms < Config.CONSULTA_LENTA_MS:
+        return
+    entrada = {
+        'funcion': funcion,
+        'sql': normalizar_sql(query),
+        'parametros': num_parametros,
+        'duracion_ms': round(duracion_ms, 3),
+        'momento': time.time(),
+    }
+    with _lock:
+        _consultas_lentas.append(entrada)
+    print(f"Consulta lenta en {funcion} ({entrada['duracion_ms']} ms, "
+          f"{num_parametros} parámetros): {entrada['sql']}")
+
+def funcion_actual():
+    return getattr(_contexto, 'funcion', FUNCION_DESCONOCIDA)
+
+def medir_consulta(funcion):
+    """Decorador: las consultas hechas dentro de la función se etiquetan con su nombre"""
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        anterior = getattr(_contexto, 'funcion', FUNCION_DESCONOCIDA)
+        _contexto.funcion = funcion.__name__
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _contexto.funcion = anterior
+    return envoltura
+
+class CursorMedido:
+    """
+    Cursor que mide cada consulta desde execute() hasta que se leen sus filas
+
+    La medición de una consulta se cierra al ejecutar la siguiente o al cerrar
+    el cursor (o la conexión).
+    """
+
+    def __init__(self, cursor, funcion):
+        self._cursor = cursor
+        self._funcion = funcion
+        self._query = None
+        self._num_parametros = 0
+        self._acumulado = 0.0
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _terminar(self):
+        if self._query is not None:
+            registrar_consulta(self._funcion, self._query, self._num_parametros, self._acumulado)
+            self._query = None
+
+    def _medir(self, metodo, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(*args)
+        finally:
+            self._acumulado += time.perf_counter() - inicio
+
+    def execute(self, query, parametros=()):
+        self._terminar()
+        self._query, self._num_parametros, self._acumulado = query, len(parametros or ()), 0.0
+        return self._medir(self._cursor.execute, query, parametros)
+
+    def executemany(self, query, filas):
+        self._terminar()
+        filas = list(filas)
+        self._query, self._acumulado = query, 0.0
+        self._num_parametros = sum(len(fila) for fila in filas)
+        return self._medir(self._cursor.executemany, query, filas)
+
+    def fetchone(self):
+        return self._medir(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._medir(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._medir(self._cursor.fetchall)
+
+    def close(self):
+        self._terminar()
+        return self._cursor.close()
+
+class ConexionMedida:
+    """Conexión cuyos cursores registran sus tiempos con la función que los usa"""
+
+    def __init__(self, conexion):
+        self._conexion = conexion
+        self._cursores = []
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def cursor(self, *args, **kwargs):
+        cursor = CursorMedido(self._conexion.cursor(*args, **kwargs), funcion_actual())
+        self._cursores.append(cursor)
+        return cursor
+
+    def close(self):
+        for cursor in self._cursores:
+            cursor._terminar()
+        self._cursores = []
+        return self._conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def conectar_medido(obtener_conexion):
+    """
+    Obtiene una conexión midiendo el tiempo de conexión (o de espera en el pool)
+
+    Args:
+        obtener_conexion: Función sin argumentos que devuelve la conexión
+
+    Returns:
+        ConexionMedida
+    """
+    inicio = time.perf_counter()
+    try:
+        conexion = obtener_conexion()
+    finally:
+        registrar_tiempo(funcion_actual(), 'conexion', time.perf_counter() - inicio)
+    return ConexionMedida(conexion)
+
+def obtener_metricas():
+    """
+    Devuelve los histogramas por función y las últimas consultas lentas
+
+    Returns:
+        dict: {'funciones': {funcion: {'conexion': {...}, 'consulta': {...}}},
+        'consultas_lentas': [...], 'umbral_lenta_ms': ...}
+    """
+    with _lock:
+        funciones = {}
+        for (funcion, fase), histograma in sorted(_histogramas.items()):
+            funciones.setdefault(funcion, {})[fase] = histograma.estadisticas()
+        lentas = list(_consultas_lentas)
+    return {
+        'funciones': funciones,
+        'consultas_lentas': lentas,
+        'umbral_lenta_ms': Config.CONSULTA_LENTA_MS,
+    }
+
+def reiniciar_metricas():
+    with _lock:
+        _histogramas.clear()
+        _consultas_lentas.clear()
@@ -0,0 +1,280 @@
+"""
+Registro de las plantillas de cartas, definidas como datos en plantillas_cartas/
+
+Cada archivo JSON del directorio (salvo comunes.json) es un tipo de carta con
+el nombre del archivo. Una plantilla declara los datos que usa y la lista de
+bloques de la carta:
+
+    {
+      "descripcion": "...",
+      "campos": {
+        "estudiante": {"requeridos": ["codigo", "nombres"], "opcionales": ["ciclo"]},
+        "empresa": {"requeridos": ["nombre"], "opcionales": ["gerente_general"]}
+      },
+      "estilos": {"nota": {"padre": "Normal", "fontSize": 10}},
+      "fragmentos": {"firma": [ ...bloques... ]},
+      "bloques": [
+        {"texto": "Lima, {fecha}"},
+        {"texto": "<b>{estudiante[nombres]}</b>", "estilo": "titulo"},
+        {"texto": "Atención: {empresa[gerente_general]}", "si": "empresa.gerente_general"},
+        {"espacio": 20},
+        {"fragmento": "firma"}
+      ]
+    }
+
+"texto" es un párrafo de ReportLab (admite <b>, <i>...) con los datos entre
+llaves; sin "estilo" usa "normal". "si" omite el párrafo cuando ese dato está
+vacío. comunes.json tiene los estilos y fragmentos que comparten todas las
+plantillas. Todo se valida al cargar (PlantillaInvalidaError), y los datos de
+cada carta antes de generarla (DatosCartaError). Agregar un tipo de carta es
+agregar un archivo: el motor (carta_generator.PlantillaCarta), la caché y el
+membrete son los mismos para todas.
+"""
+
+import json
+import os
+import string
+import threading
+
+from config import Config
+from services.cache_cartas import clave_contenido
+
+ARCHIVO_COMUNES = 'comunes.json'
+GRUPOS = ('estudiante', 'empresa')
+PROPIEDADES_ESTILO = ('padre', 'fontName', 'fontSize', 'leading', 'spaceBefore', 'spaceAfter',
+                      'alignment', 'textColor', 'leftIndent', 'firstLineIndent')
+
+class PlantillaInvalidaError(ValueError):
+    """Una plantilla de plantillas_cartas/ no tiene el formato esperado"""
+
+class DatosCartaError(ValueError):
+    """Faltan datos que la plantilla de la carta necesita"""
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            contenido = json.load(archivo)
+    except (OSError, ValueError) as e:
+        raise PlantillaInvalidaError(f"{ruta}: {e}")
+    if not isinstance(contenido, dict):
+        raise PlantillaInvalidaError(f"{ruta}: se esperaba un objeto JSON")
+    return contenido
+
+def campos_del_texto(texto):
+    """
+    Returns:
+        set: Datos que usa el texto, como 'fecha' o ('estudiante', 'nombres')
+
+    Raises:
+        PlantillaInvalidaError: Si usa algo distinto de {fecha}, {estudiante[x]} o {empresa[x]}
+    """
+    campos = set()
+    try:
+        partes = list(string.Formatter().parse(texto))
+    except ValueError as e:
+        raise PlantillaInvalidaError(f"Texto mal formado ({e}): {texto!r}")
+    for _, nombre, formato, conversion in partes:
+        if nombre is None:
+            continue
+        grupo, _, resto = nombre.partition('[')
+        if nombre == 'fecha' and not formato and not conversion:
+            campos.add('fecha')
+        elif grupo in GRUPOS and resto.endswith(']') and '[' not in resto and not formato and not conversion:
+            campos.add((grupo, resto[:-1]))
+        else:
+            raise PlantillaInvalidaError(f"Dato desconocido {{{nombre}}} en {texto!r}")
+    return campos
+
+def recorrer_bloques(bloques, fragmentos, pila=()):
+    """
+    Bloques de texto y espacio en el orden de la carta, con los fragmentos expandidos
+
+    Raises:
+        PlantillaInvalidaError: Si un fragmento no existe o se incluye a sí mismo
+    """
+    for bloque in bloques:
+        if 'fragmento' in bloque:
+            nombre = bloque['fragmento']
+            if nombre not in fragmentos:
+                raise PlantillaInvalidaError(f"Fragmento desconocido: {nombre}")
+            if nombre in pila:
+                raise PlantillaInvalidaError(f"El fragmento {nombre} se incluye a sí mismo")
+            yield from recorrer_bloques(fragmentos[nombre], fragmentos, pila + (nombre,))
+        else:
+            yield bloque
+
+def _validar_bloques(origen, bloques, estilos):
+    if not isinstance(bloques, list) or not bloques:
+        raise PlantillaInvalidaError(f"{origen}: se esperaba una lista de bloques")
+    for bloque in bloques:
+        tipos = [clave for clave in ('texto', 'espacio', 'fragmento') if isinstance(bloque, dict) and clave in bloque]
+        if len(tipos) != 1:
+            raise PlantillaInvalidaError(f"{origen}: cada bloque lleva uno de texto, espacio o fragmento: {bloque!r}")
+        sobrantes = set(bloque) - {tipos[0]} - ({'estilo', 'si'} if tipos[0] == 'texto' else set())
+        if sobrantes:
+            raise PlantillaInvalidaError(f"{origen}: claves no permitidas {sorted(sobrantes)} en {bloque!r}")
+        if tipos[0] == 'texto':
+            if not isinstance(bloque['texto'], str):
+                raise PlantillaInvalidaError(f"{origen}: el texto debe ser una cadena: {bloque!r}")
+            campos_del_texto(bloque['texto'])
+            if bloque.get('estilo', 'normal') not in estilos:
+                raise PlantillaInvalidaError(f"{origen}: estilo desconocido {bloque.get('estilo')!r}")
+            if 'si' not in bloque:
+                continue
+            grupo, _, campo = str(bloque['si']).partition('.')
+            if grupo not in GRUPOS or not campo:
+                raise PlantillaInvalidaError(f"{origen}: 'si' debe ser estudiante.<dato> o empresa.<dato>: {bloque!r}")
+        elif tipos[0] == 'espacio' and not isinstance(bloque['espacio'], (int, float)):
+            raise PlantillaInvalidaError(f"{origen}: el espacio debe ser un número: {bloque!r}")
+
+def _validar_estilos(origen, estilos):
+    if not isinstance(estilos, dict):
+        raise PlantillaInvalidaError(f"{origen}: 'estilos' debe ser un objeto")
+    for nombre, propiedades in estilos.items():
+        if not isinstance(propiedades, dict) or set(propiedades) - set(PROPIEDADES_ESTILO):
+            raise PlantillaInvalidaError(f"{origen}: estilo {nombre} con propiedades no permitidas "
+                                         f"(se admiten {', '.join(PROPIEDADES_ESTILO)})")
+
+def _declarados(definicion, tipo):
+    campos = definicion.get('campos')
+    if not isinstance(campos, dict) or set(campos) - set(GRUPOS):
+        raise PlantillaInvalidaError(f"{tipo}: 'campos' debe tener solo estudiante y empresa")
+    declarados = {}
+    for grupo in GRUPOS:
+        listas = campos.get(grupo, {})
+        if not isinstance(listas, dict):
+            raise PlantillaInvalidaError(f"{tipo}: campos.{grupo} debe tener 'requeridos' y/o 'opcionales'")
+        requeridos, opcionales = listas.get('requeridos', []), listas.get('opcionales', [])
+        if not all(isinstance(campo, str) for campo in requeridos + opcionales):
+            raise PlantillaInvalidaError(f"{tipo}: los campos de {grupo} deben ser cadenas")
+        declarados[grupo] = (tuple(requeridos), tuple(opcionales))
+    return declarados
+
+def cargar_registro(directorio):
+    """
+    Lee y valida todas las plantillas del directorio
+
+    Returns:
+        dict: 'estilos' y 'fragmentos' (comunes y de cada plantilla, en un solo
+        espacio de nombres) y 'plantillas': tipo -> definición, con 'campos'
+        como grupo -> (requeridos, opcionales) y 'huella' (sha256 de la definición)
+
+    Raises:
+        PlantillaInvalidaError
+    """
+    ruta_comunes = os.path.join(directorio, ARCHIVO_COMUNES)
+    comunes = _leer_json(ruta_comunes) if os.path.exists(ruta_comunes) else {}
+    estilos = dict(comunes.get('estilos', {}))
+    fragmentos = dict(comunes.get('fragmentos', {}))
+    _validar_estilos(ARCHIVO_COMUNES, estilos)
+
+    definiciones = {}
+    for archivo in sorted(os.listdir(directorio)):
+        if not archivo.endswith('.json') or archivo == ARCHIVO_COMUNES:
+            continue
+        tipo = archivo[:-len('.json')]
+        definicion = _leer_json(os.path.join(directorio, archivo))
+        propios = definicion.get('estilos', {})
+        _validar_estilos(archivo, propios)
+        for nombre in propios:
+            if nombre in estilos:
+                raise PlantillaInvalidaError(f"{archivo}: el estilo {nombre} ya está definido")
+        estilos.update(propios)
+        for nombre, bloques in definicion.get('fragmentos', {}).items():
+            if nombre in fragmentos:
+                raise PlantillaInvalidaError(f"{archivo}: el fragmento {nombre} ya está definido")
+            fragmentos[nombre] = bloques
+        definiciones[tipo] = definicion
+    if not definiciones:
+        raise PlantillaInvalidaError(f"{directorio}: no hay plantillas de cartas")
+
+    for nombre, bloques in fragmentos.items():
+        _validar_bloques(f"fragmento {nombre}", bloques, estilos)
+
+    plantillas = {}
+    for tipo, definicion in definiciones.items():
+        _validar_bloques(tipo, definicion.get('bloques'), estilos)
+        declarados = _declarados(definicion, tipo)
+        usados = set()
+        for bloque in recorrer_bloques(definicion['bloques'], fragmentos):
+            if 'texto' in bloque:
+                usados |= campos_del_texto(bloque['texto'])
+                if 'si' in bloque:
+                    usados.add(tuple(bloque['si'].split('.', 1)))
+        for grupo, campo in sorted(usado for usado in usados if usado != 'fecha'):
+            if campo not in declarados[grupo][0] + declarados[grupo][1]:
+                raise PlantillaInvalidaError(f"{tipo}: usa {grupo}.{campo} sin declararlo en 'campos'")
+        plantillas[tipo] = dict(
+            definicion,
+            tipo=tipo,
+            campos=declarados,
+            huella=clave_contenido({'plantilla': definicion, 'comunes': comunes}),
+        )
+    return {'estilos': estilos, 'fragmentos': fragmentos, 'plantillas': plantillas}
+
+_registro = None
+_registro_lock = threading.Lock()
+
+def obtener_registro():
+    """Registro de Config.CARTAS_PLANTILLAS, leído una vez por proceso"""
+    global _registro
+    if _registro is None:
+        with _registro_lock:
+            if _registro is None:
+                _registro = cargar_registro(Config.CARTAS_PLANTILLAS)
+    return _registro
+
+def tipos_carta():
+    return sorted(obtener_registro()['plantillas'])
+
+def obtener_definicion(tipo):
+    """
+    Raises:
+        ValueError: Si no hay una plantilla para `tipo`
+    """
+    plantillas = obtener_registro()['plantillas']
+    if tipo not in plantillas:
+        raise ValueError(f"Tipo de carta desconocido: {tipo} (hay: {', '.join(sorted(plantillas))})")
+    return plantillas[tipo]
+
+def campos_faltantes(definicion, estudiante_data, empresa_data):
+    """
+    Returns:
+        list: (grupo, campo) de los datos requeridos por la plantilla que faltan o están vacíos
+    """
+    datos = {'estudiante': estudiante_data or {}, 'empresa': empresa_data or {}}
+    faltantes = []
+    for grupo in GRUPOS:
+        for campo in definicion['campos'][grupo][0]:
+            valor = datos[grupo].get(campo)
+            if valor is None or not str(valor).strip():
+                faltantes.append((grupo, campo))
+    return faltantes
+
+def valores_carta(definicion, estudiante_data, empresa_data, fecha_actual):
+    """
+    Datos para rellenar los textos de la plantilla (los opcionales ausentes quedan en '')
+
+    Raises:
+        DatosCartaError: Si faltan datos requeridos por la plantilla
+    """
+    faltantes = campos_faltantes(definicion, estudiante_data, empresa_data)
+    if faltantes:
+        raise DatosCartaError(f"Faltan datos para la carta {definicion['tipo']}: "
+                              f"{', '.join(f'{grupo}.{campo}' for grupo, campo in faltantes)}")
+    valores = {'fecha': fecha_actual}
+    for grupo, datos in (('estudiante', estudiante_data), ('empresa', empresa_data)):
+        requeridos, opcionales = definicion['campos'][grupo]
+        valores[grupo] = {campo: '' if datos.get(campo) is None else datos[campo]
+                          for campo in requeridos + opcionales}
+    return valores
+
+def validar_datos_carta(tipo, estudiante_data, empresa_data):
+    """
+    Comprueba los datos antes de encolar o generar una carta
+
+    Raises:
+        DatosCartaError: Si faltan datos requeridos por la plantilla
+        ValueError: Si no hay una plantilla para `tipo`
+    """
+    valores_carta(obtener_definicion(tipo), estudiante_data, empresa_data, '')
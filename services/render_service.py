@@ -0,0 +1,326 @@
+"""
+Generación de cartas PDF en un pool de procesos, con cola acotada y estado por trabajo
+
+ReportLab ocupa la CPU (y el GIL) mientras maqueta una carta; aquí cada carta se
+genera en un proceso aparte para que los hilos del bot y de la API sigan
+atendiendo. Cada trabajo tiene un id para consultar su estado y, al terminar,
+se llama a la función `al_terminar` que se indicó al encolarlo (el bot la usa
+para enviar el PDF por Telegram).
+"""
+
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+from services.database_service import iniciar_carta, completar_carta, cancelar_carta
+from carta_generator import generar_carta, eliminar_carta, obtener_plantilla, asociar_carta
+from services.plantillas_cartas import validar_datos_carta
+
+ESTADOS_ACTIVOS = ('pendiente', 'en_proceso')
+
+class ColaLlenaError(Exception):
+    """Hay demasiados trabajos sin terminar; el cliente debe reintentar más tarde."""
+
+def _iniciar_proceso():
+    # Cada proceso prepara la plantilla compartida una vez, antes de su primera carta
+    obtener_plantilla()
+
+class Trabajo:
+    """
+    Carta encolada; `estado` es 'pendiente', 'en_proceso', 'lista' o 'error'
+
+    `pdf` tiene los bytes de la carta recién generada solo mientras se ejecuta
+    `al_terminar` (para enviarla sin volver a leerla); después se libera.
+    """
+
+    def __init__(self, clave=None, datos=None):
+        self.id = uuid.uuid4().hex
+        self.clave = clave
+        self.datos = datos or {}
+        self.estado = 'pendiente'
+        self.ruta_pdf = None
+        self.pdf = None
+        self.error = None
+        self.creado_en = time.time()
+        self.terminado_en = None
+        self.futuro = None
+        self.al_terminar = []
+
+    def a_dict(self):
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'ruta_pdf': self.ruta_pdf,
+            'error': self.error,
+            'creado_en': self.creado_en,
+            'terminado_en': self.terminado_en,
+        }
+
+class ServicioRender:
+    """
+    Args:
+        procesos: Procesos que generan cartas en paralelo
+        max_pendientes: Trabajos sin terminar admitidos antes de rechazar con ColaLlenaError
+        conservar_tras: Segundos que se conserva el estado de un trabajo terminado
+    """
+
+    def __init__(self, procesos=2, max_pendientes=50, conservar_tras=3600):
+        self.procesos = procesos
+        self.max_pendientes = max_pendientes
+        self.conservar_tras = conservar_tras
+        self._lock = threading.Lock()
+        self._trabajos = {}
+        self._por_clave = {}
+        self._ejecutor = None
+        # Los avisos (base de datos, Telegram) no deben bloquear el hilo que recoge resultados
+        self._avisos = ThreadPoolExecutor(max_workers=2, thread_name_prefix='render-aviso')
+        self._terminados = 0
+        self._errores = 0
+        self._rechazados = 0
+
+    def _obtener_ejecutor(self):
+        if self._ejecutor is None:
+            # 'spawn': el proceso del bot tiene hilos y conexiones abiertas que no deben copiarse
+            self._ejecutor = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_iniciar_proceso
+            )
+        return self._ejecutor
+
+    def _purgar(self):
+        limite = time.time() - self.conservar_tras
+        for trabajo_id in [t.id for t in self._trabajos.values()
+                           if t.terminado_en is not None and t.terminado_en < limite]:
+            del self._trabajos[trabajo_id]
+
+    def _activos(self):
+        return sum(1 for t in self._trabajos.values() if t.estado in ESTADOS_ACTIVOS)
+
+    def _verificar_capacidad(self):
+        if self._activos() >= self.max_pendientes:
+            self._rechazados += 1
+            raise ColaLlenaError(f"Hay {self.max_pendientes} cartas en cola; intenta más tarde")
+
+    def verificar_capacidad(self):
+        """Lanza ColaLlenaError si un trabajo nuevo sería rechazado"""
+        with self._lock:
+            self._purgar()
+            self._verificar_capacidad()
+
+    def encolar(self, tipo, estudiante_data, empresa_data, fecha_actual=None,
+                clave=None, datos=None, al_terminar=None):
+        """
+        Encola la generación de una carta
+
+        Args:
+            tipo: Nombre de una plantilla de plantillas_cartas/ ('presentacion', 'estudiante'...)
+            estudiante_data: Diccionario con datos del estudiante
+            empresa_data: Diccionario con datos de la empresa
+            fecha_actual: Fecha escrita en la carta (opcional)
+            clave: Si ya hay un trabajo sin terminar con esta clave se devuelve ese mismo
+                (y `al_terminar` se agrega a las funciones que se llaman al terminarlo)
+            datos: Información adicional que acompaña al trabajo (p. ej. solicitud_id)
+            al_terminar: Función que recibe el Trabajo cuando queda 'lista' o 'error'; si hay
+                varias (claves repetidas) se llaman en el orden en que se encolaron
+
+        Returns:
+            Trabajo
+
+        Raises:
+            ColaLlenaError: Si ya hay max_pendientes trabajos sin terminar
+            DatosCartaError: Si faltan datos que la plantilla necesita
+        """
+        # Los datos se validan aquí y no en el proceso del pool, así el error llega a quien pidió la carta
+        validar_datos_carta(tipo, estudiante_data, empresa_data)
+        with self._lock:
+            if clave is not None and clave in self._por_clave:
+                trabajo = self._trabajos[self._por_clave[clave]]
+                if al_terminar is not None:
+                    trabajo.al_terminar.append(al_terminar)
+                return trabajo
+            self._purgar()
+            self._verificar_capacidad()
+            trabajo = Trabajo(clave, datos)
+            if al_terminar is not None:
+                trabajo.al_terminar.append(al_terminar)
+            argumentos = (generar_carta, tipo, estudiante_data, empresa_data, fecha_actual)
+            try:
+                trabajo.futuro = self._obtener_ejecutor().submit(*argumentos)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. sin memoria) y el pool ya no acepta trabajos: se crea otro
+                self._ejecutor = None
+                trabajo.futuro = self._obtener_ejecutor().submit(*argumentos)
+            self._trabajos[trabajo.id] = trabajo
+            if clave is not None:
+                self._por_clave[clave] = trabajo.id
+        trabajo.futuro.add_done_callback(lambda futuro: self._avisos.submit(self._terminar, trabajo))
+        return trabajo
+
+    def unirse(self, clave, al_terminar=None):
+        """
+        Devuelve el trabajo sin terminar con esta clave, agregando `al_terminar` a sus avisos
+
+        Returns:
+            Trabajo o None si en este proceso no hay ninguno con esa clave
+        """
+        with self._lock:
+            if clave not in self._por_clave:
+                return None
+            trabajo = self._trabajos[self._por_clave[clave]]
+            if al_terminar is not None:
+                trabajo.al_terminar.append(al_terminar)
+            return trabajo
+
+    def _terminar(self, trabajo):
+        try:
+            trabajo.ruta_pdf, trabajo.pdf = trabajo.futuro.result()
+            trabajo.estado = 'lista'
+        except Exception as e:
+            print(f"Error al generar carta (trabajo {trabajo.id}): {e}")
+            trabajo.error = str(e) or e.__class__.__name__
+            trabajo.estado = 'error'
+        with self._lock:
+            # Desde aquí una clave repetida crea otro trabajo: la lista de avisos ya no cambia
+            if trabajo.clave is not None:
+                self._por_clave.pop(trabajo.clave, None)
+            avisos = list(trabajo.al_terminar)
+        for al_terminar in avisos:
+            try:
+                al_terminar(trabajo)
+            except Exception as e:
+                print(f"Error al avisar del trabajo {trabajo.id}: {e}")
+                if trabajo.estado == 'lista':
+                    trabajo.error = str(e)
+                    trabajo.estado = 'error'
+        trabajo.pdf = None
+        with self._lock:
+            trabajo.terminado_en = time.time()
+            if trabajo.estado == 'lista':
+                self._terminados += 1
+            else:
+                self._errores += 1
+
+    def consultar(self, trabajo_id):
+        """
+        Returns:
+            dict: Estado del trabajo, o None si no existe (o ya se descartó)
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None:
+                return None
+            if trabajo.estado == 'pendiente' and trabajo.futuro.running():
+                trabajo.estado = 'en_proceso'
+            return trabajo.a_dict()
+
+    def estadisticas(self):
+        with self._lock:
+            estados = {}
+            for trabajo in self._trabajos.values():
+                estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+            return {
+                'procesos': self.procesos,
+                'max_pendientes': self.max_pendientes,
+                'sin_terminar': self._activos(),
+                'estados': estados,
+                'terminados': self._terminados,
+                'errores': self._errores,
+                'rechazados': self._rechazados,
+            }
+
+    def cerrar(self, esperar=True):
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown(wait=esperar)
+        self._avisos.shutdown(wait=esperar)
+
+_servicio = None
+_servicio_lock = threading.Lock()
+
+def obtener_servicio_render():
+    """Servicio compartido del proceso; el pool de procesos se crea con la primera carta"""
+    global _servicio
+    if _servicio is None:
+        with _servicio_lock:
+            if _servicio is None:
+                _servicio = ServicioRender(
+                    procesos=Config.RENDER_PROCESOS,
+                    max_pendientes=Config.RENDER_MAX_PENDIENTES,
+                    conservar_tras=Config.RENDER_CONSERVAR_TRABAJOS
+                )
+    return _servicio
+
+def solicitar_carta(estudiante_id, empresa_id, fecha_solicitud, estudiante_data, empresa_data, al_terminar=None,
+                    tipo='presentacion'):
+    """
+    Registra la solicitud y encola su PDF; al terminar guarda la ruta en la
+    solicitud (o la borra si falló) y después llama a `al_terminar(trabajo)`
+
+    Si la misma carta ya se está generando en este proceso se devuelve ese
+    trabajo; si la genera otro proceso el estado es 'en_curso'.
+
+    Returns:
+        dict: 'estado' ('encolada', 'duplicada', 'en_curso' o 'error'), 'solicitud_id',
+        'ruta_pdf' (solo con 'duplicada') y 'trabajo' (solo con 'encolada')
+
+    Raises:
+        ColaLlenaError: Si la cola está llena (la solicitud no queda registrada)
+        DatosCartaError: Si faltan datos que la plantilla necesita (tampoco se registra)
+    """
+    servicio = obtener_servicio_render()
+    # Se comprueba antes de registrar para no dejar solicitudes pendientes sin trabajo
+    servicio.verificar_capacidad()
+    validar_datos_carta(tipo, estudiante_data, empresa_data)
+
+    inicio = iniciar_carta(estudiante_id, empresa_id, fecha_solicitud)
+    if inicio['estado'] == 'en_curso':
+        # Quien la reclamó completa la solicitud; aquí solo se espera el mismo trabajo
+        trabajo = servicio.unirse(('solicitud', inicio['solicitud_id']), al_terminar)
+        if trabajo is not None:
+            return {'estado': 'encolada', 'solicitud_id': inicio['solicitud_id'], 'ruta_pdf': None,
+                    'trabajo': trabajo}
+    if inicio['estado'] != 'nueva':
+        return {'estado': inicio['estado'], 'solicitud_id': inicio['solicitud_id'],
+                'ruta_pdf': inicio['ruta_pdf'], 'trabajo': None}
+    solicitud_id = inicio['solicitud_id']
+
+    def cancelar():
+        cancelar_carta(solicitud_id, inicio['iniciada_en'], inicio['estado_anterior'])
+
+    def registrar_resultado(trabajo):
+        if trabajo.estado == 'lista' and not completar_carta(solicitud_id, trabajo.ruta_pdf):
+            # La fila no guardó la ruta: el PDF quedaría huérfano
+            cancelar()
+            eliminar_carta(trabajo.ruta_pdf)
+            raise RuntimeError("No se pudo guardar la ruta del PDF")
+        if trabajo.estado == 'lista':
+            asociar_carta(solicitud_id, trabajo.ruta_pdf)
+        if trabajo.estado == 'error':
+            cancelar()
+        if al_terminar is not None:
+            al_terminar(trabajo)
+
+    try:
+        trabajo = servicio.encolar(
+            tipo, estudiante_data, empresa_data,
+            clave=('solicitud', solicitud_id), datos={'solicitud_id': solicitud_id},
+            al_terminar=registrar_resultado
+        )
+    except ColaLlenaError:
+        cancelar()
+        raise
+    except Exception as e:
+        print(f"Error al encolar carta: {e}")
+        cancelar()
+        return {'estado': 'error', 'solicitud_id': None, 'ruta_pdf': None, 'trabajo': None}
+    return {'estado': 'encolada', 'solicitud_id': solicitud_id, 'ruta_pdf': None, 'trabajo': trabajo}
+
+def consultar_trabajo(trabajo_id):
+    return obtener_servicio_render().consultar(trabajo_id)
+
+def obtener_estadisticas_render():
+    return obtener_servicio_render().estadisticas()
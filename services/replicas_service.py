@@ -0,0 +1,216 @@
+"""
+Enrutamiento de lecturas a réplicas de la base de datos
+
+Las funciones de database_service marcadas con @solo_lectura toman la conexión
+de la réplica menos cargada cuyo retraso de replicación esté dentro del límite;
+las marcadas con @escritura van siempre al primario. Después de una escritura,
+las lecturas de la misma conversación (por ejemplo, el mismo chat de Telegram)
+siguen yendo al primario durante Config.REPLICA_PRIMARIO_TRAS_ESCRITURA segundos,
+para que el usuario vea lo que acaba de guardar.
+"""
+
+import threading
+import time
+from functools import wraps
+
+from config import Config
+from services.cache_service import CacheTTL
+from services.connection_pool import PoolAgotadoError
+
+_contexto = threading.local()
+
+# Conversaciones que escribieron hace poco (su TTL es el tiempo que se quedan en el primario)
+_escrituras_recientes = CacheTTL(ttl_defecto=Config.REPLICA_PRIMARIO_TRAS_ESCRITURA, max_entradas=100000)
+
+def establecer_conversacion(clave):
+    """Asocia las consultas siguientes de este hilo a una conversación (None para ninguna)"""
+    _contexto.conversacion = clave
+
+def conversacion_actual():
+    return getattr(_contexto, 'conversacion', None)
+
+def en_lectura():
+    """Indica si el hilo está dentro de una función @solo_lectura (y no de una @escritura)"""
+    return getattr(_contexto, 'lectura', False)
+
+def debe_usar_primario():
+    """Indica si la conversación actual escribió hace poco"""
+    conversacion = conversacion_actual()
+    if conversacion is None:
+        return False
+    encontrado, _ = _escrituras_recientes.obtener(conversacion)
+    return encontrado
+
+def _con_modo(funcion, lectura):
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        anterior = getattr(_contexto, 'lectura', False)
+        _contexto.lectura = lectura
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _contexto.lectura = anterior
+    return envoltura
+
+def solo_lectura(funcion):
+    """Decorador: las consultas de la función pueden ir a una réplica"""
+    return _con_modo(funcion, True)
+
+def escritura(funcion):
+    """Decorador: la función usa el primario y deja la conversación en el primario un tiempo"""
+    envoltura_modo = _con_modo(funcion, False)
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        conversacion = conversacion_actual()
+        if conversacion is not None:
+            _escrituras_recientes.guardar(conversacion, True)
+        return envoltura_modo(*args, **kwargs)
+    return envoltura
+
+def medir_retraso_mysql(conexion):
+    """
+    Segundos de retraso de la réplica; 0 si el servidor no es réplica y None si
+    la replicación está detenida
+    """
+    cursor = conexion.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Exception:
+            # Servidores anteriores a MySQL 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+        estado = cursor.fetchone()
+    finally:
+        cursor.close()
+    if not estado:
+        return 0
+    if 'Seconds_Behind_Source' in estado:
+        return estado['Seconds_Behind_Source']
+    return estado.get('Seconds_Behind_Master')
+
+class Replica:
+    """Pool de una réplica junto con su último retraso medido y su disponibilidad"""
+
+    def __init__(self, nombre, pool):
+        self.nombre = nombre
+        self.pool = pool
+        self.retraso = None
+        self.retraso_medido_en = None
+        self.fuera_de_servicio_hasta = 0.0
+        self.lecturas = 0
+        self.errores = 0
+        self.llenas = 0
+        self.revision_lock = threading.Lock()
+
+class EnrutadorReplicas:
+    """
+    Elige la réplica para cada lectura
+
+    Args:
+        replicas: Lista de (nombre, PoolConexiones) de las réplicas
+        max_retraso: Segundos de retraso a partir de los cuales una réplica no recibe lecturas
+        intervalo_revision: Cada cuántos segundos se mide el retraso de una réplica
+            (también es el tiempo que queda fuera de servicio tras un error de conexión)
+        medir_retraso: Función que recibe una conexión y devuelve el retraso en segundos
+        espera_conexion: Segundos que se espera una conexión de una réplica con el pool
+            agotado antes de pasar a la siguiente (o al primario); 0 para no esperar
+    """
+
+    def __init__(self, replicas, max_retraso=5, intervalo_revision=10, medir_retraso=medir_retraso_mysql,
+                 espera_conexion=0):
+        self.replicas = [Replica(nombre, pool) for nombre, pool in replicas]
+        self.max_retraso = max_retraso
+        self.intervalo_revision = intervalo_revision
+        self.espera_conexion = espera_conexion
+        self._medir_retraso = medir_retraso
+        self._lock = threading.Lock()
+        self._lecturas_primario = 0
+
+    def _marcar_error(self, replica):
+        with self._lock:
+            replica.errores += 1
+            replica.fuera_de_servicio_hasta = time.monotonic() + self.intervalo_revision
+
+    def _revisar_retraso(self, replica):
+        """Mide el retraso si toca; si otro hilo ya lo está midiendo se usa el último valor"""
+        ahora = time.monotonic()
+        if replica.retraso_medido_en is not None and ahora - replica.retraso_medido_en < self.intervalo_revision:
+            return
+        if not replica.revision_lock.acquire(blocking=False):
+            return
+        medido_en = None
+        try:
+            conexion = replica.pool.obtener(tiempo_espera=self.espera_conexion)
+            try:
+                replica.retraso = self._medir_retraso(conexion)
+            finally:
+                conexion.close()
+            medido_en = time.monotonic()
+        except PoolAgotadoError:
+            # Ocupada no es caída: se mantiene el último retraso y se mide en el próximo préstamo
+            medido_en = replica.retraso_medido_en
+        except Exception as e:
+            print(f"Error al medir el retraso de la réplica {replica.nombre}: {e}")
+            replica.retraso = None
+            self._marcar_error(replica)
+            medido_en = time.monotonic()
+        finally:
+            replica.retraso_medido_en = medido_en
+            replica.revision_lock.release()
+
+    def _al_dia(self, replica):
+        return replica.retraso is not None and replica.retraso <= self.max_retraso
+
+    def obtener(self):
+        """
+        Presta una conexión de la réplica disponible menos cargada
+
+        Returns:
+            Conexión del pool de la réplica, o None si ninguna sirve (se usa el primario)
+        """
+        ahora = time.monotonic()
+        candidatas = [r for r in self.replicas if r.fuera_de_servicio_hasta <= ahora]
+        candidatas.sort(key=lambda replica: replica.pool.carga())
+        for replica in candidatas:
+            self._revisar_retraso(replica)
+            if not self._al_dia(replica):
+                continue
+            try:
+                # Sin esperar por una réplica saturada: se prueba la siguiente o el primario
+                conexion = replica.pool.obtener(tiempo_espera=self.espera_conexion)
+            except PoolAgotadoError:
+                with self._lock:
+                    replica.llenas += 1
+                continue
+            except Exception as e:
+                print(f"Error al conectar a la réplica {replica.nombre}: {e}")
+                self._marcar_error(replica)
+                continue
+            with self._lock:
+                replica.lecturas += 1
+            return conexion
+        with self._lock:
+            self._lecturas_primario += 1
+        return None
+
+    def estadisticas(self):
+        """
+        Returns:
+            dict: Estado de cada réplica y lecturas que tuvieron que ir al primario
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            return {
+                'lecturas_primario': self._lecturas_primario,
+                'max_retraso': self.max_retraso,
+                'replicas': [{
+                    'nombre': replica.nombre,
+                    'retraso': replica.retraso,
+                    'disponible': replica.fuera_de_servicio_hasta <= ahora and self._al_dia(replica),
+                    'carga': round(replica.pool.carga(), 3),
+                    'lecturas': replica.lecturas,
+                    'errores': replica.errores,
+                    'llenas': replica.llenas,
+                } for replica in self.replicas],
+            }
@@ -1,6 +1,27 @@
+import threading
+
 import boto3
 from config import Config
 
+# Las rutas de las cartas guardadas en S3 tienen la forma s3://bucket/clave
+PREFIJO_S3 = "s3://"
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+def _obtener_cliente():
+    # Los clientes de boto3 se pueden compartir entre hilos; crear uno por llamada es lento
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = boto3.client(
+                    's3',
+                    aws_access_key_id=Config.AWS_ACCESS_KEY,
+                    aws_secret_access_key=Config.AWS_SECRET_KEY
+                )
+    return _cliente
+
 def subir_archivo_s3(archivo):
     s3 = boto3.client(
         's3',
@@ -10,3 +31,42 @@ def subir_archivo_s3(archivo):
     
     s3.upload_file(archivo, Config.AWS_S3_BUCKET, archivo)
     return f"Archivo {archivo} subido correctamente a S3."
+
+def es_ruta_s3(ruta):
+    return bool(ruta) and ruta.startswith(PREFIJO_S3)
+
+def _separar_ruta(ruta):
+    bucket, _, clave = ruta[len(PREFIJO_S3):].partition('/')
+    return bucket, clave
+
+def ruta_s3(clave):
+    """Returns: str: Ruta s3://bucket/clave de `clave` en Config.AWS_S3_BUCKET"""
+    return f"{PREFIJO_S3}{Config.AWS_S3_BUCKET}/{clave}"
+
+def subir_bytes_s3(datos, clave, tipo_contenido='application/pdf'):
+    """
+    Sube el contenido directamente desde memoria, sin archivo temporal
+
+    Returns:
+        str: Ruta s3://bucket/clave del objeto
+    """
+    _obtener_cliente().put_object(
+        Bucket=Config.AWS_S3_BUCKET, Key=clave, Body=datos, ContentType=tipo_contenido
+    )
+    return ruta_s3(clave)
+
+def existe_s3(ruta):
+    bucket, clave = _separar_ruta(ruta)
+    try:
+        _obtener_cliente().head_object(Bucket=bucket, Key=clave)
+        return True
+    except Exception:
+        return False
+
+def descargar_bytes_s3(ruta):
+    bucket, clave = _separar_ruta(ruta)
+    return _obtener_cliente().get_object(Bucket=bucket, Key=clave)['Body'].read()
+
+def eliminar_s3(ruta):
+    bucket, clave = _separar_ruta(ruta)
+    _obtener_cliente().delete_object(Bucket=bucket, Key=clave)
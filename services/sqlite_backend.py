@@ -0,0 +1,268 @@
+"""
+Backend SQLite embebido para database_service
+
+Permite ejecutar el bot en una sola máquina sin servidor MySQL. Las conexiones
+se comportan como las de mysql.connector para las funciones de database_service:
+aceptan los mismos marcadores %s, las mismas consultas SQL y las mismas
+llamadas a cursor(), commit(), rollback() y close().
+"""
+
+import re
+import sqlite3
+import threading
+from decimal import Decimal
+from functools import lru_cache
+
+# Mismo esquema que usan las consultas de database_service, con los índices,
+# la clave única de solicitudes_carta y los totales de horas de las migraciones
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS estudiantes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    codigo TEXT NOT NULL UNIQUE,
+    dni TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    correo TEXT,
+    direccion TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS empresas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    ruc TEXT,
+    direccion TEXT,
+    contacto_email TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_empresas_nombre ON empresas (nombre);
+
+CREATE TABLE IF NOT EXISTS estudiantes_empresas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    estudiante_id INTEGER NOT NULL REFERENCES estudiantes (id),
+    empresa_id INTEGER NOT NULL REFERENCES empresas (id)
+);
+CREATE INDEX IF NOT EXISTS idx_estudiantes_empresas_estudiante ON estudiantes_empresas (estudiante_id);
+CREATE INDEX IF NOT EXISTS idx_estudiantes_empresas_empresa ON estudiantes_empresas (empresa_id);
+
+CREATE TABLE IF NOT EXISTS practicas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    estudiante_empresa_id INTEGER NOT NULL REFERENCES estudiantes_empresas (id),
+    horas DECIMAL(12, 2) NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_practicas_estudiante_empresa ON practicas (estudiante_empresa_id);
+
+CREATE TABLE IF NOT EXISTS solicitudes_carta (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    estudiante_id INTEGER NOT NULL REFERENCES estudiantes (id),
+    empresa_id INTEGER NOT NULL REFERENCES empresas (id),
+    fecha_solicitud DATE NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    ruta_pdf TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (estudiante_id, empresa_id)
+);
+CREATE INDEX IF NOT EXISTS idx_solicitudes_fecha ON solicitudes_carta (fecha_solicitud);
+
+CREATE TABLE IF NOT EXISTS fechas_criticas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    descripcion TEXT NOT NULL,
+    fecha DATE NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_fechas_criticas_estado ON fechas_criticas (estado);
+
+CREATE TABLE IF NOT EXISTS oportunidades_practicas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    empresa_id INTEGER NOT NULL REFERENCES empresas (id),
+    descripcion TEXT NOT NULL,
+    fecha_inicio DATE NOT NULL,
+    fecha_fin DATE NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'activo',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_oportunidades_estado ON oportunidades_practicas (estado);
+
+CREATE TABLE IF NOT EXISTS horas_estudiante (
+    estudiante_id INTEGER PRIMARY KEY,
+    total_horas DECIMAL(12, 2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS horas_estudiante_empresa (
+    estudiante_id INTEGER NOT NULL,
+    empresa_id INTEGER NOT NULL,
+    horas DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (estudiante_id, empresa_id)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_practicas_horas_insert AFTER INSERT ON practicas
+BEGIN
+    INSERT INTO horas_estudiante_empresa (estudiante_id, empresa_id, horas)
+    SELECT estudiante_id, empresa_id, NEW.horas FROM estudiantes_empresas WHERE id = NEW.estudiante_empresa_id
+    ON CONFLICT (estudiante_id, empresa_id) DO UPDATE SET horas = horas + excluded.horas;
+    INSERT INTO horas_estudiante (estudiante_id, total_horas)
+    SELECT estudiante_id, NEW.horas FROM estudiantes_empresas WHERE id = NEW.estudiante_empresa_id
+    ON CONFLICT (estudiante_id) DO UPDATE SET total_horas = total_horas + excluded.total_horas;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_practicas_horas_delete AFTER DELETE ON practicas
+BEGIN
+    UPDATE horas_estudiante_empresa SET horas = horas - OLD.horas
+    WHERE (estudiante_id, empresa_id) = (
+        SELECT estudiante_id, empresa_id FROM estudiantes_empresas WHERE id = OLD.estudiante_empresa_id
+    );
+    UPDATE horas_estudiante SET total_horas = total_horas - OLD.horas
+    WHERE estudiante_id = (SELECT estudiante_id FROM estudiantes_empresas WHERE id = OLD.estudiante_empresa_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_practicas_horas_update AFTER UPDATE OF horas, estudiante_empresa_id ON practicas
+BEGIN
+    UPDATE horas_estudiante_empresa SET horas = horas - OLD.horas
+    WHERE (estudiante_id, empresa_id) = (
+        SELECT estudiante_id, empresa_id FROM estudiantes_empresas WHERE id = OLD.estudiante_empresa_id
+    );
+    UPDATE horas_estudiante SET total_horas = total_horas - OLD.horas
+    WHERE estudiante_id = (SELECT estudiante_id FROM estudiantes_empresas WHERE id = OLD.estudiante_empresa_id);
+    INSERT INTO horas_estudiante_empresa (estudiante_id, empresa_id, horas)
+    SELECT estudiante_id, empresa_id, NEW.horas FROM estudiantes_empresas WHERE id = NEW.estudiante_empresa_id
+    ON CONFLICT (estudiante_id, empresa_id) DO UPDATE SET horas = horas + excluded.horas;
+    INSERT INTO horas_estudiante (estudiante_id, total_horas)
+    SELECT estudiante_id, NEW.horas FROM estudiantes_empresas WHERE id = NEW.estudiante_empresa_id
+    ON CONFLICT (estudiante_id) DO UPDATE SET total_horas = total_horas + excluded.total_horas;
+END;
+"""
+
+# Ajustes para un solo servidor con varios hilos leyendo y pocos escribiendo
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+]
+
+# Las columnas DECIMAL y DATE se devuelven como Decimal y date, igual que con MySQL
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DECIMAL', lambda valor: Decimal(valor.decode()).quantize(Decimal('0.01')))
+
+# Número de sentencias preparadas que sqlite3 conserva por conexión
+SENTENCIAS_EN_CACHE = 256
+
+_esquemas_creados = set()
+_esquemas_lock = threading.Lock()
+
+@lru_cache(maxsize=SENTENCIAS_EN_CACHE)
+def traducir_sql(query):
+    """Convierte una consulta escrita para MySQL a SQLite (marcadores y bloqueos de fila)"""
+    query = re.sub(r'\s+FOR\s+UPDATE\b', '', query, flags=re.IGNORECASE)
+    return query.replace('%s', '?')
+
+class _CursorSQLite:
+    """Cursor que acepta las consultas con marcadores %s de database_service"""
+
+    def __init__(self, cursor, como_diccionario=False):
+        self._cursor = cursor
+        self._como_diccionario = como_diccionario
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def execute(self, query, parametros=()):
+        self._cursor.execute(traducir_sql(query), tuple(parametros or ()))
+        return self
+
+    def executemany(self, query, filas):
+        self._cursor.executemany(traducir_sql(query), filas)
+        return self
+
+    def _convertir(self, fila):
+        if fila is None or not self._como_diccionario:
+            return fila
+        return {columna[0]: valor for columna, valor in zip(self._cursor.description, fila)}
+
+    def fetchone(self):
+        return self._convertir(self._cursor.fetchone())
+
+    def fetchmany(self, cantidad=None):
+        filas = self._cursor.fetchmany(cantidad) if cantidad else self._cursor.fetchmany()
+        return [self._convertir(fila) for fila in filas]
+
+    def fetchall(self):
+        return [self._convertir(fila) for fila in self._cursor.fetchall()]
+
+    @property
+    def column_names(self):
+        return tuple(columna[0] for columna in self._cursor.description or ())
+
+class ConexionSQLite:
+    """Conexión SQLite con la interfaz de mysql.connector que usa database_service"""
+
+    def __init__(self, conexion):
+        self._conexion = conexion
+
+    def cursor(self, dictionary=False, **_opciones):
+        return _CursorSQLite(self._conexion.cursor(), como_diccionario=dictionary)
+
+    def commit(self):
+        self._conexion.commit()
+
+    def rollback(self):
+        self._conexion.rollback()
+
+    def close(self):
+        self._conexion.close()
+
+    def ping(self):
+        self._conexion.execute("SELECT 1")
+
+    def is_connected(self):
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+# Columnas agregadas después de crear el esquema: (tabla, columna, definición)
+COLUMNAS_AGREGADAS = [
+    ('empresas', 'ruc', 'TEXT'),
+    ('solicitudes_carta', 'iniciada_en', 'TEXT'),
+]
+
+INDICES_POSTERIORES = """
+CREATE INDEX IF NOT EXISTS idx_empresas_ruc ON empresas (ruc);
+"""
+
+def crear_esquema(conexion):
+    """Crea las tablas, índices y triggers si no existen y agrega las columnas nuevas"""
+    conexion.executescript(ESQUEMA)
+    for tabla, columna, definicion in COLUMNAS_AGREGADAS:
+        columnas = {fila[1] for fila in conexion.execute(f"PRAGMA table_info({tabla})")}
+        if columna not in columnas:
+            conexion.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+    conexion.executescript(INDICES_POSTERIORES)
+
+def crear_conexion(ruta):
+    """
+    Abre una conexión a la base SQLite, con los pragmas aplicados y el esquema creado
+
+    Args:
+        ruta: Archivo de la base de datos (':memory:' para una base temporal)
+
+    Returns:
+        ConexionSQLite
+    """
+    conexion = sqlite3.connect(
+        ruta,
+        check_same_thread=False,
+        cached_statements=SENTENCIAS_EN_CACHE,
+        detect_types=sqlite3.PARSE_DECLTYPES
+    )
+    for pragma in PRAGMAS:
+        conexion.execute(pragma)
+    with _esquemas_lock:
+        if ruta == ':memory:' or ruta not in _esquemas_creados:
+            crear_esquema(conexion)
+            _esquemas_creados.add(ruta)
+    return ConexionSQLite(conexion)
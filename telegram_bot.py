@@ -1,10 +1,16 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, MessageHandler, CallbackContext, Filters, ConversationHandler, CallbackQueryHandler
-from services.database_service import registrar_solicitud_carta, consultar_horas, consultar_empresas, consultar_fechas_criticas, consultar_oportunidades_practicas, obtener_estudiante_id, obtener_empresa_id, existe_carta_para_estudiante_y_empresa, consultar_cartas_generadas
+from telegram.ext import Updater, CommandHandler, MessageHandler, CallbackContext, Filters, ConversationHandler, CallbackQueryHandler, TypeHandler
+from services.database_service import consultar_horas, consultar_empresas, consultar_fechas_criticas, obtener_estudiante_id, obtener_empresa_id, consultar_resumen_estudiante, consultar_oportunidades_pagina, consultar_cartas_pagina, obtener_ruta_carta, buscar_empresas, precargar_indice_empresas
 from type_helpers import format_fecha_critica, format_oportunidad
+import asyncio
 import os
 from datetime import datetime
-from carta_generator import generar_carta_presentacion
+from services.render_service import solicitar_carta, ColaLlenaError
+from carta_generator import leer_carta
+from config import Config
+from services.replicas_service import establecer_conversacion
+from services import database_async
+from services.database_async import ejecutar_en_segundo_plano
 
 # Estados de la conversación
 MENU, NOMBRE, CODIGO, DNI, EMPRESA, RUC_EMPRESA, DIRECCION = range(7)
@@ -85,13 +91,13 @@ def menu_handler(update: Update, context: CallbackContext):
     
     elif "📄 Descargar carta" in text:
         ruta_pdf = context.user_data.get('ruta_pdf')
-        if ruta_pdf and os.path.exists(ruta_pdf):
-            with open(ruta_pdf, 'rb') as pdf_file:
-                update.message.reply_document(
-                    document=pdf_file,
-                    filename=os.path.basename(ruta_pdf),
-                    caption="📄 Aquí tienes tu carta de presentación."
-                )
+        pdf = leer_carta(ruta_pdf)
+        if pdf:
+            update.message.reply_document(
+                document=pdf,
+                filename=os.path.basename(ruta_pdf),
+                caption="📄 Aquí tienes tu carta de presentación."
+            )
         else:
             update.message.reply_text("❌ No se encontró la carta para descargar. Por favor, genera una nueva.")
         return mostrar_menu_final(update, context)
@@ -135,35 +141,29 @@ def recibir_codigo_estudiante(update: Update, context: CallbackContext):
     print(f"Recibido código de estudiante: {codigo_estudiante}")  # Debug
     
     try:
-        estudiante_id = obtener_estudiante_id(codigo_estudiante)
+        if context.user_data is None:
+            context.user_data = {}
+
+        # Las consultas de horas y empresas traen todo el resumen en una sola consulta;
+        # las cartas se piden por páginas
+        resumen = None
+        ultima_opcion = context.user_data.get('ultima_opcion')
+        if ultima_opcion and ultima_opcion != "6. Ver mis cartas generadas":
+            resumen = consultar_resumen_estudiante(codigo_estudiante)
+            estudiante_id = resumen['estudiante_id'] if resumen else None
+        else:
+            estudiante_id = obtener_estudiante_id(codigo_estudiante)
         print(f"Estudiante ID obtenido: {estudiante_id}")  # Debug
         
         if estudiante_id:
-            if context.user_data is None:
-                context.user_data = {}
             context.user_data['codigo'] = codigo_estudiante
             context.user_data['estudiante_id'] = estudiante_id
+            if resumen:
+                context.user_data['resumen'] = resumen
 
             # Si la última opción fue ver cartas generadas, mostrar cartas
             if context.user_data.get('ultima_opcion') == "6. Ver mis cartas generadas":
-                cartas = consultar_cartas_generadas(estudiante_id)
-                if cartas:
-                    mensaje = "Tus cartas generadas:\n"
-                    keyboard = []
-                    for nombre_empresa, ruta_pdf in cartas:
-                        if ruta_pdf:
-                            keyboard.append([InlineKeyboardButton(
-                                f"{nombre_empresa}", callback_data=f"descargar_carta|{ruta_pdf}"
-                            )])
-                        else:
-                            mensaje += f"• {nombre_empresa}: Sin PDF\n"
-                    if keyboard:
-                        reply_markup = InlineKeyboardMarkup(keyboard)
-                        update.message.reply_text(mensaje + "Selecciona una empresa para descargar la carta:", reply_markup=reply_markup)
-                    else:
-                        update.message.reply_text(mensaje)
-                else:
-                    update.message.reply_text("No tienes cartas generadas.")
+                enviar_pagina_cartas(update.message, estudiante_id)
                 return mostrar_menu_final(update, context)
 
             # Verificar si estamos en el flujo de carta o consulta
@@ -207,7 +207,8 @@ def procesar_consulta(update: Update, context: CallbackContext, codigo_estudiant
 def consultar_horas_estudiante(update: Update, context: CallbackContext, codigo_estudiante):
     """Consulta las horas del estudiante."""
     try:
-        horas = consultar_horas(codigo_estudiante)
+        resumen = context.user_data.get('resumen')
+        horas = resumen['horas'] if resumen else consultar_horas(codigo_estudiante)
         update.message.reply_text(f"📊 Has acumulado {horas} horas de prácticas.")
         return mostrar_menu_final(update, context)
     except Exception as e:
@@ -218,7 +219,8 @@ def consultar_horas_estudiante(update: Update, context: CallbackContext, codigo_
 def consultar_empresas_estudiante(update: Update, context: CallbackContext, codigo_estudiante):
     """Consulta las empresas del estudiante."""
     try:
-        empresas = consultar_empresas(codigo_estudiante)
+        resumen = context.user_data.get('resumen')
+        empresas = resumen['empresas'] if resumen else consultar_empresas(codigo_estudiante)
         if empresas:
             empresas_texto = "\n".join([f"• {empresa}" for empresa in empresas])
             update.message.reply_text(f"🏢 Has realizado prácticas en las siguientes empresas:\n{empresas_texto}")
@@ -239,13 +241,54 @@ def recibir_dni(update: Update, context: CallbackContext):
     return EMPRESA
 
 def recibir_empresa(update: Update, context: CallbackContext):
-    """Recibe la empresa."""
+    """Recibe la empresa; si no coincide exactamente con una registrada, sugiere las más parecidas."""
     if context.user_data is None:
         context.user_data = {}
-    context.user_data['empresa'] = update.message.text
+    texto = update.message.text
+    context.user_data['empresa'] = texto
+    context.user_data.pop('empresa_id', None)
+    context.user_data.pop('ruc', None)
+
+    sugerencias = buscar_empresas(texto, Config.EMPRESAS_SUGERIDAS)
+    # Se elige sola solo si es la única igual y también coincide el sufijo (S.A.C. no es S.R.L.)
+    iguales = [empresa for empresa in sugerencias if empresa['similitud'] == 1]
+    if len(iguales) == 1 and obtener_empresa_id(texto) == iguales[0]['id']:
+        return elegir_empresa(update.message, context, iguales[0])
+    if sugerencias:
+        context.user_data['sugerencias_empresa'] = {empresa['id']: empresa for empresa in sugerencias}
+        keyboard = [[InlineKeyboardButton(empresa['nombre'], callback_data=f"empresa|{empresa['id']}")]
+                    for empresa in sugerencias]
+        keyboard.append([InlineKeyboardButton(f"✏️ Usar \"{texto}\"", callback_data="empresa|0")])
+        update.message.reply_text(
+            "¿Te refieres a alguna de estas empresas?",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return EMPRESA
     update.message.reply_text("Ingresa el RUC de la empresa:")
     return RUC_EMPRESA
 
+def elegir_empresa(message, context: CallbackContext, empresa):
+    """Usa una empresa registrada; si ya se conoce su RUC se pasa directo a la dirección."""
+    context.user_data['empresa'] = empresa['nombre']
+    context.user_data['empresa_id'] = empresa['id']
+    if empresa.get('ruc'):
+        context.user_data['ruc'] = empresa['ruc']
+        message.reply_text(f"🏢 {empresa['nombre']} (RUC {empresa['ruc']})\nIngresa la dirección de la empresa:")
+        return DIRECCION
+    message.reply_text(f"🏢 {empresa['nombre']}\nIngresa el RUC de la empresa:")
+    return RUC_EMPRESA
+
+def seleccionar_empresa_callback(update: Update, context: CallbackContext):
+    """Botón de una empresa sugerida (o de usar el nombre tal como se escribió)."""
+    query = update.callback_query
+    query.answer()
+    empresa_id = int(query.data.split("|", 1)[1])
+    sugerencias = context.user_data.pop('sugerencias_empresa', {})
+    if empresa_id in sugerencias:
+        return elegir_empresa(query.message, context, sugerencias[empresa_id])
+    query.message.reply_text("Ingresa el RUC de la empresa:")
+    return RUC_EMPRESA
+
 def recibir_ruc_empresa(update: Update, context: CallbackContext):
     """Recibe el RUC de la empresa."""
     if context.user_data is None:
@@ -263,50 +306,64 @@ def recibir_direccion(update: Update, context: CallbackContext):
     try:
         # Registrar la solicitud en la base de datos
         estudiante_id = context.user_data['estudiante_id']
-        empresa_id = obtener_empresa_id(context.user_data['empresa'])
+        empresa_id = context.user_data.get('empresa_id') or obtener_empresa_id(context.user_data['empresa'])
         
         if empresa_id is None:
             update.message.reply_text("❌ Empresa no encontrada. Por favor, verifica el nombre de la empresa.")
             return EMPRESA
         
-        # Validar que no exista ya una carta para este estudiante y empresa
-        # if existe_carta_para_estudiante_y_empresa(estudiante_id, empresa_id):
-        #     update.message.reply_text("❌ Ya has generado una carta para esta empresa. No puedes generar otra.")
-        #     return mostrar_menu_final(update, context)
-        
         fecha_solicitud = "2025-01-02"  # Fecha actual (se puede mejorar)
         
-        if registrar_solicitud_carta(estudiante_id, empresa_id, fecha_solicitud):
-            print("Llamando a generar_carta_presentacion...")
-            try:
-                # Construir los diccionarios con los datos necesarios
-                estudiante_data = {
-                    'codigo': context.user_data['codigo'],
-                    'nombres': context.user_data['nombre'],
-                    'dni': context.user_data['dni'],
-                    # Agrega otros campos si los tienes, como 'apellidos', 'carrera', 'ciclo'
-                }
-                empresa_data = {
-                    'nombre': context.user_data['empresa'],
-                    'ruc': context.user_data['ruc'],
-                    'direccion': context.user_data['direccion'],
-                }
-
-                ruta_pdf = generar_carta_presentacion(estudiante_data, empresa_data)
-                registrar_solicitud_carta(estudiante_id, empresa_id, fecha_solicitud, ruta_pdf)
-                print(f"PDF generado en: {ruta_pdf}")
-                context.user_data['ruta_pdf'] = ruta_pdf
-                update.message.reply_text(
-                    "✅ ¡Tu carta de presentación ha sido generada con éxito!\n"
-                    "Recibirás una notificación cuando esté lista."
-                )
-                return mostrar_menu_final(update, context)
-            except Exception as e:
-                print(f"Error al generar PDF: {e}")
-                update.message.reply_text("❌ Error al generar la carta. Por favor, intenta nuevamente.")
-                return ConversationHandler.END
+        # Construir los diccionarios con los datos necesarios
+        estudiante_data = {
+            'codigo': context.user_data['codigo'],
+            'nombres': context.user_data['nombre'],
+            'dni': context.user_data['dni'],
+            # Agrega otros campos si los tienes, como 'apellidos', 'carrera', 'ciclo'
+        }
+        empresa_data = {
+            'nombre': context.user_data['empresa'],
+            'ruc': context.user_data['ruc'],
+            'direccion': context.user_data['direccion'],
+        }
+
+        # Registra la solicitud y encola el PDF; se envía por Telegram cuando está listo
+        print("Encolando carta de presentación...")
+        try:
+            resultado = solicitar_carta(
+                estudiante_id, empresa_id, fecha_solicitud, estudiante_data, empresa_data,
+                al_terminar=avisar_carta_lista(context.bot, update.effective_chat.id, context.user_data)
+            )
+        except ColaLlenaError:
+            update.message.reply_text(
+                "⏳ Hay muchas cartas generándose en este momento.\n"
+                "Por favor, intenta nuevamente en unos minutos."
+            )
+            return mostrar_menu_final(update, context)
+        
+        if resultado['estado'] == 'duplicada':
+            context.user_data['ruta_pdf'] = resultado['ruta_pdf']
+            update.message.reply_text(
+                "ℹ️ Ya has generado una carta para esta empresa.\n"
+                "Puedes descargarla con el botón 📄 Descargar carta."
+            )
+            return mostrar_menu_final(update, context)
+        elif resultado['estado'] == 'en_curso':
+            update.message.reply_text(
+                "⏳ Tu carta para esta empresa ya se está generando.\n"
+                "Puedes descargarla en unos minutos con el botón 📄 Descargar carta."
+            )
+            return mostrar_menu_final(update, context)
+        elif resultado['estado'] == 'encolada':
+            print(f"Carta encolada: trabajo {resultado['trabajo'].id}")
+            context.user_data.pop('ruta_pdf', None)
+            update.message.reply_text(
+                "✅ ¡Tu carta de presentación está en preparación!\n"
+                "Recibirás una notificación cuando esté lista."
+            )
+            return mostrar_menu_final(update, context)
         else:
-            update.message.reply_text("❌ Error al registrar la solicitud. Por favor, intenta nuevamente.")
+            update.message.reply_text("❌ Error al generar la carta. Por favor, intenta nuevamente.")
             return ConversationHandler.END
         
     except Exception as e:
@@ -314,6 +371,31 @@ def recibir_direccion(update: Update, context: CallbackContext):
         update.message.reply_text("❌ Error al generar la carta. Por favor, intenta nuevamente.")
         return ConversationHandler.END
 
+def avisar_carta_lista(bot, chat_id, user_data):
+    """Función para el servicio de render: envía el PDF (o el error) al chat cuando termina el trabajo."""
+    def avisar(trabajo):
+        if trabajo.estado != 'lista':
+            bot.send_message(chat_id=chat_id, text="❌ No se pudo generar tu carta. Por favor, intenta nuevamente.")
+            return
+        user_data['ruta_pdf'] = trabajo.ruta_pdf
+        # Recién generada se envía desde memoria; si se reutilizó una ya guardada, se lee
+        pdf = trabajo.pdf or leer_carta(trabajo.ruta_pdf)
+        if pdf is None:
+            # La carta quedó registrada; solo falló la lectura, así que el trabajo sigue 'lista'
+            bot.send_message(
+                chat_id=chat_id,
+                text="⚠️ Tu carta está lista, pero no pudimos enviarla ahora. "
+                     "Disculpa las molestias: descárgala con el botón 📄 Descargar carta."
+            )
+            return
+        bot.send_document(
+            chat_id=chat_id,
+            document=pdf,
+            filename=os.path.basename(trabajo.ruta_pdf),
+            caption="📄 Tu carta de presentación está lista."
+        )
+    return avisar
+
 def mostrar_fechas_criticas(update: Update, context: CallbackContext):
     """Muestra las fechas críticas."""
     try:
@@ -329,16 +411,48 @@ def mostrar_fechas_criticas(update: Update, context: CallbackContext):
         update.message.reply_text("❌ Error al consultar las fechas críticas.")
         return ConversationHandler.END
 
+def enviar_pagina_cartas(message, estudiante_id, despues=None, pagina=None):
+    """Envía una página de cartas generadas (la consulta si no se pasa `pagina`) con un botón para la siguiente."""
+    cartas, siguiente = pagina or consultar_cartas_pagina(estudiante_id, Config.PAGINA_TAMANO_BOT, despues)
+    if not cartas:
+        message.reply_text("No tienes cartas generadas." if despues is None else "No hay más cartas.")
+        return
+    mensaje = "Tus cartas generadas:\n"
+    keyboard = []
+    for solicitud_id, nombre_empresa, ruta_pdf in cartas:
+        if ruta_pdf:
+            # callback_data admite 64 bytes: se envía el id y la ruta se busca al pulsar
+            keyboard.append([InlineKeyboardButton(
+                f"{nombre_empresa}", callback_data=f"descargar_carta|{solicitud_id}"
+            )])
+        else:
+            mensaje += f"• {nombre_empresa}: Sin PDF\n"
+    if siguiente:
+        keyboard.append([InlineKeyboardButton("➡️ Siguiente página", callback_data=f"pagina_cartas|{siguiente}")])
+    if keyboard:
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        message.reply_text(mensaje + "Selecciona una empresa para descargar la carta:", reply_markup=reply_markup)
+    else:
+        message.reply_text(mensaje)
+
+def enviar_pagina_oportunidades(message, despues=None, pagina=None):
+    """Envía una página de oportunidades en un solo mensaje con un botón para la siguiente."""
+    oportunidades, siguiente = pagina or consultar_oportunidades_pagina(Config.PAGINA_TAMANO_BOT, despues)
+    if not oportunidades:
+        message.reply_text("📝 No hay oportunidades de prácticas activas." if despues is None else "📝 No hay más oportunidades.")
+        return
+    mensaje = "\n\n".join(format_oportunidad(oportunidad) for oportunidad in oportunidades)
+    reply_markup = None
+    if siguiente:
+        reply_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("➡️ Siguiente página", callback_data=f"pagina_oportunidades|{siguiente}")
+        ]])
+    message.reply_text(mensaje, reply_markup=reply_markup)
+
 def mostrar_oportunidades(update: Update, context: CallbackContext):
-    """Muestra las oportunidades de prácticas."""
+    """Muestra la primera página de oportunidades de prácticas."""
     try:
-        oportunidades = consultar_oportunidades_practicas()
-        if oportunidades:
-            for oportunidad in oportunidades:
-                mensaje = format_oportunidad(oportunidad)
-                update.message.reply_text(mensaje)
-        else:
-            update.message.reply_text("📝 No hay oportunidades de prácticas activas.")
+        enviar_pagina_oportunidades(update.message)
         return mostrar_menu_final(update, context)
     except Exception as e:
         print(f"Error al consultar oportunidades: {e}")
@@ -369,28 +483,94 @@ def cancel(update: Update, context: CallbackContext):
     )
     return ConversationHandler.END
 
+# Con MySQL los botones de descarga y de páginas (fuera de la conversación) se
+# atienden en el event loop de database_async: el hilo del Dispatcher queda
+# libre mientras se consulta, se lee el PDF y se envía la respuesta
+def usar_capa_async():
+    return Config.DB_BACKEND == 'mysql'
+
+def enviar_carta(update: Update, context: CallbackContext, ruta_pdf):
+    """Envía el PDF de la carta (o avisa que no está) y después el menú final."""
+    message = update.callback_query.message
+    pdf = leer_carta(ruta_pdf)
+    if pdf:
+        message.reply_document(
+            document=pdf,
+            filename=os.path.basename(ruta_pdf),
+            caption="📄 Aquí tienes tu carta de presentación."
+        )
+    else:
+        message.reply_text("❌ No se encontró el archivo PDF para esta carta.")
+    return mostrar_menu_final(update, context)
+
+async def enviar_carta_async(update: Update, context: CallbackContext, solicitud_id, estudiante_id):
+    ruta_pdf = await database_async.obtener_ruta_carta(solicitud_id, estudiante_id)
+    await asyncio.to_thread(enviar_carta, update, context, ruta_pdf)
+
 def descargar_carta_callback(update: Update, context: CallbackContext):
     query = update.callback_query
     query.answer()
     data = query.data
-    if data.startswith("descargar_carta|"):
-        ruta_pdf = data.split("|", 1)[1]
-        if ruta_pdf and os.path.exists(ruta_pdf):
-            with open(ruta_pdf, 'rb') as pdf_file:
-                query.message.reply_document(
-                    document=pdf_file,
-                    filename=os.path.basename(ruta_pdf),
-                    caption="📄 Aquí tienes tu carta de presentación."
-                )
+    if not data.startswith("descargar_carta|"):
+        return mostrar_menu_final(update, context)
+    solicitud_id = data.split("|", 1)[1]
+    estudiante_id = context.user_data.get('estudiante_id')
+    if not estudiante_id:
+        query.message.reply_text("Ingresa de nuevo tu código de estudiante para ver tus cartas.")
+        return mostrar_menu_final(update, context)
+    if not solicitud_id.isdigit():
+        return enviar_carta(update, context, None)
+    # Solo se entregan las cartas del estudiante que inició la conversación
+    if usar_capa_async():
+        return ejecutar_en_segundo_plano(enviar_carta_async(update, context, int(solicitud_id), estudiante_id))
+    return enviar_carta(update, context, obtener_ruta_carta(int(solicitud_id), estudiante_id))
+
+def avisar_pagina_no_disponible(message, error):
+    print(f"Error al paginar: {error}")
+    message.reply_text("❌ Esta página ya no está disponible. Vuelve a consultar desde el menú.")
+
+async def enviar_pagina_async(message, tipo, token, estudiante_id):
+    try:
+        if tipo == "pagina_oportunidades":
+            pagina = await database_async.consultar_oportunidades_pagina(Config.PAGINA_TAMANO_BOT, token)
+            await asyncio.to_thread(enviar_pagina_oportunidades, message, token, pagina)
         else:
-            query.message.reply_text("❌ No se encontró el archivo PDF para esta carta.")
-    return mostrar_menu_final(update, context)
+            pagina = await database_async.consultar_cartas_pagina(estudiante_id, Config.PAGINA_TAMANO_BOT, token)
+            await asyncio.to_thread(enviar_pagina_cartas, message, estudiante_id, token, pagina)
+    except ValueError as e:
+        await asyncio.to_thread(avisar_pagina_no_disponible, message, e)
+
+def pagina_callback(update: Update, context: CallbackContext):
+    """Envía la siguiente página de oportunidades o de cartas (botón "Siguiente página")."""
+    query = update.callback_query
+    query.answer()
+    tipo, token = query.data.split("|", 1)
+    estudiante_id = context.user_data.get('estudiante_id')
+    if tipo != "pagina_oportunidades" and not estudiante_id:
+        query.message.reply_text("Ingresa de nuevo tu código de estudiante para ver tus cartas.")
+        return None
+    if usar_capa_async():
+        return ejecutar_en_segundo_plano(enviar_pagina_async(query.message, tipo, token, estudiante_id))
+    try:
+        if tipo == "pagina_oportunidades":
+            enviar_pagina_oportunidades(query.message, token)
+        else:
+            enviar_pagina_cartas(query.message, estudiante_id, token)
+    except ValueError as e:
+        avisar_pagina_no_disponible(query.message, e)
+    return None
+
+def marcar_conversacion(update: Update, context: CallbackContext):
+    """Asocia las consultas de esta actualización a su chat (las lecturas que siguen a una escritura van al primario)."""
+    establecer_conversacion(update.effective_chat.id if update.effective_chat else None)
 
 def main():
     """Función principal del bot."""
     # Reemplaza por tu token de BotFather
     updater = Updater("7364353585:AAFvGKyxzg6UULJoDmhS2rwVTOPdGfOsPoY", use_context=True)
     dispatcher = updater.dispatcher
+    dispatcher.add_handler(TypeHandler(Update, marcar_conversacion), group=-1)
+    precargar_indice_empresas()
 
     # Crear el ConversationHandler
     conv_handler = ConversationHandler(
@@ -400,7 +580,10 @@ def main():
             NOMBRE: [MessageHandler(Filters.text & ~Filters.command, recibir_nombre)],
             CODIGO: [MessageHandler(Filters.text & ~Filters.command, recibir_codigo_estudiante)],
             DNI: [MessageHandler(Filters.text & ~Filters.command, recibir_dni)],
-            EMPRESA: [MessageHandler(Filters.text & ~Filters.command, recibir_empresa)],
+            EMPRESA: [
+                MessageHandler(Filters.text & ~Filters.command, recibir_empresa),
+                CallbackQueryHandler(seleccionar_empresa_callback, pattern=r"^empresa\|")
+            ],
             RUC_EMPRESA: [MessageHandler(Filters.text & ~Filters.command, recibir_ruc_empresa)],
             DIRECCION: [MessageHandler(Filters.text & ~Filters.command, recibir_direccion)],
         },
@@ -410,6 +593,7 @@ def main():
 
     dispatcher.add_handler(conv_handler)
     dispatcher.add_handler(CallbackQueryHandler(descargar_carta_callback, pattern=r"^descargar_carta\|"))
+    dispatcher.add_handler(CallbackQueryHandler(pagina_callback, pattern=r"^pagina_(oportunidades|cartas)\|"))
 
     # Inicia el bot
     print("Bot iniciado...")
@@ -9,8 +9,41 @@ from services.database_service import (
     consultar_horas, 
     consultar_empresas,
     consultar_fechas_criticas,
-    consultar_oportunidades_practicas
+    consultar_oportunidades_practicas,
+    _es_clave_duplicada,
+    codificar_token_pagina,
+    decodificar_token_pagina,
+    ejecutar_preparada,
+    obtener_estadisticas_sentencias,
+    SQL_REGISTRAR_CARTAS
 )
+from services.connection_pool import PoolConexiones, PoolAgotadoError
+from services.cache_service import CacheTTL
+from services import sqlite_backend
+from services.metricas_service import Histograma, normalizar_sql
+from services.exportacion_service import a_csv, a_ndjson
+from services.indice_empresas import IndiceEmpresas, normalizar_nombre
+from carta_generator import PlantillaCarta
+from services.render_service import ServicioRender, ColaLlenaError
+from services.cache_cartas import CacheArchivos
+from services.replicas_service import (
+    EnrutadorReplicas, solo_lectura, escritura, en_lectura, debe_usar_primario, establecer_conversacion
+)
+import sqlite3
+import threading
+import time
+
+class _ConexionFalsa:
+    """Conexión mínima para probar el pool sin servidor MySQL"""
+    def __init__(self):
+        self.cerrada = False
+    def ping(self):
+        if self.cerrada:
+            raise ConnectionError("cerrada")
+    def rollback(self):
+        pass
+    def close(self):
+        self.cerrada = True
 
 def test_connection():
     """Prueba la conexión a la base de datos"""
@@ -24,6 +57,1263 @@ def test_connection():
         print("❌ Error al conectar a la base de datos")
         return False
 
+def test_pool():
+    """Prueba el préstamo, la reutilización y el agotamiento del pool"""
+    pool = PoolConexiones(_ConexionFalsa, tamano=1, tiempo_espera=0.05)
+
+    primera = pool.obtener()
+    fisica = primera._registro.conexion
+    try:
+        pool.obtener()
+        assert False, "El pool debía estar agotado"
+    except PoolAgotadoError:
+        pass
+    primera.close()
+
+    segunda = pool.obtener()
+    assert segunda._registro.conexion is fisica, "La conexión debía reutilizarse"
+    fisica.cerrada = True  # simula una conexión caída en el servidor
+    segunda.close()
+
+    tercera = pool.obtener()
+    assert tercera._registro.conexion is not fisica, "La conexión caída debía descartarse"
+    tercera.close()
+
+    estadisticas = pool.estadisticas()
+    assert estadisticas['agotados'] == 1
+    assert estadisticas['descartadas'] == 1
+    assert estadisticas['en_uso'] == 0
+
+def test_pool_conexion_perdida(monkeypatch):
+    """Una consulta que falla no deja el hueco del pool ocupado"""
+    import gc
+    from services import database_service as db
+
+    pool = PoolConexiones(_ConexionFalsa, tamano=2, tiempo_espera=0.05)
+    monkeypatch.setattr(db, '_obtener_conexion', pool.obtener)
+
+    def falla(*args):
+        raise RuntimeError("MySQL server has gone away")
+    monkeypatch.setattr(db, 'ejecutar_preparada', falla)
+    for _ in range(3):
+        assert db.consultar_empresas('20210001') == []
+    assert pool.estadisticas()['en_uso'] == 0
+
+    # Red de seguridad: un préstamo perdido sin close() vuelve al pool al recolectarse
+    for _ in range(3):
+        pool.obtener()
+    gc.collect()
+    pool.obtener().close()
+    assert pool.estadisticas()['recuperadas'] == 3
+
+def test_cache_ttl():
+    """Prueba que una ráfaga de lecturas dispare una sola carga y que la invalidación funcione"""
+    cache = CacheTTL(ttl_defecto=60)
+    cargas = []
+
+    def cargar():
+        cargas.append(1)
+        time.sleep(0.05)
+        return [("Entrega de informe", "2025-07-01")]
+
+    hilos = [threading.Thread(target=cache.obtener_o_cargar, args=('fechas', cargar)) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(cargas) == 1, "Solo un hilo debía consultar el origen"
+
+    cache.invalidar('fechas')
+    cache.obtener_o_cargar('fechas', cargar)
+    assert len(cargas) == 2
+
+    estadisticas = cache.estadisticas()
+    assert estadisticas['cargas'] == 2
+    assert estadisticas['aciertos'] == 7
+
+def test_cache_lru_negativo():
+    """Prueba el límite LRU y que los códigos inexistentes se recuerden poco tiempo"""
+    cache = CacheTTL(ttl_defecto=60, max_entradas=2)
+    cache.guardar('a', 1)
+    cache.guardar('b', 2)
+    cache.obtener('a')  # 'a' pasa a ser la más reciente
+    cache.guardar('c', 3)
+    assert cache.obtener('b') == (False, None), "Debía descartarse la menos usada"
+    assert cache.obtener('a') == (True, 1)
+
+    cache.obtener_o_cargar('inexistente', lambda: None, ttl_negativo=0.05)
+    assert cache.obtener('inexistente') == (True, None)
+    time.sleep(0.06)
+    assert cache.obtener('inexistente') == (False, None)
+
+def test_invalidacion_consultas(monkeypatch, tmp_path):
+    """Escribir oportunidades invalida sus páginas en caché y la marca avisa a los otros procesos"""
+    from config import Config
+    from services import database_service as db
+    marca = str(tmp_path / '.cache_consultas')
+    monkeypatch.setattr(Config, 'CACHE_MARCA_CONSULTAS', marca)
+    monkeypatch.setattr(db, '_escribir_fila', lambda query, parametros, descripcion: (7, 1))
+
+    db._cache_paginas.guardar(('oportunidades_practicas', 0, 20), ([], None), 60)
+    db._cache_consultas.guardar('fechas_criticas', [('Entrega', '2025-07-01')], 60)
+    assert db.crear_oportunidad_practica(1, 'Backend', '2025-01-01', '2025-06-30') == 7
+    assert db._cache_paginas.obtener(('oportunidades_practicas', 0, 20)) == (False, None)
+    assert db._cache_consultas.obtener('fechas_criticas')[0], "Solo se invalidan las oportunidades"
+
+    # Otro proceso vio la marca anterior: al revisarla descarta sus consultas
+    monkeypatch.setitem(db._marcas, marca, None)
+    monkeypatch.setitem(db._marcas_revisadas_en, marca, 0.0)
+    db._revisar_marca_consultas()
+    assert db._cache_consultas.obtener('fechas_criticas') == (False, None)
+
+    # Cada token distinto crea una entrada, pero la caché de páginas está acotada
+    monkeypatch.setattr(db, '_cargar_pagina_oportunidades', lambda despues_id, limite: ([], None))
+    for despues_id in range(1, db._cache_paginas.max_entradas + 50):
+        db.consultar_oportunidades_pagina(despues=codificar_token_pagina(despues_id))
+    assert db._cache_paginas.estadisticas()['entradas'] == db._cache_paginas.max_entradas
+
+def test_sqlite_backend():
+    """El backend SQLite acepta las consultas con %s y mantiene los totales de horas"""
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", ('A1', '1', 'Ana'))
+    cursor.execute("INSERT INTO empresas (nombre) VALUES (%s)", ('Acme',))
+    cursor.execute("INSERT INTO estudiantes_empresas (estudiante_id, empresa_id) VALUES (1, 1)")
+    cursor.executemany("INSERT INTO practicas (estudiante_empresa_id, horas) VALUES (%s, %s)", [(1, 10), (1, 5)])
+    cursor.execute("UPDATE practicas SET horas = %s WHERE id = %s", (2, 1))
+    cursor.execute("SELECT total_horas FROM horas_estudiante WHERE estudiante_id = %s FOR UPDATE", (1,))
+    assert cursor.fetchone()[0] == 7
+
+    cursor.execute("INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud) VALUES (1, 1, '2024-01-01')")
+    try:
+        cursor.execute("INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud) VALUES (1, 1, '2024-01-02')")
+        assert False, "se esperaba una clave duplicada"
+    except sqlite3.IntegrityError as e:
+        assert _es_clave_duplicada(e)
+    conexion.close()
+
+def test_ciclo_vida_carta(monkeypatch):
+    """Solicitud nueva, duplicada, en curso, reclamada y cancelada sobre el backend SQLite"""
+    from services import database_service as db
+    from services.database_service import iniciar_carta, completar_carta, cancelar_carta
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", ('A1', '1', 'Ana'))
+    cursor.executemany("INSERT INTO empresas (nombre) VALUES (%s)", [('Acme',), ('Beta',)])
+    conexion.commit()
+    monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+
+    def fila(solicitud_id):
+        cursor.execute("SELECT estado, ruta_pdf FROM solicitudes_carta WHERE id = %s", (solicitud_id,))
+        return cursor.fetchone()
+
+    inicio = iniciar_carta(1, 1, '2025-03-01')
+    assert inicio['estado'] == 'nueva' and inicio['estado_anterior'] is None
+    solicitud_id = inicio['solicitud_id']
+    assert fila(solicitud_id) == ('pendiente', None)
+    # Mientras se genera, otro pedido no la reclama
+    assert iniciar_carta(1, 1, '2025-03-02') == {'estado': 'en_curso', 'solicitud_id': solicitud_id, 'ruta_pdf': None}
+
+    assert completar_carta(solicitud_id, 's3://bucket/cartas/acme.pdf')
+    assert iniciar_carta(1, 1, '2025-03-03') == \
+        {'estado': 'duplicada', 'solicitud_id': solicitud_id, 'ruta_pdf': 's3://bucket/cartas/acme.pdf'}
+
+    # Generada pero sin el PDF: se reclama y, si falla, vuelve a quedar como estaba
+    cursor.execute("UPDATE solicitudes_carta SET ruta_pdf = %s WHERE id = %s", ('static/cartas/no_existe.pdf', solicitud_id))
+    conexion.commit()
+    reclamada = iniciar_carta(1, 1, '2025-03-04')
+    assert reclamada['estado'] == 'nueva' and reclamada['estado_anterior'] == 'generada'
+    assert reclamada['solicitud_id'] == solicitud_id and fila(solicitud_id)[0] == 'pendiente'
+    assert cancelar_carta(solicitud_id, reclamada['iniciada_en'], reclamada['estado_anterior'])
+    assert fila(solicitud_id) == ('generada', 'static/cartas/no_existe.pdf')
+
+    # Una nueva cancelada se borra; una pendiente abandonada se puede reclamar
+    otra = iniciar_carta(1, 2, '2025-03-01')
+    assert cancelar_carta(otra['solicitud_id'], otra['iniciada_en'])
+    assert fila(otra['solicitud_id']) is None
+    otra = iniciar_carta(1, 2, '2025-03-01')
+    cursor.execute("UPDATE solicitudes_carta SET iniciada_en = %s WHERE id = %s", ('2000-01-01 00:00:00', otra['solicitud_id']))
+    conexion.commit()
+    reclamada = iniciar_carta(1, 2, '2025-03-05')
+    assert reclamada['estado'] == 'nueva' and reclamada['estado_anterior'] == 'pendiente'
+    # El proceso que la abandonó ya no puede borrarla
+    assert cancelar_carta(otra['solicitud_id'], '2000-01-01 00:00:00')
+    assert fila(otra['solicitud_id']) == ('pendiente', None)
+
+    assert not completar_carta(999, 's3://bucket/cartas/perdida.pdf')
+    conexion.close()
+
+def test_metricas():
+    """Percentiles del histograma y normalización del SQL del registro de consultas lentas"""
+    histograma = Histograma()
+    for duracion_ms in [0.3] * 90 + [40] * 9 + [3000]:
+        histograma.registrar(duracion_ms)
+    estadisticas = histograma.estadisticas()
+    assert estadisticas['cantidad'] == 100
+    assert estadisticas['p50_ms'] == 0.5
+    assert estadisticas['p99_ms'] == 50
+    assert estadisticas['max_ms'] == 3000
+
+    assert normalizar_sql("SELECT id FROM estudiantes\n   WHERE codigo = %s AND estado = 'activo' LIMIT 10") == \
+        "SELECT id FROM estudiantes WHERE codigo = ? AND estado = ? LIMIT ?"
+
+def test_token_pagina():
+    """El token de continuación guarda el último id y rechaza valores manipulados"""
+    assert decodificar_token_pagina(None) == 0
+    assert decodificar_token_pagina(codificar_token_pagina(1234)) == 1234
+    for token in ['xx!', codificar_token_pagina('abc'), 'djI6MTA']:
+        try:
+            decodificar_token_pagina(token)
+            assert False, f"se esperaba un token no válido: {token}"
+        except ValueError:
+            pass
+
+def test_sentencias_preparadas():
+    """Cada conexión física del pool prepara la sentencia una sola vez"""
+    pool = PoolConexiones(lambda: sqlite_backend.crear_conexion(':memory:'), tamano=1)
+    antes = obtener_estadisticas_sentencias()['sentencias'].get('estudiante_id', {'preparadas': 0, 'ejecutadas': 0})
+    for _ in range(3):
+        conexion = pool.obtener()
+        assert ejecutar_preparada(conexion, 'estudiante_id', ('no-existe',)) == []
+        conexion.close()
+    despues = obtener_estadisticas_sentencias()['sentencias']['estudiante_id']
+    assert despues['preparadas'] - antes['preparadas'] == 1
+    assert despues['ejecutadas'] - antes['ejecutadas'] == 3
+    pool.cerrar()
+
+def test_replicas():
+    """Lecturas a la réplica menos cargada y al día; la conversación que escribe se queda en el primario"""
+    retrasos = {}
+    pools = {nombre: PoolConexiones(_ConexionFalsa, tamano=2) for nombre in ('r1', 'r2')}
+    for nombre, pool in pools.items():
+        retrasos[pool] = 0
+    enrutador = EnrutadorReplicas(
+        list(pools.items()), max_retraso=5, intervalo_revision=0,
+        medir_retraso=lambda conexion: retrasos[conexion._pool]
+    )
+
+    ocupada = enrutador.obtener()  # r1 (ambas vacías); ahora r2 es la menos cargada
+    assert ocupada._pool is pools['r1']
+    siguiente = enrutador.obtener()
+    assert siguiente._pool is pools['r2']
+    siguiente.close()
+
+    retrasos[pools['r2']] = 60  # r2 atrasada: se usa r1 aunque esté más cargada
+    conexion = enrutador.obtener()
+    assert conexion._pool is pools['r1']
+    conexion.close()
+    ocupada.close()
+
+    retrasos[pools['r1']] = None  # replicación detenida: ninguna sirve, va al primario
+    assert enrutador.obtener() is None
+    assert enrutador.estadisticas()['lecturas_primario'] == 1
+
+    @escritura
+    def escribir():
+        return en_lectura()
+
+    @solo_lectura
+    def leer():
+        return en_lectura() and not debe_usar_primario()
+
+    establecer_conversacion('chat-1')
+    assert leer()
+    assert escribir() is False
+    assert not leer()
+    establecer_conversacion('chat-2')
+    assert leer()
+    establecer_conversacion(None)
+
+def test_replica_llena():
+    """Una réplica con el pool agotado no hace esperar a la lectura ni cuenta como error"""
+    pools = {nombre: PoolConexiones(_ConexionFalsa, tamano=1, tiempo_espera=10) for nombre in ('r1', 'r2')}
+    enrutador = EnrutadorReplicas(list(pools.items()), intervalo_revision=60, medir_retraso=lambda conexion: 0)
+
+    primera = enrutador.obtener()
+    segunda = enrutador.obtener()
+    assert {primera._pool, segunda._pool} == set(pools.values())
+    inicio = time.monotonic()
+    assert enrutador.obtener() is None  # las dos llenas: al primario sin esperar los 10 segundos
+    assert time.monotonic() - inicio < 1
+    estadisticas = enrutador.estadisticas()
+    assert [replica['errores'] for replica in estadisticas['replicas']] == [0, 0]
+    assert sum(replica['llenas'] for replica in estadisticas['replicas']) == 2
+    assert all(replica['disponible'] for replica in estadisticas['replicas'])
+
+    segunda.close()
+    tercera = enrutador.obtener()
+    assert tercera._pool is segunda._pool
+    tercera.close()
+    primera.close()
+
+def test_exportacion_por_bloques():
+    """La exportación produce el encabezado primero y luego bloques del tamaño pedido"""
+    from datetime import date
+    filas = [(i, date(2024, 1, i + 1), 'Empresa, S.A.') for i in range(5)]
+    bloques = list(a_csv(['id', 'fecha', 'empresa'], iter(filas), filas_por_bloque=2))
+    assert bloques[0] == "id,fecha,empresa\r\n"
+    assert len(bloques) == 4  # encabezado + 2 + 2 + 1
+    assert bloques[1].startswith('0,2024-01-01,"Empresa, S.A."')
+
+    lineas = "".join(a_ndjson(['id', 'fecha', 'empresa'], iter(filas), filas_por_bloque=2)).splitlines()
+    assert len(lineas) == 5
+    assert '"fecha": "2024-01-05"' in lineas[-1]
+
+def test_indice_empresas():
+    """Búsqueda por RUC, por nombre normalizado y aproximada, con carga incremental por id y completa"""
+    tabla = [
+        {'id': 1, 'nombre': 'Tech Solutions S.A.C.', 'ruc': '20123456789', 'direccion': None, 'contacto_email': None},
+        {'id': 2, 'nombre': 'Banco de Crédito del Perú', 'ruc': None, 'direccion': None, 'contacto_email': None},
+    ]
+    indice = IndiceEmpresas(lambda ultimo_id: [e for e in tabla if e['id'] > ultimo_id], refrescar_tras=3600)
+    indice.refrescar()
+
+    assert normalizar_nombre('Tech Solutions S.A.C.') == 'tech solutions'
+    assert indice.por_ruc('20123456789')['id'] == 1
+    assert indice.por_nombre('TECH SOLUTIONS SAC')['id'] == 1
+    assert indice.buscar('banco credito peru')[0]['id'] == 2
+    assert indice.buscar('zzzz') == []
+
+    tabla.append({'id': 3, 'nombre': 'Minera Andina S.A.', 'ruc': None, 'direccion': None, 'contacto_email': None})
+    assert indice.por_nombre('minera andina') is None  # aún no toca refrescar
+    indice.refrescar(forzar=True)
+    assert indice.por_nombre('minera andina')['id'] == 3
+    assert indice.estadisticas()['ultimo_id'] == 3
+
+    # Las renombradas y eliminadas solo desaparecen con la carga completa
+    tabla[0] = dict(tabla[0], nombre='Tech Andes S.A.C.')
+    del tabla[1]
+    indice.refrescar(forzar=True)
+    assert indice.por_nombre('tech solutions')['id'] == 1
+    indice.reconstruir_tras = 0
+    indice.agregar({'id': 4, 'nombre': 'Agro Sur', 'ruc': None, 'direccion': None, 'contacto_email': None})
+    indice.refrescar(forzar=True)
+    assert indice.por_nombre('tech solutions') is None
+    assert indice.por_nombre('tech andes')['id'] == 1
+    assert indice.por_ruc('20123456789')['nombre'] == 'Tech Andes S.A.C.'
+    assert indice.buscar('banco credito peru') == []
+    assert indice.por_nombre('agro sur') is None  # ya no está en la tabla, aunque sea la de mayor id
+
+def test_empresas_con_sufijo(monkeypatch):
+    """El sufijo societario cuenta para la coincidencia exacta y los empates no se eligen solos"""
+    import telegram_bot
+    from services import database_service as db
+
+    tabla = [
+        {'id': 1, 'nombre': 'Inversiones Lima S.A.C.', 'ruc': None, 'direccion': None, 'contacto_email': None},
+        {'id': 2, 'nombre': 'Minera Andina S.A.', 'ruc': None, 'direccion': None, 'contacto_email': None},
+        {'id': 3, 'nombre': 'Minera Andina S.R.L.', 'ruc': None, 'direccion': None, 'contacto_email': None},
+    ]
+    indice = IndiceEmpresas(lambda ultimo_id: [e for e in tabla if e['id'] > ultimo_id], refrescar_tras=3600)
+    indice.refrescar()
+    assert normalizar_nombre('Inversiones Lima S.R.L.', quitar_sufijos=False) == 'inversiones lima srl'
+    assert indice.por_nombre('inversiones lima sac')['id'] == 1
+    assert indice.por_nombre('Inversiones Lima')['id'] == 1
+    assert indice.por_nombre('Inversiones Lima S.R.L.') is None
+    assert indice.buscar('Inversiones Lima S.R.L.')[0]['similitud'] == 1  # los trigramas no ven el sufijo
+    assert indice.por_nombre('Minera Andina S.R.L.')['id'] == 3
+    assert indice.por_nombre('Minera Andina') is None
+
+    monkeypatch.setattr(db, '_indice_empresas', indice)
+    monkeypatch.setattr(db, '_obtener_conexion', lambda: None)
+    assert db.obtener_empresa_id('Inversiones Lima S.R.L.') is None
+
+    class _MensajeFalso:
+        def __init__(self, texto):
+            self.text = texto
+            self.textos = []
+        def reply_text(self, texto, reply_markup=None):
+            self.textos.append(texto)
+
+    class _Falso:
+        def __init__(self, **atributos):
+            self.__dict__.update(atributos)
+
+    def escribir(texto):
+        context = _Falso(user_data={})
+        estado = telegram_bot.recibir_empresa(_Falso(message=_MensajeFalso(texto)), context)
+        return estado, context.user_data
+
+    estado, user_data = escribir('Inversiones Lima S.A.C.')
+    assert estado == telegram_bot.RUC_EMPRESA and user_data['empresa_id'] == 1
+    for texto in ('Inversiones Lima S.R.L.', 'Minera Andina'):
+        estado, user_data = escribir(texto)
+        assert estado == telegram_bot.EMPRESA and 'empresa_id' not in user_data
+
+def test_empresas_async(monkeypatch):
+    """La versión asíncrona busca por RUC con la misma consulta y guarda el RUC de las empresas nuevas"""
+    import asyncio
+    from services import database_async
+    from services import database_service as db
+
+    class _CursorFalso:
+        lastrowid = 7
+        async def __aenter__(self):
+            return self
+        async def __aexit__(self, *exc):
+            return False
+        async def execute(self, query, parametros):
+            ejecutadas.append((query, parametros))
+
+    class _ConexionFalsa:
+        def cursor(self):
+            return _CursorFalso()
+
+    async def get_connection():
+        return _ConexionFalsa()
+
+    async def _consultar(query, parametros=(), todas=False):
+        ejecutadas.append((query, parametros))
+        return (5, 'Minera Andina S.A.', None, None, None)
+
+    ejecutadas = []
+    monkeypatch.setattr(db, '_indice_empresas', IndiceEmpresas(lambda ultimo_id: [], refrescar_tras=3600))
+    monkeypatch.setattr(database_async, 'get_connection', get_connection)
+    monkeypatch.setattr(database_async, 'liberar_conexion', lambda connection: None)
+    monkeypatch.setattr(database_async, '_consultar', _consultar)
+
+    empresa = asyncio.run(database_async.obtener_empresa_por_ruc('Minera Andina S.A.'))
+    assert ejecutadas == [(db.SQL_EMPRESA_POR_RUC, ('Minera Andina S.A.', 'Minera Andina S.A.'))]
+    assert empresa == {'id': 5, 'nombre': 'Minera Andina S.A.', 'direccion': None,
+                       'contacto_email': None, 'ruc': 'Minera Andina S.A.'}
+
+    ejecutadas.clear()
+    assert asyncio.run(database_async.crear_empresa('20987654321', 'Agro Sur', 'Av. Lima 1', None)) == 7
+    assert ejecutadas[0][1] == ('Agro Sur', '20987654321', 'Av. Lima 1', None)
+    assert asyncio.run(database_async.obtener_empresa_por_ruc('20987654321'))['id'] == 7
+    assert len(ejecutadas) == 1  # la empresa nueva se encuentra en el índice
+    assert asyncio.run(database_async.obtener_empresa_id('AGRO SUR')) == 7
+    assert len(ejecutadas) == 1  # también por nombre, sin consultar la base de datos
+
+def test_capa_async(monkeypatch, tmp_path):
+    """Páginas, ciclo de vida de la carta y exportación en la versión asíncrona"""
+    import asyncio
+    from pymysql.err import IntegrityError
+    from config import Config
+    from services import database_async
+    from services import database_service as db
+
+    class _CursorFalso:
+        def __init__(self, conexion):
+            self.conexion = conexion
+            self.lastrowid = 12
+            self.rowcount = 1
+        async def __aenter__(self):
+            return self
+        async def __aexit__(self, *exc):
+            return False
+        def __await__(self):
+            yield from []
+            return self
+        async def execute(self, query, parametros):
+            self.conexion.ejecutadas.append(query)
+            if query == db.SQL_INSERTAR_SOLICITUD_PENDIENTE and self.conexion.duplicada:
+                raise IntegrityError(database_async.ER_DUP_ENTRY, "Duplicate entry")
+        async def fetchone(self):
+            return (9, 's3://bucket/cartas/carta.pdf', 'generada')
+        async def fetchmany(self, tamano):
+            lote, self.conexion.filas = self.conexion.filas[:tamano], self.conexion.filas[tamano:]
+            return lote
+        async def close(self):
+            pass
+
+    class _ConexionFalsa:
+        def __init__(self, duplicada=False, filas=()):
+            self.duplicada = duplicada
+            self.filas = list(filas)
+            self.ejecutadas = []
+            self.transaccion = []
+            self.cerrada = False
+        def cursor(self, clase=None):
+            return _CursorFalso(self)
+        async def begin(self):
+            self.transaccion.append('begin')
+        async def commit(self):
+            self.transaccion.append('commit')
+        async def rollback(self):
+            self.transaccion.append('rollback')
+        def close(self):
+            self.cerrada = True
+
+    conexiones = []
+    async def get_connection():
+        return conexiones.pop(0)
+
+    consultas = []
+    async def _consultar(query, parametros=(), todas=False):
+        consultas.append((query, parametros))
+        return [(1, 'a'), (2, 'b'), (3, 'c')][:parametros[-1]]
+
+    monkeypatch.setattr(Config, 'CACHE_MARCA_CONSULTAS', str(tmp_path / '.cache_consultas'))
+    monkeypatch.setattr(db, '_cache_paginas', CacheTTL(max_entradas=10))
+    monkeypatch.setattr(database_async, 'get_connection', get_connection)
+    monkeypatch.setattr(database_async, 'liberar_conexion', lambda connection: None)
+    monkeypatch.setattr(database_async, '_consultar', _consultar)
+
+    pagina, siguiente = asyncio.run(database_async.consultar_oportunidades_pagina(2))
+    assert pagina == [('a',), ('b',)] and decodificar_token_pagina(siguiente) == 2
+    assert asyncio.run(database_async.consultar_oportunidades_pagina(2)) == (pagina, siguiente)
+    assert len(consultas) == 1  # la segunda vez sale de la caché de páginas compartida
+    assert asyncio.run(database_async.consultar_cartas_pagina(1, 5)) == ([(1, 'a'), (2, 'b'), (3, 'c')], None)
+
+    nueva, duplicada = _ConexionFalsa(), _ConexionFalsa(duplicada=True)
+    conexiones.extend([nueva, duplicada])
+    inicio = asyncio.run(database_async.iniciar_carta(1, 2, '2025-03-01'))
+    assert inicio['estado'] == 'nueva' and inicio['solicitud_id'] == 12 and inicio['estado_anterior'] is None
+    assert nueva.transaccion == ['begin', 'commit']
+    assert asyncio.run(database_async.iniciar_carta(1, 2, '2025-03-01')) == \
+        {'estado': 'duplicada', 'solicitud_id': 9, 'ruta_pdf': 's3://bucket/cartas/carta.pdf'}
+    assert duplicada.transaccion == ['begin', 'rollback']
+
+    escrituras = _ConexionFalsa()
+    conexiones.extend([escrituras, escrituras])
+    assert asyncio.run(database_async.completar_carta(12, 'static/cartas/carta.pdf'))
+    assert asyncio.run(database_async.cancelar_carta(12, inicio['iniciada_en']))
+    assert escrituras.ejecutadas == [db.SQL_COMPLETAR_SOLICITUD, db.SQL_CANCELAR_SOLICITUD]
+
+    async def exportar(leer):
+        filas = await database_async.exportar_solicitudes_carta('2025-01-01', tamano_lote=2)
+        leidas = []
+        async for fila in filas:
+            leidas.append(fila)
+            if len(leidas) == leer:
+                break
+        await filas.aclose()
+        return leidas
+
+    completa, parcial = _ConexionFalsa(filas=[(1,), (2,), (3,)]), _ConexionFalsa(filas=[(1,), (2,), (3,)])
+    conexiones.extend([completa, parcial])
+    assert asyncio.run(exportar(None)) == [(1,), (2,), (3,)] and not completa.cerrada
+    assert asyncio.run(exportar(1)) == [(1,)] and parcial.cerrada  # con filas sin leer no vuelve al pool
+
+def test_capa_async_cancelacion_y_escrituras(monkeypatch, tmp_path):
+    """Una carga cancelada no deja colgados a los demás y las escrituras invalidan las cachés compartidas"""
+    import asyncio
+    from config import Config
+    from services import database_async
+    from services import database_service as db
+
+    cache = CacheTTL(max_entradas=10)
+    cargas = []
+    async def cargar():
+        cargas.append(1)
+        if len(cargas) == 1:
+            await asyncio.sleep(10)
+        return 'valor'
+
+    async def cancelar_la_primera():
+        primera = asyncio.create_task(database_async._obtener_o_cargar(cache, 'clave', cargar))
+        await asyncio.sleep(0)
+        segunda = asyncio.create_task(database_async._obtener_o_cargar(cache, 'clave', cargar))
+        await asyncio.sleep(0)
+        primera.cancel()
+        return await asyncio.wait_for(segunda, timeout=2)
+
+    assert asyncio.run(cancelar_la_primera()) == 'valor'
+    assert len(cargas) == 2 and database_async._cargas_en_curso == {}
+
+    escrituras = []
+    async def _escribir(query, parametros):
+        escrituras.append((query, parametros))
+        return 1
+    async def _insertar(query, parametros):
+        escrituras.append((query, parametros))
+        return 7
+    async def _consultar(query, parametros=(), todas=False):
+        return [(1, 'A1', '1', 'Ana')] if parametros == ['A1'] else []
+    monkeypatch.setattr(Config, 'CACHE_MARCA_CONSULTAS', str(tmp_path / '.cache_consultas'))
+    monkeypatch.setattr(database_async, '_escribir', _escribir)
+    monkeypatch.setattr(database_async, '_insertar', _insertar)
+    monkeypatch.setattr(database_async, '_consultar', _consultar)
+    invalidaciones = []
+    monkeypatch.setattr(db, 'invalidar_fechas_criticas', lambda: invalidaciones.append('fechas'))
+    monkeypatch.setattr(db, 'invalidar_oportunidades_practicas', lambda: invalidaciones.append('oportunidades'))
+
+    assert asyncio.run(database_async.crear_fecha_critica('Informe final', '2025-07-01')) == 7
+    assert asyncio.run(database_async.actualizar_estado_fecha_critica(7, 'completada'))
+    assert asyncio.run(database_async.crear_oportunidad_practica(1, 'Backend', '2025-04-01', '2025-08-01')) == 7
+    assert asyncio.run(database_async.actualizar_estado_oportunidad(7, 'inactivo'))
+    assert invalidaciones == ['fechas', 'fechas', 'oportunidades', 'oportunidades']
+    assert [query for query, _ in escrituras] == [db.SQL_CREAR_FECHA_CRITICA, db.SQL_ESTADO_FECHA_CRITICA,
+                                                 db.SQL_CREAR_OPORTUNIDAD, db.SQL_ESTADO_OPORTUNIDAD]
+    assert asyncio.run(database_async.consultar_estudiantes_para_cartas(['A1', 'B2'], tamano_lote=1)) == \
+        {'A1': {'id': 1, 'codigo': 'A1', 'dni': '1', 'nombres': 'Ana'}}
+
+    # Desde un hilo: la corrutina corre en el event loop propio de la capa
+    futuro = database_async.ejecutar_en_segundo_plano(database_async.crear_fecha_critica('Otra', '2025-07-02'))
+    assert futuro.result(timeout=5) == 7
+
+def test_plantilla_carta():
+    """La plantilla compartida genera el mismo PDF en cada uso y no reutiliza los párrafos ya maquetados"""
+    import io
+    from reportlab import rl_config
+    estudiante = {'codigo': '20210001', 'dni': '12345678', 'nombres': 'Ana', 'apellidos': 'Ríos',
+                  'carrera': 'Ingeniería de Sistemas', 'ciclo': '8vo'}
+    empresa = {'nombre': 'Tech Solutions S.A.C.', 'ruc': '20123456789', 'direccion': 'Av. Arequipa 123'}
+    plantilla = PlantillaCarta()
+    anterior, rl_config.invariant = rl_config.invariant, 1
+    try:
+        pdfs = []
+        for _ in range(2):
+            story = plantilla.historia_presentacion(estudiante, empresa, "1 de marzo de 2025")
+            assert not any(f is g for f in story for g in plantilla.fragmentos['firma_director'])
+            destino = io.BytesIO()
+            plantilla.construir(story, destino)
+            pdfs.append(destino.getvalue())
+    finally:
+        rl_config.invariant = anterior
+    assert pdfs[0].startswith(b'%PDF') and pdfs[0] == pdfs[1]
+
+def test_generar_carta_en_memoria():
+    """La carta recién generada se devuelve en memoria; la reutilizada se lee del archivo guardado"""
+    from carta_generator import generar_carta, leer_carta, eliminar_carta
+    estudiante = {'codigo': 'MEM1', 'dni': '1', 'nombres': 'Ana'}
+    empresa = {'nombre': 'Acme', 'ruc': '20', 'direccion': 'Av. 1'}
+    ruta, datos = generar_carta('presentacion', estudiante, empresa, "1 de marzo de 2025")
+    try:
+        assert datos.startswith(b'%PDF')
+        assert generar_carta('presentacion', estudiante, empresa, "1 de marzo de 2025") == (ruta, None)
+        assert leer_carta(ruta) == datos
+    finally:
+        eliminar_carta(ruta)
+    assert leer_carta(ruta) is None
+
+def test_generar_carta_s3(monkeypatch):
+    """Con SAVE_LOCAL = False una carta ya subida a S3 no se vuelve a generar ni a subir"""
+    import carta_generator
+    from config import Config
+
+    subidas = {}
+    def subir_bytes_s3(datos, clave):
+        subidas[carta_generator.ruta_s3(clave)] = datos
+        return carta_generator.ruta_s3(clave)
+
+    monkeypatch.setattr(Config, 'SAVE_LOCAL', False)
+    monkeypatch.setattr(carta_generator, 'existe_s3', lambda ruta: ruta in subidas)
+    monkeypatch.setattr(carta_generator, 'subir_bytes_s3', subir_bytes_s3)
+    estudiante = {'codigo': 'S3A', 'dni': '1', 'nombres': 'Ana'}
+    empresa = {'nombre': 'Acme', 'ruc': '20', 'direccion': 'Av. 1'}
+    ruta, datos = carta_generator.generar_carta('presentacion', estudiante, empresa, "1 de marzo de 2025")
+    assert ruta.startswith('s3://') and subidas == {ruta: datos}
+    monkeypatch.setattr(carta_generator, 'subir_bytes_s3', None)  # fallaría si se volviera a subir
+    assert carta_generator.generar_carta('presentacion', estudiante, empresa, "1 de marzo de 2025") == (ruta, None)
+
+def test_carta_con_membrete():
+    """Sobre el membrete se obtiene el mismo texto en las mismas posiciones; un campo enorme usa Platypus"""
+    import io
+    from pypdf import PdfReader
+
+    def textos(pdf):
+        encontrados = []
+        for numero, pagina in enumerate(PdfReader(io.BytesIO(pdf)).pages):
+            pagina.extract_text(visitor_text=lambda texto, cm, tm, fuente, tamano: encontrados.append(
+                (numero, texto, round(cm[4] + tm[4], 2), round(cm[5] + tm[5], 2))) if texto.strip() else None)
+        return sorted(encontrados)
+
+    estudiante = {'codigo': '20210001', 'dni': '12345678', 'nombres': 'Ana', 'apellidos': 'Ríos',
+                  'carrera': 'Ingeniería de Sistemas', 'ciclo': '8vo'}
+    empresa = {'nombre': 'Tech Solutions S.A.C.', 'ruc': '20123456789', 'direccion': 'Av. Arequipa 123',
+               'gerente_general': 'Dr. Juan Pérez'}
+    plantilla = PlantillaCarta()
+    for historia in (plantilla.historia_presentacion, plantilla.historia_estudiante):
+        completa, rapida = io.BytesIO(), io.BytesIO()
+        plantilla.construir(historia(estudiante, empresa, "1 de marzo de 2025"), completa)
+        assert plantilla.construir_con_membrete(historia.__name__, historia(estudiante, empresa, "1 de marzo de 2025"), rapida)
+        assert textos(rapida.getvalue()) == textos(completa.getvalue())
+
+    enorme = dict(estudiante, carrera='Ingeniería ' * 400)
+    destino = io.BytesIO()
+    assert not plantilla.construir_con_membrete('presentacion', plantilla.historia_presentacion(enorme, empresa, "hoy"), destino)
+    assert destino.getvalue() == b''
+
+def test_plantillas_cartas():
+    """Una plantilla nueva en JSON se genera sin código; las plantillas y los datos se validan antes"""
+    import io
+    import json
+    import os
+    import shutil
+    import tempfile
+    import pytest
+    from config import Config
+    from services.plantillas_cartas import cargar_registro, PlantillaInvalidaError, DatosCartaError
+
+    aceptacion = {
+        'campos': {'estudiante': {'requeridos': ['nombres']}, 'empresa': {'requeridos': ['nombre'],
+                                                                          'opcionales': ['gerente_general']}},
+        'estilos': {'nota': {'padre': 'Normal', 'fontSize': 9, 'alignment': 'derecha'}},
+        'bloques': [
+            {'fragmento': 'despedida'},
+            {'texto': '<b>{empresa[nombre]}</b> acepta a {estudiante[nombres]}.'},
+            {'texto': 'Firma: {empresa[gerente_general]}', 'si': 'empresa.gerente_general', 'estilo': 'nota'},
+        ],
+    }
+    with tempfile.TemporaryDirectory() as directorio:
+        shutil.copy(os.path.join(Config.CARTAS_PLANTILLAS, 'comunes.json'), directorio)
+        with open(os.path.join(directorio, 'aceptacion.json'), 'w', encoding='utf-8') as archivo:
+            json.dump(aceptacion, archivo)
+        plantilla = PlantillaCarta(cargar_registro(directorio))
+        story = plantilla.historia('aceptacion', {'nombres': 'Ana'}, {'nombre': 'Acme'}, 'hoy')
+        assert [getattr(f, 'text', None) for f in story][-1] == '<b>Acme</b> acepta a Ana.'
+        assert plantilla.construir_con_membrete('aceptacion', story, io.BytesIO())
+        with pytest.raises(DatosCartaError):
+            plantilla.historia('aceptacion', {'nombres': ' '}, {'nombre': 'Acme'}, 'hoy')
+        with pytest.raises(ValueError):
+            plantilla.historia('certificado', {'nombres': 'Ana'}, {'nombre': 'Acme'}, 'hoy')
+
+        for cambio in ({'texto': 'DNI {estudiante[dni]}'}, {'fragmento': 'no_existe'}, {'texto': 'x', 'estilo': 'otro'},
+                       {'texto': '{empresa.nombre}'}, {'espacio': 10, 'si': 'empresa.nombre'}):
+            with open(os.path.join(directorio, 'aceptacion.json'), 'w', encoding='utf-8') as archivo:
+                json.dump(dict(aceptacion, bloques=aceptacion['bloques'] + [cambio]), archivo)
+            with pytest.raises(PlantillaInvalidaError):
+                cargar_registro(directorio)
+
+def test_benchmark_regresiones():
+    """Solo cuenta como regresión lo que empeora más que la tolerancia, en la dirección de cada métrica"""
+    from benchmark_cartas import comparar_con_base, percentil
+    assert percentil([5, 1, 4, 2, 3], 0.5) == 3 and percentil([5, 1, 4, 2, 3], 0.99) == 5
+    base = {'presentacion.latencia_p99_ms': 10.0, 'lote_4_procesos.cartas_por_segundo': 100.0,
+            'presentacion.tamano_max_bytes': 4000, 'lote_4_procesos.fallidas': 0, 'ya_no_existe': 1.0}
+    metricas = {'presentacion.latencia_p99_ms': 13.0, 'lote_4_procesos.cartas_por_segundo': 70.0,
+                'presentacion.tamano_max_bytes': 4100, 'lote_4_procesos.fallidas': 3}
+    regresiones = comparar_con_base(metricas, base, 0.2)
+    assert [nombre for nombre, *_ in regresiones] == ['presentacion.latencia_p99_ms', 'lote_4_procesos.cartas_por_segundo']
+    assert comparar_con_base(metricas, base, 0.5) == []
+
+def test_servicio_render():
+    """Trabajos con la misma clave se comparten, la cola llena rechaza y al terminar se avisa"""
+    import os
+    servicio = ServicioRender(procesos=1, max_pendientes=1)
+    terminado = threading.Event()
+    estudiante = {'codigo': 'T1', 'dni': '1', 'nombres': 'Ana', 'apellidos': 'Ríos', 'carrera': 'Sistemas', 'ciclo': '8vo'}
+    empresa = {'nombre': 'Acme', 'ruc': 'PRUEBA', 'direccion': 'Av. 1'}
+    try:
+        avisos = []
+        trabajo = servicio.encolar('estudiante', estudiante, empresa, clave='a', al_terminar=lambda t: avisos.append(1))
+        # El segundo pedido comparte el trabajo y también recibe el aviso
+        segundo = servicio.encolar('estudiante', estudiante, empresa, clave='a',
+                                   al_terminar=lambda t: (avisos.append(2), terminado.set()))
+        assert segundo is trabajo
+        try:
+            servicio.encolar('estudiante', estudiante, empresa, clave='b')
+            assert False, "se esperaba la cola llena"
+        except ColaLlenaError:
+            pass
+        assert terminado.wait(60) and avisos == [1, 2]
+        estado = servicio.consultar(trabajo.id)
+        assert estado['estado'] == 'lista' and os.path.exists(estado['ruta_pdf'])
+        os.remove(estado['ruta_pdf'])
+        assert servicio.estadisticas()['rechazados'] == 1
+    finally:
+        servicio.cerrar()
+
+def test_aviso_carta_sin_pdf(monkeypatch):
+    """Si el PDF no se puede leer se avisa con un mensaje en lugar de enviar un documento vacío"""
+    import telegram_bot
+    from services.render_service import Trabajo
+
+    class _BotFalso:
+        def __init__(self):
+            self.mensajes = []
+            self.documentos = []
+        def send_message(self, chat_id, text):
+            self.mensajes.append(text)
+        def send_document(self, **kwargs):
+            self.documentos.append(kwargs)
+
+    monkeypatch.setattr(telegram_bot, 'leer_carta', lambda ruta_pdf: None)
+    bot = _BotFalso()
+    user_data = {}
+    trabajo = Trabajo()
+    trabajo.estado, trabajo.ruta_pdf = 'lista', 'static/cartas/ab/cd/carta.pdf'
+    telegram_bot.avisar_carta_lista(bot, 1, user_data)(trabajo)
+    assert bot.documentos == [] and len(bot.mensajes) == 1
+    assert trabajo.estado == 'lista' and user_data['ruta_pdf'] == trabajo.ruta_pdf
+
+def test_descargar_carta_por_id(monkeypatch):
+    """El botón de descarga lleva el id de la solicitud y solo entrega cartas del estudiante de la conversación"""
+    import os
+    import telegram_bot
+
+    class _MensajeFalso:
+        def __init__(self):
+            self.documentos = []
+            self.textos = []
+            self.botones = []
+        def reply_text(self, texto, reply_markup=None):
+            self.textos.append(texto)
+            if reply_markup is not None:
+                self.botones.extend(boton for fila in reply_markup.inline_keyboard for boton in fila)
+        def reply_document(self, document, filename, caption):
+            self.documentos.append((document, filename))
+
+    class _ConsultaFalsa:
+        def __init__(self, data):
+            self.data = data
+            self.message = _MensajeFalso()
+        def answer(self):
+            pass
+
+    class _Falso:
+        def __init__(self, **atributos):
+            self.__dict__.update(atributos)
+
+    ruta_larga = 'static/cartas/ab/cd/carta_presentacion_20210001_0123456789abcdef01234567.pdf'
+    cartas = {(41, 1): ruta_larga}
+    monkeypatch.setattr(telegram_bot, 'consultar_cartas_pagina',
+                        lambda estudiante_id, limite, despues: ([(41, 'Tech Solutions S.A.C.', ruta_larga)], None))
+    monkeypatch.setattr(telegram_bot, 'obtener_ruta_carta',
+                        lambda solicitud_id, estudiante_id: cartas.get((solicitud_id, estudiante_id)))
+    monkeypatch.setattr(telegram_bot, 'leer_carta', lambda ruta_pdf: b'%PDF' if ruta_pdf else None)
+    monkeypatch.setattr(telegram_bot, 'mostrar_menu_final', lambda update, context: None)
+    monkeypatch.setattr(telegram_bot.Config, 'DB_BACKEND', 'sqlite')
+
+    mensaje = _MensajeFalso()
+    telegram_bot.enviar_pagina_cartas(mensaje, 1)
+    data = mensaje.botones[0].callback_data
+    assert data == 'descargar_carta|41' and len(data.encode()) <= 64
+
+    def pulsar(data, user_data):
+        consulta = _ConsultaFalsa(data)
+        telegram_bot.descargar_carta_callback(_Falso(callback_query=consulta), _Falso(user_data=user_data))
+        return consulta.message
+
+    assert pulsar(data, {'estudiante_id': 1}).documentos == [(b'%PDF', os.path.basename(ruta_larga))]
+    assert pulsar(data, {'estudiante_id': 2}).documentos == []  # carta de otro estudiante
+    assert pulsar(data, {}).documentos == []
+    assert pulsar(f'descargar_carta|{ruta_larga}', {'estudiante_id': 1}).documentos == []
+
+    # Con MySQL la consulta y el envío corren en el event loop de database_async
+    async def obtener_ruta_async(solicitud_id, estudiante_id):
+        return cartas.get((solicitud_id, estudiante_id))
+    monkeypatch.setattr(telegram_bot.Config, 'DB_BACKEND', 'mysql')
+    monkeypatch.setattr(telegram_bot.database_async, 'obtener_ruta_carta', obtener_ruta_async)
+    consulta = _ConsultaFalsa(data)
+    futuro = telegram_bot.descargar_carta_callback(_Falso(callback_query=consulta), _Falso(user_data={'estudiante_id': 1}))
+    futuro.result(timeout=5)
+    assert consulta.message.documentos == [(b'%PDF', os.path.basename(ruta_larga))]
+
+def test_cache_cartas():
+    """Un nombre ya generado no se vuelve a generar y la limpieza respeta el tamaño máximo"""
+    import os
+    import tempfile
+    from carta_generator import clave_carta
+    estudiante = {'codigo': 'A1', 'nombres': 'Ana  Ríos', 'dni': '1'}
+    empresa = {'nombre': 'Acme', 'ruc': '20', 'direccion': 'Av. 1'}
+    assert clave_carta('presentacion', estudiante, empresa, 'hoy') == \
+        clave_carta('presentacion', dict(estudiante, nombres=' Ana Ríos'), empresa, 'hoy')
+    assert clave_carta('presentacion', estudiante, empresa, 'hoy') != clave_carta('presentacion', estudiante, empresa, 'mañana')
+
+    with tempfile.TemporaryDirectory() as directorio:
+        cache = CacheArchivos(directorio, max_bytes=25, intervalo_limpieza=3600)
+        generaciones = []
+
+        def generar(destino):
+            generaciones.append(destino)
+            with open(destino, 'wb') as archivo:
+                archivo.write(b'x' * 10)
+
+        ruta = cache.obtener_o_generar('a.pdf', generar)
+        assert cache.obtener_o_generar('a.pdf', generar) == ruta and len(generaciones) == 1
+        for nombre in ('b.pdf', 'c.pdf'):
+            cache.obtener_o_generar(nombre, generar)
+            time.sleep(0.01)
+        os.utime(ruta, (0, 0))  # 'a.pdf' es la usada hace más tiempo
+        with open(os.path.join(directorio, 'nota.txt'), 'w') as archivo:
+            archivo.write('no es de la caché')
+        os.utime(os.path.join(directorio, 'nota.txt'), (0, 0))
+        assert cache.limpiar() == 1
+        assert sorted(os.listdir(directorio)) == ['b.pdf', 'c.pdf', 'nota.txt']
+
+def test_almacen_cartas():
+    """Las cartas van a subcarpetas por hash y el manifiesto guía la limpieza y las huérfanas"""
+    import os
+    import tempfile
+    from services.almacen_cartas import ManifiestoCartas, ruta_fragmentada
+    from services.database_service import SQL_EXPIRAR_CARTA, SQL_MOVER_CARTA
+
+    with tempfile.TemporaryDirectory() as directorio:
+        manifiesto = ManifiestoCartas(os.path.join(directorio, 'manifiesto.sqlite3'))
+        cache = CacheArchivos(os.path.join(directorio, 'cartas'), max_bytes=25, niveles=2, manifiesto=manifiesto)
+
+        def generar(destino):
+            with open(destino, 'wb') as archivo:
+                archivo.write(b'x' * 10)
+
+        rutas = [cache.obtener_o_generar(nombre, generar) for nombre in ('a.pdf', 'b.pdf', 'c.pdf')]
+        assert rutas[0] == ruta_fragmentada(cache.directorio, 'a.pdf') and os.path.exists(rutas[0])
+        assert len(os.path.relpath(rutas[0], cache.directorio).split(os.sep)) == 3
+        assert [entrada.name for entrada, _ in cache.recorrer_archivos()].count('a.pdf') == 1
+        manifiesto.asociar(1, rutas[0])
+        manifiesto.asociar(2, rutas[1])
+        manifiesto.registrar(rutas[0], 10, usado=0)  # 'a.pdf' es la usada hace más tiempo
+
+        assert cache.limpiar() == 1 and not os.path.exists(rutas[0])
+        assert manifiesto.estadisticas()['archivos'] == 2
+        assert manifiesto.huerfanas() == [(1, os.path.normpath(rutas[0]))]
+        recorridas = [ruta for ruta, _, _ in manifiesto.recorrer_por_uso(tamano_lote=1)]
+        assert sorted(recorridas) == sorted(os.path.normpath(ruta) for ruta in rutas[1:])
+        manifiesto.cerrar()
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES ('A1', '1', 'Ana')")
+    cursor.execute("INSERT INTO empresas (nombre) VALUES ('Acme')")
+    cursor.execute("INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf, estado) "
+                   "VALUES (1, 1, '2024-01-01', 'a.pdf', 'generada')")
+    cursor.execute(SQL_MOVER_CARTA, ('otra.pdf', 1, 'b.pdf'))
+    assert cursor.rowcount == 0, "Solo cambia la ruta si sigue siendo la leída"
+    cursor.execute(SQL_EXPIRAR_CARTA, (1, 'a.pdf'))
+    cursor.execute("SELECT ruta_pdf, estado FROM solicitudes_carta")
+    assert cursor.fetchall() == [(None, 'expirada')]
+    conexion.close()
+
+def test_registro_cartas_masivas():
+    """El registro masivo inserta las cartas nuevas y actualiza la ruta de las que ya existían"""
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.executemany("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", [('A1', '1', 'Ana'), ('B2', '2', 'Beto')])
+    cursor.execute("INSERT INTO empresas (nombre) VALUES (%s)", ('Acme',))
+    cursor.execute("INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud) VALUES (1, 1, '2024-01-01')")
+    cursor.executemany(SQL_REGISTRAR_CARTAS['sqlite'], [
+        (1, 1, '2024-03-01', 'a.pdf', 'generada'),
+        (2, 1, '2024-03-01', 'b.pdf', 'generada'),
+    ])
+    cursor.execute("SELECT estudiante_id, fecha_solicitud, ruta_pdf, estado FROM solicitudes_carta ORDER BY estudiante_id")
+    filas = cursor.fetchall()
+    assert [(f[0], str(f[1]), f[2], f[3]) for f in filas] == [
+        (1, '2024-03-01', 'a.pdf', 'generada'), (2, '2024-03-01', 'b.pdf', 'generada')
+    ]
+    conexion.close()
+
+def test_cartas_masivas_en_manifiesto(monkeypatch, tmp_path):
+    """Las cartas del lote quedan asociadas a su solicitud en el manifiesto"""
+    import os
+    import carta_generator
+    from config import Config
+    from services import database_service as db
+    from services.almacen_cartas import ManifiestoCartas
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.executemany("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", [('A1', '1', 'Ana'), ('B2', '2', 'Beto')])
+    cursor.execute("INSERT INTO empresas (nombre) VALUES (%s)", ('Acme',))
+    cursor.execute("INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud) VALUES (1, 1, '2024-01-01')")
+    conexion.commit()
+    monkeypatch.setattr(Config, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+
+    a, b = str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')
+    registradas = db.registrar_cartas_masivas(
+        [(1, 1, '2024-03-01', a), (2, 1, '2024-03-01', b), (2, 1, '2024-03-01', 's3://bucket/c.pdf')], tamano_lote=2
+    )
+    cursor.execute("SELECT id, ruta_pdf FROM solicitudes_carta ORDER BY id")
+    assert sorted(registradas) == cursor.fetchall() and len(registradas) == 2
+    solicitud_a = [solicitud_id for solicitud_id, ruta in registradas if ruta == a][0]
+
+    manifiesto = ManifiestoCartas(str(tmp_path / 'manifiesto.db'))
+    monkeypatch.setattr(carta_generator, 'obtener_cache_cartas', lambda: type('Cache', (), {'manifiesto': manifiesto}))
+    carta_generator.asociar_cartas(registradas)
+    assert manifiesto.ruta_solicitud(solicitud_a) == os.path.normpath(a)
+    assert manifiesto.solicitudes_de(b) == []  # la carta de B2 terminó en S3, que no se anota
+    manifiesto.cerrar()
+    conexion.close()
+
+def test_importador_masivo(monkeypatch, tmp_path):
+    """Cuenta insertadas y actualizadas, marca el archivo como terminado y refresca índice y horas"""
+    import os
+    from decimal import Decimal
+    import importador_masivo
+    from config import Config
+    from services import database_service as db
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", ('A1', '1', 'Ana'))
+    cursor.execute("INSERT INTO empresas (nombre, ruc) VALUES (%s, %s)", ('Acme SAC', '20100000001'))
+    conexion.commit()
+    monkeypatch.setattr(Config, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(Config, 'CACHE_MARCA_ESTUDIANTES', str(tmp_path / '.cache_estudiantes'))
+    monkeypatch.setattr(Config, 'CACHE_MARCA_EMPRESAS', str(tmp_path / '.cache_empresas'))
+    monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+    monkeypatch.setattr(db, '_indice_empresas', None)
+
+    estudiantes = tmp_path / 'estudiantes.csv'
+    estudiantes.write_text("codigo,dni,nombre\nA1,1,Ana María\nB2,2,Beto\nB2,2,Beto B.\nC3,,Sin DNI\n", encoding='utf-8')
+    resultado = importador_masivo.importar('estudiantes', str(estudiantes), tamano_lote=2)
+    assert (resultado['insertadas'], resultado['actualizadas'], resultado['rechazadas']) == (1, 2, 1)
+    cursor.execute("SELECT codigo, nombre FROM estudiantes ORDER BY codigo")
+    assert cursor.fetchall() == [('A1', 'Ana María'), ('B2', 'Beto B.')]
+
+    # Terminado: no se vuelve a importar; si el archivo cambia, sí
+    resultado = importador_masivo.importar('estudiantes', str(estudiantes))
+    assert (resultado['insertadas'], resultado['actualizadas'], resultado['omitidas']) == (0, 0, 4)
+    estudiantes.write_text("codigo,dni,nombre\nD4,4,Dora\n", encoding='utf-8')
+    resultado = importador_masivo.importar('estudiantes', str(estudiantes))
+    assert (resultado['insertadas'], resultado['omitidas']) == (1, 0)
+    cursor.execute("SELECT COUNT(*) FROM importaciones_progreso WHERE terminado = 1")
+    assert cursor.fetchone()[0] == 2
+
+    # Las empresas actualizadas se ven en el índice sin esperar a la reconstrucción
+    assert db.obtener_empresa_id('Acme SAC') == 1
+    empresas = tmp_path / 'empresas.jsonl'
+    empresas.write_text('{"nombre": "Acme SAC", "ruc": "20100000099"}\n{"nombre": "Beta"}\n', encoding='utf-8')
+    resultado = importador_masivo.importar('empresas', str(empresas))
+    assert (resultado['insertadas'], resultado['actualizadas']) == (1, 1)
+    assert db._buscar_en_indice(lambda indice: indice.por_ruc('20100000099'))['id'] == 1
+    assert os.path.exists(Config.CACHE_MARCA_EMPRESAS)
+
+    # Sin el trigger de inserción los totales quedarían desfasados: se recalculan
+    cursor.execute("INSERT INTO estudiantes_empresas (estudiante_id, empresa_id) VALUES (1, 1)")
+    cursor.execute("DROP TRIGGER trg_practicas_horas_insert")
+    conexion.commit()
+    practicas = tmp_path / 'practicas.csv'
+    practicas.write_text("estudiante_empresa_id,horas\n1,10\n1,5.5\n", encoding='utf-8')
+    resultado = importador_masivo.importar('practicas', str(practicas))
+    assert resultado['insertadas'] == 2
+    cursor.execute("SELECT total_horas FROM horas_estudiante WHERE estudiante_id = 1")
+    assert cursor.fetchone()[0] == Decimal('15.5')
+    conexion.close()
+
+def test_aplicar_migraciones(monkeypatch):
+    """Se registran las migraciones aplicadas y una que falla se reintenta en la siguiente ejecución"""
+    import migraciones
+    from services import database_service as db
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+    ejecutadas = []
+
+    def fallar(cursor):
+        cursor.execute("UPDATE estudiantes SET nombre = 'x'")
+        raise RuntimeError("fallo a medias")
+
+    monkeypatch.setattr(migraciones, 'MIGRACIONES', [
+        (1, "Primera", lambda cursor: ejecutadas.append(1)),
+        (2, "Segunda", fallar),
+    ])
+    cursor = conexion.cursor()
+    cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", ('A1', '1', 'Ana'))
+    conexion.commit()
+    assert migraciones.aplicar_migraciones() is False
+    cursor.execute("SELECT version FROM schema_migrations")
+    assert cursor.fetchall() == [(1,)]
+    cursor.execute("SELECT nombre FROM estudiantes")
+    assert cursor.fetchone()[0] == 'Ana'
+
+    monkeypatch.setattr(migraciones, 'MIGRACIONES', [
+        (1, "Primera", lambda cursor: ejecutadas.append(1)),
+        (2, "Segunda", lambda cursor: ejecutadas.append(2)),
+    ])
+    assert migraciones.aplicar_migraciones() is True
+    assert migraciones.aplicar_migraciones() is True
+    assert ejecutadas == [1, 2]
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    assert cursor.fetchall() == [(1,), (2,)]
+    conexion.close()
+
+def test_migracion_solicitudes_unicas():
+    """Los estados NULL se rellenan antes del NOT NULL y los duplicados se copian antes de borrarse"""
+    import migraciones
+
+    class _CursorFalso:
+        rowcount = 0
+        def __init__(self):
+            self.ejecutadas = []
+            self._filas = []
+        def execute(self, query, parametros=()):
+            query = ' '.join(query.split())
+            self.ejecutadas.append(query)
+            if 'information_schema.COLUMNS' in query:
+                self._filas = [('id',), ('estudiante_id',), ('empresa_id',), ('ruta_pdf',), ('estado',)]
+            elif 'information_schema.TABLES' in query:
+                self._filas = [(1,)]
+            else:
+                self._filas = []
+        def fetchall(self):
+            return self._filas
+        def fetchone(self):
+            return self._filas[0]
+
+    cursor = _CursorFalso()
+    migraciones._migracion_003_solicitudes_unicas(cursor)
+
+    def posicion(inicio):
+        return next(i for i, query in enumerate(cursor.ejecutadas) if query.startswith(inicio))
+
+    assert posicion("UPDATE solicitudes_carta SET estado = 'pendiente' WHERE estado IS NULL") < posicion(
+        "ALTER TABLE solicitudes_carta MODIFY COLUMN estado")
+    assert posicion("CREATE TABLE IF NOT EXISTS solicitudes_carta_duplicadas") < posicion(
+        "INSERT IGNORE INTO solicitudes_carta_duplicadas") < posicion("DELETE s1 FROM solicitudes_carta")
+    assert "JOIN solicitudes_carta_duplicadas d ON s1.id = d.id" in cursor.ejecutadas[posicion("DELETE s1")]
+
+def test_verificar_planes(monkeypatch):
+    """EXPLAIN marca los recorridos completos por encima del umbral y las consultas que no se pueden explicar"""
+    import migraciones
+    from services.database_service import CONSULTAS_LECTURA
+
+    # Cada consulta registrada trae un parámetro por marcador
+    for nombre, (query, parametros) in CONSULTAS_LECTURA.items():
+        assert query.count('%s') == len(parametros), nombre
+
+    planes = {
+        'SELECT 1': [{'table': 'estudiantes', 'type': 'ref', 'rows': 1}],
+        'SELECT 2': [{'table': 'empresas', 'type': 'ref', 'rows': 1},
+                     {'table': 'practicas', 'type': 'ALL', 'rows': 5000}],
+        'SELECT 3': [{'table': 'fechas_criticas', 'type': 'ALL', 'rows': 20}],
+    }
+
+    class _CursorFalso:
+        def execute(self, query, parametros):
+            consulta = query[len("EXPLAIN "):]
+            if consulta not in planes:
+                raise RuntimeError("sintaxis")
+            self._filas = planes[consulta]
+        def fetchall(self):
+            return self._filas
+        def close(self):
+            pass
+
+    class _ConexionFalsa:
+        cerrada = False
+        def cursor(self, dictionary=False):
+            assert dictionary
+            return _CursorFalso()
+        def close(self):
+            self.cerrada = True
+
+    conexion = _ConexionFalsa()
+    monkeypatch.setattr(migraciones, 'get_connection', lambda: conexion)
+    monkeypatch.setattr(migraciones, 'CONSULTAS_LECTURA', {
+        'indexada': ('SELECT 1', ()), 'completa': ('SELECT 2', ()),
+        'pequena': ('SELECT 3', ()), 'rota': ('SELECT 4', ()),
+    })
+    assert migraciones.verificar_planes(max_filas=1000) == [('completa', 'practicas', 5000), ('rota', None, None)]
+    assert conexion.cerrada
+    assert migraciones.verificar_planes(max_filas=10) == [
+        ('completa', 'practicas', 5000), ('pequena', 'fechas_criticas', 20), ('rota', None, None)
+    ]
+
+    monkeypatch.setattr(migraciones, 'get_connection', lambda: None)
+    assert migraciones.verificar_planes() is None
+
+def test_horas_sin_tablas_materializadas(monkeypatch):
+    """Las horas son Decimal en todas las consultas y se suman desde practicas si faltan las tablas de la migración 2"""
+    from decimal import Decimal
+    from services import database_service as db
+
+    def preparar(con_tablas):
+        conexion = sqlite_backend.crear_conexion(':memory:')
+        cursor = conexion.cursor()
+        if not con_tablas:
+            for nombre in ('insert', 'delete', 'update'):
+                cursor.execute(f"DROP TRIGGER trg_practicas_horas_{nombre}")
+            cursor.execute("DROP TABLE horas_estudiante_empresa")
+            cursor.execute("DROP TABLE horas_estudiante")
+        cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", ('H1', '1', 'Hugo'))
+        cursor.executemany("INSERT INTO empresas (nombre) VALUES (%s)", [('Acme',), ('Beta',)])
+        cursor.executemany("INSERT INTO estudiantes_empresas (estudiante_id, empresa_id) VALUES (%s, %s)", [(1, 1), (1, 2)])
+        cursor.executemany("INSERT INTO practicas (estudiante_empresa_id, horas) VALUES (%s, %s)",
+                           [(1, Decimal('10.25')), (1, Decimal('5')), (2, Decimal('4.5'))])
+        conexion.commit()
+        monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+        db._cache_estudiantes.invalidar()
+        return conexion
+
+    monkeypatch.setattr(db, '_sin_horas_materializadas_en', None)
+    for con_tablas in (True, False):
+        conexion = preparar(con_tablas)
+        horas = db.consultar_horas('H1')
+        resumen = db.consultar_resumen_estudiante('H1')
+        assert horas == resumen['horas'] == Decimal('19.75')
+        assert type(horas) is type(resumen['horas']) is Decimal
+        assert sorted(db.consultar_horas_por_empresa('H1')) == [('Acme', Decimal('15.25')), ('Beta', Decimal('4.50'))]
+        assert (db._sin_horas_materializadas_en is None) == con_tablas
+        conexion.close()
+
+def test_admin_fechas_y_oportunidades(monkeypatch, tmp_path):
+    """Los endpoints de administración escriben con token y las consultas ven los cambios"""
+    import app as api
+    from config import Config
+    from services import database_service as db
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    conexion.cursor().execute("INSERT INTO empresas (nombre) VALUES (%s)", ('Acme',))
+    conexion.commit()
+    monkeypatch.setattr(Config, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(Config, 'CACHE_MARCA_CONSULTAS', str(tmp_path / '.cache_consultas'))
+    monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+    db._cache_consultas.invalidar()
+    db._cache_paginas.invalidar()
+    cliente = api.app.test_client()
+    admin = {'X-Admin-Token': 'secreto'}
+
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', '')
+    assert cliente.post('/fechas_criticas', json={'descripcion': 'Informe', 'fecha': '2025-07-01'}).status_code == 403
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secreto')
+    assert cliente.post('/fechas_criticas', json={'descripcion': 'Informe', 'fecha': '2025-07-01'},
+                        headers={'X-Admin-Token': 'otro'}).status_code == 401
+    assert cliente.post('/fechas_criticas', json={'descripcion': 'Informe', 'fecha': '01/07/2025'},
+                        headers=admin).status_code == 400
+
+    assert cliente.get('/fechas_criticas').get_json() == {'fechas_criticas': []}
+    respuesta = cliente.post('/fechas_criticas', json={'descripcion': 'Informe', 'fecha': '2025-07-01'}, headers=admin)
+    assert respuesta.status_code == 201
+    fecha_id = respuesta.get_json()['id']
+    assert [fecha[0] for fecha in cliente.get('/fechas_criticas').get_json()['fechas_criticas']] == ['Informe']
+    assert cliente.patch(f'/fechas_criticas/{fecha_id}', json={'estado': 'completada'}, headers=admin).status_code == 200
+    assert cliente.get('/fechas_criticas').get_json() == {'fechas_criticas': []}
+    assert cliente.patch('/fechas_criticas/999', json={'estado': 'completada'}, headers=admin).status_code == 404
+
+    oportunidad = {'empresa_id': 1, 'descripcion': 'Backend', 'fecha_inicio': '2025-04-01', 'fecha_fin': '2025-08-01'}
+    assert cliente.post('/oportunidades', json=dict(oportunidad, fecha_fin='2025-01-01'), headers=admin).status_code == 400
+    assert cliente.get('/oportunidades').get_json()['oportunidades'] == []
+    respuesta = cliente.post('/oportunidades', json=oportunidad, headers=admin)
+    assert respuesta.status_code == 201
+    oportunidad_id = respuesta.get_json()['id']
+    assert ['Backend' in o for o in cliente.get('/oportunidades').get_json()['oportunidades']] == [True]
+    assert cliente.patch(f'/oportunidades/{oportunidad_id}', json={'estado': 'cerrada'}, headers=admin).status_code == 200
+    assert cliente.get('/oportunidades').get_json()['oportunidades'] == []
+    conexion.close()
+
+def test_resumen_estudiante(monkeypatch):
+    """El resumen trae ID, horas, empresas y solo las cartas generadas, también por la API"""
+    from decimal import Decimal
+    import app as api
+    from services import database_service as db
+
+    conexion = sqlite_backend.crear_conexion(':memory:')
+    cursor = conexion.cursor()
+    cursor.execute("INSERT INTO estudiantes (codigo, dni, nombre) VALUES (%s, %s, %s)", ('R1', '1', 'Rosa'))
+    cursor.executemany("INSERT INTO empresas (nombre) VALUES (%s)", [('Acme',), ('Beta',)])
+    cursor.executemany("INSERT INTO estudiantes_empresas (estudiante_id, empresa_id) VALUES (%s, %s)", [(1, 1), (1, 2)])
+    cursor.executemany("INSERT INTO practicas (estudiante_empresa_id, horas) VALUES (%s, %s)", [(1, Decimal('8')), (2, Decimal('4.5'))])
+    cursor.execute("""
+        INSERT INTO solicitudes_carta (estudiante_id, empresa_id, fecha_solicitud, ruta_pdf, estado)
+        VALUES (1, 1, '2024-03-01', 'static/cartas/acme.pdf', 'generada'), (1, 2, '2024-03-02', NULL, 'pendiente')
+    """)
+    conexion.commit()
+    monkeypatch.setattr(db, '_obtener_conexion', PoolConexiones(lambda: conexion, tamano=1).obtener)
+    monkeypatch.setattr(db, '_sin_horas_materializadas_en', None)
+    db._cache_estudiantes.invalidar()
+
+    resumen = db.consultar_resumen_estudiante('R1')
+    assert resumen == {
+        'codigo': 'R1', 'estudiante_id': 1, 'horas': Decimal('12.50'),
+        'empresas': ['Acme', 'Beta'], 'cartas': [('Acme', 'static/cartas/acme.pdf')]
+    }
+    assert db.consultar_resumen_estudiante('NOEXISTE') is None
+
+    cliente = api.app.test_client()
+    respuesta = cliente.get('/estudiante/R1/resumen')
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    assert Decimal(str(datos['horas'])) == Decimal('12.50')
+    assert datos['cartas'] == [{'empresa': 'Acme', 'ruta_pdf': 'static/cartas/acme.pdf'}]
+    assert sorted(datos['empresas']) == ['Acme', 'Beta']
+    assert cliente.get('/estudiante/NOEXISTE/resumen').status_code == 404
+    conexion.close()
+
 def test_estudiante():
     """Prueba la búsqueda de un estudiante"""
     print("\n🔍 Probando búsqueda de estudiante...")
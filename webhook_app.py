@@ -1,40 +1,71 @@
 import os
-from flask import Flask, request
+import threading
+from flask import Flask, request, jsonify
 from telegram import Bot, Update
-from telegram.ext import Dispatcher, CommandHandler, MessageHandler, Filters, ConversationHandler, CallbackQueryHandler
+from telegram.ext import Dispatcher, CommandHandler, MessageHandler, Filters, ConversationHandler, CallbackQueryHandler, TypeHandler
 
 from telegram_bot import (
     start, menu_handler, recibir_nombre, recibir_codigo_estudiante, recibir_dni,
-    recibir_empresa, recibir_ruc_empresa, recibir_direccion, cancel, descargar_carta_callback,
+    recibir_empresa, recibir_ruc_empresa, recibir_direccion, cancel, descargar_carta_callback, pagina_callback,
+    marcar_conversacion, seleccionar_empresa_callback,
     MENU, NOMBRE, CODIGO, DNI, EMPRESA, RUC_EMPRESA, DIRECCION
 )
+from services.database_service import (
+    obtener_estadisticas_pool, obtener_metricas_consultas, obtener_estadisticas_sentencias,
+    obtener_estadisticas_replicas, precargar_indice_empresas
+)
+from services.render_service import obtener_estadisticas_render
 
 TOKEN = "7364353585:AAFvGKyxzg6UULJoDmhS2rwVTOPdGfOsPoY"
-bot = Bot(token=TOKEN)
 
 app = Flask(__name__)
 
-dispatcher = Dispatcher(bot, None, workers=4, use_context=True)
-
-conv_handler = ConversationHandler(
-    entry_points=[CommandHandler('start', start)],
-    states={
-        MENU: [MessageHandler(Filters.text & ~Filters.command, menu_handler)],
-        NOMBRE: [MessageHandler(Filters.text & ~Filters.command, recibir_nombre)],
-        CODIGO: [MessageHandler(Filters.text & ~Filters.command, recibir_codigo_estudiante)],
-        DNI: [MessageHandler(Filters.text & ~Filters.command, recibir_dni)],
-        EMPRESA: [MessageHandler(Filters.text & ~Filters.command, recibir_empresa)],
-        RUC_EMPRESA: [MessageHandler(Filters.text & ~Filters.command, recibir_ruc_empresa)],
-        DIRECCION: [MessageHandler(Filters.text & ~Filters.command, recibir_direccion)],
-    },
-    fallbacks=[CommandHandler('cancel', cancel)],
-    allow_reentry=True
-)
-dispatcher.add_handler(conv_handler)
-dispatcher.add_handler(CallbackQueryHandler(descargar_carta_callback, pattern=r"^descargar_carta\|"))
+# El bot y el dispatcher se crean al arrancar la aplicación y no al importar el
+# módulo: los procesos 'spawn' del pool de render vuelven a importar __main__ y
+# no deben crear otro dispatcher ni cargar el índice de empresas
+bot = None
+dispatcher = None
+_inicio_lock = threading.Lock()
+
+def iniciar_bot():
+    global bot, dispatcher
+    with _inicio_lock:
+        if dispatcher is None:
+            bot = Bot(token=TOKEN)
+            dispatcher = _crear_dispatcher(bot)
+            precargar_indice_empresas()
+    return dispatcher
+
+def _crear_dispatcher(bot):
+    dispatcher = Dispatcher(bot, None, workers=4, use_context=True)
+    dispatcher.add_handler(TypeHandler(Update, marcar_conversacion), group=-1)
+
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler('start', start)],
+        states={
+            MENU: [MessageHandler(Filters.text & ~Filters.command, menu_handler)],
+            NOMBRE: [MessageHandler(Filters.text & ~Filters.command, recibir_nombre)],
+            CODIGO: [MessageHandler(Filters.text & ~Filters.command, recibir_codigo_estudiante)],
+            DNI: [MessageHandler(Filters.text & ~Filters.command, recibir_dni)],
+            EMPRESA: [
+                MessageHandler(Filters.text & ~Filters.command, recibir_empresa),
+                CallbackQueryHandler(seleccionar_empresa_callback, pattern=r"^empresa\|")
+            ],
+            RUC_EMPRESA: [MessageHandler(Filters.text & ~Filters.command, recibir_ruc_empresa)],
+            DIRECCION: [MessageHandler(Filters.text & ~Filters.command, recibir_direccion)],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        allow_reentry=True
+    )
+    dispatcher.add_handler(conv_handler)
+    dispatcher.add_handler(CallbackQueryHandler(descargar_carta_callback, pattern=r"^descargar_carta\|"))
+    dispatcher.add_handler(CallbackQueryHandler(pagina_callback, pattern=r"^pagina_(oportunidades|cartas)\|"))
+    return dispatcher
 
 @app.route(f"/webhook/{TOKEN}", methods=["POST"])
 def webhook():
+    # Con un servidor WSGI (sin __main__) el bot se crea con la primera actualización
+    dispatcher = iniciar_bot()
     update = Update.de_json(request.get_json(force=True), bot)
     dispatcher.process_update(update)
     return "ok"
@@ -43,5 +74,16 @@ def webhook():
 def health():
     return "Bot is running!"
 
+@app.route("/estadisticas")
+def estadisticas():
+    return jsonify({
+        'pool': obtener_estadisticas_pool(),
+        'consultas': obtener_metricas_consultas(),
+        'sentencias': obtener_estadisticas_sentencias(),
+        'replicas': obtener_estadisticas_replicas(),
+        'render': obtener_estadisticas_render()
+    })
+
 if __name__ == "__main__":
+    iniciar_bot()
     app.run(host="0.0.0.0", port=8443) 
\ No newline at end of file